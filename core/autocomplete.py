@@ -3,71 +3,269 @@ if __name__ == "__main__":
 		"This python script cannot be executed individually, please use main.py"
 	)
 
-from .utils.path import get_all_allowed_paths, EXCLUDED_FILES
-import importlib.util
 import os
+import sys
+import marshal
+import importlib
+import importlib.util
+from argparse import ArgumentParser
+from .registry import (
+	SCRIPTS_SUBDIR,
+	ScriptEntry,
+	ScriptRegistry,
+	get_script_registry,
+)
+
+COMPLETION_CACHE_VERSION = 1
+COMPLETION_CACHE_FILENAME = ".completion_cache"
+# Argparse action classes and the action re-created from the cache
+CACHED_ACTIONS = {
+	"_StoreAction": "store",
+	"_StoreConstAction": "store_true",
+	"_StoreTrueAction": "store_true",
+	"_StoreFalseAction": "store_true",
+	"BooleanOptionalAction": "store_true",
+	"_AppendAction": "append",
+	"_AppendConstAction": "append_const",
+	"_CountAction": "count",
+	"_ExtendAction": "extend",
+	"_VersionAction": "store_true",
+}
+
+
+def _get_registry(toolkit_path: str, scripts_subdir: str) -> ScriptRegistry:
+	if scripts_subdir == SCRIPTS_SUBDIR:
+		return get_script_registry(toolkit_path)
+	return ScriptRegistry(toolkit_path, subdirectory=scripts_subdir)
 
 
 class PathCompleter(object):
+	"""Completes every script path, from the cached script registry."""
+
 	def __init__(self, toolkit_path, scripts_subdir="scripts", **kwargs):
 		self.toolkit_path = toolkit_path
 		self.scripts_subdir = scripts_subdir
-		self.choices = get_all_allowed_paths(
-			project_root=toolkit_path, subdirectory=scripts_subdir
-		)
+		self._choices: list[str] | None = None
+
+	@property
+	def choices(self) -> list[str]:
+		if self._choices is None:
+			registry = _get_registry(self.toolkit_path, self.scripts_subdir)
+			self._choices = list(registry.scripts())
+		return self._choices
 
 	def __call__(self, **kwargs):
 		return self.choices
 
 
 class SingleLevelPathCompleter(object):
+	"""
+	Completes one directory level at a time, from the cached script
+	registry. Directories are completed with a trailing slash.
+	"""
+
 	def __init__(self, toolkit_path, scripts_subdir="scripts", **kwargs):
 		self.toolkit_path = toolkit_path
 		self.scripts_subdir = scripts_subdir
 		self.choices = []
 
-	def __add_slash_if_dir__(self, _path: str) -> str:
-		if os.path.isdir(_path):
-			return _path + "/"
-		return _path
-
-	def __is_valid_file__(self, file: str):
-		file = os.path.basename(file)
-		if file.startswith("__"):
-			return False
-		if file in EXCLUDED_FILES:
-			return False
-		return True
-
 	def __call__(self, **kwargs):
 		prefix: str = kwargs.pop("prefix")
-		if len(prefix) == 0 or "/" not in prefix:
-			for file in os.listdir(
-				os.path.join(self.toolkit_path, self.scripts_subdir)
-			):
-				file_relpath = os.path.join(self.scripts_subdir, file)
-				file_relpath = self.__add_slash_if_dir__(file_relpath)
-				if self.__is_valid_file__(file):
-					self.choices.append(file_relpath)
+		if "/" in prefix:
+			directory = os.path.dirname(prefix)
 		else:
-			current_directory = prefix.split("/")
-			subdir = ""
-			if len(current_directory) != 1:
-				current_directory = current_directory[0:-1]
-
-			for i, v in enumerate(current_directory):
-				subdir = os.path.join(subdir, current_directory[i])
-			current_directory = os.path.join(self.toolkit_path, subdir)
-
-			if os.path.isdir(current_directory):
-				for file in os.listdir(current_directory):
-					file_relpath = os.path.join(subdir, file)
-					file_relpath = self.__add_slash_if_dir__(file_relpath)
-					if self.__is_valid_file__(file):
-						self.choices.append(file_relpath)
+			directory = self.scripts_subdir
+		registry = _get_registry(self.toolkit_path, self.scripts_subdir)
+		choices = set()
+		for script_path in registry.scripts():
+			if not script_path.startswith(f"{directory}/"):
+				continue
+			child = script_path[len(directory) + 1 :].split("/", 1)
+			if len(child) > 1:
+				choices.add(f"{directory}/{child[0]}/")
+			else:
+				choices.add(script_path)
+		self.choices = sorted(choices)
 		return self.choices
 
 
+def get_parser_options(parser: ArgumentParser) -> dict | None:
+	"""
+	Serializes the option tables of a sub-script parser. The filename and
+	help actions are added by make_parser and are left out.
+
+	:return: Actions and mutually exclusive groups, None if the parser
+	  cannot be cached (e.g. an argument with its own completer).
+	"""
+	actions = []
+	for action in parser._actions:
+		action_class = type(action).__name__
+		if action_class == "_HelpAction" or action.dest == "filename":
+			continue
+		if action_class not in CACHED_ACTIONS:
+			return None
+		if getattr(action, "completer", None) is not None:
+			return None
+		actions.append(
+			{
+				"option_strings": list(action.option_strings),
+				"dest": action.dest,
+				"action": CACHED_ACTIONS[action_class],
+				"nargs": action.nargs,
+				"choices": (
+					None
+					if action.choices is None
+					else [str(c) for c in action.choices]
+				),
+				"required": action.required,
+				"help": action.help,
+				"metavar": (
+					action.metavar
+					if action.metavar is None or isinstance(action.metavar, str)
+					else list(action.metavar)
+				),
+			}
+		)
+	groups = [
+		[a.dest for a in group._group_actions]
+		for group in parser._mutually_exclusive_groups
+	]
+	return {"actions": actions, "groups": groups}
+
+
+def make_completion_parser(options: dict, **kwargs) -> ArgumentParser:
+	"""
+	Re-creates a sub-script parser from its cached option tables, good
+	enough for completion only (types and defaults are not kept).
+
+	:param kwargs: make_parser args.
+	"""
+	from .parser import make_parser
+
+	parser = make_parser(**kwargs)
+	groups = {}
+	for group_dests in options["groups"]:
+		group = parser.add_mutually_exclusive_group()
+		for dest in group_dests:
+			groups[dest] = group
+	for action in options["actions"]:
+		container = groups.get(action["dest"], parser)
+		action_kwargs = {"action": action["action"], "help": action["help"]}
+		if action["action"] == "append_const":
+			action_kwargs["const"] = None
+		if action["action"] in ("store", "append", "extend"):
+			action_kwargs["nargs"] = action["nargs"]
+			action_kwargs["choices"] = action["choices"]
+			if action["metavar"] is not None:
+				action_kwargs["metavar"] = (
+					action["metavar"]
+					if isinstance(action["metavar"], str)
+					else tuple(action["metavar"])
+				)
+		if action["option_strings"]:
+			action_kwargs["dest"] = action["dest"]
+			action_kwargs["required"] = action["required"]
+			container.add_argument(*action["option_strings"], **action_kwargs)
+		else:
+			container.add_argument(action["dest"], **action_kwargs)
+	return parser
+
+
+class CompletionCache:
+	"""
+	Option tables of sub-script parsers, cached to a file so that
+	tab-completion can answer without importing the sub-script.
+
+	A script is only imported again once its mtime changes.
+	"""
+
+	def __init__(
+		self,
+		toolkit_path: str,
+		registry: ScriptRegistry | None = None,
+		cache_path: str | None = None,
+	):
+		self.toolkit_path = toolkit_path
+		self.registry = registry or get_script_registry(toolkit_path)
+		self.cache_path = cache_path or os.path.join(
+			self.registry.toolkit_path, COMPLETION_CACHE_FILENAME
+		)
+		self._scripts: dict[str, dict] | None = None
+
+	def _load(self) -> dict[str, dict]:
+		if self._scripts is not None:
+			return self._scripts
+		self._scripts = {}
+		try:
+			with open(self.cache_path, "rb") as cache_file:
+				data = marshal.load(cache_file)
+			if (
+				data["version"] == COMPLETION_CACHE_VERSION
+				and data["python"] == sys.hexversion
+			):
+				self._scripts = data["scripts"]
+		except (OSError, EOFError, ValueError, KeyError, TypeError):
+			pass
+		return self._scripts
+
+	def _save(self) -> None:
+		scripts = self.registry.scripts()
+		data = {
+			"version": COMPLETION_CACHE_VERSION,
+			"python": sys.hexversion,
+			# Drop removed scripts
+			"scripts": {k: v for k, v in self._load().items() if k in scripts},
+		}
+		tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+		try:
+			with open(tmp_path, "wb") as cache_file:
+				marshal.dump(data, cache_file)
+			os.replace(tmp_path, self.cache_path)
+		except OSError:
+			# Completion still works, importing the script every time
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+
+	def _introspect(self, entry: ScriptEntry, **kwargs) -> dict | None:
+		module = importlib.import_module(entry["module"])
+		parser: ArgumentParser = getattr(module, entry["argparser"])(**kwargs)
+		return get_parser_options(parser)
+
+	def get_options(self, entry: ScriptEntry, **kwargs) -> dict | None:
+		"""
+		:param kwargs: make_parser args, used if the script must be imported.
+		:return: Cached option tables of the script, None if it has no
+		  argparser or it cannot be cached.
+		"""
+		if not entry["argparser"]:
+			return None
+		scripts = self._load()
+		cached = scripts.get(entry["path"])
+		if cached is not None and cached["mtime"] == entry["mtime"]:
+			return cached["options"]
+		try:
+			options = self._introspect(
+				entry, **{**kwargs, "use_argcomplete": False}
+			)
+		except Exception:
+			# Import errors are reported when main.py imports the script
+			return None
+		scripts[entry["path"]] = {"mtime": entry["mtime"], "options": options}
+		self._save()
+		return options
+
+	def get_parser(self, entry: ScriptEntry, **kwargs) -> ArgumentParser | None:
+		"""
+		:param kwargs: make_parser args.
+		:return: Completion parser of the script, None if it must be
+		  imported to complete it.
+		"""
+		options = self.get_options(entry, **kwargs)
+		if options is None:
+			return None
+		return make_completion_parser(options, **kwargs)
+
+
 def argcomplete_exists() -> bool:
 	argcomplete_spec = importlib.util.find_spec("argcomplete")
 	return argcomplete_spec is not None
@@ -1,6 +1,5 @@
 from typing import Literal, get_args
-from sys import getdefaultencoding
-import subprocess
+from core.utils.command import run_command
 
 UNIT_STATUSES = Literal[
 	"UNKNOWN",
@@ -73,11 +72,7 @@ class Unit:
 		if extra_args:
 			cmd = cmd + " " + " ".join(extra_args)
 		cmd = f"{cmd} {self.name}.{self.service_type}".split()
-		return (
-			subprocess.check_output(args=cmd)
-			.decode(getdefaultencoding())
-			.strip()
-		)
+		return run_command(cmd, check=True).output.strip()
 
 	def _command(self, action: UNIT_COMMANDS, extra_args=None) -> int:
 		if action not in get_args(UNIT_COMMANDS):
@@ -86,7 +81,7 @@ class Unit:
 		if extra_args:
 			cmd = cmd + " " + " ".join(extra_args)
 		cmd = f"{cmd} {self.name}.{self.service_type}".split()
-		return subprocess.call(args=cmd)
+		return run_command(cmd, capture_output=False).returncode
 
 	def start(self) -> int:
 		return self._command("start")
@@ -1,4 +1,4 @@
-import subprocess
+from core.utils.command import run_command
 
 
 def get_inet_udev_info(device: str) -> dict:
@@ -9,27 +9,20 @@ def get_inet_udev_info(device: str) -> dict:
 	:param str field: If specified only this field will be returned.
 	"""
 	data = {}
-	with subprocess.Popen(
-		f"udevadm info /sys/class/net/{device}".split(),
-		stdout=subprocess.PIPE,
-		stderr=subprocess.PIPE,
-	) as sp:
-		out, err = sp.communicate()
-		returncode = sp.returncode
-		if returncode == 0:
-			out = out.decode("utf-8").split("\n")
-			for line in out:
-				if len(line.strip()) == 0:
-					continue
-				udev_field, l_entry = line.split(": ", 1)
-				if "=" in l_entry:
-					l_field, l_value = l_entry.split("=", 1)
-				else:
-					l_field = None
-					l_value = l_entry
+	result = run_command(["udevadm", "info", f"/sys/class/net/{device}"])
+	if result.ok:
+		for line in result.stdout.decode("utf-8").split("\n"):
+			if len(line.strip()) == 0:
+				continue
+			udev_field, l_entry = line.split(": ", 1)
+			if "=" in l_entry:
+				l_field, l_value = l_entry.split("=", 1)
+			else:
+				l_field = None
+				l_value = l_entry
 
-				if l_field:
-					data[l_field] = l_value
-				else:
-					data[udev_field] = l_value
-		return data
+			if l_field:
+				data[l_field] = l_value
+			else:
+				data[udev_field] = l_value
+	return data
@@ -4,12 +4,29 @@ import sys
 import argparse
 import os
 import socket
+import socketserver
+import threading
+import time
 import json
 
 GUEST_STOPPED = 0
 GUEST_RUNNING = 1
 GUEST_NOT_ON_HOST = 2
 GUEST_CONFIG_MISSING = 3
+QEMU_RUN_DIR = "/run/qemu-server"
+LXC_CGROUP_DIRS = ("/sys/fs/cgroup/lxc", "/sys/fs/cgroup/pids/lxc")
+PVE_NODES_DIR = "/etc/pve/nodes"
+PVE_VERSION_FILE = "/etc/pve/.version"
+GUEST_SUBPATHS = {"vm": "qemu-server", "ct": "lxc"}
+DEFAULT_SOCKET = "/run/zabbix-pve-guests.sock"
+DEFAULT_INTERVAL = 10
+CLIENT_TIMEOUT = 2
+# Root of the toolkit when the script runs from its tree
+TOOLKIT_PATH = os.path.dirname(
+	os.path.dirname(
+		os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+	)
+)
 
 parser = argparse.ArgumentParser(
 	prog="discover_pve_guests.py",
@@ -23,12 +40,40 @@ parser.add_argument(
 	help="Returns Guest Status [GUEST_ID] [GUEST_TYPE]",
 )
 parser.add_argument("-d", "--discovery", required=False, action="store_true")
-args = parser.parse_args()
-
-if not args.discovery and not args.status:
-	parser.error(
-		"No arguments entered, please enter a valid argument. (Use --h|--help for more information)"
-	)
+parser.add_argument(
+	"-a",
+	"--all-statuses",
+	required=False,
+	action="store_true",
+	help="Returns Status of every Guest on this host as JSON (For dependent items)",
+)
+parser.add_argument(
+	"-D",
+	"--daemon",
+	required=False,
+	action="store_true",
+	help="Serve cached discovery and status results over a UNIX socket",
+)
+parser.add_argument(
+	"--socket",
+	required=False,
+	default=DEFAULT_SOCKET,
+	help=f"Daemon UNIX socket path (Default: {DEFAULT_SOCKET})",
+)
+parser.add_argument(
+	"-i",
+	"--interval",
+	required=False,
+	default=DEFAULT_INTERVAL,
+	type=int,
+	help=f"Daemon status refresh interval in seconds (Default: {DEFAULT_INTERVAL})",
+)
+parser.add_argument(
+	"--no-daemon",
+	required=False,
+	action="store_true",
+	help="Do not query the daemon, always collect data in-process",
+)
 
 
 def discover_guests(command):
@@ -73,54 +118,302 @@ def discover_guests(command):
 		return result
 
 
+def get_vm_is_running(guest_id) -> bool:
+	# Same check as qm status, without loading the PVE Perl stack
+	try:
+		with open(f"{QEMU_RUN_DIR}/{guest_id}.pid", "r") as pid_file:
+			pid = int(pid_file.read().strip())
+		with open(f"/proc/{pid}/cmdline", "rb") as cmdline_file:
+			cmdline = cmdline_file.read()
+	except (OSError, ValueError):
+		return False
+	return f"-id\0{guest_id}\0".encode() in cmdline
+
+
+def get_ct_is_running(guest_id) -> bool:
+	return any(os.path.isdir(f"{d}/{guest_id}") for d in LXC_CGROUP_DIRS)
+
+
 def get_status(guest_id: int, guest_type: str):
 	guest_type = guest_type.lower()
 	if guest_type == "vm":
-		command = "qm"
+		is_running = get_vm_is_running(guest_id)
 	elif guest_type == "ct":
-		command = "pct"
+		is_running = get_ct_is_running(guest_id)
 	else:
 		raise ValueError(f"Invalid Guest Type for Guest {guest_id}")
-	args = [f"/usr/sbin/{command}", "status", guest_id]
-	with subprocess.Popen(
-		args, stdout=subprocess.PIPE, stderr=sys.stderr
-	) as proc:
-		out, err = proc.communicate()
-		return out.decode("utf-8".strip()).split(": ")[-1].rstrip("\n").lstrip()
+	return "running" if is_running else "stopped"
+
+
+def get_all_statuses(hostname: str) -> dict[str, int]:
+	statuses = {}
+	for guest_type, subpath in (("vm", "qemu-server"), ("ct", "lxc")):
+		for conf in os.listdir(f"/etc/pve/nodes/{hostname}/{subpath}"):
+			if not conf.endswith(".conf"):
+				continue
+			guest_id = conf.removesuffix(".conf")
+			if get_status(guest_id, guest_type) == "running":
+				statuses[guest_id] = GUEST_RUNNING
+			else:
+				statuses[guest_id] = GUEST_STOPPED
+	return statuses
+
+
+def get_guest_hosts() -> dict[tuple[str, str], str]:
+	"""Returns a (guest_id, guest_type):host map of every cluster guest."""
+	guest_hosts = {}
+	for pve_host in os.listdir(PVE_NODES_DIR):
+		for guest_type, subpath in GUEST_SUBPATHS.items():
+			subpath_dir = f"{PVE_NODES_DIR}/{pve_host}/{subpath}"
+			if not os.path.isdir(subpath_dir):
+				continue
+			for conf in os.listdir(subpath_dir):
+				if conf.endswith(".conf"):
+					guest_id = conf.removesuffix(".conf")
+					guest_hosts[(guest_id, guest_type)] = pve_host
+	return guest_hosts
+
+
+def get_status_code(guest_id, guest_type: str, hostname: str) -> int:
+	guest_type = guest_type.lower()
+	subpath = GUEST_SUBPATHS.get(guest_type, "qemu-server")
+	if not os.path.exists(
+		f"{PVE_NODES_DIR}/{hostname}/{subpath}/{guest_id}.conf"
+	):
+		for pve_host in os.listdir(f"{PVE_NODES_DIR}/"):
+			if os.path.exists(
+				f"{PVE_NODES_DIR}/{pve_host}/{subpath}/{guest_id}.conf"
+			):
+				return GUEST_NOT_ON_HOST
+		return GUEST_CONFIG_MISSING
+	if get_status(guest_id, guest_type) == "running":
+		return GUEST_RUNNING
+	return GUEST_STOPPED
+
+
+def get_discovery() -> dict:
+	statuses = []
+	statuses.extend(discover_guests("qm"))
+	statuses.extend(discover_guests("pct"))
+	return {"data": statuses}
+
+
+def get_pmxcfs_watcher(interval: int):
+	"""
+	Returns the toolkit's pmxcfs watcher, None when the script was deployed
+	on its own.
+	"""
+	if TOOLKIT_PATH not in sys.path:
+		sys.path.append(TOOLKIT_PATH)
+	try:
+		from core.proxmox.watch import PVEWatcher
+	except ImportError:
+		return None
+	try:
+		return PVEWatcher(poll_interval=interval)
+	except OSError as e:
+		print(f"Could not watch pmxcfs: {e}", file=sys.stderr)
+		return None
+
+
+def get_pmxcfs_version() -> str | None:
+	try:
+		with open(PVE_VERSION_FILE, "r") as version_file:
+			return version_file.read()
+	except OSError:
+		return None
+
+
+class GuestCache:
+	"""
+	In-memory discovery and status table.
+	Statuses are refreshed every interval, discovery data only when guests
+	or nodes change in pmxcfs. Changes are received from a PVEWatcher when
+	given, otherwise the pmxcfs version is compared on every refresh.
+	"""
+
+	def __init__(
+		self, hostname: str, interval: int = DEFAULT_INTERVAL, watcher=None
+	):
+		self.hostname = hostname
+		self.interval = interval
+		self.discovery: str = json.dumps({"data": []})
+		self.guest_hosts: dict[tuple[str, str], str] = {}
+		self.statuses: dict[str, int] = {}
+		self._pmxcfs_version = None
+		self.watcher = watcher
+		self._discovery_stale = True
+		if watcher:
+			watcher.subscribe(self._on_pmxcfs_change, kinds=("nodes", "guests"))
+
+	def _on_pmxcfs_change(self, event):
+		self._discovery_stale = True
+
+	def refresh(self):
+		if self.watcher:
+			discovery_stale = self._discovery_stale
+		else:
+			pmxcfs_version = get_pmxcfs_version()
+			discovery_stale = (
+				pmxcfs_version is None or pmxcfs_version != self._pmxcfs_version
+			)
+			self._pmxcfs_version = pmxcfs_version
+		if discovery_stale:
+			self._discovery_stale = False
+			self.guest_hosts = get_guest_hosts()
+			self.discovery = json.dumps(get_discovery())
+		self.statuses = get_all_statuses(self.hostname)
+
+	def wait(self):
+		"""Waits for the next refresh, pmxcfs changes end it early."""
+		if not self.watcher:
+			time.sleep(self.interval)
+			return
+		deadline = time.monotonic() + self.interval
+		while not self._discovery_stale:
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				break
+			self.watcher.poll(timeout=remaining)
+
+	def run(self):
+		while True:
+			self.wait()
+			try:
+				self.refresh()
+			except Exception as e:
+				print(f"Could not refresh guest cache: {e}", file=sys.stderr)
+
+	def get_status_code(self, guest_id: str, guest_type: str) -> int:
+		host = self.guest_hosts.get((guest_id, guest_type.lower()))
+		if host is None:
+			return GUEST_CONFIG_MISSING
+		if host != self.hostname:
+			return GUEST_NOT_ON_HOST
+		return self.statuses.get(guest_id, GUEST_STOPPED)
+
+	def query(self, request: str) -> str:
+		request_args = request.split()
+		if request_args == ["discovery"]:
+			return self.discovery
+		if request_args == ["all-statuses"]:
+			return json.dumps(self.statuses)
+		if len(request_args) == 3 and request_args[0] == "status":
+			return str(self.get_status_code(*request_args[1:]))
+		raise ValueError(f"Invalid request: {request}")
+
+
+def get_socket_is_served(socket_path: str) -> bool:
+	"""Returns whether a daemon is listening on the socket."""
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+		client.settimeout(CLIENT_TIMEOUT)
+		try:
+			client.connect(socket_path)
+		except (ConnectionRefusedError, FileNotFoundError):
+			return False
+	return True
+
+
+def run_daemon(socket_path: str, interval: int):
+	if os.path.exists(socket_path):
+		if get_socket_is_served(socket_path):
+			raise RuntimeError(f"A daemon is already serving {socket_path}")
+		# Left behind by a daemon that did not exit cleanly
+		os.unlink(socket_path)
+
+	cache = GuestCache(
+		hostname=socket.gethostname(),
+		interval=interval,
+		watcher=get_pmxcfs_watcher(interval),
+	)
+	cache.refresh()
+	threading.Thread(target=cache.run, daemon=True).start()
+
+	class RequestHandler(socketserver.StreamRequestHandler):
+		def handle(self):
+			request = self.rfile.readline().decode("utf-8").strip()
+			try:
+				response = cache.query(request)
+			except ValueError as e:
+				response = f"ERROR {e}"
+			self.wfile.write(f"{response}\n".encode("utf-8"))
+
+	with socketserver.ThreadingUnixStreamServer(
+		socket_path, RequestHandler
+	) as server:
+		# Read-only data, zabbix-agent must be able to connect.
+		os.chmod(socket_path, 0o666)
+		try:
+			server.serve_forever()
+		finally:
+			os.unlink(socket_path)
+
+
+def query_daemon(socket_path: str, request: str) -> str | None:
+	"""Returns the daemon's response, or None if it is unavailable."""
+	try:
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+			client.settimeout(CLIENT_TIMEOUT)
+			client.connect(socket_path)
+			client.sendall(f"{request}\n".encode("utf-8"))
+			response = b""
+			while not response.endswith(b"\n"):
+				chunk = client.recv(65536)
+				if not chunk:
+					break
+				response += chunk
+	except OSError:
+		return None
+	response = response.decode("utf-8").strip()
+	if not response or response.startswith("ERROR"):
+		return None
+	return response
 
 
 def main(**kwargs):
-	if args.status and isinstance(args.status, list):
-		guest_id = args.status[0]
-		guest_type = args.status[1].lower()
-		subpath = "qemu-server"
-		if guest_type == "ct":
-			subpath = "lxc"
+	args = parser.parse_args()
+	if (
+		not args.discovery
+		and not args.status
+		and not args.all_statuses
+		and not args.daemon
+	):
+		parser.error(
+			"No arguments entered, please enter a valid argument. (Use --h|--help for more information)"
+		)
+
+	if args.daemon:
 		try:
-			hostname = socket.gethostname()
-		except:
-			raise Exception("Could not get Hostname")
-		if not os.path.exists(
-			f"/etc/pve/nodes/{hostname}/{subpath}/{guest_id}.conf"
-		):
-			for pve_host in os.listdir("/etc/pve/nodes/"):
-				if os.path.exists(
-					f"/etc/pve/nodes/{pve_host}/{subpath}/{guest_id}.conf"
-				):
-					print(GUEST_NOT_ON_HOST)
-					sys.exit()
-			print(GUEST_CONFIG_MISSING)
+			run_daemon(args.socket, args.interval)
+		except RuntimeError as e:
+			print(e, file=sys.stderr)
+			sys.exit(1)
+		sys.exit()
+
+	if args.all_statuses:
+		request = "all-statuses"
+	elif args.status and isinstance(args.status, list):
+		request = f"status {args.status[0]} {args.status[1].lower()}"
+	else:
+		request = "discovery"
+	if not args.no_daemon:
+		response = query_daemon(args.socket, request)
+		if response is not None:
+			print(response)
 			sys.exit()
-		status = get_status(guest_id, guest_type)
-		if status == "running":
-			print(GUEST_RUNNING)
-		else:
-			print(GUEST_STOPPED)
+
+	# Daemon is down, collect data in-process
+	try:
+		hostname = socket.gethostname()
+	except:
+		raise Exception("Could not get Hostname")
+	if args.all_statuses:
+		print(json.dumps(get_all_statuses(hostname)))
 		sys.exit()
-	statuses = []
-	statuses.extend(discover_guests("qm"))
-	statuses.extend(discover_guests("pct"))
-	print(json.dumps({"data": statuses}))
+	if args.status and isinstance(args.status, list):
+		print(get_status_code(args.status[0], args.status[1], hostname))
+		sys.exit()
+	print(json.dumps(get_discovery()))
 
 
 if __name__ == "__main__":
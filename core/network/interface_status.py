@@ -4,8 +4,10 @@ if __name__ == "__main__":
 		"This python script cannot be executed individually, please use main.py"
 	)
 
-import subprocess
+import os
 import logging
+from core.network.links import SYS_CLASS_NET, read_sysfs_link
+from core.utils.command import run_command
 from core.format.colors import bcolors, print_c
 from core.parser import make_parser, ArgumentParser
 
@@ -15,24 +17,28 @@ logger = logging.getLogger(__name__)
 def argparser(**kwargs) -> ArgumentParser:
 	parser = make_parser(
 		prog="Interface Status Fetcher",
-		description="Gets interface status with ip binary",
+		description="Gets interface status from sysfs",
 		**kwargs,
 	)
 	parser.add_argument("interface")
 	return parser
 
 
-def get_iface_status(iface_name):
+def get_iface_status(iface_name: str) -> str:
+	"""
+	:return: Operational state as printed by ip link (UP, DOWN, UNKNOWN...).
+	"""
+	if os.path.isdir(SYS_CLASS_NET):
+		return read_sysfs_link(iface_name).operstate
+	return get_iface_status_ip(iface_name)
+
+
+def get_iface_status_ip(iface_name):
+	"""Parses ip link show, for systems without sysfs."""
 	IP_ARGS = ["/usr/sbin/ip", "link", "show", iface_name]
-	with subprocess.Popen(
-		IP_ARGS, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-	) as ip_proc:
-		output: list[str] = []
-		errors: list[str] = []
-		for l_out in ip_proc.stdout:
-			output.append(l_out.decode("utf-8").strip())
-		for l_err in ip_proc.stderr:
-			errors.append(l_err.decode("utf-8").strip())
+	result = run_command(IP_ARGS)
+	output: list[str] = [l.strip() for l in result.output.splitlines()]
+	errors: list[str] = [l.strip() for l in result.errors.splitlines()]
 	iface_status_line = None
 	for l in errors:
 		if "does not exist" in l:
@@ -0,0 +1,276 @@
+import ipaddress
+from bisect import bisect_left, bisect_right
+from typing import Iterable
+
+IPAddress = ipaddress.IPv4Address | ipaddress.IPv6Address
+IPNetwork = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+class AddressPoolExhausted(Exception):
+	pass
+
+
+class IntervalSet:
+	"""
+	Set of integers stored as sorted, disjoint and non-adjacent inclusive
+	intervals. Lookups are binary searches, so a /16 with thousands of
+	reservations is a few comparisons instead of a list scan.
+	"""
+
+	__slots__ = ("_starts", "_ends")
+
+	def __init__(self, values: Iterable[int] = ()):
+		self._starts: list[int] = []
+		self._ends: list[int] = []
+		self.update(values)
+
+	def update(self, values: Iterable[int]) -> None:
+		"""Adds many values at once, sorted and merged in a single pass."""
+		values = sorted(set(values))
+		if not values:
+			return
+		intervals = sorted(
+			[*zip(self._starts, self._ends), *((v, v) for v in values)]
+		)
+		self._starts = []
+		self._ends = []
+		for start, end in intervals:
+			if self._ends and start <= self._ends[-1] + 1:
+				self._ends[-1] = max(self._ends[-1], end)
+				continue
+			self._starts.append(start)
+			self._ends.append(end)
+
+	def add(self, start: int, end: int | None = None) -> None:
+		end = start if end is None else end
+		# Intervals overlapping or adjacent to [start, end] are merged
+		i = bisect_left(self._ends, start - 1)
+		j = bisect_right(self._starts, end + 1)
+		if i < j:
+			start = min(start, self._starts[i])
+			end = max(end, self._ends[j - 1])
+		self._starts[i:j] = [start]
+		self._ends[i:j] = [end]
+
+	def remove(self, start: int, end: int | None = None) -> None:
+		end = start if end is None else end
+		i = bisect_left(self._ends, start)
+		j = bisect_right(self._starts, end)
+		if i >= j:
+			return
+		starts = []
+		ends = []
+		if self._starts[i] < start:
+			starts.append(self._starts[i])
+			ends.append(start - 1)
+		if self._ends[j - 1] > end:
+			starts.append(end + 1)
+			ends.append(self._ends[j - 1])
+		self._starts[i:j] = starts
+		self._ends[i:j] = ends
+
+	def __contains__(self, value: int) -> bool:
+		i = bisect_right(self._starts, value) - 1
+		return i >= 0 and self._ends[i] >= value
+
+	def __len__(self) -> int:
+		return sum(e - s + 1 for s, e in zip(self._starts, self._ends))
+
+	def __bool__(self) -> bool:
+		return bool(self._starts)
+
+	def intervals(self) -> list[tuple[int, int]]:
+		return list(zip(self._starts, self._ends))
+
+	def count(self, low: int, high: int) -> int:
+		"""Number of values within [low, high]."""
+		total = 0
+		i = bisect_left(self._ends, low)
+		while i < len(self._starts) and self._starts[i] <= high:
+			total += min(self._ends[i], high) - max(self._starts[i], low) + 1
+			i += 1
+		return total
+
+	def next_missing(self, value: int) -> int:
+		"""Smallest integer >= value that is not in the set."""
+		i = bisect_right(self._starts, value) - 1
+		if i >= 0 and self._ends[i] >= value:
+			# Intervals are never adjacent, the value past one is missing
+			return self._ends[i] + 1
+		return value
+
+	def find_gap(self, size: int, low: int, high: int) -> int | None:
+		""":return: Start of the first run of size missing values in [low, high]."""
+		start = self.next_missing(low)
+		i = bisect_right(self._starts, start)
+		while start + size - 1 <= high:
+			if i >= len(self._starts) or self._starts[i] > start + size - 1:
+				return start
+			start = self._ends[i] + 1
+			i += 1
+		return None
+
+
+class SubnetAllocator:
+	"""
+	Free address allocator of a single subnet.
+
+	The network and broadcast addresses of IPv4 subnets (and the
+	subnet-router anycast address of IPv6 subnets) are never allocated,
+	except on /31, /32, /127 and /128 point to point subnets.
+	"""
+
+	def __init__(
+		self,
+		network: IPNetwork | str,
+		reserved: Iterable[IPAddress | str] = (),
+	):
+		self.network: IPNetwork = ipaddress.ip_network(network, strict=False)
+		self.low = int(self.network.network_address)
+		self.high = int(self.network.broadcast_address)
+		if self.network.num_addresses > 2:
+			self.low += 1
+			if self.network.version == 4:
+				self.high -= 1
+		self.reserved = IntervalSet()
+		self.update(reserved)
+
+	def _to_int(self, address: IPAddress | str) -> int | None:
+		address = ipaddress.ip_address(address)
+		if address not in self.network:
+			return None
+		return int(address)
+
+	def _to_address(self, value: int) -> IPAddress:
+		return type(self.network.network_address)(value)
+
+	def update(self, addresses: Iterable[IPAddress | str]) -> None:
+		"""Reserves many addresses, those outside the subnet are ignored."""
+		values = (self._to_int(a) for a in addresses)
+		self.reserved.update(v for v in values if v is not None)
+
+	def reserve(self, address: IPAddress | str) -> bool:
+		""":return: False if the address is outside the subnet."""
+		value = self._to_int(address)
+		if value is None:
+			return False
+		self.reserved.add(value)
+		return True
+
+	def release(self, address: IPAddress | str) -> None:
+		value = self._to_int(address)
+		if value is not None:
+			self.reserved.remove(value)
+
+	def is_free(self, address: IPAddress | str) -> bool:
+		value = self._to_int(address)
+		if value is None or not self.low <= value <= self.high:
+			return False
+		return value not in self.reserved
+
+	@property
+	def free_count(self) -> int:
+		return (
+			self.high - self.low + 1 - self.reserved.count(self.low, self.high)
+		)
+
+	def _get_start(self, start: IPAddress | str | None) -> int:
+		if start is None:
+			return self.low
+		value = self._to_int(start)
+		if value is None or value > self.high:
+			return self.low
+		return max(value, self.low)
+
+	def next_free(
+		self, start: IPAddress | str | None = None
+	) -> IPAddress | None:
+		"""
+		:param start: Search from this address on, wrapping around to the
+		  start of the subnet.
+		:return: First free address, None if the subnet is full.
+		"""
+		value = self._next_free_value(self._get_start(start))
+		return None if value is None else self._to_address(value)
+
+	def _next_free_value(self, start_value: int) -> int | None:
+		value = self.reserved.next_missing(start_value)
+		if value > self.high:
+			value = self.reserved.next_missing(self.low)
+			if value >= start_value:
+				return None
+		return value
+
+	def allocate(
+		self,
+		count: int = 1,
+		start: IPAddress | str | None = None,
+		contiguous=False,
+	) -> list[IPAddress]:
+		"""
+		Reserves and returns count free addresses, nothing is reserved if
+		the subnet cannot hold all of them.
+
+		:param start: Search from this address on, wrapping around to the
+		  start of the subnet.
+		:param contiguous: Addresses must be consecutive.
+		"""
+		if count < 1:
+			raise ValueError("count must be greater than 0.")
+		if count > self.free_count:
+			raise AddressPoolExhausted(
+				f"{self.network} has {self.free_count} free addresses, {count} requested."
+			)
+		start_value = self._get_start(start)
+		if contiguous:
+			first = self.reserved.find_gap(count, start_value, self.high)
+			if first is None:
+				first = self.reserved.find_gap(
+					count, self.low, min(self.high, start_value + count - 2)
+				)
+			if first is None:
+				raise AddressPoolExhausted(
+					f"{self.network} has no {count} contiguous free addresses."
+				)
+			self.reserved.add(first, first + count - 1)
+			return [self._to_address(v) for v in range(first, first + count)]
+
+		addresses = []
+		while len(addresses) < count:
+			# free_count was checked, the subnet cannot run out here
+			value = self._next_free_value(start_value)
+			self.reserved.add(value)
+			addresses.append(self._to_address(value))
+			start_value = value + 1 if value < self.high else self.low
+		return addresses
+
+
+class IPAM:
+	"""Subnet allocators by network, reservations are routed by address."""
+
+	def __init__(self, networks: Iterable[IPNetwork | str] = ()):
+		self.subnets: dict[IPNetwork, SubnetAllocator] = {}
+		for network in networks:
+			self.add_subnet(network)
+
+	def add_subnet(
+		self,
+		network: IPNetwork | str,
+		reserved: Iterable[IPAddress | str] = (),
+	) -> SubnetAllocator:
+		network = ipaddress.ip_network(network, strict=False)
+		allocator = self.subnets.get(network)
+		if allocator is None:
+			allocator = SubnetAllocator(network)
+			self.subnets[network] = allocator
+		allocator.update(reserved)
+		return allocator
+
+	def get(self, network: IPNetwork | str) -> SubnetAllocator | None:
+		return self.subnets.get(ipaddress.ip_network(network, strict=False))
+
+	def update(self, addresses: Iterable[IPAddress | str]) -> None:
+		"""Reserves every address in each subnet holding it."""
+		addresses = [ipaddress.ip_address(a) for a in addresses]
+		for allocator in self.subnets.values():
+			allocator.update(addresses)
@@ -0,0 +1,451 @@
+import os
+import time
+import errno
+import select
+import socket
+import struct
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, Literal
+
+logger = logging.getLogger()
+
+SYS_CLASS_NET = "/sys/class/net"
+DEFAULT_POLL_INTERVAL = 1.0
+
+# See rtnetlink(7) and linux/if_link.h
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_OPERSTATE = 16
+IFLA_CARRIER = 33
+IFF_UP = 0x1
+NLMSG_HEADER_STRUCT = struct.Struct("=IHHII")
+IFINFOMSG_STRUCT = struct.Struct("=BxHiII")
+RTATTR_STRUCT = struct.Struct("=HH")
+NETLINK_RECV_SIZE = 64 * 1024
+# RFC 2863 operational states, as printed by ip link
+IF_OPER_STATES = (
+	"UNKNOWN",
+	"NOTPRESENT",
+	"DOWN",
+	"LOWERLAYERDOWN",
+	"TESTING",
+	"DORMANT",
+	"UP",
+)
+
+LinkEventKind = Literal["added", "removed", "changed"]
+
+
+@dataclass(frozen=True)
+class LinkStatus:
+	name: str
+	index: int
+	# ip link state (UP, DOWN, UNKNOWN, LOWERLAYERDOWN...)
+	operstate: str
+	carrier: bool | None = None
+	mtu: int | None = None
+	address: str | None = None
+	flags: int = 0
+	# Mbps, only read from sysfs and unknown for virtual interfaces
+	speed: int | None = None
+
+	@property
+	def admin_up(self) -> bool:
+		return bool(self.flags & IFF_UP)
+
+	@property
+	def is_up(self) -> bool:
+		# Loopback and tunnels never report an operational state
+		if self.operstate == "UNKNOWN":
+			return self.admin_up and bool(self.carrier)
+		return self.operstate == "UP"
+
+
+@dataclass(frozen=True)
+class LinkEvent:
+	kind: LinkEventKind
+	name: str
+	# None once the link is removed
+	link: LinkStatus | None
+	previous: LinkStatus | None = None
+
+
+## sysfs
+def _read_sysfs_attr(link_dir: str, attr: str) -> str | None:
+	try:
+		with open(os.path.join(link_dir, attr), "r") as attr_file:
+			return attr_file.read().strip()
+	except OSError:
+		# e.g. carrier and speed are EINVAL while the link is down
+		return None
+
+
+def _read_sysfs_int(link_dir: str, attr: str, base=10) -> int | None:
+	value = _read_sysfs_attr(link_dir, attr)
+	try:
+		return int(value, base) if value else None
+	except ValueError:
+		return None
+
+
+def read_sysfs_link(
+	name: str, sys_class_net: str = SYS_CLASS_NET
+) -> LinkStatus:
+	"""Reads a link's status from sysfs, without forking ip."""
+	link_dir = os.path.join(sys_class_net, name)
+	if not os.path.isdir(link_dir):
+		raise ValueError(f"Interface {name} does not exist")
+	carrier = _read_sysfs_int(link_dir, "carrier")
+	speed = _read_sysfs_int(link_dir, "speed")
+	return LinkStatus(
+		name=name,
+		index=_read_sysfs_int(link_dir, "ifindex") or 0,
+		operstate=(
+			_read_sysfs_attr(link_dir, "operstate") or "unknown"
+		).upper(),
+		carrier=None if carrier is None else bool(carrier),
+		mtu=_read_sysfs_int(link_dir, "mtu"),
+		address=_read_sysfs_attr(link_dir, "address") or None,
+		flags=_read_sysfs_int(link_dir, "flags", 16) or 0,
+		speed=speed if speed is not None and speed >= 0 else None,
+	)
+
+
+def get_sysfs_links(
+	sys_class_net: str = SYS_CLASS_NET,
+) -> dict[str, LinkStatus]:
+	links = {}
+	for name in sorted(os.listdir(sys_class_net)):
+		try:
+			links[name] = read_sysfs_link(name, sys_class_net)
+		except ValueError:
+			# Removed while listing, or a bonding_masters file
+			continue
+	return links
+
+
+## rtnetlink
+def open_netlink_socket(groups: int = 0) -> socket.socket:
+	"""
+	:param groups: Multicast groups to receive notifications from.
+	"""
+	if not hasattr(socket, "AF_NETLINK"):
+		raise OSError(errno.ENOSYS, "Netlink sockets are not available.")
+	sock = socket.socket(
+		socket.AF_NETLINK, socket.SOCK_RAW | socket.SOCK_CLOEXEC, NETLINK_ROUTE
+	)
+	try:
+		sock.bind((0, groups))
+	except OSError:
+		sock.close()
+		raise
+	return sock
+
+
+def make_getlink_request(seq: int) -> bytes:
+	ifinfomsg = IFINFOMSG_STRUCT.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+	header = NLMSG_HEADER_STRUCT.pack(
+		NLMSG_HEADER_STRUCT.size + len(ifinfomsg),
+		RTM_GETLINK,
+		NLM_F_REQUEST | NLM_F_DUMP,
+		seq,
+		0,
+	)
+	return header + ifinfomsg
+
+
+def parse_link_message(data: bytes | memoryview) -> LinkStatus:
+	"""
+	Parses the ifinfomsg and attributes of an RTM_NEWLINK or RTM_DELLINK
+	message, without its nlmsghdr.
+	"""
+	_family, _type, index, flags, _change = IFINFOMSG_STRUCT.unpack_from(data)
+	attrs = {}
+	offset = IFINFOMSG_STRUCT.size
+	while offset + RTATTR_STRUCT.size <= len(data):
+		rta_len, rta_type = RTATTR_STRUCT.unpack_from(data, offset)
+		if rta_len < RTATTR_STRUCT.size:
+			break
+		attrs[rta_type] = bytes(
+			data[offset + RTATTR_STRUCT.size : offset + rta_len]
+		)
+		offset += (rta_len + 3) & ~3
+
+	operstate = "UNKNOWN"
+	if IFLA_OPERSTATE in attrs:
+		state = attrs[IFLA_OPERSTATE][0]
+		if state < len(IF_OPER_STATES):
+			operstate = IF_OPER_STATES[state]
+	carrier = None
+	if IFLA_CARRIER in attrs:
+		carrier = bool(attrs[IFLA_CARRIER][0])
+	mtu = None
+	if IFLA_MTU in attrs:
+		mtu = struct.unpack("=I", attrs[IFLA_MTU][:4])[0]
+	address = None
+	if attrs.get(IFLA_ADDRESS):
+		address = ":".join(f"{b:02x}" for b in attrs[IFLA_ADDRESS])
+	return LinkStatus(
+		name=attrs.get(IFLA_IFNAME, b"").rstrip(b"\0").decode(),
+		index=index,
+		operstate=operstate,
+		carrier=carrier,
+		mtu=mtu,
+		address=address,
+		flags=flags,
+	)
+
+
+def parse_netlink_messages(
+	data: bytes,
+) -> list[tuple[int, int, int, memoryview]]:
+	"""
+	:return: (type, flags, seq, payload) of every message in a datagram.
+	"""
+	messages = []
+	view = memoryview(data)
+	offset = 0
+	while offset + NLMSG_HEADER_STRUCT.size <= len(data):
+		msg_len, msg_type, msg_flags, seq, _pid = (
+			NLMSG_HEADER_STRUCT.unpack_from(data, offset)
+		)
+		if msg_len < NLMSG_HEADER_STRUCT.size:
+			break
+		payload = view[offset + NLMSG_HEADER_STRUCT.size : offset + msg_len]
+		messages.append((msg_type, msg_flags, seq, payload))
+		offset += (msg_len + 3) & ~3
+	return messages
+
+
+def dump_links(sock: socket.socket | None = None) -> dict[str, LinkStatus]:
+	"""
+	Fetches every link with a single RTM_GETLINK dump request.
+
+	:param sock: NETLINK_ROUTE socket, a temporary one is opened if None.
+	"""
+	own_sock = sock is None
+	if own_sock:
+		sock = open_netlink_socket()
+	try:
+		seq = int.from_bytes(os.urandom(4), "little")
+		sock.send(make_getlink_request(seq))
+		links = {}
+		while True:
+			data = sock.recv(NETLINK_RECV_SIZE)
+			for msg_type, _flags, msg_seq, payload in parse_netlink_messages(
+				data
+			):
+				if msg_seq != seq:
+					continue
+				if msg_type == NLMSG_DONE:
+					return links
+				if msg_type == NLMSG_ERROR:
+					error = -struct.unpack_from("=i", payload)[0]
+					if error:
+						raise OSError(error, os.strerror(error))
+					return links
+				if msg_type == RTM_NEWLINK:
+					link = parse_link_message(payload)
+					links[link.name] = link
+	finally:
+		if own_sock:
+			sock.close()
+
+
+def get_links(use_netlink=True) -> dict[str, LinkStatus]:
+	"""
+	:return: name:LinkStatus of every link, from one rtnetlink dump when
+	  available (without speeds) and from sysfs otherwise.
+	"""
+	if use_netlink:
+		try:
+			return dump_links()
+		except OSError as e:
+			logger.debug("rtnetlink unavailable, reading sysfs: %s", e)
+	return get_sysfs_links()
+
+
+def _link_changed(link: LinkStatus, previous: LinkStatus) -> bool:
+	return (
+		link.operstate != previous.operstate
+		or link.carrier != previous.carrier
+		or link.admin_up != previous.admin_up
+	)
+
+
+def diff_links(
+	previous: dict[str, LinkStatus], current: dict[str, LinkStatus]
+) -> list[LinkEvent]:
+	"""Events of links added, removed or whose up/down state changed."""
+	events = []
+	for name, link in current.items():
+		old = previous.get(name)
+		if old is None:
+			events.append(LinkEvent("added", name, link))
+		elif _link_changed(link, old):
+			events.append(LinkEvent("changed", name, link, old))
+	for name, old in previous.items():
+		if name not in current:
+			events.append(LinkEvent("removed", name, None, old))
+	return events
+
+
+class LinkWatcher:
+	"""
+	Publishes link up/down events.
+
+	Events are received from the rtnetlink link multicast group when
+	available, otherwise sysfs is polled and compared every poll_interval.
+	"""
+
+	def __init__(
+		self,
+		poll_interval: float = DEFAULT_POLL_INTERVAL,
+		use_netlink=True,
+		sys_class_net: str = SYS_CLASS_NET,
+	):
+		self.poll_interval = poll_interval
+		self.sys_class_net = sys_class_net
+		self._subscribers: list[
+			tuple[Callable[[LinkEvent], None], set[str] | None]
+		] = []
+		self._sock: socket.socket | None = None
+		self._thread: threading.Thread | None = None
+		self._stop = threading.Event()
+		if use_netlink:
+			try:
+				# Subscribed before the dump, no change can be missed
+				self._sock = open_netlink_socket(RTMGRP_LINK)
+				self._sock.setblocking(False)
+			except OSError as e:
+				logger.debug("rtnetlink unavailable, polling sysfs: %s", e)
+		self.links: dict[str, LinkStatus] = self._snapshot()
+
+	@property
+	def uses_netlink(self) -> bool:
+		return self._sock is not None
+
+	def _snapshot(self) -> dict[str, LinkStatus]:
+		if self._sock:
+			# A dump on its own socket, the monitor only gets notifications
+			return dump_links()
+		return get_sysfs_links(self.sys_class_net)
+
+	def subscribe(
+		self,
+		callback: Callable[[LinkEvent], None],
+		names: Iterable[str] | None = None,
+	) -> None:
+		"""
+		:param names: Only receive events of these links, all if None.
+		"""
+		self._subscribers.append((callback, set(names) if names else None))
+
+	def _publish(self, events: list[LinkEvent]) -> None:
+		for event in events:
+			logger.debug("Link change: %s", event)
+			for callback, names in self._subscribers:
+				if names is None or event.name in names:
+					try:
+						callback(event)
+					except Exception:
+						logger.exception("Link change subscriber failed.")
+
+	def _read_netlink(self, timeout: float | None) -> list[LinkEvent]:
+		readable, _, _ = select.select([self._sock], [], [], timeout)
+		if not readable:
+			return []
+		links = dict(self.links)
+		while True:
+			try:
+				data = self._sock.recv(NETLINK_RECV_SIZE)
+			except BlockingIOError:
+				break
+			except OSError as e:
+				if e.errno != errno.ENOBUFS:
+					raise
+				# Notifications were dropped, re-sync from a full dump
+				logger.debug("rtnetlink buffer overrun, dumping links.")
+				links = dump_links()
+				continue
+			for msg_type, _flags, _seq, payload in parse_netlink_messages(data):
+				if msg_type == RTM_NEWLINK:
+					link = parse_link_message(payload)
+					links[link.name] = link
+				elif msg_type == RTM_DELLINK:
+					links.pop(parse_link_message(payload).name, None)
+		events = diff_links(self.links, links)
+		self.links = links
+		return events
+
+	def _poll_sysfs(self, timeout: float | None) -> list[LinkEvent]:
+		if timeout:
+			self._stop.wait(timeout)
+		links = get_sysfs_links(self.sys_class_net)
+		events = diff_links(self.links, links)
+		self.links = links
+		return events
+
+	def poll(self, timeout: float | None = None) -> list[LinkEvent]:
+		"""
+		Waits up to timeout seconds for link changes and publishes them.
+		"""
+		if timeout is None:
+			timeout = self.poll_interval
+		if self._sock:
+			events = self._read_netlink(timeout)
+		else:
+			events = self._poll_sysfs(timeout)
+		self._publish(events)
+		return events
+
+	def _run(self) -> None:
+		while not self._stop.is_set():
+			self.poll()
+
+	def start(self) -> None:
+		"""Publishes events from a background thread."""
+		if self._thread and self._thread.is_alive():
+			return
+		self._stop.clear()
+		self._thread = threading.Thread(
+			target=self._run, name="link-watch", daemon=True
+		)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._thread:
+			self._thread.join()
+			self._thread = None
+		if self._sock:
+			self._sock.close()
+			self._sock = None
+
+
+def wait_for_link_down(watcher: LinkWatcher, name: str, timeout: float) -> bool:
+	"""
+	Waits up to timeout seconds for link name to go down or be removed.
+
+	:return: Whether the link went down.
+	"""
+	deadline = time.monotonic() + timeout
+	while (remaining := deadline - time.monotonic()) > 0:
+		for event in watcher.poll(min(remaining, watcher.poll_interval)):
+			if event.name == name and (
+				event.link is None or not event.link.is_up
+			):
+				return True
+	return False
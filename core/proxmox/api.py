@@ -0,0 +1,445 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from urllib.parse import quote, urlencode
+from core.proxmox.constants import PVE_CFG_ROOT
+from core.utils.command import DEFAULT_CONCURRENCY, run_command, run_commands
+from core.utils.lazy import lazy_import
+
+# Only imported when the API is used, ssl is a heavy import
+http_client = lazy_import("http.client")
+ssl = lazy_import("ssl")
+futures = lazy_import("concurrent.futures")
+
+logger = logging.getLogger()
+
+PVE_API_PORT = 8006
+PVE_API_BASE = "/api2/json"
+PVE_ROOT_CA = f"{PVE_CFG_ROOT}/pve-root-ca.pem"
+# Tickets are valid for 2 hours, they are renewed a few minutes earlier
+PVE_TICKET_LIFETIME = 7200
+PVE_TICKET_RENEW_MARGIN = 300
+DEFAULT_API_TIMEOUT = 30
+# Per-user cache of API tickets and query results
+DEFAULT_CACHE_DIR = os.path.join(
+	os.path.expanduser("~"), ".cache", "py-pve-toolkit"
+)
+DEFAULT_TICKET_CACHE_DIR = DEFAULT_CACHE_DIR
+
+# Environment variables holding the API connection and credentials
+ENV_API_HOST = "PVE_API_HOST"
+ENV_API_PORT = "PVE_API_PORT"
+ENV_API_SOCKET = "PVE_API_SOCKET"
+ENV_API_TOKEN = "PVE_API_TOKEN"
+ENV_API_USER = "PVE_API_USER"
+ENV_API_PASSWORD = "PVE_API_PASSWORD"
+ENV_API_VERIFY_SSL = "PVE_API_VERIFY_SSL"
+ENV_API_CACHE_TTL = "PVE_API_CACHE_TTL"
+
+
+class PVEAPIError(Exception):
+	def __init__(self, status: int, reason: str, errors=None):
+		self.status = status
+		self.reason = reason
+		self.errors = errors
+		super().__init__(f"PVE API Error ({status}): {reason}", errors)
+
+
+def get_ticket_expiry(ticket: str) -> float:
+	"""
+	Tickets are formatted as PVE:<user>:<hex timestamp>::<signature>.
+
+	:return: Unix time at which the ticket expires, 0 if unparseable.
+	"""
+	try:
+		return int(ticket.split(":")[2], 16) + PVE_TICKET_LIFETIME
+	except (IndexError, ValueError):
+		return 0
+
+
+def encode_api_params(params: dict | None) -> dict[str, str]:
+	"""Booleans are sent as 1/0, None values are left out."""
+	encoded = {}
+	for k, v in (params or {}).items():
+		if v is None:
+			continue
+		if isinstance(v, bool):
+			v = int(v)
+		encoded[k] = str(v)
+	return encoded
+
+
+class PVEAPIClient:
+	"""
+	PVE REST API client, re-using keep-alive connections to pveproxy (or a
+	local UNIX socket) instead of forking pvesh for every request.
+
+	Authenticates with an API token, or with a ticket that is cached on
+	disk until it expires. Idle connections are pooled, so concurrent
+	threads each get their own connection.
+
+	GET responses may be cached for cache_ttl seconds, any other request
+	clears the cache.
+	"""
+
+	def __init__(
+		self,
+		host: str = "localhost",
+		port: int = PVE_API_PORT,
+		token: str | None = None,
+		user: str | None = None,
+		password: str | None = None,
+		unix_socket: str | None = None,
+		use_ssl: bool = True,
+		verify_ssl: bool = True,
+		ca_file: str | None = None,
+		timeout: float = DEFAULT_API_TIMEOUT,
+		cache_ttl: float = 0,
+		ticket_cache_dir: str | None = DEFAULT_TICKET_CACHE_DIR,
+	):
+		"""
+		:param token: API token formatted as USER@REALM!TOKENID=SECRET.
+		:param unix_socket: Connect to this socket path instead of host:port.
+		:param ca_file: CA to verify pveproxy with, the cluster CA by default.
+		:param ticket_cache_dir: Directory to cache tickets in, None to
+		  keep them in memory only.
+		"""
+		if not token and not (user and password):
+			raise ValueError("An API token or user and password are required.")
+		self.host = host
+		self.port = port
+		self.token = token
+		self.user = user
+		self.password = password
+		self.unix_socket = unix_socket
+		self.use_ssl = use_ssl and not unix_socket
+		self.verify_ssl = verify_ssl
+		self.ca_file = ca_file
+		if ca_file is None and os.path.isfile(PVE_ROOT_CA):
+			self.ca_file = PVE_ROOT_CA
+		self.timeout = timeout
+		self.cache_ttl = cache_ttl
+		self.ticket_cache_dir = ticket_cache_dir
+		self._ticket: str | None = None
+		self._csrf_token: str | None = None
+		self._lock = threading.Lock()
+		self._idle: list = []
+		# GET responses, shared by the pvesh_get_many worker threads
+		self._cache_lock = threading.Lock()
+		self._cache: dict[str, tuple[float, bytes]] = {}
+
+	@classmethod
+	def from_env(cls, environ=None) -> "PVEAPIClient | None":
+		"""
+		:return: Client configured from PVE_API_* variables, None if no
+		  credentials are set.
+		"""
+		environ = os.environ if environ is None else environ
+		token = environ.get(ENV_API_TOKEN)
+		user = environ.get(ENV_API_USER)
+		password = environ.get(ENV_API_PASSWORD)
+		if not token and not (user and password):
+			return None
+		return cls(
+			host=environ.get(ENV_API_HOST, "localhost"),
+			port=int(environ.get(ENV_API_PORT, PVE_API_PORT)),
+			token=token,
+			user=user,
+			password=password,
+			unix_socket=environ.get(ENV_API_SOCKET),
+			verify_ssl=environ.get(ENV_API_VERIFY_SSL, "1").lower()
+			not in ("0", "false", "no"),
+			cache_ttl=float(environ.get(ENV_API_CACHE_TTL, 0)),
+		)
+
+	## Connections
+	def _connect(self):
+		if self.unix_socket:
+			return make_unix_http_connection(
+				self.unix_socket, timeout=self.timeout
+			)
+		if not self.use_ssl:
+			return http_client.HTTPConnection(
+				self.host, self.port, timeout=self.timeout
+			)
+		if self.verify_ssl:
+			context = ssl.create_default_context(cafile=self.ca_file)
+			# Nodes are usually addressed by IP or short hostname
+			context.check_hostname = False
+		else:
+			context = ssl._create_unverified_context()
+		return http_client.HTTPSConnection(
+			self.host, self.port, timeout=self.timeout, context=context
+		)
+
+	def _acquire(self):
+		with self._lock:
+			if self._idle:
+				return self._idle.pop(), True
+		return self._connect(), False
+
+	def _release(self, connection) -> None:
+		with self._lock:
+			self._idle.append(connection)
+
+	def close(self) -> None:
+		with self._lock:
+			idle, self._idle = self._idle, []
+		for connection in idle:
+			connection.close()
+
+	## Authentication
+	def _get_ticket_cache_path(self) -> str | None:
+		if not self.ticket_cache_dir or not self.user:
+			return None
+		target = self.unix_socket or f"{self.host}:{self.port}"
+		filename = f"ticket-{self.user}-{target}".replace("/", "_")
+		return os.path.join(self.ticket_cache_dir, f"{filename}.json")
+
+	def _load_ticket(self) -> bool:
+		path = self._get_ticket_cache_path()
+		if not path or not os.path.isfile(path):
+			return False
+		try:
+			with open(path, "r") as ticket_file:
+				cached = json.load(ticket_file)
+			ticket, csrf_token = cached["ticket"], cached["csrf_token"]
+		except (OSError, ValueError, KeyError):
+			return False
+		if not self._ticket_valid(ticket):
+			return False
+		self._ticket, self._csrf_token = ticket, csrf_token
+		return True
+
+	def _save_ticket(self) -> None:
+		path = self._get_ticket_cache_path()
+		if not path:
+			return
+		try:
+			os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+			fd = os.open(
+				f"{path}.tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+			)
+			with os.fdopen(fd, "w") as ticket_file:
+				json.dump(
+					{"ticket": self._ticket, "csrf_token": self._csrf_token},
+					ticket_file,
+				)
+			os.replace(f"{path}.tmp", path)
+		except OSError as e:
+			logger.debug("Could not cache PVE API ticket: %s", e)
+
+	def _clear_ticket(self) -> None:
+		self._ticket = self._csrf_token = None
+		path = self._get_ticket_cache_path()
+		if path and os.path.isfile(path):
+			os.remove(path)
+
+	def _ticket_valid(self, ticket: str | None) -> bool:
+		if not ticket:
+			return False
+		return get_ticket_expiry(ticket) - PVE_TICKET_RENEW_MARGIN > time.time()
+
+	def login(self) -> None:
+		"""Requests a new ticket, and caches it."""
+		data = self._request(
+			"POST",
+			"/access/ticket",
+			{"username": self.user, "password": self.password},
+			authenticate=False,
+		)
+		self._ticket = data["ticket"]
+		self._csrf_token = data["CSRFPreventionToken"]
+		self._save_ticket()
+
+	def _get_auth_headers(self, method: str) -> dict[str, str]:
+		if self.token:
+			return {"Authorization": f"PVEAPIToken={self.token}"}
+		with self._lock:
+			if not self._ticket_valid(self._ticket) and not self._load_ticket():
+				self._ticket = None
+		if self._ticket is None:
+			self.login()
+		headers = {"Cookie": f"PVEAuthCookie={quote(self._ticket)}"}
+		if method != "GET":
+			headers["CSRFPreventionToken"] = self._csrf_token
+		return headers
+
+	## Requests
+	def _send(
+		self, method: str, url: str, body: bytes | None, headers: dict
+	) -> tuple[int, str, bytes]:
+		connection, reused = self._acquire()
+		try:
+			connection.request(method, url, body=body, headers=headers)
+			response = connection.getresponse()
+			raw = response.read()
+		except (
+			http_client.RemoteDisconnected,
+			ConnectionResetError,
+			BrokenPipeError,
+		):
+			connection.close()
+			if not reused:
+				raise
+			# pveproxy closed the idle connection, retry on a new one
+			connection = self._connect()
+			connection.request(method, url, body=body, headers=headers)
+			response = connection.getresponse()
+			raw = response.read()
+		except BaseException:
+			connection.close()
+			raise
+		if response.will_close:
+			connection.close()
+		else:
+			self._release(connection)
+		return response.status, response.reason, raw
+
+	def _request(
+		self,
+		method: str,
+		path: str,
+		params: dict | None = None,
+		authenticate=True,
+	):
+		params = encode_api_params(params)
+		url = PVE_API_BASE + "/" + path.lstrip("/")
+		body = None
+		headers = {"Accept": "application/json"}
+		if method in ("GET", "DELETE"):
+			if params:
+				url += "?" + urlencode(params)
+		else:
+			body = urlencode(params).encode()
+			headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+		if method == "GET" and self.cache_ttl > 0:
+			with self._cache_lock:
+				cached = self._cache.get(url)
+			if cached and cached[0] > time.monotonic():
+				return json.loads(cached[1]).get("data")
+		elif method != "GET":
+			with self._cache_lock:
+				self._cache.clear()
+
+		for attempt in range(2):
+			request_headers = dict(headers)
+			if authenticate:
+				request_headers.update(self._get_auth_headers(method))
+			logger.debug("PVE API %s %s", method, url)
+			status, reason, raw = self._send(method, url, body, request_headers)
+			# Expired or revoked ticket
+			if (
+				status == 401
+				and authenticate
+				and not self.token
+				and not attempt
+			):
+				self._clear_ticket()
+				continue
+			break
+
+		if status >= 400:
+			errors = None
+			try:
+				errors = json.loads(raw).get("errors")
+			except ValueError:
+				pass
+			raise PVEAPIError(status, reason, errors)
+		if method == "GET" and self.cache_ttl > 0:
+			with self._cache_lock:
+				self._cache[url] = (time.monotonic() + self.cache_ttl, raw)
+		return json.loads(raw).get("data") if raw else None
+
+	def get(self, path: str, params: dict | None = None):
+		return self._request("GET", path, params)
+
+	def post(self, path: str, params: dict | None = None):
+		return self._request("POST", path, params)
+
+	def put(self, path: str, params: dict | None = None):
+		return self._request("PUT", path, params)
+
+	def delete(self, path: str, params: dict | None = None):
+		return self._request("DELETE", path, params)
+
+
+_unix_http_connection_class = None
+
+
+def make_unix_http_connection(path: str, timeout: float | None = None):
+	"""Returns an http.client connection over the UNIX socket at path."""
+	global _unix_http_connection_class
+	if _unix_http_connection_class is None:
+		# Defined on first use, http.client is lazily imported
+		class UnixHTTPConnection(http_client.HTTPConnection):
+			def __init__(self, path: str, timeout: float | None = None):
+				super().__init__("localhost", timeout=timeout)
+				self.unix_path = path
+
+			def connect(self):
+				self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+				self.sock.settimeout(self.timeout)
+				self.sock.connect(self.unix_path)
+
+		_unix_http_connection_class = UnixHTTPConnection
+	return _unix_http_connection_class(path, timeout=timeout)
+
+
+_api_client: PVEAPIClient | None = None
+_api_client_loaded = False
+
+
+def get_api_client() -> PVEAPIClient | None:
+	"""
+	Returns the process-wide PVEAPIClient, None if no API credentials are
+	configured (see PVEAPIClient.from_env).
+	"""
+	global _api_client, _api_client_loaded
+	if not _api_client_loaded:
+		_api_client = PVEAPIClient.from_env()
+		_api_client_loaded = True
+	return _api_client
+
+
+def pvesh_get(path: str, params: dict | None = None):
+	"""
+	GETs path from the PVE API, through the API client when credentials
+	are configured and with pvesh otherwise.
+	"""
+	client = get_api_client()
+	if client:
+		return client.get(path, params)
+	return json.loads(
+		run_command(_get_pvesh_args(path, params), check=True).output
+	)
+
+
+def _get_pvesh_args(path: str, params: dict | None = None) -> list[str]:
+	cmd_args = ["pvesh", "get", path, "--output-format", "json"]
+	for k, v in encode_api_params(params).items():
+		cmd_args += [f"--{k}", v]
+	return cmd_args
+
+
+def pvesh_get_many(paths: list[str], params: dict | None = None) -> list:
+	"""
+	Concurrent pvesh_get of every path, results keep the order of paths.
+	API requests overlap on the client's connection pool, pvesh processes
+	on the CommandRunner.
+	"""
+	if not paths:
+		return []
+	client = get_api_client()
+	if client:
+		workers = min(len(paths), DEFAULT_CONCURRENCY)
+		with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+			return list(executor.map(lambda p: client.get(p, params), paths))
+	results = run_commands(
+		[_get_pvesh_args(path, params) for path in paths], check=True
+	)
+	return [json.loads(r.output) for r in results]
@@ -1,6 +1,15 @@
-import subprocess
-import json
+import os
+import re
+import shlex
+import logging
 from typing import TypedDict, Required, NotRequired, Literal
+from core.proxmox.constants import PVE_CFG_JOBS, PVE_CFG_VZDUMP_CRON
+from core.utils.lazy import lazy_import
+
+api = lazy_import("core.proxmox.api")
+subprocess = lazy_import("subprocess")
+
+logger = logging.getLogger()
 
 # See https://pve.proxmox.com/pve-docs/api-viewer/#/cluster/backup/{id} for more arguments
 BackupJob = TypedDict(
@@ -13,35 +22,34 @@ BackupJob = TypedDict(
 		"mode": NotRequired[Literal["snapshot", "suspend", "stop"]],
 		"bwlimit": NotRequired[int],
 		"compress": NotRequired[Literal[0, 1, "gzip", "lzo", "zstd"]],
+		"exclude": NotRequired[str],
 	},
 )
+# Attributes holding comma separated guest IDs
+BACKUP_JOB_VMID_KEYS = ("vmid", "exclude")
+JOBS_CFG_SECTION_REGEX = r"^([a-z\-]+):\s*(\S+)\s*$"
+VZDUMP_CRON_REGEX = r"^(?:\S+\s+){5}root\s+vzdump\s+(.*)$"
 
 
 def get_all_backup_jobs() -> list[BackupJob]:
 	"""
 	PVE API Based Function, does not require remote/ssh arguments.
 	"""
-	jobs = subprocess.check_output(
-		"pvesh get /cluster/backup --output-format json-pretty".split()
-	)
-	return json.loads(jobs)
+	return api.pvesh_get("/cluster/backup")
 
 
 def get_backup_job(job_id: str) -> dict:
 	"""
 	PVE API Based Function, does not require remote/ssh arguments.
 	"""
-	jobs = subprocess.check_output(
-		f"pvesh get /cluster/backup/{job_id} --output-format json-pretty".split()
-	)
-	return json.loads(jobs)
+	return api.pvesh_get(f"/cluster/backup/{job_id}")
 
 
 def set_backup_attrs(
 	job_id: str, data: dict, raise_exception=False
 ) -> None | list:
 	"""
-	Sets a dictionary of attributes on a backup job.
+	Sets a dictionary of attributes on a backup job with a single call.
 	PVE API Based Function, does not require remote/ssh arguments.
 
 	:param str job_id: Backup Job ID, contains letters and numbers.
@@ -50,13 +58,206 @@ def set_backup_attrs(
 	:return: Keys that returned an error
 	:rtype: None | list
 	"""
-	errors = []
-	for k, v in data.items():
-		attr_call = subprocess.call(
-			f"pvesh set /cluster/backup/{job_id} -{k} {v}".split()
-		)
-		if not raise_exception and attr_call > 0:
-			errors.append(k)
-	if len(errors) < 1:
+	if not data:
 		return None
-	return errors
+	client = api.get_api_client()
+	if client:
+		try:
+			client.put(f"/cluster/backup/{job_id}", data)
+		except api.PVEAPIError:
+			if raise_exception:
+				raise
+			return list(data.keys())
+		return None
+	cmd_args = ["pvesh", "set", f"/cluster/backup/{job_id}"]
+	for k, v in data.items():
+		cmd_args += [f"-{k}", str(v)]
+	attr_call = subprocess.call(cmd_args)
+	if attr_call > 0:
+		if raise_exception:
+			raise Exception(
+				f"Bad command return code ({attr_call}).", " ".join(cmd_args)
+			)
+		return list(data.keys())
+	return None
+
+
+def parse_jobs_cfg(raw: str) -> list[BackupJob]:
+	"""Parses the vzdump sections of jobs.cfg."""
+	jobs = []
+	job = None
+	for line in raw.splitlines():
+		line = line.rstrip()
+		if not line or line.lstrip().startswith("#"):
+			continue
+		if not line[0].isspace():
+			m = re.match(JOBS_CFG_SECTION_REGEX, line)
+			job = None
+			if m and m.group(1) == "vzdump":
+				job = {"id": m.group(2)}
+				jobs.append(job)
+		elif job is not None:
+			attr = line.strip().split(None, 1)
+			job[attr[0]] = attr[1].strip() if len(attr) > 1 else ""
+	return jobs
+
+
+def parse_vzdump_cron(raw: str) -> list[BackupJob]:
+	"""
+	Parses the legacy vzdump.cron job lines.
+	Guest IDs are positional arguments, everything else is an --option.
+	"""
+	jobs = []
+	for line in raw.splitlines():
+		m = re.match(VZDUMP_CRON_REGEX, line.strip())
+		if not m:
+			continue
+		job = {}
+		vmids = []
+		args = shlex.split(m.group(1))
+		idx = 0
+		while idx < len(args):
+			arg = args[idx]
+			if arg.startswith("-"):
+				key = arg.lstrip("-")
+				if idx + 1 < len(args) and not args[idx + 1].startswith("-"):
+					job[key] = args[idx + 1]
+					idx += 1
+				else:
+					job[key] = "1"
+			else:
+				vmids.append(arg)
+			idx += 1
+		if vmids:
+			job["vmid"] = ",".join(vmids)
+		jobs.append(job)
+	return jobs
+
+
+def remap_vmid_list(vmids: str, mapping: dict[int, int]) -> str:
+	"""
+	Applies every old:new pair of mapping at once, so chained or
+	swapped IDs are remapped correctly.
+	"""
+	return ",".join(
+		str(mapping.get(int(v), v)) if v.strip().isdigit() else v
+		for v in vmids.split(",")
+	)
+
+
+class BackupJobManager:
+	"""
+	Loads every backup job once and applies guest ID remaps with a single
+	pvesh call per changed job.
+
+	Jobs are read from jobs.cfg and the legacy vzdump.cron, the PVE API is
+	only queried when a legacy job has no ID to address it with.
+	"""
+
+	def __init__(
+		self,
+		jobs_cfg_path: str | None = None,
+		vzdump_cron_path: str | None = None,
+	):
+		self.jobs_cfg_path = jobs_cfg_path or PVE_CFG_JOBS
+		self.vzdump_cron_path = vzdump_cron_path or PVE_CFG_VZDUMP_CRON
+		self._jobs: dict[str, BackupJob] | None = None
+		self._vmid_index: dict[int, set[str]] = {}
+
+	def _read_file(self, path: str) -> str | None:
+		if not os.path.isfile(path):
+			return None
+		with open(path, "r") as cfg_file:
+			return cfg_file.read()
+
+	def load(self, force=False) -> dict[str, BackupJob]:
+		if self._jobs is not None and not force:
+			return self._jobs
+		jobs: list[BackupJob] = []
+		jobs_cfg = self._read_file(self.jobs_cfg_path)
+		if jobs_cfg:
+			jobs += parse_jobs_cfg(jobs_cfg)
+		vzdump_cron = self._read_file(self.vzdump_cron_path)
+		if vzdump_cron:
+			jobs += parse_vzdump_cron(vzdump_cron)
+		if any("id" not in job for job in jobs):
+			logger.debug("Legacy backup jobs without an ID, using PVE API.")
+			jobs = get_all_backup_jobs()
+		self._jobs = {job["id"]: job for job in jobs}
+		self._build_index()
+		return self._jobs
+
+	def _build_index(self) -> None:
+		self._vmid_index = {}
+		for job_id, job in self._jobs.items():
+			for v in job.get("vmid", "").split(","):
+				if v.strip().isdigit():
+					self._vmid_index.setdefault(int(v), set()).add(job_id)
+
+	def jobs(self) -> dict[str, BackupJob]:
+		return self.load()
+
+	def jobs_containing(self, vmid: int) -> list[BackupJob]:
+		"""Returns the jobs explicitly listing vmid."""
+		jobs = self.load()
+		return [
+			jobs[job_id]
+			for job_id in sorted(self._vmid_index.get(int(vmid), ()))
+		]
+
+	def plan_remap(self, mapping: dict[int, int]) -> dict[str, dict]:
+		"""
+		Computes the minimal set of changes for a batch of guest ID remaps.
+
+		:param mapping: old_id:new_id pairs.
+		:return: job_id:changed attributes pairs, unchanged jobs are omitted.
+		"""
+		mapping = {int(k): int(v) for k, v in mapping.items()}
+		changes = {}
+		for job_id, job in self.load().items():
+			job_changes = {}
+			for k in BACKUP_JOB_VMID_KEYS:
+				if k not in job:
+					continue
+				new_value = remap_vmid_list(str(job[k]), mapping)
+				if new_value != job[k]:
+					job_changes[k] = new_value
+			if job_changes:
+				changes[job_id] = job_changes
+		return changes
+
+	def apply(self, changes: dict[str, dict], dry_run=False) -> list[str]:
+		"""
+		:return: IDs of the jobs that could not be changed.
+		:rtype: list[str]
+		"""
+		jobs = self.load()
+		failed = []
+		for job_id, job_changes in changes.items():
+			job_description = jobs.get(job_id, {}).get("comment", "")
+			job_label = (
+				f"{job_id} ({job_description})" if job_description else job_id
+			)
+			if dry_run:
+				logger.info(
+					"Fake modified backup job %s: %s", job_label, job_changes
+				)
+				continue
+			if set_backup_attrs(job_id=job_id, data=job_changes):
+				failed.append(job_id)
+				continue
+			logger.info("Modified backup job %s.", job_label)
+			if job_id in jobs:
+				jobs[job_id].update(job_changes)
+		if not dry_run:
+			self._build_index()
+		return failed
+
+	def remap(self, mapping: dict[int, int], dry_run=False) -> list[str]:
+		"""
+		Remaps guest IDs on every backup job.
+
+		:return: IDs of the jobs that could not be changed.
+		:rtype: list[str]
+		"""
+		return self.apply(self.plan_remap(mapping), dry_run=dry_run)
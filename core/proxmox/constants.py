@@ -2,9 +2,31 @@
 # BR Consulting S.R.L. 2024
 PVE_CFG_ROOT = "/etc/pve"
 PVE_CFG_NODES_DIR = f"{PVE_CFG_ROOT}/nodes"
+PVE_CFG_VMLIST = f"{PVE_CFG_ROOT}/.vmlist"
+# Cluster-wide change counters, one per tracked file
+PVE_CFG_VERSION = f"{PVE_CFG_ROOT}/.version"
 PVE_CFG_STORAGE = f"{PVE_CFG_ROOT}/storage.cfg"
 PVE_CFG_REPLICATION = f"{PVE_CFG_ROOT}/replication.cfg"
-STORAGE_TYPES = ["lvm", "lvmthin", "zfspool", "dir", "cephfs", "rbd"]
+PVE_CFG_JOBS = f"{PVE_CFG_ROOT}/jobs.cfg"
+PVE_CFG_VZDUMP_CRON = f"{PVE_CFG_ROOT}/vzdump.cron"
+PVE_CFG_USER = f"{PVE_CFG_ROOT}/user.cfg"
+# Local (per node) pvesr job state
+PVE_REPLICATION_STATE = "/var/lib/pve-manager/pve-replication-state.json"
+PVE_GUEST_SUBPATHS = ("qemu-server", "lxc")
+PVE_QEMU_RUN_DIR = "/run/qemu-server"
+# cgroup v2 (PVE 7+) and v1 container cgroup directories
+PVE_LXC_CGROUP_DIRS = ("/sys/fs/cgroup/lxc", "/sys/fs/cgroup/pids/lxc")
+STORAGE_TYPES = [
+	"lvm",
+	"lvmthin",
+	"zfspool",
+	"dir",
+	"cephfs",
+	"nfs",
+	"cifs",
+	"glusterfs",
+	"rbd",
+]
 DISK_TYPES = [
 	"ide",
 	"sata",
@@ -14,4 +36,6 @@ DISK_TYPES = [
 	"mp",
 	"rootfs",
 	"vmstate",
+	"efidisk",
+	"tpmstate",
 ]
@@ -0,0 +1,314 @@
+import re
+from core.proxmox.constants import DISK_TYPES
+from core.proxmox.guests import DiskDict, get_guest_cfg_path
+from core.utils.file_edit import write_file_atomic
+from core.utils.lazy import lazy_import
+
+hashlib = lazy_import("hashlib")
+urllib_parse = lazy_import("urllib.parse")
+
+# Keys of key=value pairs, anything else is a bare value (e.g. a volume)
+GUEST_OPTION_KEY_REGEX = re.compile(r"^[a-z][a-z0-9_\-]*$", re.IGNORECASE)
+GUEST_NET_KEY_REGEX = re.compile(r"^net([0-9]+)$")
+GUEST_CONFIG_SECTION_REGEX = re.compile(r"^\[([^\]]+)\]\s*$")
+GUEST_CONFIG_PENDING = "PENDING"
+GUEST_CONFIG_SPECIAL_PREFIX = "special:"
+# Keys holding volumes that are never media (CD-ROM) drives
+GUEST_VOLUME_KEYS = ("vmstate",)
+
+
+class GuestOption:
+	"""
+	A single configuration option, its value is only split into
+	key=value pairs and bare values when first accessed.
+	"""
+
+	__slots__ = ("key", "raw", "_values", "_bare")
+
+	def __init__(self, key: str, raw: str):
+		self.key = key
+		self.raw = raw
+		self._values: dict[str, str] | None = None
+		self._bare: list[str] | None = None
+
+	def _parse(self) -> None:
+		values = {}
+		bare = []
+		for token in self.raw.split(","):
+			if not token:
+				continue
+			k, sep, v = token.partition("=")
+			if sep and GUEST_OPTION_KEY_REGEX.match(k):
+				values[k] = v
+			else:
+				bare.append(token)
+		self._values = values
+		self._bare = bare
+
+	@property
+	def values(self) -> dict[str, str]:
+		if self._values is None:
+			self._parse()
+		return self._values
+
+	@property
+	def bare(self) -> list[str]:
+		if self._bare is None:
+			self._parse()
+		return self._bare
+
+	def get(self, k: str, default=None) -> str | None:
+		return self.values.get(k, default)
+
+	def __repr__(self):
+		return f"{self.__class__.__name__}({self.key}: {self.raw})"
+
+
+class GuestDisk(GuestOption):
+	__slots__ = ()
+
+	@property
+	def interface(self) -> str:
+		return self.key
+
+	@property
+	def volume(self) -> str | None:
+		if self.bare:
+			return self.bare[0]
+		return self.values.get("file", self.values.get("volume"))
+
+	@property
+	def storage(self) -> str | None:
+		volume = self.volume
+		if not volume or ":" not in volume:
+			return None
+		return volume.split(":", 1)[0]
+
+	@property
+	def name(self) -> str | None:
+		volume = self.volume
+		if not volume or ":" not in volume:
+			return None
+		return volume.split(":", 1)[1]
+
+	@property
+	def is_cloudinit(self) -> bool:
+		return "cloudinit" in (self.volume or "")
+
+	@property
+	def is_media(self) -> bool:
+		return "media" in self.values and not self.is_cloudinit
+
+	def to_disk_dict(self) -> DiskDict:
+		disk: DiskDict = {
+			"interface": self.interface,
+			"storage": self.storage,
+			"name": self.name,
+		}
+		if self.key not in GUEST_VOLUME_KEYS:
+			disk["raw_values"] = self.volume
+		return disk
+
+
+class GuestNet(GuestOption):
+	__slots__ = ()
+
+	@property
+	def index(self) -> int:
+		return int(GUEST_NET_KEY_REGEX.match(self.key).group(1))
+
+	@property
+	def bridge(self) -> str | None:
+		return self.values.get("bridge")
+
+	@property
+	def tag(self) -> int | None:
+		tag = self.values.get("tag")
+		return int(tag) if tag else None
+
+
+def is_guest_disk_key(key: str) -> bool:
+	return re.sub(r"[0-9]+", "", key) in DISK_TYPES
+
+
+class GuestConfig:
+	"""
+	PVE guest .conf file kept as raw lines.
+
+	Options are located with a cheap line scan and only parsed when
+	accessed, unchanged configurations are written back byte for byte.
+	Sections are addressed by name, None being the current configuration.
+	"""
+
+	__slots__ = ("_lines", "_index", "_ranges", "_options")
+
+	def __init__(self, raw: str | bytes = ""):
+		if isinstance(raw, bytes):
+			raw = raw.decode("utf-8")
+		self._lines: list[str] = raw.splitlines(keepends=True)
+		self._index: dict[str | None, dict[str, int]] | None = None
+		self._ranges: dict[str | None, tuple[int, int]] = {}
+		self._options: dict[tuple[str | None, str], GuestOption] = {}
+
+	@classmethod
+	def from_file(cls, path: str) -> "GuestConfig":
+		with open(path, "rb") as guest_conf_file:
+			return cls(guest_conf_file.read())
+
+	@classmethod
+	def from_guest_id(cls, guest_id: int) -> "GuestConfig":
+		"""Uses Proxmox FUSE Volume data, does not require remote/ssh arguments."""
+		path = get_guest_cfg_path(guest_id=guest_id)
+		if not path:
+			raise ValueError(f"Guest {guest_id} does not exist.")
+		return cls.from_file(path)
+
+	def _build_index(self) -> dict[str | None, dict[str, int]]:
+		if self._index is not None:
+			return self._index
+		index: dict[str | None, dict[str, int]] = {None: {}}
+		ranges = {}
+		section = None
+		start = 0
+		for idx, line in enumerate(self._lines):
+			if line.startswith("["):
+				section_match = GUEST_CONFIG_SECTION_REGEX.match(line)
+				if section_match:
+					ranges[section] = (start, idx)
+					section = section_match.group(1)
+					start = idx + 1
+					index.setdefault(section, {})
+					continue
+			if line.startswith("#") or ":" not in line:
+				continue
+			key = line.split(":", 1)[0].strip()
+			index[section][key] = idx
+		ranges[section] = (start, len(self._lines))
+		self._index = index
+		self._ranges = ranges
+		return index
+
+	def _invalidate(self) -> None:
+		self._index = None
+		self._options.clear()
+
+	@property
+	def digest(self) -> str:
+		"""Matches the digest reported by qm/pct config."""
+		return hashlib.sha1(self.dumps().encode("utf-8")).hexdigest()
+
+	@property
+	def description(self) -> str:
+		return self.get_description()
+
+	def get_description(self, section: str | None = None) -> str:
+		"""Returns the unquoted comment lines of a section."""
+		self._build_index()
+		start, end = self._ranges.get(section, (0, 0))
+		return "\n".join(
+			urllib_parse.unquote(line[1:].rstrip("\r\n"))
+			for line in self._lines[start:end]
+			if line.startswith("#")
+		)
+
+	def sections(self) -> list[str | None]:
+		return list(self._build_index())
+
+	def snapshots(self) -> list[str]:
+		return [
+			s
+			for s in self._build_index()
+			if s is not None
+			and s != GUEST_CONFIG_PENDING
+			and not s.startswith(GUEST_CONFIG_SPECIAL_PREFIX)
+		]
+
+	def keys(self, section: str | None = None) -> list[str]:
+		return list(self._build_index().get(section, {}))
+
+	def get(self, key: str, section: str | None = None) -> str | None:
+		"""Returns the raw, unparsed value of an option."""
+		line_idx = self._build_index().get(section, {}).get(key)
+		if line_idx is None:
+			return None
+		return self._lines[line_idx].split(":", 1)[1].strip()
+
+	def option(
+		self, key: str, section: str | None = None, cls=GuestOption
+	) -> GuestOption | None:
+		cached = self._options.get((section, key))
+		if cached is not None and isinstance(cached, cls):
+			return cached
+		raw = self.get(key, section)
+		if raw is None:
+			return None
+		option = cls(key, raw)
+		self._options[(section, key)] = option
+		return option
+
+	def disks(
+		self, section: str | None = None, exclude_media=True
+	) -> list[GuestDisk]:
+		disks = []
+		for key in self.keys(section):
+			if not is_guest_disk_key(key):
+				continue
+			disk = self.option(key, section, cls=GuestDisk)
+			if exclude_media and disk.is_media:
+				continue
+			if disk.storage is None:
+				continue
+			disks.append(disk)
+		return disks
+
+	def vmstate_disks(self) -> list[GuestDisk]:
+		"""Returns the RAM state volumes of every snapshot."""
+		disks = []
+		for snapshot in self.snapshots():
+			disk = self.option("vmstate", snapshot, cls=GuestDisk)
+			if disk and disk.storage is not None:
+				disks.append(disk)
+		return disks
+
+	def nets(self, section: str | None = None) -> dict[int, GuestNet]:
+		nets = {}
+		for key in self.keys(section):
+			if GUEST_NET_KEY_REGEX.match(key):
+				net = self.option(key, section, cls=GuestNet)
+				nets[net.index] = net
+		return nets
+
+	def set(self, key: str, value, section: str | None = None) -> None:
+		index = self._build_index()
+		if section not in index:
+			raise KeyError(f"Section {section} does not exist.")
+		line = f"{key}: {value}\n"
+		line_idx = index[section].get(key)
+		if line_idx is not None:
+			self._lines[line_idx] = line
+		else:
+			start, end = self._ranges[section]
+			insert_idx = start
+			for idx in range(start, end):
+				if self._lines[idx].strip():
+					insert_idx = idx + 1
+			if insert_idx > 0 and not self._lines[insert_idx - 1].endswith(
+				"\n"
+			):
+				self._lines[insert_idx - 1] += "\n"
+			self._lines.insert(insert_idx, line)
+		self._invalidate()
+
+	def delete(self, key: str, section: str | None = None) -> bool:
+		line_idx = self._build_index().get(section, {}).get(key)
+		if line_idx is None:
+			return False
+		del self._lines[line_idx]
+		self._invalidate()
+		return True
+
+	def dumps(self) -> str:
+		return "".join(self._lines)
+
+	def write(self, path: str) -> None:
+		write_file_atomic(path, self.dumps())
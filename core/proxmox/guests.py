@@ -2,13 +2,34 @@
 # BR Consulting S.R.L. 2024
 import os
 import re
+import json
 import logging
-import subprocess
-from .constants import PVE_CFG_NODES_DIR
+import threading
+from .constants import (
+	PVE_CFG_NODES_DIR,
+	PVE_CFG_VERSION,
+	PVE_CFG_VMLIST,
+	PVE_GUEST_SUBPATHS,
+	PVE_QEMU_RUN_DIR,
+	PVE_LXC_CGROUP_DIRS,
+)
 from sys import getdefaultencoding
 from typing import TypedDict, Literal, overload, NotRequired
 from enum import Enum
+from dataclasses import dataclass
+from copy import deepcopy
 from core.proxmox.constants import DISK_TYPES, PVE_CFG_REPLICATION
+from core.utils.ssh import get_remote_args
+from core.utils.command import run_command
+from core.utils.file_edit import Substitution, edit_file
+from core.utils.lazy import lazy_import
+
+# Off the startup path of every guest script, only used by a few helpers
+api = lazy_import("core.proxmox.api")
+# Imports this module, only resolved once its functions run
+guest_config = lazy_import("core.proxmox.guest_config")
+socket = lazy_import("socket")
+subprocess = lazy_import("subprocess")
 
 logger = logging.getLogger()
 
@@ -27,12 +48,177 @@ class DiskDict(TypedDict):
 	name: str
 
 
+GUEST_CONF_REGEX = r"^[0-9]+.conf$"
+# pmxcfs .vmlist guest types
+VMLIST_TYPES = {"qemu": "qemu-server", "lxc": "lxc"}
+
+
+@dataclass(frozen=True)
+class GuestIndexEntry:
+	"""Location of a single guest configuration within pmxcfs."""
+
+	host: str
+	subpath: str
+	path: str
+
+	@property
+	def type(self) -> str:
+		if self.subpath == "lxc":
+			return PveGuestType.LINUX_CONTAINER.value
+		return PveGuestType.VIRTUAL_MACHINE.value
+
+
+class GuestIndex:
+	"""
+	Maps every guest ID in the cluster to its host, type and config path.
+
+	Loaded from pmxcfs's .vmlist when available, otherwise from a single
+	scan of the nodes directory. The index is rebuilt whenever the vmlist
+	counter in pmxcfs's .version changes, a single small read per lookup.
+	Without .version, whenever the mtime of the nodes directory or of any
+	node's qemu-server/lxc directory changes.
+	"""
+
+	def __init__(
+		self,
+		nodes_dir: str | None = None,
+		vmlist_path: str | None = None,
+		version_path: str | None = None,
+	):
+		self.nodes_dir = nodes_dir or PVE_CFG_NODES_DIR
+		self.vmlist_path = vmlist_path or PVE_CFG_VMLIST
+		self.version_path = version_path or PVE_CFG_VERSION
+		self._entries: dict[int, GuestIndexEntry] = {}
+		self._signature: tuple | None = None
+		self._lock = threading.Lock()
+		# Set when a PVEWatcher invalidates the index on changes
+		self.watched = False
+		self._stale = True
+
+	def _get_version(self) -> int | None:
+		try:
+			with open(self.version_path, "r") as version_file:
+				return int(json.load(version_file)["vmlist"])
+		except (OSError, ValueError, KeyError, TypeError):
+			return None
+
+	def _get_signature(self) -> tuple | None:
+		if not os.path.isdir(self.nodes_dir):
+			return None
+		version = self._get_version()
+		if version is not None:
+			return ("version", version)
+		signature = [os.stat(self.nodes_dir).st_mtime_ns]
+		with os.scandir(self.nodes_dir) as nodes:
+			for node in sorted(nodes, key=lambda n: n.name):
+				if not node.is_dir():
+					continue
+				for subp in PVE_GUEST_SUBPATHS:
+					try:
+						mtime = os.stat(
+							os.path.join(node.path, subp)
+						).st_mtime_ns
+					except FileNotFoundError:
+						mtime = None
+					signature.append((node.name, subp, mtime))
+		return tuple(signature)
+
+	def _make_entry(self, guest_id: int, host: str, subp: str):
+		return GuestIndexEntry(
+			host=host,
+			subpath=subp,
+			path=f"{self.nodes_dir}/{host}/{subp}/{guest_id}.conf",
+		)
+
+	def _load_vmlist(self) -> dict[int, GuestIndexEntry] | None:
+		try:
+			with open(self.vmlist_path, "r") as vmlist_file:
+				vmlist = json.load(vmlist_file)
+		except (OSError, ValueError):
+			return None
+		entries = {}
+		try:
+			for guest_id, guest in vmlist["ids"].items():
+				subp = VMLIST_TYPES.get(guest["type"])
+				if not subp:
+					continue
+				entries[int(guest_id)] = self._make_entry(
+					guest_id, guest["node"], subp
+				)
+		except (KeyError, TypeError, ValueError, AttributeError):
+			logger.debug(
+				"Could not parse %s, scanning nodes.", self.vmlist_path
+			)
+			return None
+		return entries
+
+	def _scan(self) -> dict[int, GuestIndexEntry]:
+		entries = {}
+		with os.scandir(self.nodes_dir) as nodes:
+			for node in nodes:
+				if not node.is_dir():
+					continue
+				for subp in PVE_GUEST_SUBPATHS:
+					try:
+						confs = os.scandir(os.path.join(node.path, subp))
+					except FileNotFoundError:
+						continue
+					with confs:
+						for conf in confs:
+							if not re.match(GUEST_CONF_REGEX, conf.name):
+								continue
+							guest_id = int(conf.name.removesuffix(".conf"))
+							entries[guest_id] = self._make_entry(
+								guest_id, node.name, subp
+							)
+		return entries
+
+	def invalidate(self) -> None:
+		self._stale = True
+
+	def refresh(self, force=False) -> None:
+		if self.watched and not self._stale and not force:
+			return
+		with self._lock:
+			# Cleared first, an invalidation while rebuilding is kept
+			self._stale = False
+			signature = self._get_signature()
+			if not force and signature == self._signature:
+				return
+			entries = {}
+			if signature is not None:
+				entries = self._load_vmlist()
+				if entries is None:
+					entries = self._scan()
+			# Readers never see a new signature with the old entries
+			self._signature, self._entries = signature, entries
+
+	def get(self, guest_id: int) -> GuestIndexEntry | None:
+		self.refresh()
+		return self._entries.get(int(guest_id))
+
+	def exists(self, guest_id: int) -> bool:
+		return self.get(guest_id) is not None
+
+	def all(self) -> dict[int, GuestIndexEntry]:
+		self.refresh()
+		return self._entries
+
+
+_guest_index: GuestIndex | None = None
+
+
+def get_guest_index() -> GuestIndex:
+	"""Returns the process-wide GuestIndex."""
+	global _guest_index
+	if _guest_index is None:
+		_guest_index = GuestIndex()
+	return _guest_index
+
+
 def get_guest_exists(guest_id: int):
 	guest_id = int(guest_id)
-	if not os.path.isdir(PVE_CFG_NODES_DIR):
-		return False
-	guest_list = get_all_guests()
-	return guest_id in guest_list["vm"] or guest_id in guest_list["ct"]
+	return get_guest_index().exists(guest_id)
 
 
 @overload
@@ -71,25 +257,21 @@ def get_guest_cfg_path(
 	* type [ct|vm]
 	* subpath [lxc|vm]
 	"""
-	for h in os.listdir(PVE_CFG_NODES_DIR):
-		for subp in ["qemu-server", "lxc"]:
-			p = f"{PVE_CFG_NODES_DIR}/{h}/{subp}/{guest_id}.conf"
-			if os.path.isfile(p):
-				guest_type = PveGuestType.VIRTUAL_MACHINE.value
-				if subp == "lxc":
-					guest_type = PveGuestType.LINUX_CONTAINER.value
-				if get_as_dict:
-					return {
-						"path": p,
-						"host": h,
-						"type": guest_type,
-						"subpath": subp,
-					}
-				if get_host:
-					return h
-				if get_type:
-					return subp
-				return p
+	entry = get_guest_index().get(guest_id)
+	if not entry:
+		return None
+	if get_as_dict:
+		return {
+			"path": entry.path,
+			"host": entry.host,
+			"type": entry.type,
+			"subpath": entry.subpath,
+		}
+	if get_host:
+		return entry.host
+	if get_type:
+		return entry.subpath
+	return entry.path
 
 
 def get_guest_is_ct(guest_id: int) -> bool:
@@ -101,7 +283,162 @@ def get_guest_is_ct(guest_id: int) -> bool:
 	return True
 
 
+GUEST_STATUS_RUNNING = "running"
+GUEST_STATUS_STOPPED = "stopped"
+
+
+def get_vm_is_running(guest_id: int) -> bool:
+	"""
+	Whether a Virtual Machine runs on the local host, reads its QEMU PID
+	file instead of forking qm.
+	"""
+	try:
+		with open(f"{PVE_QEMU_RUN_DIR}/{guest_id}.pid", "r") as f:
+			pid = int(f.read().strip())
+		with open(f"/proc/{pid}/cmdline", "rb") as f:
+			cmdline = f.read()
+	except (OSError, ValueError):
+		return False
+	# Guard against PID re-use by another process
+	return f"-id\0{guest_id}\0".encode() in cmdline
+
+
+def get_ct_is_running(guest_id: int) -> bool:
+	"""
+	Whether a Linux Container runs on the local host, checks its LXC
+	cgroup instead of forking pct.
+	"""
+	return any(
+		os.path.isdir(f"{cgroup_dir}/{guest_id}")
+		for cgroup_dir in PVE_LXC_CGROUP_DIRS
+	)
+
+
+def get_running_vm_ids() -> set[int]:
+	"""
+	Returns the IDs of Virtual Machines running on the local host.
+	Reads QEMU PID files, does not fork any qm processes.
+	"""
+	running = set()
+	try:
+		pid_files = os.scandir(PVE_QEMU_RUN_DIR)
+	except FileNotFoundError:
+		return running
+	with pid_files:
+		for pid_file in pid_files:
+			if not pid_file.name.endswith(".pid"):
+				continue
+			guest_id = pid_file.name.removesuffix(".pid")
+			if guest_id.isdigit() and get_vm_is_running(guest_id):
+				running.add(int(guest_id))
+	return running
+
+
+def get_running_ct_ids() -> set[int]:
+	"""
+	Returns the IDs of Linux Containers running on the local host.
+	Reads the LXC cgroup tree, does not fork any pct processes.
+	"""
+	running = set()
+	for cgroup_dir in PVE_LXC_CGROUP_DIRS:
+		try:
+			entries = os.scandir(cgroup_dir)
+		except FileNotFoundError:
+			continue
+		with entries:
+			for entry in entries:
+				if entry.name.isdigit() and entry.is_dir():
+					running.add(int(entry.name))
+	return running
+
+
+def get_local_guest_statuses(filter_ids: list | dict = []) -> dict[int, str]:
+	"""
+	Returns a guest_id:status map for every guest on the local host.
+	"""
+	if isinstance(filter_ids, dict):
+		filter_ids = list(filter_ids.keys())
+	filter_ids = {int(v) for v in filter_ids}
+	hostname = socket.gethostname()
+	running_vms = get_running_vm_ids()
+	running_cts = get_running_ct_ids()
+	statuses = {}
+	for guest_id, entry in get_guest_index().all().items():
+		if entry.host != hostname:
+			continue
+		if filter_ids and guest_id not in filter_ids:
+			continue
+		if entry.type == PveGuestType.LINUX_CONTAINER.value:
+			is_running = guest_id in running_cts
+		else:
+			is_running = guest_id in running_vms
+		statuses[guest_id] = (
+			GUEST_STATUS_RUNNING if is_running else GUEST_STATUS_STOPPED
+		)
+	return statuses
+
+
+# /cluster/resources guest types
+CLUSTER_RESOURCE_TYPES = {"qemu": "vm", "lxc": "ct"}
+
+
+def get_cluster_resources(
+	resource_type: str | None = "vm", remote_args: list[str] | None = None
+) -> list[dict]:
+	"""
+	Returns cluster resources (guests by default) with a single
+	/cluster/resources API call.
+	"""
+	client = api.get_api_client()
+	if client:
+		# Cluster-wide, no need to query through a remote node
+		return client.get("/cluster/resources", {"type": resource_type})
+	cmd_args = "pvesh get /cluster/resources --output-format json".split()
+	if resource_type:
+		cmd_args += ["--type", resource_type]
+	if remote_args:
+		cmd_args = remote_args + cmd_args
+	return json.loads(run_command(cmd_args, check=True).output)
+
+
+def get_cluster_guest_statuses(
+	node: str | None = None, remote_args: list[str] | None = None
+) -> dict[int, str]:
+	"""
+	Returns a guest_id:status map for every guest in the cluster, or only
+	the ones on node, with a single /cluster/resources API call.
+	"""
+	resources = get_cluster_resources(remote_args=remote_args)
+	statuses = {}
+	for resource in resources:
+		if node and resource.get("node") != node:
+			continue
+		statuses[int(resource["vmid"])] = resource["status"]
+	return statuses
+
+
+def get_guest_statuses(node: str | None = None) -> dict[int, str]:
+	"""
+	Returns a guest_id:status map for node, or for the whole cluster when
+	node is None.
+	Local guests are resolved from runtime state without forking.
+	"""
+	if node and node == socket.gethostname():
+		return get_local_guest_statuses()
+	return get_cluster_guest_statuses(node=node)
+
+
 def get_guest_status(guest_id: int, remote_args: list[str] | None = None):
+	# Local guests are resolved from runtime state
+	if not remote_args:
+		entry = get_guest_index().get(guest_id)
+		if entry and entry.host == socket.gethostname():
+			if entry.type == PveGuestType.LINUX_CONTAINER.value:
+				is_running = get_ct_is_running(guest_id)
+			else:
+				is_running = get_vm_is_running(guest_id)
+			return GUEST_STATUS_RUNNING if is_running else GUEST_STATUS_STOPPED
+
 	# CT
 	if get_guest_is_ct(guest_id):
 		cmd_args = ["pct"]
@@ -111,41 +448,55 @@ def get_guest_status(guest_id: int, remote_args: list[str] | None = None):
 	cmd_args = cmd_args + ["status", str(guest_id)]
 	if remote_args:
 		cmd_args = remote_args + cmd_args
-	with subprocess.Popen(cmd_args, stdout=subprocess.PIPE) as proc:
-		proc_o, proc_e = proc.communicate()
-		if proc.returncode != 0:
-			raise Exception(
-				f"Bad command return code ({proc.returncode}).",
-				proc_o.decode(),
-				proc_e.decode(),
-			)
-		result = proc_o.decode().split("\n")
-		return result[0].strip().split(": ")[-1]
-
-
-GUEST_CONF_REGEX = r"^[0-9]+.conf$"
+	result = run_command(cmd_args, check=True).output.split("\n")
+	return result[0].strip().split(": ")[-1]
 
 
 def get_all_guests(filter_ids: list | dict = []):
 	if isinstance(filter_ids, dict):
 		filter_ids = list(filter_ids.keys())
+	filter_ids = {int(v) for v in filter_ids}
 	guests = {}
 	guests["vm"] = []
 	guests["ct"] = []
-	for host in os.listdir(PVE_CFG_NODES_DIR):
-		for i in os.listdir(f"{PVE_CFG_NODES_DIR}/{host}/qemu-server/"):
-			if re.match(GUEST_CONF_REGEX, i):
-				guest_id = int(i.rstrip(".conf"))
-				if guest_id in filter_ids or len(filter_ids) < 1:
-					guests["vm"].append(guest_id)
-		for i in os.listdir(f"{PVE_CFG_NODES_DIR}/{host}/lxc/"):
-			if re.match(GUEST_CONF_REGEX, i):
-				guest_id = int(i.rstrip(".conf"))
-				if guest_id in filter_ids or len(filter_ids) < 1:
-					guests["ct"].append(guest_id)
+	for guest_id, entry in get_guest_index().all().items():
+		if guest_id in filter_ids or len(filter_ids) < 1:
+			guests[entry.type].append(guest_id)
 	return guests
 
 
+def parse_net_opts_from_string(net_opts: str) -> dict:
+	net_opts_parsed = {}
+	for o in net_opts.split(","):
+		k, v = o.split("=", 1)
+		net_opts_parsed[k] = v
+	return net_opts_parsed
+
+
+def get_guest_net_cfgs(
+	filter_ids: list | dict = [],
+) -> dict[int, dict[int, dict]]:
+	"""
+	Reads the current netN options of many guests straight from their
+	configuration files, in a single pass over the guest index.
+	Uses Proxmox FUSE Volume data, does not require remote/ssh arguments.
+
+	:return: guest_id:{net_id:net_opts} pairs.
+	"""
+	if isinstance(filter_ids, dict):
+		filter_ids = list(filter_ids.keys())
+	filter_ids = {int(v) for v in filter_ids}
+	net_cfgs = {}
+	for guest_id, entry in get_guest_index().all().items():
+		if filter_ids and guest_id not in filter_ids:
+			continue
+		nets = guest_config.GuestConfig.from_file(entry.path).nets()
+		net_cfgs[guest_id] = {
+			net_id: dict(net.values) for net_id, net in nets.items()
+		}
+	return net_cfgs
+
+
 def parse_net_opts_to_string(net_opts: dict) -> str:
 	r = ""
 	for k, v in net_opts.items():
@@ -161,6 +512,13 @@ def get_guest_snapshots(guest_id: int, remote_args: list | None = None) -> list:
 		raise ValueError("guest_id must be of type int.")
 	else:
 		guest_id = int(guest_id)
+
+	# Snapshot sections are readable from pmxcfs on any cluster node
+	guest_cfg_path = get_guest_cfg_path(guest_id=guest_id)
+	if guest_cfg_path and os.path.isfile(guest_cfg_path):
+		guest_conf = read_guest_conf(guest_id=guest_id, path=guest_cfg_path)
+		return list(guest_conf["snapshots"].keys())
+
 	snapshots = []
 	if get_guest_is_ct(guest_id):
 		proc_cmd = "pct"
@@ -183,6 +541,128 @@ def get_guest_snapshots(guest_id: int, remote_args: list | None = None) -> list:
 	return snapshots
 
 
+def parse_guest_cfg_option(guest_cfg: dict, option_k: str, option_v: str):
+	"""
+	Parses a single guest configuration option onto guest_cfg.
+
+	Comma separated values become a dict, with key=value pairs as items
+	and volumes or bare values in the raw_values list.
+	"""
+	# If Option has multiple key/value pairs in it (Comma separated)
+	if "," in option_v:
+		if option_k not in guest_cfg:
+			guest_cfg[option_k] = {}
+		option_v = option_v.replace(",,", ",").split(",")
+		for sub_v in option_v:
+			# Guess Separator
+			fs = None
+			for sep in ["=", ":"]:
+				if sep in sub_v and sub_v.count(sep) == 1:
+					fs = sep
+			# If separator is equal assume it's not a Volume/Disk path.
+			if fs == "=":
+				k, v = sub_v.split(fs)
+				try:
+					v = int(v)
+				except Exception:
+					pass
+				guest_cfg[option_k][k] = v
+			# If it's a raw value
+			else:
+				if not sub_v or sub_v.lower() == "none":
+					continue
+				if "raw_values" not in guest_cfg[option_k]:
+					guest_cfg[option_k]["raw_values"] = []
+				try:
+					sub_v = int(sub_v)
+				except Exception:
+					pass
+				guest_cfg[option_k]["raw_values"].append(sub_v)
+	else:
+		try:
+			option_v = int(option_v)
+		except ValueError:
+			pass
+		guest_cfg[option_k] = option_v
+	return guest_cfg
+
+
+class GuestConfDict(TypedDict):
+	digest: str
+	current: dict
+	pending: dict
+	snapshots: dict[str, dict]
+
+
+def get_guest_conf_dict(config) -> GuestConfDict:
+	"""
+	Returns every section of a GuestConfig with the same shape as
+	parse_guest_cfg, for callers working with option dicts.
+	"""
+	result: GuestConfDict = {
+		"digest": config.digest,
+		"current": {},
+		"pending": {},
+		"snapshots": {},
+	}
+	for section in config.sections():
+		if section is None:
+			section_cfg = result["current"]
+		elif section == guest_config.GUEST_CONFIG_PENDING:
+			section_cfg = result["pending"]
+		elif section.startswith(guest_config.GUEST_CONFIG_SPECIAL_PREFIX):
+			# Not part of the guest configuration (e.g. [special:cloudinit])
+			continue
+		else:
+			section_cfg = result["snapshots"].setdefault(section, {})
+		for option_k in config.keys(section):
+			parse_guest_cfg_option(
+				section_cfg, option_k, config.get(option_k, section)
+			)
+		description = config.get_description(section)
+		if description:
+			section_cfg["description"] = description
+	return result
+
+
+def parse_guest_conf(raw: str | bytes) -> GuestConfDict:
+	"""
+	Parses the contents of a PVE guest .conf file.
+
+	Every section is returned with the same shape as parse_guest_cfg,
+	the digest matches the one reported by qm/pct config.
+	"""
+	return get_guest_conf_dict(guest_config.GuestConfig(raw))
+
+
+def read_guest_conf(guest_id: int, path: str | None = None) -> GuestConfDict:
+	"""
+	Reads a guest's configuration, pending changes and snapshots
+	from pmxcfs in a single file read.
+	Uses Proxmox FUSE Volume data, does not require remote/ssh arguments.
+	"""
+	if not path:
+		path = get_guest_cfg_path(guest_id=guest_id)
+	if not path:
+		raise ValueError(f"Guest {guest_id} does not exist.")
+	return get_guest_conf_dict(guest_config.GuestConfig.from_file(path))
+
+
+def apply_guest_conf_pending(guest_conf: GuestConfDict) -> dict:
+	"""Returns the current configuration with pending changes applied."""
+	guest_cfg = deepcopy(guest_conf["current"])
+	pending = deepcopy(guest_conf["pending"])
+	pending_delete = pending.pop("delete", None)
+	if isinstance(pending_delete, dict):
+		pending_delete = pending_delete.get("raw_values", [])
+	elif pending_delete is not None:
+		pending_delete = [pending_delete]
+	for option_k in pending_delete or []:
+		guest_cfg.pop(str(option_k).lstrip("!"), None)
+	guest_cfg.update(pending)
+	return guest_cfg
+
+
 def parse_guest_cfg(
 	guest_id: int,
 	remote_args: list | None = None,
@@ -204,6 +684,32 @@ def parse_guest_cfg(
 			snapshot_name,
 		)
 
+	if current and snapshot_name:
+		raise ValueError(
+			"The current and snapshot args cannot be used at the same time."
+		)
+
+	# Read config file from pmxcfs directly when possible
+	guest_cfg_path = get_guest_cfg_path(guest_id=guest_id)
+	if guest_cfg_path and os.path.isfile(guest_cfg_path):
+		if debug:
+			logger.debug("Reading Guest config from %s", guest_cfg_path)
+		guest_conf = read_guest_conf(guest_id=guest_id, path=guest_cfg_path)
+		if snapshot_name:
+			if snapshot_name not in guest_conf["snapshots"]:
+				raise ValueError(
+					f"Snapshot {snapshot_name} does not exist for Guest {guest_id}."
+				)
+			guest_cfg = guest_conf["snapshots"][snapshot_name]
+		elif current:
+			guest_cfg = guest_conf["current"]
+		else:
+			guest_cfg = apply_guest_conf_pending(guest_conf)
+		guest_cfg["digest"] = guest_conf["digest"]
+		if debug:
+			logger.debug("Parsed Guest config: %s", guest_cfg)
+		return guest_cfg
+
 	guest_cfg = {}
 	if get_guest_is_ct(guest_id):
 		proc_cmd = "pct"
@@ -211,10 +717,6 @@ def parse_guest_cfg(
 		proc_cmd = "qm"
 
 	cmd_args = [f"/usr/sbin/{proc_cmd}", "config", str(guest_id)]
-	if current and snapshot_name:
-		raise ValueError(
-			"The current and snapshot args cannot be used at the same time."
-		)
 	if snapshot_name:
 		cmd_args.insert(len(cmd_args) - 1, "--snapshot")
 		cmd_args.insert(len(cmd_args) - 1, snapshot_name)
@@ -225,64 +727,18 @@ def parse_guest_cfg(
 	if debug:
 		logger.debug(cmd_args)
 
-	with subprocess.Popen(
-		cmd_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-	) as proc:
-		proc_o, proc_e = proc.communicate()
-		if proc.returncode != 0:
-			raise Exception(
-				f"Bad command return code ({proc.returncode}).",
-				proc_o.decode(),
-				proc_e.decode(),
-			)
+	result = run_command(cmd_args, check=True)
+	if debug:
+		logger.debug("Showing parsed Guest config lines:")
+	for line in result.stdout.decode("utf-8").split("\n"):
+		line = line.rstrip()
 		if debug:
-			logger.debug("Showing parsed Guest config lines:")
-		for line in proc_o.decode("utf-8").split("\n"):
-			line = line.rstrip()
-			if debug:
-				logger.debug(line)
-			if len(line.strip()) == 0:
-				continue
-			line_split = line.split(": ")
-			option_k = line_split[0]
-			option_v = line_split[-1]
-			# If Option has multiple key/value pairs in it (Comma separated)
-			if "," in option_v:
-				if option_k not in guest_cfg:
-					guest_cfg[option_k] = {}
-				option_v = option_v.replace(",,", ",").split(",")
-				for sub_v in option_v:
-					# Guess Separator
-					fs = None
-					for sep in ["=", ":"]:
-						if sep in sub_v and sub_v.count(sep) == 1:
-							fs = sep
-					# If separator is equal assume it's not a Volume/Disk path.
-					if fs == "=":
-						k, v = sub_v.split(fs)
-						try:
-							v = int(v)
-						except Exception:
-							pass
-						guest_cfg[option_k][k] = v
-					# If it's a raw value
-					else:
-						if not sub_v or sub_v.lower() == "none":
-							continue
-						if "raw_values" not in guest_cfg[option_k]:
-							guest_cfg[option_k]["raw_values"] = []
-						try:
-							sub_v = int(sub_v)
-						except Exception:
-							pass
-						guest_cfg[option_k]["raw_values"].append(sub_v)
-			else:
-				try:
-					option_v = int(option_v)
-				except ValueError:
-					pass
-				guest_cfg[option_k] = option_v
-		return guest_cfg
+			logger.debug(line)
+		if len(line.strip()) == 0:
+			continue
+		line_split = line.split(": ")
+		parse_guest_cfg_option(guest_cfg, line_split[0], line_split[-1])
+	return guest_cfg
 
 
 def parse_guest_net_cfg(
@@ -301,29 +757,17 @@ def parse_guest_net_cfg(
 
 	cmd_args = [f"/usr/sbin/{proc_cmd}", "config", str(guest_id), "--current"]
 	if remote:
-		cmd_args = ["/usr/bin/ssh", f"{remote_user}@{remote_host}"] + cmd_args
+		cmd_args = get_remote_args(remote_host, remote_user) + cmd_args
 	if debug:
 		logger.debug(cmd_args)
-	with subprocess.Popen(cmd_args, stdout=subprocess.PIPE) as proc:
-		proc_o, proc_e = proc.communicate()
-		if proc.returncode != 0:
-			raise Exception(
-				f"Bad command return code ({proc.returncode}).",
-				proc_o.decode(),
-				proc_e.decode(),
-			)
-		for line in proc_o.decode().split("\n"):
-			line = line.rstrip()
-			if re.search(r"^net[0-9]+:.*$", line):
-				line_split = line.split(": ")
-				net_index = line_split[0].lstrip("net")
-				net_opts = line_split[-1].split(",")
-				net_opts_parsed = {}
-				for o in net_opts:
-					k, v = o.split("=")
-					net_opts_parsed[k] = v
-				net_cfg[int(net_index)] = net_opts_parsed
-		return net_cfg
+	result = run_command(cmd_args, check=True)
+	for line in result.output.split("\n"):
+		line = line.rstrip()
+		if re.search(r"^net[0-9]+:.*$", line):
+			line_split = line.split(": ")
+			net_index = line_split[0].lstrip("net")
+			net_cfg[int(net_index)] = parse_net_opts_from_string(line_split[-1])
+	return net_cfg
 
 
 def is_valid_guest_disk_type(
@@ -340,7 +784,9 @@ def is_valid_guest_disk_type(
 	return True
 
 
-def rename_guest_replication_jobs(old_id: int, new_id: int) -> None:
+def rename_guest_replication_jobs(
+	old_id: int, new_id: int, dry_run=False
+) -> None:
 	"""
 	Renames Replication Jobs in the default PVE Replication Config File
 	This function is NOT RECOMMENDED as it does not modify remote replicated disks.
@@ -353,22 +799,16 @@ def rename_guest_replication_jobs(old_id: int, new_id: int) -> None:
 		new_id,
 		PVE_CFG_REPLICATION,
 	)
-	sed_regex = rf"s/^local: {old_id}-\(.*\)$/local: {new_id}-\1/g"
-	rpl_cmd_args = [
-		"/usr/bin/sed",
-		"-i",
-		sed_regex,  # Sed F String Regex
+	edit_file(
 		PVE_CFG_REPLICATION,
-	]
-	logger.debug("Executing command:" + " ".join(rpl_cmd_args))
-	with subprocess.Popen(rpl_cmd_args, stdout=subprocess.PIPE) as proc:
-		proc_o, proc_e = proc.communicate()
-		if proc.returncode != 0:
-			raise Exception(
-				f"Bad command return code ({proc.returncode}).",
-				proc_o.decode(),
-				proc_e.decode(),
+		[
+			Substitution(
+				pattern=rf"^local: {old_id}-(.*)$",
+				replacement=rf"local: {new_id}-\1",
 			)
+		],
+		dry_run=dry_run,
+	)
 	return
 
 
@@ -409,36 +849,6 @@ def get_guest_replication_jobs(old_id: int) -> dict:
 	return jobs
 
 
-def get_guest_replication_statuses(
-	guest_id: int, remote_args: list | None = None, raise_exception=False
-) -> dict:
-	"""
-	:return: Dictionary with id:status pairs
-	:rtype: dict
-	"""
-	cmd = f"pvesr status --guest {guest_id}"
-	if remote_args:
-		cmd = remote_args + cmd.split()
-	data = {}
-	job_statuses = None
-	if raise_exception:
-		job_statuses = subprocess.check_output(cmd)
-	else:
-		try:
-			job_statuses = subprocess.check_output(cmd)
-		except:
-			pass
-	if job_statuses:
-		job_statuses = job_statuses.decode("utf-8").splitlines()
-		job_statuses.pop(0)
-		for line in job_statuses:
-			_job_idx = 0
-			_status_idx = -1
-			_parsed_line = line.split()
-			data[_parsed_line[_job_idx]] = _parsed_line[_status_idx]
-	return data
-
-
 def parse_guest_disk(
 	disk_name, disk_values: str | dict, vmstate=False
 ) -> DiskDict | None:
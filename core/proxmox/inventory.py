@@ -0,0 +1,494 @@
+# Author: Dylan Blanqué
+# BR Consulting S.R.L. 2024
+import os
+import re
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Literal
+from .guests import GuestIndex, get_guest_index
+from .guest_config import GuestConfig
+from .storage import (
+	FILE_STORAGE_TYPES,
+	PVEStorage,
+	StorageConfig,
+	get_storage_config,
+)
+from core.utils.command import CommandResult, get_command_runner
+from core.utils.lazy import lazy_import
+from core.utils.ssh import get_remote_args
+
+asyncio = lazy_import("asyncio")
+socket = lazy_import("socket")
+
+logger = logging.getLogger()
+
+# vm-100-disk-0, subvol-101-disk-0, base-100-disk-0.qcow2, vm-100-state-snap1
+PVE_VOLUME_NAME_REGEX = re.compile(
+	r"^(?:vm|base|subvol|basevol)-([0-9]+)-(.+?)(?:\.(raw|qcow2|vmdk))?$"
+)
+# Storage types whose volumes are visible from every node
+SHARED_STORAGE_TYPES = ("rbd", "cephfs", "nfs", "cifs", "glusterfs")
+# Storage types holding guest images that cannot be listed
+UNLISTED_STORAGE_TYPES = ("btrfs", "zfs")
+PVE_CEPH_KEYRING_DIR = "/etc/pve/priv/ceph"
+VolumeState = Literal[
+	"referenced", "orphaned", "unreferenced", "misnamed", "missing"
+]
+
+
+@dataclass
+class StorageVolume:
+	"""A single image found on a storage backend."""
+
+	storage: str
+	name: str
+	size: int | None = None
+
+	@property
+	def volume_id(self) -> str:
+		return f"{self.storage}:{self.name}"
+
+	@property
+	def guest_id(self) -> int | None:
+		"""Owner Guest ID, from the volume name."""
+		m = PVE_VOLUME_NAME_REGEX.match(os.path.basename(self.name))
+		return int(m.group(1)) if m else None
+
+	@property
+	def dir_guest_id(self) -> int | None:
+		"""Guest ID of the images/<id>/ directory, for file storages."""
+		if "/" not in self.name:
+			return None
+		dir_id = self.name.split("/", 1)[0]
+		return int(dir_id) if dir_id.isdigit() else None
+
+
+@dataclass
+class InventoryReport:
+	node: str
+	volumes: dict[str, list[StorageVolume]] = field(default_factory=dict)
+	# volume_id:[guest_id, ...] of every volume referenced in a config
+	references: dict[str, list[int]] = field(default_factory=dict)
+	states: dict[str, VolumeState] = field(default_factory=dict)
+	# storage:error pairs of backends that could not be listed
+	errors: dict[str, str] = field(default_factory=dict)
+
+	def by_state(self, state: VolumeState) -> list[str]:
+		return sorted(v for v, s in self.states.items() if s == state)
+
+
+def storage_is_shared(storage: PVEStorage) -> bool:
+	if storage.type in SHARED_STORAGE_TYPES:
+		return True
+	return str(getattr(storage, "shared", "0")) == "1"
+
+
+def storage_is_on_node(storage: PVEStorage | dict, node: str) -> bool:
+	""":param storage: PVEStorage or raw storage.cfg section."""
+	attrs = storage if isinstance(storage, dict) else vars(storage)
+	if str(attrs.get("disable", "0")) == "1":
+		return False
+	nodes = attrs.get("nodes")
+	if not nodes:
+		return True
+	return node in [n.strip() for n in nodes.split(",")]
+
+
+def get_lvs_cmd(vgname: str) -> list[str]:
+	return [
+		"/usr/sbin/lvs",
+		"--reportformat",
+		"json",
+		"--units",
+		"b",
+		"--nosuffix",
+		"-o",
+		"lv_name,lv_size,lv_attr,pool_lv",
+		vgname,
+	]
+
+
+def parse_lvs_report(raw: str) -> list[dict]:
+	lvs = []
+	for report in json.loads(raw).get("report", []):
+		lvs += report.get("lv", [])
+	return lvs
+
+
+def get_zfs_list_cmd(pool: str) -> list[str]:
+	return [
+		"/usr/sbin/zfs",
+		"list",
+		"-H",
+		"-p",
+		"-o",
+		"name,used,volsize",
+		"-t",
+		"filesystem,volume",
+		"-r",
+		pool,
+	]
+
+
+def parse_zfs_list(raw: str, pool: str) -> list[tuple[str, int | None]]:
+	"""
+	:return: (name, size) pairs of the pool's direct children, PVE does not
+	nest its datasets.
+	"""
+	datasets = []
+	prefix = pool.rstrip("/") + "/"
+	for line in raw.splitlines():
+		cols = line.split("\t")
+		if len(cols) < 3 or not cols[0].startswith(prefix):
+			continue
+		name = cols[0][len(prefix) :]
+		if "/" in name:
+			continue
+		size = cols[2] if cols[2].isdigit() else cols[1]
+		datasets.append((name, int(size) if size.isdigit() else None))
+	return datasets
+
+
+def get_rbd_ls_cmd(storage: PVEStorage) -> list[str]:
+	cmd_args = ["/usr/bin/rbd", "ls", "-l", "--format", "json", "-p"]
+	cmd_args.append(storage.path)
+	# External clusters
+	monhost = getattr(storage, "monhost", None)
+	if monhost:
+		cmd_args += [
+			"-m",
+			monhost,
+			"--id",
+			getattr(storage, "username", "admin"),
+			"--keyring",
+			f"{PVE_CEPH_KEYRING_DIR}/{storage.name}.keyring",
+		]
+	return cmd_args
+
+
+def parse_rbd_ls(raw: str) -> list[tuple[str, int | None]]:
+	images = []
+	for image in json.loads(raw or "[]"):
+		# Snapshots are listed along with their image
+		if image.get("snapshot"):
+			continue
+		images.append((image["image"], image.get("size")))
+	return images
+
+
+def get_images_find_cmd(path: str) -> list[str]:
+	return [
+		"/usr/bin/find",
+		f"{path}/images",
+		"-mindepth",
+		"2",
+		"-maxdepth",
+		"2",
+		"-printf",
+		"%P\t%s\n",
+	]
+
+
+def parse_images_find(raw: str) -> list[tuple[str, int | None]]:
+	images = []
+	for line in raw.splitlines():
+		name, _, size = line.partition("\t")
+		if name:
+			images.append((name, int(size) if size.isdigit() else None))
+	return images
+
+
+def scan_images_dir(path: str) -> list[tuple[str, int | None]]:
+	"""Lists images/<guest_id>/<file> entries of a file based storage."""
+	images = []
+	images_dir = f"{path}/images"
+	if not os.path.isdir(images_dir):
+		return images
+	with os.scandir(images_dir) as guest_dirs:
+		for guest_dir in guest_dirs:
+			if not guest_dir.is_dir():
+				continue
+			with os.scandir(guest_dir.path) as files:
+				for f in files:
+					try:
+						size = f.stat().st_size
+					except OSError:
+						size = None
+					images.append((f"{guest_dir.name}/{f.name}", size))
+	return images
+
+
+def get_lv_storage(lv: dict, storages: list[PVEStorage]) -> PVEStorage | None:
+	"""Assigns an LV to the LVM or LVM-Thin storage holding it."""
+	# Thin pools and their metadata volumes are not images
+	if lv.get("lv_attr", "").startswith("t") or lv["lv_name"].startswith("["):
+		return None
+	for storage in storages:
+		thinpool = getattr(storage, "thinpool", None)
+		if storage.type == "lvmthin":
+			if lv.get("pool_lv") and lv.get("pool_lv") == thinpool:
+				return storage
+		elif not lv.get("pool_lv"):
+			return storage
+	return None
+
+
+def get_volume_ref_names(
+	storage_type: str, name: str
+) -> tuple[str, str | None]:
+	"""
+	Splits a configured volume name into the image name as listed by the
+	backend, and the base image name of linked clones.
+
+	:return: (name, base_name) pair.
+	"""
+	parts = name.split("/")
+	if storage_type in ("dir", "cephfs"):
+		# [<base_id>/<base_file>/]<guest_id>/<file>
+		if len(parts) >= 4:
+			return "/".join(parts[-2:]), "/".join(parts[:2])
+		return name, None
+	# [<base_name>/]<name>
+	if len(parts) >= 2:
+		return parts[-1], parts[0]
+	return name, None
+
+
+async def _run_backend_cmds(
+	commands: list[list[str]], remote_args: list[str] | None = None
+) -> list[CommandResult | BaseException]:
+	# A missing binary must only fail its own backend
+	runner = get_command_runner()
+	return await asyncio.gather(
+		*(runner.run(c, remote_args=remote_args) for c in commands),
+		return_exceptions=True,
+	)
+
+
+class StorageInventory:
+	"""
+	Lists every image on a node's storages with one bulk call per backend
+	(VG, ZFS pool, RBD pool or images directory) and joins them against
+	every guest configuration in the cluster.
+
+	Node-local storages are only matched against the node's guests, so an
+	image left behind after a migration is reported as unreferenced.
+	"""
+
+	def __init__(
+		self,
+		node: str | None = None,
+		storage_config: StorageConfig | None = None,
+		guest_index: GuestIndex | None = None,
+	):
+		self.hostname = socket.gethostname()
+		self.node = node or self.hostname
+		self.storage_config = storage_config or get_storage_config()
+		self.guest_index = guest_index or get_guest_index()
+
+	@property
+	def remote_args(self) -> list[str] | None:
+		if self.node == self.hostname:
+			return None
+		return get_remote_args(self.node)
+
+	def get_storages(self, names: list[str] | None = None) -> list[PVEStorage]:
+		return [
+			s
+			for s in self.storage_config.all().values()
+			if (not names or s.name in names)
+			and storage_is_on_node(s, self.node)
+		]
+
+	def get_unlisted_storages(
+		self, names: list[str] | None = None
+	) -> list[str]:
+		"""Names of the node's storages whose images cannot be listed."""
+		return [
+			name
+			for name, section in self.storage_config.sections().items()
+			if section["type"] in UNLISTED_STORAGE_TYPES
+			and (not names or name in names)
+			and storage_is_on_node(section, self.node)
+		]
+
+	def collect(
+		self, storages: list[PVEStorage]
+	) -> tuple[dict[str, list[StorageVolume]], dict[str, str]]:
+		"""
+		:return: storage:volumes and storage:error pairs.
+		"""
+		volumes: dict[str, list[StorageVolume]] = {s.name: [] for s in storages}
+		errors: dict[str, str] = {}
+		# One call per backend, shared by every storage on it
+		commands: dict[tuple[str, str], list[str]] = {}
+		backend_storages: dict[tuple[str, str], list[PVEStorage]] = {}
+		for storage in storages:
+			if storage.type in ("lvm", "lvmthin"):
+				key = ("lvm", storage.path)
+				commands.setdefault(key, get_lvs_cmd(storage.path))
+			elif storage.type == "zfspool":
+				key = ("zfs", storage.path)
+				commands.setdefault(key, get_zfs_list_cmd(storage.path))
+			elif storage.type == "rbd":
+				key = ("rbd", storage.name)
+				commands.setdefault(key, get_rbd_ls_cmd(storage))
+			elif storage.type in FILE_STORAGE_TYPES:
+				key = ("dir", storage.path)
+				if self.remote_args:
+					commands.setdefault(key, get_images_find_cmd(storage.path))
+			else:
+				continue
+			backend_storages.setdefault(key, []).append(storage)
+
+		keys = list(commands)
+		results = dict(
+			zip(
+				keys,
+				asyncio.run(
+					_run_backend_cmds(
+						[commands[k] for k in keys], self.remote_args
+					)
+				),
+			)
+		)
+		for key, key_storages in backend_storages.items():
+			backend = key[0]
+			try:
+				if backend == "dir" and key not in results:
+					self._add_images(
+						volumes, key_storages, scan_images_dir(key[1])
+					)
+					continue
+				if isinstance(results[key], BaseException):
+					raise results[key]
+				result = results[key].check()
+				if backend == "lvm":
+					for lv in parse_lvs_report(result.output):
+						storage = get_lv_storage(lv, key_storages)
+						if storage:
+							size = str(lv.get("lv_size", ""))
+							volumes[storage.name].append(
+								StorageVolume(
+									storage=storage.name,
+									name=lv["lv_name"],
+									size=int(size) if size.isdigit() else None,
+								)
+							)
+				elif backend == "zfs":
+					self._add_images(
+						volumes,
+						key_storages,
+						parse_zfs_list(result.output, key[1]),
+					)
+				elif backend == "rbd":
+					self._add_images(
+						volumes, key_storages, parse_rbd_ls(result.output)
+					)
+				elif backend == "dir":
+					self._add_images(
+						volumes, key_storages, parse_images_find(result.output)
+					)
+			except Exception as e:
+				error = e.args[-1] if e.args else repr(e)
+				for storage in key_storages:
+					logger.error("Could not list storage %s: %s", storage, e)
+					errors[storage.name] = str(error).strip()
+					volumes.pop(storage.name, None)
+		return volumes, errors
+
+	@staticmethod
+	def _add_images(
+		volumes: dict[str, list[StorageVolume]],
+		storages: list[PVEStorage],
+		images: list[tuple[str, int | None]],
+	) -> None:
+		# Storages sharing a backend see the same images, keep the first one
+		storage = storages[0]
+		for name, size in images:
+			volumes[storage.name].append(
+				StorageVolume(storage=storage.name, name=name, size=size)
+			)
+
+	def get_volume_refs(
+		self, storages: list[PVEStorage]
+	) -> dict[str, set[int]]:
+		"""
+		Parses every guest configuration once, snapshots and unused disks
+		included.
+
+		:return: volume_id:guest_ids pairs. Base images of linked clones
+		are included without guest IDs.
+		"""
+		storages_by_name = {s.name: s for s in storages}
+		refs: dict[str, set[int]] = {}
+		for guest_id, entry in self.guest_index.all().items():
+			try:
+				guest_config = GuestConfig.from_file(entry.path)
+			except OSError as e:
+				logger.warning("Could not read Guest %s: %s", guest_id, e)
+				continue
+			for section in guest_config.sections():
+				for disk in guest_config.disks(section=section):
+					storage = storages_by_name.get(disk.storage)
+					if not storage:
+						continue
+					if (
+						not storage_is_shared(storage)
+						and entry.host != self.node
+					):
+						continue
+					name, base_name = get_volume_ref_names(
+						storage.type, disk.name
+					)
+					refs.setdefault(f"{storage.name}:{name}", set()).add(
+						guest_id
+					)
+					if base_name:
+						refs.setdefault(f"{storage.name}:{base_name}", set())
+		return refs
+
+	def get_volume_state(
+		self, volume: StorageVolume, refs: dict[str, set[int]]
+	) -> VolumeState | None:
+		"""Returns None for images not managed by PVE."""
+		owner_id = volume.guest_id
+		if owner_id is None:
+			# Anything within images/<id>/ is managed by PVE
+			if volume.dir_guest_id is not None:
+				return "misnamed"
+			return None
+		if volume.volume_id in refs:
+			guest_ids = refs[volume.volume_id]
+			if guest_ids and owner_id not in guest_ids:
+				return "misnamed"
+			if volume.dir_guest_id not in (None, owner_id):
+				return "misnamed"
+			return "referenced"
+		if not self.guest_index.exists(owner_id):
+			return "orphaned"
+		return "unreferenced"
+
+	def report(self, storage_names: list[str] | None = None) -> InventoryReport:
+		storages = self.get_storages(storage_names)
+		volumes, errors = self.collect(storages)
+		for name in self.get_unlisted_storages(storage_names):
+			storage_type = self.storage_config.sections()[name]["type"]
+			errors[name] = f"Listing {storage_type} storages is not supported."
+		refs = self.get_volume_refs(storages)
+		report = InventoryReport(node=self.node, volumes=volumes, errors=errors)
+		found = set()
+		for storage_volumes in volumes.values():
+			for volume in storage_volumes:
+				found.add(volume.volume_id)
+				state = self.get_volume_state(volume, refs)
+				if state:
+					report.states[volume.volume_id] = state
+		for volume_id, guest_ids in refs.items():
+			report.references[volume_id] = sorted(guest_ids)
+			storage_name = volume_id.split(":", 1)[0]
+			# Only report missing volumes of storages that could be listed
+			if storage_name in volumes and volume_id not in found:
+				report.states[volume_id] = "missing"
+		return report
@@ -10,16 +10,9 @@ def pve_version_exists() -> bool:
 
 
 def get_pve_version(full=False) -> str:
-	import subprocess
+	from core.utils.command import run_command
 
-	with subprocess.Popen("pveversion", stdout=subprocess.PIPE) as proc:
-		proc_o, proc_e = proc.communicate()
-		if proc.returncode != 0:
-			raise Exception(
-				f"Bad command return code ({proc.returncode}).",
-				proc_o.decode(),
-				proc_e.decode(),
-			)
-		if full:
-			return proc_o.decode("utf-8").strip()
-		return proc_o.decode("utf-8").strip().split("/")[1]
+	result = run_command(["pveversion"], check=True)
+	if full:
+		return result.output.strip()
+	return result.output.strip().split("/")[1]
@@ -1,4 +1,20 @@
-from typing import TypedDict
+import os
+import time
+import logging
+from typing import Iterable, TypedDict
+from core.utils.command import CommandError, run_command
+from core.proxmox.constants import PVE_CFG_REPLICATION, PVE_REPLICATION_STATE
+
+logger = logging.getLogger()
+
+PVESR_BIN = "/usr/bin/pvesr"
+DEFAULT_WAIT_TIMEOUT = 120
+DEFAULT_WAIT_INITIAL_INTERVAL = 0.5
+DEFAULT_WAIT_MAX_INTERVAL = 8.0
+# How often watched files are checked for changes between status calls
+WATCH_TICK = 0.1
+# Status of jobs still configured while pvesr status cannot be read
+REPLICATION_STATUS_UNKNOWN = "unknown"
 
 
 class ReplicationJobDict(TypedDict):
@@ -6,3 +22,192 @@ class ReplicationJobDict(TypedDict):
 	target: str
 	schedule: str
 	source: str
+
+
+def get_replication_job_guest_id(job_id: str) -> int:
+	"""Replication Job IDs are formatted as <guest_id>-<job_number>."""
+	return int(job_id.split("-")[0])
+
+
+def get_replication_jobs(
+	guest_ids: Iterable[int] | None = None, cfg_path: str | None = None
+) -> dict[int, dict[str, ReplicationJobDict]] | None:
+	"""
+	Reads replication jobs from the PVE Replication Config File.
+	Uses Proxmox FUSE Volume data, does not require remote/ssh arguments.
+
+	:return: {guest_id: {job_id: job}}, None if the file cannot be read.
+	"""
+	cfg_path = cfg_path or PVE_CFG_REPLICATION
+	if guest_ids is not None:
+		guest_ids = {int(guest_id) for guest_id in guest_ids}
+	try:
+		with open(cfg_path, "r") as replication_cfg:
+			lines = replication_cfg.readlines()
+	except FileNotFoundError:
+		return {}
+	except OSError:
+		return None
+
+	jobs = {}
+	job = None
+	for line in lines:
+		line = line.strip()
+		if len(line) < 1:
+			continue
+		if line.startswith("local:"):
+			job_id = line.split(": ")[1].strip()
+			guest_id = get_replication_job_guest_id(job_id)
+			job = None
+			if guest_ids is None or guest_id in guest_ids:
+				job = {}
+				jobs.setdefault(guest_id, {})[job_id] = job
+			continue
+		if job is not None:
+			_key, _value = (line.split(sep=None, maxsplit=1) + [""])[:2]
+			job[_key] = _value
+	return jobs
+
+
+def get_replication_statuses(
+	guest_ids: Iterable[int] | None = None,
+	remote_args: list | None = None,
+	raise_exception=False,
+) -> dict[int, dict[str, str]] | None:
+	"""
+	Gets the status of every replication job with one pvesr call.
+
+	:return: {guest_id: {job_id: status}}, None if pvesr failed.
+	:rtype: dict | None
+	"""
+	cmd_args = [PVESR_BIN, "status"]
+	if remote_args:
+		cmd_args = remote_args + cmd_args
+	if guest_ids is not None:
+		guest_ids = {int(guest_id) for guest_id in guest_ids}
+	try:
+		result = run_command(cmd_args, check=True)
+	except (CommandError, OSError) as e:
+		if raise_exception:
+			raise
+		logger.warning("Could not get replication job statuses (%s).", e)
+		return None
+
+	data = {}
+	# First line is the header
+	for line in result.output.splitlines()[1:]:
+		_parsed_line = line.split()
+		if not _parsed_line:
+			continue
+		job_id = _parsed_line[0]
+		try:
+			guest_id = get_replication_job_guest_id(job_id)
+		except ValueError:
+			continue
+		if guest_ids is not None and guest_id not in guest_ids:
+			continue
+		data.setdefault(guest_id, {})[job_id] = _parsed_line[-1]
+	return data
+
+
+class ReplicationWatch:
+	"""
+	Detects changes on the replication config and the local pvesr state
+	file by their mtimes, cheap enough to check many times per second.
+	"""
+
+	def __init__(self, paths: Iterable[str] | None = None):
+		self.paths = tuple(
+			paths or (PVE_CFG_REPLICATION, PVE_REPLICATION_STATE)
+		)
+		self._signature = self._get_signature()
+
+	def _get_signature(self) -> tuple:
+		signature = []
+		for path in self.paths:
+			try:
+				stat = os.stat(path)
+				signature.append((stat.st_mtime_ns, stat.st_size))
+			except OSError:
+				signature.append(None)
+		return tuple(signature)
+
+	def changed(self) -> bool:
+		signature = self._get_signature()
+		if signature == self._signature:
+			return False
+		self._signature = signature
+		return True
+
+
+def wait_for_replication_jobs_removal(
+	guest_ids: Iterable[int],
+	remote_args: list | None = None,
+	timeout: float = DEFAULT_WAIT_TIMEOUT,
+	initial_interval: float = DEFAULT_WAIT_INITIAL_INTERVAL,
+	max_interval: float = DEFAULT_WAIT_MAX_INTERVAL,
+	cfg_path: str | None = None,
+	state_path: str | None = None,
+) -> dict[int, dict[str, str]]:
+	"""
+	Waits until every replication job of guest_ids is removed.
+
+	Jobs are checked whenever the replication config or state file
+	changes, otherwise with an exponential backoff. Each check is a
+	single batched pvesr status call for all guests, skipped entirely
+	once the replication config has no jobs left for them.
+
+	While pvesr status fails, jobs left in the replication config keep
+	being awaited with REPLICATION_STATUS_UNKNOWN.
+
+	:param timeout: Seconds to wait without any job being removed.
+	:param state_path: Local pvesr state file, not watched for remote guests.
+	:return: Remaining {guest_id: {job_id: status}}, empty if all were removed.
+	:rtype: dict
+	"""
+	guest_ids = {int(guest_id) for guest_id in guest_ids}
+	watch_paths = [cfg_path or PVE_CFG_REPLICATION]
+	# The state file is written by the node running the jobs
+	if not remote_args:
+		watch_paths.append(state_path or PVE_REPLICATION_STATE)
+	watch = ReplicationWatch(paths=watch_paths)
+	interval = initial_interval
+	deadline = time.monotonic() + timeout
+	remaining_count = None
+	while True:
+		jobs = get_replication_jobs(guest_ids, cfg_path=cfg_path)
+		if jobs == {}:
+			return {}
+		statuses = get_replication_statuses(guest_ids, remote_args)
+		if statuses is None:
+			# Jobs still configured are awaited, all guests if unreadable
+			jobs = jobs or {guest_id: {} for guest_id in guest_ids}
+			statuses = {
+				guest_id: dict.fromkeys(guest_jobs, REPLICATION_STATUS_UNKNOWN)
+				for guest_id, guest_jobs in jobs.items()
+			}
+		else:
+			count = sum(len(job_statuses) for job_statuses in statuses.values())
+			if count < 1:
+				return {}
+			if remaining_count is not None and count < remaining_count:
+				logger.info("A job finished, awaiting further.")
+				deadline = time.monotonic() + timeout
+				interval = initial_interval
+			remaining_count = count
+
+		now = time.monotonic()
+		if now >= deadline:
+			logger.info("Timeout reached, cannot wait any longer.")
+			return statuses
+		logger.debug(
+			"Waiting for %s replication jobs (next check in %ss).",
+			sum(len(job_statuses) for job_statuses in statuses.values()),
+			interval,
+		)
+		wake_at = min(now + interval, deadline)
+		while time.monotonic() < wake_at:
+			time.sleep(min(WATCH_TICK, max(0, wake_at - time.monotonic())))
+			if watch.changed():
+				break
+		interval = min(interval * 2, max_interval)
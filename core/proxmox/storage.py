@@ -1,10 +1,19 @@
 # Author: Dylan Blanqué
 # BR Consulting S.R.L. 2024
+import os
+import re
 import logging
-import subprocess
+import threading
+from collections import Counter
 from .constants import PVE_CFG_STORAGE
 from .guests import get_guest_cfg_path
+from core.utils.file_edit import Substitution, edit_file
+from core.utils.command import run_command
 from dataclasses import dataclass
+from typing import Callable
+from core.utils.lazy import lazy_import
+
+futures = lazy_import("concurrent.futures")
 
 logger = logging.getLogger()
 
@@ -15,8 +24,14 @@ PATH_ASSOC = {
 	"zfspool": "pool",
 	"dir": "path",
 	"cephfs": "path",
+	"nfs": "path",
+	"cifs": "path",
+	"glusterfs": "path",
 	"rbd": "pool",
 }
+# Storages holding images as files in <path>/images/<guest_id>/
+FILE_STORAGE_TYPES = ("dir", "cephfs", "nfs", "cifs", "glusterfs")
+DEFAULT_REASSIGN_WORKERS = 4
 
 
 class DiskReassignException(Exception):
@@ -43,21 +58,14 @@ class PVEStorage:
 	def __str__(self):
 		return self.name
 
-	def reassign_disk(
-		self,
-		disk_name: str,
-		new_guest_id: int,
-		new_guest_cfg: str | None = None,
-		remote_args=None,
-		dry_run=False,
-	):
-		cmd_args = None
-		lv_tags = False
-		guest_id = disk_name.split("-")[1]
-		guest_id = int(guest_id)
+	def get_disk_rename(
+		self, disk_name: str, new_guest_id: int
+	) -> "DiskRename":
+		"""Returns the rename operation for disk_name, does not execute it."""
+		guest_id = int(disk_name.split("-")[1])
 		id_prefix = False
-		old_disk_path = None
-		new_disk_path = None
+		old_disk_dir = None
+		new_disk_dir = None
 
 		# CT/LXC Subvolumes have an ID Prefix in the disk name
 		if f"{guest_id}/" in disk_name:
@@ -72,8 +80,6 @@ class PVEStorage:
 				disk_name,
 				new_disk_name,
 			]
-			if hasattr(self, "tagged_only"):
-				lv_tags = True if self.tagged_only else False
 		elif self.type == "zfspool":
 			# zfs rename \"$storpath/$diskname\" \"$storpath/$diskname_new\"
 			cmd_args = [
@@ -82,27 +88,15 @@ class PVEStorage:
 				f"{self.path}/{disk_name}",
 				f"{self.path}/{new_disk_name}",
 			]
-		elif self.type in ["dir", "cephfs"]:
+		elif self.type in FILE_STORAGE_TYPES:
 			# mv "$storpath/images/${!1}/$diskname" "$storpath/images/${!2}/"
-			old_disk_path = f"{self.path}/images/{guest_id}"
-			new_disk_path = f"{self.path}/images/{new_guest_id}"
+			old_disk_dir = f"{self.path}/images/{guest_id}"
+			new_disk_dir = f"{self.path}/images/{new_guest_id}"
 			cmd_args = [
 				"/usr/bin/mv",
-				f"{self.path}/images/{guest_id}/{disk_name}",
-				f"{new_disk_path}/{new_disk_name}",
+				f"{old_disk_dir}/{disk_name}",
+				f"{new_disk_dir}/{new_disk_name}",
 			]
-			# Attempt to create unexisting dir
-			logger.debug("Ensuring path exists (%s).", new_disk_path)
-			if dry_run:
-				logger.info("mkdir %s", new_disk_path)
-			else:
-				mkdir_args = ["/usr/bin/mkdir", "-p", new_disk_path]
-				if remote_args:
-					mkdir_args = remote_args + mkdir_args
-				try:
-					subprocess.call(mkdir_args)
-				except:
-					raise DiskDirectoryException()
 		elif self.type == "rbd":
 			cmd_args = [
 				"/usr/bin/rbd",
@@ -114,162 +108,405 @@ class PVEStorage:
 			raise UnsupportedStorageType(
 				f"Unsupported Storage Type {self.type}"
 			)
+		return DiskRename(
+			storage=self,
+			guest_id=guest_id,
+			new_guest_id=int(new_guest_id),
+			disk_name=disk_name,
+			new_disk_name=new_disk_name,
+			id_prefix=id_prefix,
+			cmd_args=cmd_args,
+			old_disk_dir=old_disk_dir,
+			new_disk_dir=new_disk_dir,
+		)
 
-		if remote_args:
-			cmd_args = remote_args + cmd_args
-		# ! Rename disk in Storage
-		logger.debug("Changing disk name in storage.")
-		if dry_run:
-			logger.info(" ".join(cmd_args))
-		else:
-			logger.debug(" ".join(cmd_args))
-			try:
-				subprocess.call(cmd_args)
-			except:
-				raise DiskReassignException()
-
-		# ! Rename disk in Guest Configuration
-		# Does not require SSH
-		guest_cfg_path = (
-			new_guest_cfg
-			if new_guest_cfg
-			else get_guest_cfg_path(guest_id=guest_id)
+	@property
+	def uses_lv_tags(self) -> bool:
+		return self.type in ["lvm", "lvmthin"] and bool(self.tagged_only)
+
+	def reassign_disk(
+		self,
+		disk_name: str,
+		new_guest_id: int,
+		new_guest_cfg: str | None = None,
+		remote_args=None,
+		dry_run=False,
+	):
+		failed = reassign_disks(
+			disks=[(self, disk_name)],
+			new_guest_id=new_guest_id,
+			new_guest_cfg=new_guest_cfg,
+			remote_args=remote_args,
+			dry_run=dry_run,
 		)
-		sed_regex = None
-		# LXC ID Prefix on Diskname
-		if id_prefix:
-			sed_regex = (
-				rf"s@:{guest_id}/{disk_name}@:{new_guest_id}/{new_disk_name}@g"
+		if failed:
+			raise DiskReassignException(disk_name)
+		return
+
+
+@dataclass
+class DiskRename:
+	"""A single disk rename within a storage."""
+
+	storage: PVEStorage
+	guest_id: int
+	new_guest_id: int
+	disk_name: str
+	new_disk_name: str
+	id_prefix: bool
+	cmd_args: list[str]
+	old_disk_dir: str | None = None
+	new_disk_dir: str | None = None
+
+	@property
+	def volume(self) -> str:
+		"""Volume ID as written in the guest configuration."""
+		if self.id_prefix:
+			return f"{self.storage.name}:{self.guest_id}/{self.disk_name}"
+		return f"{self.storage.name}:{self.disk_name}"
+
+	@property
+	def new_volume(self) -> str:
+		if self.id_prefix:
+			return (
+				f"{self.storage.name}:{self.new_guest_id}/{self.new_disk_name}"
 			)
-		# VM has no Prefix
-		else:
-			sed_regex = rf"s@:{disk_name}@:{new_disk_name}@g"
-		sed_cmd_args = ["/usr/bin/sed", "-i", sed_regex, guest_cfg_path]
-		sed_cmd_args = sed_cmd_args
-		logger.debug(
-			"Changing disk in Guest Configuration (%s) from %s to %s.",
-			guest_cfg_path,
-			disk_name,
-			new_disk_name,
+		return f"{self.storage.name}:{self.new_disk_name}"
+
+	@property
+	def lane(self) -> str:
+		"""Renames within the same lane must not run concurrently."""
+		if self.storage.type in ["lvm", "lvmthin"]:
+			# LVM serializes metadata changes per VG
+			return f"lvm:{self.storage.path}"
+		return f"{self.storage.name}:{self.disk_name}"
+
+
+def _run_disk_cmd(cmd_args: list[str], remote_args=None) -> int:
+	result = run_command(cmd_args, remote_args=remote_args)
+	if not result.ok:
+		logger.error(
+			"Bad command return code (%s): %s",
+			result.returncode,
+			result.errors.strip(),
 		)
+	return result.returncode
+
+
+def rewrite_guest_cfg_volumes(
+	guest_cfg_path: str, volumes: dict[str, str], dry_run=False
+) -> str:
+	"""
+	Replaces every old:new volume ID pair in a guest configuration
+	with a single read and atomic write.
+
+	:return: Unified diff of the changes.
+	"""
+	substitutions = [
+		Substitution(
+			# Volume must be a whole token, lvm:... never matches within
+			# local-lvm:...
+			pattern=rf"(?<![\w.-]){re.escape(volume)}(?=[,\s]|$)",
+			replacement=lambda _, new_volume=new_volume: new_volume,
+		)
+		for volume, new_volume in volumes.items()
+	]
+	return edit_file(guest_cfg_path, substitutions, dry_run=dry_run)
+
+
+def reassign_disks(
+	disks: list[tuple[PVEStorage, str]],
+	new_guest_id: int,
+	new_guest_cfg: str | None = None,
+	remote_args=None,
+	dry_run=False,
+	max_workers=DEFAULT_REASSIGN_WORKERS,
+	on_renamed: Callable[[DiskRename], None] | None = None,
+	guest_id: int | None = None,
+) -> list[str]:
+	"""
+	Re-assigns many disks of a single guest to new_guest_id.
+
+	Renames that do not share an LVM Volume Group run concurrently, the
+	guest configuration is rewritten once and LV tags are changed with
+	one lvchange call per Volume Group.
+
+	Disks named after another guest (e.g. linked clone base volumes) are
+	not renamed and are returned as failed, the rest are still renamed.
+
+	:param disks: (storage, disk_name) pairs.
+	:param on_renamed: Called from the worker threads as soon as a disk is
+	  renamed in its storage, before the configuration is rewritten.
+	:param guest_id: Guest owning the disks, defaults to the guest most
+	  disks are named after.
+	:return: Names of the disks that could not be renamed.
+	:rtype: list[str]
+	"""
+	renames: list[DiskRename] = []
+	skipped: list[str] = []
+	for storage, disk_name in disks:
+		try:
+			renames.append(storage.get_disk_rename(disk_name, new_guest_id))
+		except (IndexError, ValueError, UnsupportedStorageType) as e:
+			logger.error("Cannot re-assign disk %s (%s).", disk_name, e)
+			skipped.append(f"{storage.name}:{disk_name}")
+	if not renames:
+		return skipped
+	if guest_id is None:
+		guest_id = Counter(r.guest_id for r in renames).most_common(1)[0][0]
+	guest_id = int(guest_id)
+	for rename in renames:
+		if rename.guest_id != guest_id:
+			logger.error(
+				"Disk %s belongs to Guest %s, not re-assigning it.",
+				rename.volume,
+				rename.guest_id,
+			)
+			skipped.append(f"{rename.storage.name}:{rename.disk_name}")
+	renames = [r for r in renames if r.guest_id == guest_id]
+	if not renames:
+		return skipped
+
+	# Ensure new disk directories exist
+	for new_disk_dir in {r.new_disk_dir for r in renames if r.new_disk_dir}:
+		logger.debug("Ensuring path exists (%s).", new_disk_dir)
+		mkdir_args = ["/usr/bin/mkdir", "-p", new_disk_dir]
 		if dry_run:
-			logger.info(" ".join(sed_cmd_args))
-		else:
-			logger.debug(" ".join(sed_cmd_args))
-			with subprocess.Popen(sed_cmd_args, stdout=subprocess.PIPE) as proc:
-				proc_o, proc_e = proc.communicate()
-				if proc.returncode != 0:
-					raise Exception(
-						f"Bad command return code ({proc.returncode}).",
-						proc_o.decode(),
-						proc_e.decode(),
-					)
-
-		# ! Change LV Tags
-		if lv_tags:
+			logger.info(" ".join(mkdir_args))
+		elif _run_disk_cmd(mkdir_args, remote_args) != 0:
+			raise DiskDirectoryException(new_disk_dir)
+
+	# ! Rename disks in Storage
+	lanes: dict[str, list[DiskRename]] = {}
+	for rename in renames:
+		lanes.setdefault(rename.lane, []).append(rename)
+	failed: list[DiskRename] = []
+
+	def _run_lane(lane: list[DiskRename]):
+		for rename in lane:
+			logger.debug(
+				"Changing disk name in storage %s from %s to %s.",
+				rename.storage,
+				rename.disk_name,
+				rename.new_disk_name,
+			)
+			if dry_run:
+				logger.info(" ".join(rename.cmd_args))
+			elif _run_disk_cmd(rename.cmd_args, remote_args) != 0:
+				failed.append(rename)
+			elif on_renamed:
+				on_renamed(rename)
+
+	with futures.ThreadPoolExecutor(
+		max_workers=max(1, max_workers)
+	) as executor:
+		for _ in executor.map(_run_lane, lanes.values()):
+			pass
+	renamed = [r for r in renames if r not in failed]
+
+	# ! Rename disks in Guest Configuration
+	# Does not require SSH
+	guest_cfg_path = (
+		new_guest_cfg
+		if new_guest_cfg
+		else get_guest_cfg_path(guest_id=guest_id)
+	)
+	volumes = {r.volume: r.new_volume for r in renamed}
+	logger.debug(
+		"Changing disks in Guest Configuration (%s): %s",
+		guest_cfg_path,
+		volumes,
+	)
+	if dry_run:
+		logger.info("Rewrite %s volumes: %s", guest_cfg_path, volumes)
+	elif volumes:
+		rewrite_guest_cfg_volumes(guest_cfg_path, volumes)
+
+	# ! Change LV Tags, once per Volume Group
+	vg_renames: dict[str, list[DiskRename]] = {}
+	for rename in renamed:
+		if rename.storage.uses_lv_tags:
+			vg_renames.setdefault(rename.storage.path, []).append(rename)
+	for vgname, vg_group in vg_renames.items():
+		lvtag_cmd_args = ["/usr/sbin/lvchange"]
+		add_tags = set()
+		for rename in vg_group:
 			suffix = (
 				"-cloudinit"
-				if new_disk_name.endswith("-cloudinit")
+				if rename.new_disk_name.endswith("-cloudinit")
 				else "-disk-"
 			)
-			lvtag_cmd_args = [
-				"/usr/sbin/lvchange",
-				"--deltag",
-				disk_name,
-				"--add-tag",
-				f"{self.name}-{new_disk_name.split(suffix)[0]}",
-				f"{self.name}/{new_disk_name}",
-			]
-			if remote_args:
-				lvtag_cmd_args = remote_args + lvtag_cmd_args
-			if dry_run:
-				logger.info(lvtag_cmd_args)
-			else:
-				with subprocess.Popen(
-					lvtag_cmd_args, stdout=subprocess.PIPE
-				) as proc:
-					proc_o, proc_e = proc.communicate()
-					if proc.returncode != 0:
-						logger.error(
-							"Could not change LV Tags properly, beware of checking them after the script finishes."
-						)
-		if old_disk_path:
-			logger.debug("Attempting to remove %s", old_disk_path)
-			try:
-				rmdir_args = ["/usr/bin/rmdir", old_disk_path]
-				if remote_args:
-					rmdir_args = remote_args + rmdir_args
-				with subprocess.Popen(
-					rmdir_args, stdout=subprocess.PIPE
-				) as proc:
-					proc_o, proc_e = proc.communicate()
-					if proc.returncode != 0:
-						raise Exception(
-							f"Bad command return code ({proc.returncode}).",
-							proc_o.decode(),
-							proc_e.decode(),
-						)
-			except:
-				logger.error(
-					"Could not delete prior Guest ID Images Path (%s)",
-					old_disk_path,
-				)
-		return
-
+			lvtag_cmd_args += ["--deltag", rename.disk_name]
+			add_tags.add(
+				f"{rename.storage.name}-{rename.new_disk_name.split(suffix)[0]}"
+			)
+		for tag in sorted(add_tags):
+			lvtag_cmd_args += ["--addtag", tag]
+		lvtag_cmd_args += [f"{vgname}/{r.new_disk_name}" for r in vg_group]
+		if dry_run:
+			logger.info(" ".join(lvtag_cmd_args))
+		elif _run_disk_cmd(lvtag_cmd_args, remote_args) != 0:
+			logger.error(
+				"Could not change LV Tags properly, beware of checking them after the script finishes."
+			)
 
-def get_storage_cfg(storage_name: str) -> PVEStorage:
-	sed_regex = rf"/.*: {storage_name}$/,/^$/p"
-	cmd_args = [
-		"/usr/bin/sed",
-		"-n",
-		sed_regex,
-		PVE_CFG_STORAGE,
-	]
-	with subprocess.Popen(
-		cmd_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-	) as proc:
-		proc_o, proc_e = proc.communicate()
-		if proc.returncode != 0:
-			raise Exception(
-				f"Bad command return code ({proc.returncode}).",
-				proc_o.decode(),
-				proc_e.decode(),
+	for old_disk_dir in {r.old_disk_dir for r in renamed if r.old_disk_dir}:
+		logger.debug("Attempting to remove %s", old_disk_dir)
+		rmdir_args = ["/usr/bin/rmdir", old_disk_dir]
+		if dry_run:
+			logger.info(" ".join(rmdir_args))
+		elif _run_disk_cmd(rmdir_args, remote_args) != 0:
+			logger.error(
+				"Could not delete prior Guest ID Images Path (%s)",
+				old_disk_dir,
 			)
-		storage = {}
-		for line in proc_o.decode().split("\n"):
-			line = line.rstrip()
-			if len(line) < 1:
+	return skipped + [f"{r.storage.name}:{r.disk_name}" for r in failed]
+
+
+STORAGE_CFG_SECTION_REGEX = r"^([a-z0-9]+):\s*(\S+)\s*$"
+
+
+def parse_storage_cfg(raw: str) -> dict[str, dict[str, str]]:
+	"""
+	Parses storage.cfg into a {name: attributes} dict, every section keeps
+	its type under the "type" key.
+	"""
+	sections: dict[str, dict[str, str]] = {}
+	section = None
+	for line in raw.splitlines():
+		line = line.rstrip()
+		if not line or line.lstrip().startswith("#"):
+			continue
+		# Section Header
+		if not line[0].isspace():
+			m = re.match(STORAGE_CFG_SECTION_REGEX, line)
+			if not m:
+				logger.debug("Unparsed storage.cfg line: %s", line)
+				section = None
 				continue
-			# Path Definition
-			if ": " in line:
-				line = line.split(": ")
-				storage["type"] = line[0].strip()
-				storage["name"] = line[1].strip()
-			# Attribute Definitions
-			else:
-				line = line.split(" ")
-				attr_key = line[0].strip()
-				attr_val = line[1].strip()
-				storage[attr_key] = attr_val
-		if storage["type"] not in PATH_ASSOC:
-			raise Exception(f"Storage type unsupported ({storage['type']})")
-		path_def = PATH_ASSOC[storage["type"]]
-		if path_def not in storage:
-			raise Exception(
-				"Bad storage parameters, path definition not found.", storage
-			)
-		r = PVEStorage(
-			name=storage["name"], type=storage["type"], path=storage[path_def]
+			section = {"type": m.group(1), "name": m.group(2)}
+			sections[section["name"]] = section
+		# Attribute Definitions
+		elif section is not None:
+			attr = line.strip().split(None, 1)
+			section[attr[0]] = attr[1].strip() if len(attr) > 1 else "1"
+	return sections
+
+
+def make_storage(storage: dict[str, str]) -> PVEStorage:
+	if storage["type"] not in PATH_ASSOC:
+		raise UnsupportedStorageType(
+			f"Storage type unsupported ({storage['type']})"
 		)
-		try:
-			for k, v in storage.items():
-				if k in ["name", "type", path_def]:
-					continue
-				setattr(r, k, v)
-		except:
+	path_def = PATH_ASSOC[storage["type"]]
+	if path_def not in storage:
+		raise Exception(
+			"Bad storage parameters, path definition not found.", storage
+		)
+	r = PVEStorage(
+		name=storage["name"], type=storage["type"], path=storage[path_def]
+	)
+	for k, v in storage.items():
+		if k in ["name", "type", path_def]:
+			continue
+		setattr(r, k, v)
+	return r
+
+
+class StorageConfig:
+	"""
+	Parsed storage.cfg, re-read only when the file mtime changes.
+
+	Storages with a supported type are exposed as PVEStorage objects,
+	every section is available raw through sections().
+	"""
+
+	def __init__(self, cfg_path: str | None = None):
+		self.cfg_path = cfg_path or PVE_CFG_STORAGE
+		self._sections: dict[str, dict[str, str]] = {}
+		self._storages: dict[str, PVEStorage] = {}
+		self._mtime: int | None = None
+		self._lock = threading.Lock()
+		# Set when a PVEWatcher invalidates the configuration on changes
+		self.watched = False
+		self._stale = True
+
+	def invalidate(self) -> None:
+		self._stale = True
+
+	def refresh(self, force=False) -> None:
+		if self.watched and not self._stale and not force:
+			return
+		with self._lock:
+			self._stale = False
 			try:
-				print(storage)
-			except:
-				pass
-			raise
-		return r
+				mtime = os.stat(self.cfg_path).st_mtime_ns
+			except FileNotFoundError:
+				mtime = None
+			if not force and mtime == self._mtime and self._mtime is not None:
+				return
+			sections = {}
+			storages = {}
+			if mtime is not None:
+				with open(self.cfg_path, "r") as cfg_file:
+					sections = parse_storage_cfg(cfg_file.read())
+				for name, section in sections.items():
+					try:
+						storages[name] = make_storage(section)
+					except Exception as e:
+						logger.debug("Skipping storage %s: %s", name, e)
+			# A failed read leaves the previous mtime, it is retried
+			self._sections, self._storages = sections, storages
+			self._mtime = mtime
+
+	def sections(self) -> dict[str, dict[str, str]]:
+		self.refresh()
+		return self._sections
+
+	def get(self, name: str) -> PVEStorage | None:
+		self.refresh()
+		return self._storages.get(name)
+
+	def all(self) -> dict[str, PVEStorage]:
+		self.refresh()
+		return self._storages
+
+	def by_type(self, *storage_types: str) -> list[PVEStorage]:
+		return [s for s in self.all().values() if s.type in storage_types]
+
+	def by_path(self, path: str) -> list[PVEStorage]:
+		"""
+		Returns the storages whose path (directory, VG or pool) is path or
+		contains it, most specific first.
+		"""
+		path = path.rstrip("/")
+		matches = [
+			s
+			for s in self.all().values()
+			if path == s.path.rstrip("/")
+			or path.startswith(s.path.rstrip("/") + "/")
+		]
+		return sorted(matches, key=lambda s: len(s.path), reverse=True)
+
+
+_storage_config: StorageConfig | None = None
+
+
+def get_storage_config() -> StorageConfig:
+	"""Returns the process-wide StorageConfig."""
+	global _storage_config
+	if _storage_config is None:
+		_storage_config = StorageConfig()
+	return _storage_config
+
+
+def get_storage_cfg(storage_name: str) -> PVEStorage:
+	storage_cfg = get_storage_config()
+	storage = storage_cfg.get(storage_name)
+	if storage:
+		return storage
+	section = storage_cfg.sections().get(storage_name)
+	if not section:
+		raise Exception(f"Storage {storage_name} not found in storage.cfg")
+	# Raises the reason why it could not be loaded
+	return make_storage(section)
@@ -0,0 +1,275 @@
+import os
+import re
+import json
+import time
+import logging
+import ipaddress
+from dataclasses import dataclass, field
+from core.network.ipam import SubnetAllocator
+from core.proxmox.guests import GuestIndex, get_guest_index
+from core.proxmox.guest_config import GuestConfig
+from core.utils.lazy import lazy_import
+
+api = lazy_import("core.proxmox.api")
+
+logger = logging.getLogger()
+
+# Provisioning automation calls scripts back to back, node networks are
+# re-used for a short while instead of being fetched on every call.
+DEFAULT_SUBNET_INDEX_TTL = 60.0
+SUBNET_INDEX_CACHE_FILENAME = "subnet_index.json"
+SUBNET_INDEX_VERSION = 1
+# Cloud-Init (ipconfigN) and LXC (netN) options holding static addresses
+GUEST_IP_KEY_REGEX = re.compile(r"^(ipconfig|net)[0-9]+$")
+GUEST_IP_KEYS = ("ip", "ip6")
+
+IPAddress = ipaddress.IPv4Address | ipaddress.IPv6Address
+IPNetwork = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+@dataclass
+class BridgeSubnet:
+	"""Network of a bridge (or physical interface) across the cluster."""
+
+	bridge: str
+	network: IPNetwork
+	gateway: IPAddress | None = None
+	# Sorted node addresses within network
+	reserved: list[IPAddress] = field(default_factory=list)
+
+	def to_dict(self) -> dict:
+		return {
+			"bridge": self.bridge,
+			"network": str(self.network),
+			"gateway": str(self.gateway) if self.gateway else None,
+			"reserved": [str(a) for a in self.reserved],
+		}
+
+	@classmethod
+	def from_dict(cls, data: dict) -> "BridgeSubnet":
+		return cls(
+			bridge=data["bridge"],
+			network=ipaddress.ip_network(data["network"]),
+			gateway=(
+				ipaddress.ip_address(data["gateway"])
+				if data["gateway"]
+				else None
+			),
+			reserved=[ipaddress.ip_address(a) for a in data["reserved"]],
+		)
+
+
+class SubnetIndex:
+	"""
+	Maps every bridge of the cluster to its network, gateway and the host
+	addresses reserved by the nodes.
+	"""
+
+	def __init__(
+		self,
+		subnets: dict[str, BridgeSubnet] | None = None,
+		created: float | None = None,
+	):
+		self.subnets = subnets or {}
+		self.created = time.time() if created is None else created
+
+	@classmethod
+	def from_node_networks(
+		cls, node_networks: dict[str, list[dict]]
+	) -> "SubnetIndex":
+		"""
+		:param node_networks: node:/nodes/{node}/network data.
+		"""
+		subnets: dict[str, BridgeSubnet] = {}
+		addresses: set[IPAddress] = set()
+		for ifaces in node_networks.values():
+			for iface_dict in ifaces:
+				if "iface" not in iface_dict:
+					raise ValueError(
+						f"Missing critical key in Interface Dictionary.\n{iface_dict}"
+					)
+				if "cidr" not in iface_dict:
+					continue
+				iface = iface_dict["iface"]
+				interface = ipaddress.ip_interface(iface_dict["cidr"])
+				addresses.add(
+					ipaddress.ip_address(iface_dict["address"])
+					if iface_dict.get("address")
+					else interface.ip
+				)
+				# The first node holding a bridge defines its network
+				subnet = subnets.get(iface)
+				if subnet is None:
+					subnet = BridgeSubnet(
+						bridge=iface, network=interface.network
+					)
+					subnets[iface] = subnet
+				if subnet.gateway is None and iface_dict.get("gateway"):
+					subnet.gateway = ipaddress.ip_address(iface_dict["gateway"])
+
+		# Node addresses are reserved whichever interface holds them
+		sorted_addresses = sorted(addresses, key=lambda a: (a.version, a))
+		for subnet in subnets.values():
+			subnet.reserved = [
+				a for a in sorted_addresses if a in subnet.network
+			]
+		return cls(subnets)
+
+	def get(self, bridge: str) -> BridgeSubnet | None:
+		"""
+		:param bridge: Interface name, if no interface is named exactly so
+		  the first one starting with it is returned (e.g. vmbr0 for vmbr0v10).
+		"""
+		if bridge in self.subnets:
+			return self.subnets[bridge]
+		for iface, subnet in self.subnets.items():
+			if iface.startswith(bridge):
+				return subnet
+		return None
+
+	def get_allocator(
+		self,
+		bridge: str,
+		guest_addresses: dict[int, list[IPAddress]] | None = None,
+	) -> SubnetAllocator | None:
+		"""
+		:param guest_addresses: guest_id:addresses, see get_guest_addresses.
+		:return: Allocator of the bridge's network, with node, gateway and
+		  guest addresses reserved.
+		"""
+		subnet = self.get(bridge)
+		if subnet is None:
+			return None
+		allocator = SubnetAllocator(subnet.network, subnet.reserved)
+		if subnet.gateway:
+			allocator.reserve(subnet.gateway)
+		for addresses in (guest_addresses or {}).values():
+			allocator.update(addresses)
+		return allocator
+
+	def is_fresh(self, ttl: float) -> bool:
+		return 0 <= time.time() - self.created < ttl
+
+	def to_dict(self) -> dict:
+		return {
+			"version": SUBNET_INDEX_VERSION,
+			"created": self.created,
+			"subnets": [s.to_dict() for s in self.subnets.values()],
+		}
+
+	@classmethod
+	def from_dict(cls, data: dict) -> "SubnetIndex":
+		if data.get("version") != SUBNET_INDEX_VERSION:
+			raise ValueError("Unsupported subnet index version.")
+		subnets = [BridgeSubnet.from_dict(s) for s in data["subnets"]]
+		return cls({s.bridge: s for s in subnets}, created=data["created"])
+
+
+def fetch_node_networks() -> dict[str, list[dict]]:
+	"""
+	Fetches the network data of every online node concurrently.
+
+	:return: node:/nodes/{node}/network data.
+	"""
+	nodes = []
+	for node_data in api.pvesh_get("/nodes"):
+		if node_data.get("status", "online") != "online":
+			logger.warning(
+				"Skipping network data of %s node %s.",
+				node_data.get("status"),
+				node_data["node"],
+			)
+			continue
+		nodes.append(node_data["node"])
+	networks = api.pvesh_get_many([f"/nodes/{node}/network" for node in nodes])
+	return dict(zip(nodes, networks))
+
+
+def get_guest_addresses(
+	guest_index: GuestIndex | None = None,
+) -> dict[int, list[IPAddress]]:
+	"""
+	Reads the static addresses of every guest in a single pass over the
+	configuration tree, from ipconfigN (VMs) and netN (CTs) options.
+	Snapshot and pending sections are ignored.
+
+	:return: guest_id:addresses, guests without static addresses are left out.
+	"""
+	guest_index = guest_index or get_guest_index()
+	guest_addresses = {}
+	for guest_id, entry in guest_index.all().items():
+		try:
+			guest_config = GuestConfig.from_file(entry.path)
+		except OSError:
+			# Moved or deleted since the index was read
+			continue
+		addresses = []
+		for key in guest_config.keys():
+			if not GUEST_IP_KEY_REGEX.match(key):
+				continue
+			option = guest_config.option(key)
+			for ip_key in GUEST_IP_KEYS:
+				value = option.get(ip_key)
+				if not value:
+					continue
+				try:
+					addresses.append(ipaddress.ip_interface(value).ip)
+				except ValueError:
+					# dhcp, auto or manual
+					continue
+		if addresses:
+			guest_addresses[guest_id] = addresses
+	return guest_addresses
+
+
+def get_subnet_index_cache_path() -> str:
+	return os.path.join(api.DEFAULT_CACHE_DIR, SUBNET_INDEX_CACHE_FILENAME)
+
+
+def load_subnet_index(cache_path: str, ttl: float) -> SubnetIndex | None:
+	""":return: Cached SubnetIndex, None if missing, unreadable or stale."""
+	try:
+		with open(cache_path, "r") as cache_file:
+			index = SubnetIndex.from_dict(json.load(cache_file))
+	except (OSError, ValueError, KeyError, TypeError):
+		return None
+	if not index.is_fresh(ttl):
+		return None
+	return index
+
+
+def save_subnet_index(index: SubnetIndex, cache_path: str) -> None:
+	tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+	try:
+		os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+		with open(tmp_path, "w") as cache_file:
+			json.dump(index.to_dict(), cache_file)
+		os.replace(tmp_path, cache_path)
+	except OSError as e:
+		logger.warning("Could not cache subnet index (%s).", e)
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+
+
+def get_subnet_index(
+	ttl: float = DEFAULT_SUBNET_INDEX_TTL,
+	cache_path: str | None = None,
+	refresh=False,
+) -> SubnetIndex:
+	"""
+	Returns the cluster SubnetIndex, from the cache if it is younger
+	than ttl seconds.
+
+	:param ttl: Cache lifetime in seconds, 0 disables the cache.
+	:param refresh: Fetch node networks even if the cache is fresh.
+	"""
+	cache_path = cache_path or get_subnet_index_cache_path()
+	if ttl > 0 and not refresh:
+		index = load_subnet_index(cache_path, ttl)
+		if index is not None:
+			logger.debug("Using cached subnet index %s.", cache_path)
+			return index
+	index = SubnetIndex.from_node_networks(fetch_node_networks())
+	if ttl > 0:
+		save_subnet_index(index, cache_path)
+	return index
@@ -0,0 +1,407 @@
+import os
+import json
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Literal
+from core.proxmox.constants import (
+	PVE_CFG_ROOT,
+	PVE_GUEST_SUBPATHS,
+)
+from core.proxmox.guests import get_guest_index
+from core.proxmox.storage import get_storage_config
+
+logger = logging.getLogger()
+
+PVE_CHANGE_KINDS = Literal["nodes", "guests", "storage", "replication", "jobs"]
+# Files directly under the pmxcfs root
+PVE_ROOT_FILE_KINDS: dict[str, PVE_CHANGE_KINDS] = {
+	"storage.cfg": "storage",
+	"replication.cfg": "replication",
+	"jobs.cfg": "jobs",
+	"vzdump.cron": "jobs",
+	".members": "nodes",
+	".vmlist": "guests",
+}
+# Per file counters in pmxcfs' .version, with the file they track
+PVE_VERSION_KINDS: dict[str, tuple[PVE_CHANGE_KINDS, str]] = {
+	"storage.cfg": ("storage", "storage.cfg"),
+	"replication.cfg": ("replication", "replication.cfg"),
+	"jobs.cfg": ("jobs", "jobs.cfg"),
+	"vzdump.cron": ("jobs", "vzdump.cron"),
+	"vmlist": ("guests", ".vmlist"),
+}
+DEFAULT_POLL_INTERVAL = 1.0
+
+# See inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = (
+	IN_MODIFY
+	| IN_CLOSE_WRITE
+	| IN_MOVED_FROM
+	| IN_MOVED_TO
+	| IN_CREATE
+	| IN_DELETE
+	| IN_DELETE_SELF
+)
+INOTIFY_EVENT_STRUCT = struct.Struct("iIII")
+
+
+@dataclass(frozen=True)
+class PVEChangeEvent:
+	kind: PVE_CHANGE_KINDS
+	path: str
+
+
+class Inotify:
+	"""Minimal inotify(7) binding through libc with ctypes."""
+
+	def __init__(self):
+		libc_name = ctypes.util.find_library("c") or "libc.so.6"
+		self._libc = ctypes.CDLL(libc_name, use_errno=True)
+		for func in ("inotify_init1", "inotify_add_watch", "inotify_rm_watch"):
+			if not hasattr(self._libc, func):
+				raise OSError(errno.ENOSYS, f"{func} is not available.")
+		self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed.")
+
+	def add_watch(self, path: str, mask: int = INOTIFY_MASK) -> int:
+		wd = self._libc.inotify_add_watch(
+			self.fd, os.fsencode(path), ctypes.c_uint32(mask)
+		)
+		if wd < 0:
+			err = ctypes.get_errno()
+			raise OSError(err, os.strerror(err), path)
+		return wd
+
+	def rm_watch(self, wd: int) -> None:
+		self._libc.inotify_rm_watch(self.fd, wd)
+
+	def read(self, timeout: float | None) -> list[tuple[int, int, str]]:
+		"""
+		:return: (watch descriptor, mask, name) tuples.
+		"""
+		readable, _, _ = select.select([self.fd], [], [], timeout)
+		if not readable:
+			return []
+		try:
+			data = os.read(self.fd, 64 * 1024)
+		except BlockingIOError:
+			return []
+		events = []
+		offset = 0
+		while offset + INOTIFY_EVENT_STRUCT.size <= len(data):
+			wd, mask, _cookie, length = INOTIFY_EVENT_STRUCT.unpack_from(
+				data, offset
+			)
+			offset += INOTIFY_EVENT_STRUCT.size
+			name = data[offset : offset + length].rstrip(b"\0")
+			offset += length
+			events.append((wd, mask, os.fsdecode(name)))
+		return events
+
+	def close(self) -> None:
+		if self.fd >= 0:
+			os.close(self.fd)
+			self.fd = -1
+
+
+class PVEWatcher:
+	"""
+	Publishes pmxcfs change events for nodes, guest configurations and
+	the storage, replication and backup job configurations.
+
+	Local changes are received through inotify when available. pmxcfs is
+	a FUSE filesystem that does not notify changes made on other cluster
+	nodes, so the .version and .members files are also polled, every
+	cluster-wide write bumps the counters in .version.
+	"""
+
+	def __init__(
+		self,
+		root: str | None = None,
+		poll_interval: float = DEFAULT_POLL_INTERVAL,
+		use_inotify=True,
+	):
+		self.root = root or PVE_CFG_ROOT
+		self.nodes_dir = os.path.join(self.root, "nodes")
+		self.poll_interval = poll_interval
+		self._subscribers: list[
+			tuple[Callable[[PVEChangeEvent], None], set[str] | None]
+		] = []
+		self._inotify: Inotify | None = None
+		self._watches: dict[int, tuple[PVE_CHANGE_KINDS | None, str]] = {}
+		self._versions: dict | None = None
+		self._members: bytes | None = None
+		self._signature: dict[str, tuple | None] = {}
+		self._thread: threading.Thread | None = None
+		self._stop = threading.Event()
+		if use_inotify:
+			try:
+				self._inotify = Inotify()
+			except OSError as e:
+				logger.debug("inotify unavailable, polling only: %s", e)
+		self._read_versions()
+		self._read_members()
+		self._signature = self._get_signature()
+		if self._inotify:
+			self._add_watches()
+
+	@property
+	def uses_inotify(self) -> bool:
+		return self._inotify is not None
+
+	def subscribe(
+		self,
+		callback: Callable[[PVEChangeEvent], None],
+		kinds: Iterable[PVE_CHANGE_KINDS] | None = None,
+	) -> None:
+		"""
+		:param kinds: Only receive these event kinds, all if None.
+		"""
+		self._subscribers.append((callback, set(kinds) if kinds else None))
+
+	def _publish(self, events: list[PVEChangeEvent]) -> None:
+		for event in events:
+			logger.debug("pmxcfs change: %s", event)
+			for callback, kinds in self._subscribers:
+				if kinds is None or event.kind in kinds:
+					try:
+						callback(event)
+					except Exception:
+						logger.exception("pmxcfs change subscriber failed.")
+
+	def _watch(self, path: str, kind: PVE_CHANGE_KINDS | None) -> None:
+		try:
+			wd = self._inotify.add_watch(path)
+		except OSError as e:
+			logger.debug("Could not watch %s: %s", path, e)
+			return
+		self._watches[wd] = (kind, path)
+
+	def _add_watches(self) -> None:
+		for wd in list(self._watches):
+			self._inotify.rm_watch(wd)
+		self._watches.clear()
+		self._watch(self.root, None)
+		self._watch(self.nodes_dir, "nodes")
+		for node_dir in self._get_node_dirs():
+			# Only to catch guest directories being created
+			self._watch(node_dir, "nodes")
+		for guest_dir in self._get_guest_dirs():
+			self._watch(guest_dir, "guests")
+
+	def _get_node_dirs(self) -> list[str]:
+		try:
+			nodes = sorted(os.listdir(self.nodes_dir))
+		except OSError:
+			return []
+		return [
+			os.path.join(self.nodes_dir, node)
+			for node in nodes
+			if os.path.isdir(os.path.join(self.nodes_dir, node))
+		]
+
+	def _get_guest_dirs(self) -> list[str]:
+		return [
+			os.path.join(node_dir, subp)
+			for node_dir in self._get_node_dirs()
+			for subp in PVE_GUEST_SUBPATHS
+			if os.path.isdir(os.path.join(node_dir, subp))
+		]
+
+	def _read_versions(self) -> list[PVEChangeEvent]:
+		try:
+			with open(os.path.join(self.root, ".version"), "r") as f:
+				versions = json.load(f)
+		except (OSError, ValueError):
+			return []
+		previous, self._versions = self._versions, versions
+		if previous is None or previous == versions:
+			return []
+		events = []
+		for key, (kind, name) in PVE_VERSION_KINDS.items():
+			if versions.get(key) != previous.get(key):
+				events.append(
+					PVEChangeEvent(kind, os.path.join(self.root, name))
+				)
+		# Guest configurations have no counters of their own
+		if not events:
+			events.append(PVEChangeEvent("guests", self.nodes_dir))
+		return events
+
+	def _read_members(self) -> list[PVEChangeEvent]:
+		path = os.path.join(self.root, ".members")
+		try:
+			with open(path, "rb") as f:
+				members = f.read()
+		except OSError:
+			return []
+		previous, self._members = self._members, members
+		if previous is None or previous == members:
+			return []
+		return [PVEChangeEvent("nodes", path)]
+
+	def _get_signature(self) -> dict[str, tuple | None]:
+		"""mtimes of watched paths, used when .version cannot be read."""
+		paths = [os.path.join(self.root, name) for name in PVE_ROOT_FILE_KINDS]
+		paths += [self.nodes_dir, *self._get_guest_dirs()]
+		signature = {}
+		for path in paths:
+			try:
+				stat = os.stat(path)
+				signature[path] = (stat.st_mtime_ns, stat.st_size)
+			except OSError:
+				signature[path] = None
+		return signature
+
+	def _get_path_kind(self, path: str) -> PVE_CHANGE_KINDS:
+		name = os.path.basename(path)
+		if name in PVE_ROOT_FILE_KINDS:
+			return PVE_ROOT_FILE_KINDS[name]
+		if path == self.nodes_dir:
+			return "nodes"
+		return "guests"
+
+	def _poll_signature(self) -> list[PVEChangeEvent]:
+		signature = self._get_signature()
+		previous, self._signature = self._signature, signature
+		return [
+			PVEChangeEvent(self._get_path_kind(path), path)
+			for path in sorted(set(signature) | set(previous))
+			if signature.get(path) != previous.get(path)
+		]
+
+	def _read_inotify(self, timeout: float | None) -> list[PVEChangeEvent]:
+		events = []
+		rewatch = False
+		for wd, mask, name in self._inotify.read(timeout):
+			if mask & IN_IGNORED or wd not in self._watches:
+				continue
+			kind, dir_path = self._watches[wd]
+			path = os.path.join(dir_path, name) if name else dir_path
+			if kind is None:
+				kind = PVE_ROOT_FILE_KINDS.get(name)
+				if kind is None:
+					continue
+			elif kind == "guests" and name and not name.endswith(".conf"):
+				continue
+			# Node directories hold frequently written status files
+			elif (
+				kind == "nodes"
+				and dir_path != self.nodes_dir
+				and name not in PVE_GUEST_SUBPATHS
+			):
+				continue
+			if kind == "nodes" or mask & IN_DELETE_SELF:
+				rewatch = True
+			events.append(PVEChangeEvent(kind, path))
+		if rewatch:
+			self._add_watches()
+		return events
+
+	def poll(self, timeout: float | None = None) -> list[PVEChangeEvent]:
+		"""
+		Waits up to timeout seconds for changes and publishes them.
+
+		:return: De-duplicated change events.
+		"""
+		if timeout is None:
+			timeout = self.poll_interval
+		events = []
+		if self._inotify:
+			events += self._read_inotify(timeout)
+		elif timeout:
+			self._stop.wait(timeout)
+		if self._versions is not None:
+			events += self._read_versions()
+		elif not self._inotify:
+			events += self._poll_signature()
+		events += self._read_members()
+		events = list(dict.fromkeys(events))
+		self._publish(events)
+		return events
+
+	def _run(self) -> None:
+		while not self._stop.is_set():
+			self.poll()
+
+	def start(self) -> None:
+		"""Publishes events from a background thread."""
+		if self._thread and self._thread.is_alive():
+			return
+		self._stop.clear()
+		self._thread = threading.Thread(
+			target=self._run, name="pmxcfs-watch", daemon=True
+		)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._thread:
+			self._thread.join()
+			self._thread = None
+		if self._inotify:
+			self._inotify.close()
+			self._inotify = None
+
+
+def watch_caches(watcher: PVEWatcher) -> None:
+	"""
+	Makes the process-wide guest index and storage configuration caches
+	rely on watcher events instead of re-checking mtimes on every lookup.
+	"""
+	guest_index = get_guest_index()
+	storage_config = get_storage_config()
+	guest_index.watched = True
+	storage_config.watched = True
+	watcher.subscribe(
+		lambda _: guest_index.invalidate(), kinds=("nodes", "guests")
+	)
+	watcher.subscribe(lambda _: storage_config.invalidate(), kinds=("storage",))
+
+
+def unwatch_caches() -> None:
+	"""Reverts watch_caches, lookups re-check mtimes again."""
+	for cache in (get_guest_index(), get_storage_config()):
+		cache.watched = False
+		cache.invalidate()
+
+
+@contextmanager
+def watching_caches(
+	poll_interval: float = DEFAULT_POLL_INTERVAL,
+) -> Iterator[PVEWatcher | None]:
+	"""
+	Keeps the process-wide caches watched by a background PVEWatcher
+	while the block runs, for long-lived callers doing many lookups.
+
+	:return: The running watcher, None when pmxcfs is not mounted.
+	"""
+	if not os.path.isdir(PVE_CFG_ROOT):
+		yield None
+		return
+	watcher = PVEWatcher(poll_interval=poll_interval)
+	watch_caches(watcher)
+	watcher.start()
+	try:
+		yield watcher
+	finally:
+		watcher.stop()
+		unwatch_caches()
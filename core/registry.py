@@ -0,0 +1,243 @@
+if __name__ == "__main__":
+	raise Exception(
+		"This python script cannot be executed individually, please use main.py"
+	)
+
+# This module is imported by main.py on every run, it must stay cheap to
+# import: no logging, typing or json, the cache is a marshal dump.
+import os
+import sys
+import marshal
+from .utils.path import EXCLUDED_FILES, path_as_module
+
+REGISTRY_VERSION = 1
+REGISTRY_FILENAME = ".script_registry.cache"
+SCRIPTS_SUBDIR = "scripts"
+ARGPARSER_FACTORY = "argparser"
+
+# Script entries are plain dicts:
+# 	path: Script path relative to the toolkit.
+# 	module: Module path.
+# 	argparser: Name of the argparser factory function, None if it has none.
+# 	prog: make_parser prog.
+# 	description: make_parser description.
+# 	mtime: Script mtime in nanoseconds.
+ScriptEntry = dict
+
+
+def is_script_file(filename: str) -> bool:
+	return (
+		filename.endswith(".py")
+		and not filename.startswith("__")
+		and filename not in EXCLUDED_FILES
+	)
+
+
+def _get_constant_str(node) -> str | None:
+	import ast
+
+	if isinstance(node, ast.Constant) and isinstance(node.value, str):
+		return node.value
+	return None
+
+
+def parse_script(source: str, rel_path: str, mtime: int = 0) -> ScriptEntry:
+	"""
+	Statically parses a sub-script, without importing it or any of its
+	dependencies.
+
+	:return: Script entry, prog and description are only set if passed to
+	  make_parser as string literals.
+	"""
+	import ast
+
+	tree = ast.parse(source, filename=rel_path)
+	functions = {
+		node.name: node
+		for node in tree.body
+		if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+	}
+	entry: ScriptEntry = {
+		"path": rel_path,
+		"module": path_as_module(rel_path),
+		"argparser": None,
+		"prog": None,
+		"description": None,
+		"mtime": mtime,
+	}
+	factory = functions.get(ARGPARSER_FACTORY)
+	if factory is None:
+		return entry
+	entry["argparser"] = factory.name
+	for node in ast.walk(factory):
+		if not isinstance(node, ast.Call):
+			continue
+		func_name = getattr(node.func, "id", getattr(node.func, "attr", None))
+		if func_name != "make_parser":
+			continue
+		for keyword in node.keywords:
+			if keyword.arg in ("prog", "description"):
+				entry[keyword.arg] = _get_constant_str(keyword.value)
+		break
+	return entry
+
+
+class ScriptRegistry:
+	"""
+	Sub-scripts of the toolkit (module path, argparser factory and
+	description), cached to a marshal file so that main.py can resolve and
+	list scripts without importing or globbing them.
+
+	The cache is rebuilt when a script, or a directory holding scripts,
+	changes its mtime, or when read by another Python version.
+	"""
+
+	def __init__(
+		self,
+		toolkit_path: str,
+		subdirectory: str = SCRIPTS_SUBDIR,
+		cache_path: str | None = None,
+	):
+		self.toolkit_path = os.path.abspath(toolkit_path or ".")
+		self.subdirectory = subdirectory
+		if not cache_path:
+			cache_filename = REGISTRY_FILENAME
+			if subdirectory != SCRIPTS_SUBDIR:
+				# Registries of other directories must not overwrite it
+				cache_filename = f"{REGISTRY_FILENAME}.{subdirectory.strip('/').replace('/', '.')}"
+			cache_path = os.path.join(self.toolkit_path, cache_filename)
+		self.cache_path = cache_path
+		self._scripts: dict[str, ScriptEntry] | None = None
+		# Relative directory path:mtime of every walked directory
+		self._dirs: dict[str, int] = {}
+
+	def _stat_mtime(self, rel_path: str) -> int | None:
+		try:
+			return os.stat(
+				os.path.join(self.toolkit_path, rel_path)
+			).st_mtime_ns
+		except OSError:
+			return None
+
+	def _is_fresh(self, data: dict) -> bool:
+		if data.get("version") != REGISTRY_VERSION:
+			return False
+		if data.get("python") != sys.hexversion:
+			return False
+		if data.get("subdirectory") != self.subdirectory:
+			return False
+		for rel_path, mtime in data["dirs"].items():
+			if self._stat_mtime(rel_path) != mtime:
+				return False
+		for entry in data["scripts"].values():
+			if self._stat_mtime(entry["path"]) != entry["mtime"]:
+				return False
+		return True
+
+	def load(self) -> bool:
+		"""
+		Loads the cached registry.
+
+		:return: Whether the cache exists and is still valid.
+		"""
+		try:
+			with open(self.cache_path, "rb") as cache_file:
+				data = marshal.load(cache_file)
+			if not self._is_fresh(data):
+				return False
+		except (
+			OSError,
+			EOFError,
+			ValueError,
+			KeyError,
+			TypeError,
+			AttributeError,
+		):
+			return False
+		self._scripts = data["scripts"]
+		self._dirs = data["dirs"]
+		return True
+
+	def build(self) -> dict[str, ScriptEntry]:
+		scripts: dict[str, ScriptEntry] = {}
+		dirs: dict[str, int] = {}
+		scripts_dir = os.path.join(self.toolkit_path, self.subdirectory)
+		for dir_path, dir_names, file_names in os.walk(scripts_dir):
+			dir_names[:] = sorted(
+				d for d in dir_names if not d.startswith((".", "__"))
+			)
+			rel_dir = os.path.relpath(dir_path, self.toolkit_path)
+			dirs[rel_dir] = os.stat(dir_path).st_mtime_ns
+			for filename in sorted(file_names):
+				if not is_script_file(filename):
+					continue
+				rel_path = os.path.join(rel_dir, filename)
+				file_path = os.path.join(dir_path, filename)
+				try:
+					with open(file_path, "r") as script_file:
+						source = script_file.read()
+					scripts[rel_path] = parse_script(
+						source, rel_path, os.stat(file_path).st_mtime_ns
+					)
+				except (OSError, SyntaxError, ValueError):
+					# Unreadable scripts still fail when imported by main.py
+					continue
+		self._scripts = scripts
+		self._dirs = dirs
+		return scripts
+
+	def save(self) -> None:
+		data = {
+			"version": REGISTRY_VERSION,
+			"python": sys.hexversion,
+			"subdirectory": self.subdirectory,
+			"dirs": self._dirs,
+			"scripts": self._scripts or {},
+		}
+		tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+		try:
+			with open(tmp_path, "wb") as cache_file:
+				marshal.dump(data, cache_file)
+			os.replace(tmp_path, self.cache_path)
+		except OSError:
+			# Read-only installs still work, just without the cache
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+
+	def refresh(self, force=False) -> None:
+		if not force and self._scripts is not None:
+			return
+		if force or not self.load():
+			self.build()
+			self.save()
+
+	def scripts(self) -> dict[str, ScriptEntry]:
+		self.refresh()
+		return self._scripts
+
+	def get(self, name: str) -> ScriptEntry | None:
+		"""
+		:param name: Script path relative to the toolkit, or its module path.
+		"""
+		scripts = self.scripts()
+		if name.endswith(".py"):
+			if os.path.isabs(name):
+				name = os.path.relpath(name, self.toolkit_path)
+			name = os.path.normpath(name)
+		if name in scripts:
+			return scripts[name]
+		for entry in scripts.values():
+			if entry["module"] == name:
+				return entry
+		return None
+
+
+_script_registry: ScriptRegistry | None = None
+
+
+def get_script_registry(toolkit_path: str) -> ScriptRegistry:
+	"""Returns the process-wide ScriptRegistry."""
+	global _script_registry
+	if _script_registry is None:
+		_script_registry = ScriptRegistry(toolkit_path)
+	return _script_registry
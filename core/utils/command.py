@@ -0,0 +1,197 @@
+import time
+import logging
+import threading
+import weakref
+from dataclasses import dataclass
+from sys import getdefaultencoding
+from core.utils.lazy import lazy_import
+from core.utils.ssh import get_remote_args
+
+# Imported on the first command, asyncio (and ssl) are heavy imports
+asyncio = lazy_import("asyncio")
+
+logger = logging.getLogger(__name__)
+
+# Maximum concurrent subprocesses per event loop
+DEFAULT_CONCURRENCY = 8
+
+
+@dataclass
+class CommandResult:
+	"""Structured result of a finished subprocess."""
+
+	args: list[str]
+	returncode: int
+	stdout: bytes
+	stderr: bytes
+	duration: float
+	timed_out: bool = False
+
+	@property
+	def ok(self) -> bool:
+		return self.returncode == 0 and not self.timed_out
+
+	@property
+	def output(self) -> str:
+		return self.stdout.decode(getdefaultencoding())
+
+	@property
+	def errors(self) -> str:
+		return self.stderr.decode(getdefaultencoding())
+
+	def check(self) -> "CommandResult":
+		"""Raises CommandError if the command failed, returns self otherwise."""
+		if self.timed_out:
+			raise CommandTimeoutError(self)
+		if self.returncode != 0:
+			raise CommandError(self)
+		return self
+
+
+class CommandError(Exception):
+	def __init__(self, result: CommandResult):
+		self.result = result
+		super().__init__(
+			f"Bad command return code ({result.returncode}).",
+			result.output,
+			result.errors,
+		)
+
+
+class CommandTimeoutError(CommandError):
+	def __init__(self, result: CommandResult):
+		self.result = result
+		Exception.__init__(
+			self,
+			f"Command timed out after {result.duration:.2f} seconds.",
+			" ".join(result.args),
+		)
+
+
+class CommandRunner:
+	"""
+	Runs subprocesses with asyncio, so many I/O bound commands (qm, pvesh,
+	ssh, etc.) can overlap instead of running back to back.
+
+	Concurrency is limited with a semaphore per event loop. Blocking
+	run_command calls each run their own event loop, callers running them
+	from a thread pool are bounded by the pool's workers instead.
+	"""
+
+	def __init__(
+		self,
+		concurrency: int = DEFAULT_CONCURRENCY,
+		timeout: float | None = None,
+	):
+		self.concurrency = max(1, concurrency)
+		self.timeout = timeout
+		self._semaphores: weakref.WeakKeyDictionary[
+			asyncio.AbstractEventLoop, asyncio.Semaphore
+		] = weakref.WeakKeyDictionary()
+
+	def _get_semaphore(self) -> "asyncio.Semaphore":
+		loop = asyncio.get_running_loop()
+		semaphore = self._semaphores.get(loop)
+		if semaphore is None:
+			semaphore = asyncio.Semaphore(self.concurrency)
+			self._semaphores[loop] = semaphore
+		return semaphore
+
+	async def run(
+		self,
+		cmd_args: list[str],
+		host: str | None = None,
+		user: str = "root",
+		remote_args: list | None = None,
+		timeout: float | None = None,
+		check=False,
+		input: bytes | None = None,
+		capture_output=True,
+	) -> CommandResult:
+		"""
+		:param host: Runs the command on host through the SSH session pool.
+		:param remote_args: Explicit remote command prefix, overrides host.
+		:param timeout: Seconds until the command is killed, defaults to the
+		  runner's timeout.
+		:param check: Raise CommandError if the command fails.
+		:param capture_output: If False stdout and stderr are inherited.
+		"""
+		if host and not remote_args:
+			remote_args = get_remote_args(host, user)
+		cmd_args = [str(a) for a in cmd_args]
+		if remote_args:
+			cmd_args = list(remote_args) + cmd_args
+		if timeout is None:
+			timeout = self.timeout
+		pipe = asyncio.subprocess.PIPE if capture_output else None
+		if input is not None:
+			stdin = asyncio.subprocess.PIPE
+		else:
+			# Prevent concurrent ssh sessions from reading the terminal
+			stdin = asyncio.subprocess.DEVNULL if capture_output else None
+
+		async with self._get_semaphore():
+			logger.debug(" ".join(cmd_args))
+			start = time.monotonic()
+			proc = await asyncio.create_subprocess_exec(
+				*cmd_args, stdin=stdin, stdout=pipe, stderr=pipe
+			)
+			timed_out = False
+			try:
+				stdout, stderr = await asyncio.wait_for(
+					proc.communicate(input), timeout
+				)
+			except asyncio.TimeoutError:
+				timed_out = True
+				proc.kill()
+				stdout, stderr = await proc.communicate()
+			result = CommandResult(
+				args=cmd_args,
+				returncode=proc.returncode,
+				stdout=stdout or b"",
+				stderr=stderr or b"",
+				duration=time.monotonic() - start,
+				timed_out=timed_out,
+			)
+		if check:
+			result.check()
+		return result
+
+	async def run_many(
+		self, commands: list[list[str]], **kwargs
+	) -> list[CommandResult]:
+		"""
+		Runs every command concurrently, bounded by the runner's
+		concurrency, results keep the order of commands.
+		"""
+		return list(
+			await asyncio.gather(
+				*(self.run(cmd_args, **kwargs) for cmd_args in commands)
+			)
+		)
+
+
+_command_runner: CommandRunner | None = None
+_command_runner_lock = threading.Lock()
+
+
+def get_command_runner() -> CommandRunner:
+	"""Returns the process-wide CommandRunner."""
+	global _command_runner
+	with _command_runner_lock:
+		if _command_runner is None:
+			_command_runner = CommandRunner()
+	return _command_runner
+
+
+def run_command(cmd_args: list[str], **kwargs) -> CommandResult:
+	"""
+	Blocking wrapper of CommandRunner.run for synchronous callers,
+	cannot be called from a running event loop.
+	"""
+	return asyncio.run(get_command_runner().run(cmd_args, **kwargs))
+
+
+def run_commands(commands: list[list[str]], **kwargs) -> list[CommandResult]:
+	"""Blocking wrapper of CommandRunner.run_many."""
+	return asyncio.run(get_command_runner().run_many(commands, **kwargs))
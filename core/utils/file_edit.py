@@ -0,0 +1,107 @@
+import os
+import re
+import logging
+from dataclasses import dataclass
+from typing import Callable
+from core.utils.lazy import lazy_import
+
+difflib = lazy_import("difflib")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Substitution:
+	"""
+	A single regex or literal substitution.
+
+	Regex substitutions default to multi-line mode, so ^ and $ match on
+	every line like sed does.
+	"""
+
+	pattern: str
+	replacement: str | Callable[[re.Match], str]
+	literal: bool = False
+	count: int = 0
+	flags: int = re.MULTILINE
+
+	def apply(self, content: str) -> str:
+		if self.literal:
+			if callable(self.replacement):
+				raise TypeError(
+					"Literal substitutions require a str replacement."
+				)
+			return content.replace(
+				self.pattern, self.replacement, self.count or -1
+			)
+		return re.sub(
+			self.pattern,
+			self.replacement,
+			content,
+			count=self.count,
+			flags=self.flags,
+		)
+
+
+def apply_substitutions(content: str, substitutions: list[Substitution]) -> str:
+	for substitution in substitutions:
+		content = substitution.apply(content)
+	return content
+
+
+def write_file_atomic(path: str, content: str) -> None:
+	"""
+	Writes content to a temporary file next to path and renames it over
+	path, readers never see a partially written file.
+	Same pattern PVE uses for pmxcfs (/etc/pve) files.
+	"""
+	tmp_path = f"{path}.tmp.{os.getpid()}"
+	try:
+		with open(tmp_path, "w") as tmp_file:
+			tmp_file.write(content)
+			tmp_file.flush()
+			os.fsync(tmp_file.fileno())
+		try:
+			os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+		except OSError:
+			# File may not exist yet, and pmxcfs does not support chmod.
+			pass
+		os.rename(tmp_path, path)
+	except BaseException:
+		try:
+			os.unlink(tmp_path)
+		except OSError:
+			pass
+		raise
+
+
+def edit_file(
+	path: str, substitutions: list[Substitution], dry_run=False
+) -> str:
+	"""
+	Applies substitutions to a file with one read and one atomic write.
+
+	:param bool dry_run: Only compute the changes, do not write them.
+	:return: Unified diff of the changes, empty if nothing changed.
+	:rtype: str
+	"""
+	with open(path, "r") as edited_file:
+		content = edited_file.read()
+	new_content = apply_substitutions(content, substitutions)
+	diff = "".join(
+		difflib.unified_diff(
+			content.splitlines(keepends=True),
+			new_content.splitlines(keepends=True),
+			fromfile=path,
+			tofile=path,
+		)
+	)
+	if not diff:
+		logger.debug("No changes to apply on %s", path)
+		return diff
+	if dry_run:
+		logger.info("Changes to apply on %s:\n%s", path, diff)
+	else:
+		logger.debug("Writing changes to %s:\n%s", path, diff)
+		write_file_atomic(path, new_content)
+	return diff
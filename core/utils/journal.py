@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Literal, TypedDict, NotRequired
+
+logger = logging.getLogger()
+
+JournalState = Literal["started", "done", "failed"]
+JOURNAL_STARTED: JournalState = "started"
+JOURNAL_DONE: JournalState = "done"
+JOURNAL_FAILED: JournalState = "failed"
+
+
+class JournalEntry(TypedDict):
+	time: float
+	key: str | None
+	step: str
+	state: JournalState
+	data: NotRequired[dict]
+
+
+class Journal:
+	"""
+	Append-only JSON lines journal of multi-step operations.
+
+	Steps are written before they run and again once they finish or fail.
+	Every line is flushed and fsynced, a crash can leave at most the last
+	step of each operation unfinished. Without a path the journal is only
+	kept in memory (e.g. for dry-runs).
+	"""
+
+	def __init__(self, path: str | None = None):
+		self.path = path
+		self._lock = threading.Lock()
+		self._entries: list[JournalEntry] = []
+		# Latest entry of every (key, step) pair
+		self._steps: dict[tuple[str | None, str], JournalEntry] = {}
+		if path and os.path.exists(path):
+			self._load()
+
+	def _load(self) -> None:
+		with open(self.path, "r") as journal_file:
+			lines = journal_file.readlines()
+		for line_number, line in enumerate(lines, start=1):
+			if not line.strip():
+				continue
+			try:
+				entry: JournalEntry = json.loads(line)
+			except ValueError:
+				# A line cut short by a crash
+				logger.warning(
+					"Ignoring corrupt journal line %s in %s.",
+					line_number,
+					self.path,
+				)
+				continue
+			self._add(entry)
+
+	def _add(self, entry: JournalEntry) -> None:
+		self._entries.append(entry)
+		self._steps[(entry["key"], entry["step"])] = entry
+
+	def record(
+		self,
+		key: str | None,
+		step: str,
+		state: JournalState,
+		data: dict | None = None,
+	) -> JournalEntry:
+		entry: JournalEntry = {
+			"time": time.time(),
+			"key": key,
+			"step": step,
+			"state": state,
+		}
+		if data is not None:
+			entry["data"] = data
+		with self._lock:
+			if self.path:
+				journal_dir = os.path.dirname(self.path)
+				if journal_dir:
+					os.makedirs(journal_dir, exist_ok=True)
+				with open(self.path, "a") as journal_file:
+					journal_file.write(json.dumps(entry) + "\n")
+					journal_file.flush()
+					os.fsync(journal_file.fileno())
+			self._add(entry)
+		return entry
+
+	def get(self, key: str | None, step: str) -> JournalEntry | None:
+		return self._steps.get((key, step))
+
+	def get_data(self, key: str | None, step: str) -> dict | None:
+		entry = self.get(key, step)
+		if entry is None:
+			return None
+		return entry.get("data", {})
+
+	def is_done(self, key: str | None, step: str) -> bool:
+		entry = self.get(key, step)
+		return entry is not None and entry["state"] == JOURNAL_DONE
+
+	def keys(self) -> list[str]:
+		"""Operation keys, in the order they were first journaled."""
+		return list(
+			dict.fromkeys(
+				e["key"] for e in self._entries if e["key"] is not None
+			)
+		)
+
+	def steps(self, key: str | None) -> list[JournalEntry]:
+		"""Latest entry of every step of key, in the order they started."""
+		return [
+			self._steps[(key, s)]
+			for s in dict.fromkeys(
+				e["step"] for e in self._entries if e["key"] == key
+			)
+		]
+
+	@contextmanager
+	def step(
+		self, key: str | None, step: str, data: dict | None = None
+	) -> Iterator[dict]:
+		"""
+		Journals a step around the wrapped block, the yielded dict is
+		written along with the done or failed entry.
+		"""
+		data = dict(data or {})
+		self.record(key, step, JOURNAL_STARTED, data)
+		try:
+			yield data
+		except BaseException as e:
+			data["error"] = str(e) or e.__class__.__name__
+			self.record(key, step, JOURNAL_FAILED, data)
+			raise
+		self.record(key, step, JOURNAL_DONE, data)
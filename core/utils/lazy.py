@@ -0,0 +1,62 @@
+import sys
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+	"""
+	Placeholder of a module that is only imported on its first attribute
+	access, keeping heavy imports (asyncio, ssl, etc.) off the startup
+	path of scripts that never use them.
+
+	Attributes set or deleted (e.g. by mock.patch) are forwarded to the
+	imported module.
+	"""
+
+	def __init__(self, name: str):
+		super().__init__(name)
+		object.__setattr__(self, "_lazy_lock", threading.Lock())
+		object.__setattr__(self, "_lazy_module", None)
+
+	def _load(self) -> ModuleType:
+		module = self._lazy_module
+		if module is None:
+			with self._lazy_lock:
+				module = self._lazy_module
+				if module is None:
+					module = importlib.import_module(self.__name__)
+					object.__setattr__(self, "_lazy_module", module)
+		return module
+
+	@property
+	def loaded(self) -> bool:
+		return self._lazy_module is not None
+
+	def __getattr__(self, name: str):
+		return getattr(self._load(), name)
+
+	def __setattr__(self, name: str, value) -> None:
+		setattr(self._load(), name, value)
+
+	def __delattr__(self, name: str) -> None:
+		delattr(self._load(), name)
+
+	def __dir__(self):
+		return dir(self._load())
+
+	def __repr__(self) -> str:
+		state = "loaded" if self.loaded else "not loaded"
+		return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name: str) -> ModuleType:
+	"""
+	Returns module name, imported on first use.
+
+	Modules that were already imported are returned as is.
+	"""
+	module = sys.modules.get(name)
+	if module is not None:
+		return module
+	return LazyModule(name)
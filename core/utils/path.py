@@ -1,6 +1,8 @@
 import os
 import glob
 
+# Journals and rollback manifests must outlive the toolkit's checkout.
+DEFAULT_STATE_DIR = "/var/lib/py-pve-toolkit"
 EXCLUDED_FILES = [
 	"main.py",
 	"template.py",
@@ -28,3 +30,8 @@ def get_all_allowed_paths(project_root: str, subdirectory: str | None = None):
 
 def path_as_module(_path):
 	return os.path.splitext(_path)[0].replace("/", ".")
+
+
+def get_state_path(*parts: str) -> str:
+	""":return: Path within the toolkit's state directory."""
+	return os.path.join(DEFAULT_STATE_DIR, *parts)
@@ -1,8 +1,10 @@
 import os
 from core.format.colors import print_c, bcolors
-from core.debian.apt import apt_dist_upgrade, apt_update
+from core.utils.lazy import lazy_import
 from typing import TypedDict, Required
 
+apt = lazy_import("core.debian.apt")
+
 
 class YesNoChoicesDict(TypedDict):
 	yes: Required[list[str]]
@@ -71,9 +73,9 @@ def prompt_update(dist_upgrade=True):
 	if yes_no_input(
 		msg="Do you wish to perform an update?", input_default=True
 	):
-		apt_update()
+		apt.apt_update()
 		if dist_upgrade:
-			apt_dist_upgrade()
+			apt.apt_dist_upgrade()
 	print_c(bcolors.L_GREEN, "Update Complete.")
 
 
@@ -0,0 +1,108 @@
+import os
+import atexit
+import logging
+from core.utils.lazy import lazy_import
+
+shutil = lazy_import("shutil")
+subprocess = lazy_import("subprocess")
+tempfile = lazy_import("tempfile")
+
+logger = logging.getLogger(__name__)
+
+SSH_BIN = "/usr/bin/ssh"
+# Seconds an idle master stays up, in case the process dies before cleanup.
+DEFAULT_CONTROL_PERSIST = 300
+DEFAULT_CONNECT_TIMEOUT = 10
+
+
+class SSHSessionPool:
+	"""
+	Keeps one multiplexed SSH connection (ControlMaster) per remote target
+	for the lifetime of the process.
+
+	The first command sent to a target opens the master connection, every
+	following command re-uses its socket and skips the TCP and key-exchange
+	handshakes.
+	"""
+
+	def __init__(
+		self,
+		control_dir: str | None = None,
+		control_persist: int = DEFAULT_CONTROL_PERSIST,
+		connect_timeout: int = DEFAULT_CONNECT_TIMEOUT,
+	):
+		self._control_dir = control_dir
+		self._owns_control_dir = control_dir is None
+		self.control_persist = control_persist
+		self.connect_timeout = connect_timeout
+		self._targets: set[str] = set()
+
+	@property
+	def control_dir(self) -> str:
+		if self._control_dir is None:
+			self._control_dir = tempfile.mkdtemp(prefix="py-pve-toolkit-ssh-")
+		return self._control_dir
+
+	@property
+	def control_path(self) -> str:
+		# %C is a hash of the connection parameters, keeps the socket path
+		# short enough for the UNIX socket path length limit.
+		return os.path.join(self.control_dir, "%C")
+
+	def ssh_options(self) -> list[str]:
+		return [
+			"-o",
+			"ControlMaster=auto",
+			"-o",
+			f"ControlPath={self.control_path}",
+			"-o",
+			f"ControlPersist={self.control_persist}",
+			"-o",
+			f"ConnectTimeout={self.connect_timeout}",
+		]
+
+	def remote_args(self, host: str, user: str = "root") -> list[str]:
+		"""Returns the SSH command prefix for a multiplexed remote call."""
+		if not host:
+			raise ValueError("host is required.")
+		target = f"{user}@{host}"
+		self._targets.add(target)
+		return [SSH_BIN, *self.ssh_options(), target]
+
+	def close(self) -> None:
+		"""Stops every master connection opened by this pool."""
+		for target in self._targets:
+			logger.debug("Closing SSH master connection for %s", target)
+			subprocess.call(
+				[
+					SSH_BIN,
+					"-o",
+					f"ControlPath={self.control_path}",
+					"-O",
+					"exit",
+					target,
+				],
+				stdout=subprocess.DEVNULL,
+				stderr=subprocess.DEVNULL,
+			)
+		self._targets.clear()
+		if self._owns_control_dir and self._control_dir:
+			shutil.rmtree(self._control_dir, ignore_errors=True)
+			self._control_dir = None
+
+
+_ssh_pool: SSHSessionPool | None = None
+
+
+def get_ssh_pool() -> SSHSessionPool:
+	"""Returns the process-wide SSHSessionPool."""
+	global _ssh_pool
+	if _ssh_pool is None:
+		_ssh_pool = SSHSessionPool()
+		atexit.register(_ssh_pool.close)
+	return _ssh_pool
+
+
+def get_remote_args(host: str, user: str = "root") -> list[str]:
+	"""Returns remote_args for host, backed by the process-wide pool."""
+	return get_ssh_pool().remote_args(host=host, user=user)
@@ -5,11 +5,15 @@ import sys
 import os
 from core.utils.path import path_as_module
 from core.parser import make_parser
+from core.registry import get_script_registry
 from core.utils.shell import is_completion_context
-from core.autocomplete import argcomplete_exists
 
-# Import and use argcomplete if available
-use_argcomplete = argcomplete_exists() and is_completion_context()
+# Import and use argcomplete if available, only looked up when completing
+use_argcomplete = False
+if is_completion_context():
+	from core.autocomplete import argcomplete_exists
+
+	use_argcomplete = argcomplete_exists()
 if use_argcomplete:
 	from argcomplete import autocomplete
 
@@ -21,8 +25,12 @@ python_interactive = bool(getattr(sys, "ps1", sys.flags.interactive))
 if python_interactive:
 	print("Interactive mode enabled.")
 
+registry = get_script_registry(TOOLKIT_PATH)
+
 if len(sys.argv) <= 1 and not use_argcomplete:
 	print("Please enter a valid script path.")
+	for script in registry.scripts().values():
+		print(f"  {script['path']:<48} {script['description'] or ''}".rstrip())
 	sys.exit(1)
 
 if use_argcomplete:
@@ -34,7 +42,11 @@ if use_argcomplete:
 else:
 	filename = sys.argv[1]
 
-if filename.endswith(".py") or "/" in filename:
+# Resolved without importing the sub-script
+script_entry = registry.get(filename) if filename else None
+if script_entry:
+	parsed_filename = script_entry["module"]
+elif filename.endswith(".py") or "/" in filename:
 	parsed_filename = path_as_module(filename)
 else:
 	parsed_filename = filename
@@ -49,6 +61,16 @@ def _autocomplete_parser():
 if len(filename) == 0 and use_argcomplete:
 	_autocomplete_parser()
 
+# Complete from the cached option tables, without importing the sub-script
+if use_argcomplete and script_entry:
+	from core.autocomplete import CompletionCache
+
+	completion_parser = CompletionCache(TOOLKIT_PATH, registry).get_parser(
+		script_entry, **PARSER_ARGS
+	)
+	if completion_parser:
+		autocomplete(completion_parser)
+
 try:
 	# Import sub-script module
 	module = __import__(parsed_filename, fromlist=["main", "argparser"])
@@ -63,7 +85,14 @@ except AttributeError:
 	sys.exit(f"Error: Sub-script '{parsed_filename}' has no 'main' function.")
 
 # Check if sub-script provides an argparser
-script_parser = getattr(module, "argparser", None)
+if script_entry:
+	script_parser = (
+		getattr(module, script_entry["argparser"])
+		if script_entry["argparser"]
+		else None
+	)
+else:
+	script_parser = getattr(module, "argparser", None)
 if script_parser:
 	# Initialize sub-script's parser (inheriting main_parser)
 	sub_parser: ArgumentParser = script_parser(**PARSER_ARGS)
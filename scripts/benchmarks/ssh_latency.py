@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+if __name__ == "__main__":
+	raise Exception(
+		"This python script cannot be executed individually, please use main.py"
+	)
+
+import subprocess
+import statistics
+from time import perf_counter
+from core.format.colors import bcolors, print_c
+from core.parser import make_parser, ArgumentParser
+from core.utils.ssh import SSH_BIN, SSHSessionPool
+
+
+def argparser(**kwargs) -> ArgumentParser:
+	parser = make_parser(
+		prog="SSH Remote Command Latency Benchmark",
+		description="Compares per-command latency of plain SSH calls against the multiplexed SSH session pool.",
+		**kwargs,
+	)
+	parser.add_argument("host", help="Remote host to benchmark against.")
+	parser.add_argument("-l", "--remote-user", default="root")
+	parser.add_argument(
+		"-n",
+		"--count",
+		default=20,
+		type=int,
+		help="Commands to execute per mode.",
+	)
+	parser.add_argument(
+		"-c",
+		"--command",
+		default="true",
+		help="Remote command to execute.",
+	)
+	return parser
+
+
+class LocalParser:
+	host: str
+	remote_user: str
+	count: int
+	command: str
+
+
+def time_commands(remote_args: list[str], command: str, count: int):
+	samples = []
+	for _ in range(count):
+		start = perf_counter()
+		subprocess.run(
+			remote_args + command.split(),
+			stdout=subprocess.DEVNULL,
+			check=True,
+		)
+		samples.append((perf_counter() - start) * 1000)
+	return samples
+
+
+def print_results(label: str, samples: list[float]):
+	print_c(bcolors.L_BLUE, label)
+	print(f"\tmean:   {statistics.mean(samples):8.2f} ms")
+	print(f"\tmedian: {statistics.median(samples):8.2f} ms")
+	print(f"\tmin:    {min(samples):8.2f} ms")
+	print(f"\tmax:    {max(samples):8.2f} ms")
+
+
+def main(argv_a: LocalParser, **kwargs):
+	if argv_a.count < 1:
+		raise ValueError("count must be greater than 0.")
+	target = f"{argv_a.remote_user}@{argv_a.host}"
+
+	plain = time_commands([SSH_BIN, target], argv_a.command, argv_a.count)
+	print_results("Plain SSH (one connection per command)", plain)
+
+	pool = SSHSessionPool()
+	try:
+		remote_args = pool.remote_args(argv_a.host, argv_a.remote_user)
+		pooled = time_commands(remote_args, argv_a.command, argv_a.count)
+	finally:
+		pool.close()
+	print_results("SSH Session Pool (first command opens the master)", pooled)
+	print_results(
+		"SSH Session Pool (excluding master setup)", pooled[1:] or pooled
+	)
+
+	speedup = statistics.median(plain) / statistics.median(pooled)
+	print_c(bcolors.L_GREEN, f"Median speed-up: {speedup:.1f}x")
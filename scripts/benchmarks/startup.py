@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+if __name__ == "__main__":
+	raise Exception(
+		"This python script cannot be executed individually, please use main.py"
+	)
+
+import os
+import sys
+import json
+import statistics
+import subprocess
+from time import perf_counter
+from dataclasses import dataclass, field
+from core.format.colors import bcolors, print_c
+from core.parser import make_parser, ArgumentParser
+from core.registry import get_script_registry
+
+# Median import time allowed for main.py and a sub-script's argparser
+DEFAULT_BUDGET_MS = 60.0
+DEFAULT_RUNS = 5
+# Modules that must stay off the startup path, they are lazily imported
+STARTUP_EXCLUDED_MODULES = ("asyncio", "ssl")
+IMPORTTIME_PREFIX = "import time:"
+
+
+def argparser(**kwargs) -> ArgumentParser:
+	parser = make_parser(
+		prog="Toolkit Startup Benchmark",
+		description="Measures the startup import time of main.py sub-scripts with python -X importtime and enforces a startup budget.",
+		**kwargs,
+	)
+	parser.add_argument(
+		"scripts",
+		nargs="*",
+		help="Sub-scripts to measure (Default: every script with an argparser).",
+	)
+	parser.add_argument(
+		"-n",
+		"--runs",
+		default=DEFAULT_RUNS,
+		type=int,
+		help="Runs per sub-script, the median is compared to the budget.",
+	)
+	parser.add_argument(
+		"-b",
+		"--budget-ms",
+		default=DEFAULT_BUDGET_MS,
+		type=float,
+		help=f"Import time budget in milliseconds (Default: {DEFAULT_BUDGET_MS}).",
+	)
+	parser.add_argument(
+		"-j", "--json", action="store_true", help="Output results as JSON"
+	)
+	return parser
+
+
+class LocalParser:
+	scripts: list[str]
+	runs: int
+	budget_ms: float
+	json: bool
+
+
+@dataclass
+class StartupResult:
+	script: str
+	import_ms: float
+	wall_ms: float
+	excluded_modules: list[str] = field(default_factory=list)
+
+	def within_budget(self, budget_ms: float) -> bool:
+		return self.import_ms <= budget_ms and not self.excluded_modules
+
+
+def parse_importtime(raw: str) -> dict[str, int]:
+	"""
+	Parses python -X importtime output.
+
+	:return: module:cumulative microseconds of every imported module.
+	"""
+	modules = {}
+	for line in raw.splitlines():
+		if not line.startswith(IMPORTTIME_PREFIX):
+			continue
+		try:
+			_, cumulative, name = line[len(IMPORTTIME_PREFIX) :].split("|")
+			modules[name.strip()] = int(cumulative)
+		except ValueError:
+			# Header line
+			continue
+	return modules
+
+
+def get_total_import_us(raw: str) -> int:
+	"""Sums the cumulative time of every top-level import."""
+	total = 0
+	for line in raw.splitlines():
+		if not line.startswith(IMPORTTIME_PREFIX):
+			continue
+		parts = line[len(IMPORTTIME_PREFIX) :].split("|")
+		if len(parts) != 3 or not parts[1].strip().isdigit():
+			continue
+		# Nested imports are indented past the separator's single space
+		if parts[2].startswith("  "):
+			continue
+		total += int(parts[1])
+	return total
+
+
+def get_startup_cmd(toolkit_path: str, script: str) -> list[str]:
+	return [
+		sys.executable,
+		"-X",
+		"importtime",
+		os.path.join(toolkit_path, "main.py"),
+		script,
+		"-h",
+	]
+
+
+def measure_startup(toolkit_path: str, script: str, runs: int) -> StartupResult:
+	import_samples = []
+	wall_samples = []
+	excluded = set()
+	# Bytecode is cached as it would be on an installed toolkit, the
+	# discarded warm-up run compiles whatever is missing.
+	env = {
+		k: v
+		for k, v in os.environ.items()
+		if k not in ("COMP_LINE", "COMP_POINT", "PYTHONDONTWRITEBYTECODE")
+	}
+	subprocess.run(
+		get_startup_cmd(toolkit_path, script),
+		stdout=subprocess.DEVNULL,
+		stderr=subprocess.DEVNULL,
+		env=env,
+		check=False,
+	)
+	for _ in range(runs):
+		start = perf_counter()
+		proc = subprocess.run(
+			get_startup_cmd(toolkit_path, script),
+			stdout=subprocess.DEVNULL,
+			stderr=subprocess.PIPE,
+			env=env,
+			check=False,
+		)
+		wall_samples.append((perf_counter() - start) * 1000)
+		raw = proc.stderr.decode(errors="replace")
+		if proc.returncode != 0:
+			raise RuntimeError(
+				f"Bad command return code ({proc.returncode}).",
+				script,
+				raw.strip().splitlines()[-1:],
+			)
+		import_samples.append(get_total_import_us(raw) / 1000)
+		modules = parse_importtime(raw)
+		excluded.update(m for m in STARTUP_EXCLUDED_MODULES if m in modules)
+	return StartupResult(
+		script=script,
+		import_ms=statistics.median(import_samples),
+		wall_ms=statistics.median(wall_samples),
+		excluded_modules=sorted(excluded),
+	)
+
+
+def main(argv_a: LocalParser, **kwargs):
+	if argv_a.runs < 1:
+		raise ValueError("runs must be greater than 0.")
+	toolkit_path = kwargs.get("toolkit_path") or "."
+	registry = get_script_registry(toolkit_path)
+	scripts = argv_a.scripts or [
+		s["path"] for s in registry.scripts().values() if s["argparser"]
+	]
+	for script in scripts:
+		entry = registry.get(script)
+		# Sub-scripts without an argparser would run instead of printing help
+		if entry and not entry["argparser"]:
+			raise ValueError(f"{script} has no argparser, it cannot be timed.")
+
+	results = [
+		measure_startup(toolkit_path, script, argv_a.runs) for script in scripts
+	]
+	over_budget = [r for r in results if not r.within_budget(argv_a.budget_ms)]
+
+	if argv_a.json:
+		print(
+			json.dumps(
+				{
+					"budget_ms": argv_a.budget_ms,
+					"results": [r.__dict__ for r in results],
+				},
+				indent=2,
+			)
+		)
+	else:
+		for r in results:
+			color = bcolors.GREEN
+			if r in over_budget:
+				color = bcolors.RED
+			print_c(
+				color,
+				f"{r.script:<48} import {r.import_ms:7.2f} ms"
+				+ f"  wall {r.wall_ms:7.2f} ms",
+			)
+			if r.excluded_modules:
+				print_c(
+					bcolors.RED,
+					"\tImports lazily loaded modules: "
+					+ ", ".join(r.excluded_modules),
+				)
+		print(f"Budget: {argv_a.budget_ms:.2f} ms")
+	if over_budget:
+		sys.exit(1)
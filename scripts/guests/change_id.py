@@ -28,32 +28,55 @@ from core.signal_handlers.sigint import graceful_exit
 
 # IMPORTS
 import logging
-import socket
-import subprocess
 import json
+import threading
+from collections import Counter
+from typing import TypedDict
 from core.proxmox.guests import (
 	get_guest_cfg_path,
 	get_guest_status,
-	get_guest_snapshots,
 	get_guest_exists,
-	parse_guest_cfg,
 	DiskDict,
-	get_guest_replication_statuses,
-	parse_guest_disk,
-	is_valid_guest_disk_type,
 	get_guest_replication_jobs,
+	get_guest_index,
+)
+from core.proxmox.backup import BackupJobManager
+from core.proxmox.guest_config import GuestConfig
+from core.proxmox.storage import (
+	get_storage_cfg,
+	reassign_disks,
+	rewrite_guest_cfg_volumes,
+	PVEStorage,
+	DiskRename,
+	DiskReassignException,
+	DiskDirectoryException,
+)
+from core.proxmox.replication import (
+	DEFAULT_WAIT_TIMEOUT,
+	ReplicationJobDict,
+	get_replication_statuses,
+	wait_for_replication_jobs_removal,
 )
-from core.proxmox.backup import get_all_backup_jobs, set_backup_attrs
-from core.proxmox.storage import get_storage_cfg, DiskReassignException
-from core.proxmox.replication import ReplicationJobDict
 from core.format.colors import bcolors, print_c
 from core.classes.ColoredFormatter import set_logger
+from core.utils.command import run_command
+from core.utils.lazy import lazy_import
+from core.utils.journal import Journal, JOURNAL_DONE, JOURNAL_STARTED
+from core.utils.path import DEFAULT_STATE_DIR, get_state_path
 from core.utils.prompt import yes_no_input
+from core.utils.ssh import get_remote_args
 from core.parser import make_parser, ArgumentParser
-from time import sleep
+
+datetime = lazy_import("datetime")
+futures = lazy_import("concurrent.futures")
+socket = lazy_import("socket")
+watch = lazy_import("core.proxmox.watch")
 
 script_path = os.path.realpath(__file__)
 script_dir = os.path.dirname(script_path)
+DEFAULT_WORKERS = 4
+# Storage types shared between nodes, locks do not depend on the node.
+SHARED_STORAGE_TYPES = ("rbd", "cephfs", "nfs", "cifs", "glusterfs")
 
 
 def argparser(**kwargs) -> ArgumentParser:
@@ -69,6 +92,38 @@ def argparser(**kwargs) -> ArgumentParser:
 	parser.add_argument("-d", "--dry-run", action="store_true", default=False)
 	parser.add_argument("--debug", action="store_true", default=False)
 	parser.add_argument("-v", "--verbose", action="store_true", default=False)
+	parser.add_argument(
+		"-m",
+		"--mapping-file",
+		default=None,
+		help="File with one origin/target ID pair per line (or a JSON object) for batch mode.",
+	)
+	parser.add_argument(
+		"-w",
+		"--workers",
+		default=DEFAULT_WORKERS,
+		type=int,
+		help=f"Maximum concurrent guest ID changes in batch mode (Default: {DEFAULT_WORKERS}).",
+	)
+	parser.add_argument(
+		"-J",
+		"--journal",
+		default=None,
+		help=f"Journal file path, every step is recorded before and after it runs (Default: {DEFAULT_STATE_DIR}/journals/change_id-<date>.jsonl in batch mode, none for a single guest).",
+	)
+	journal_mode = parser.add_mutually_exclusive_group()
+	journal_mode.add_argument(
+		"--resume",
+		default=None,
+		metavar="JOURNAL",
+		help="Resume the guest ID changes of a journal, skipping finished steps.",
+	)
+	journal_mode.add_argument(
+		"--rollback",
+		default=None,
+		metavar="JOURNAL",
+		help="Revert the guest ID changes of a journal.",
+	)
 	return parser
 
 
@@ -80,6 +135,11 @@ class LocalParser:
 	dry_run: bool
 	debug: bool
 	verbose: bool
+	mapping_file: str | None
+	workers: int
+	journal: str | None
+	resume: str | None
+	rollback: str | None
 
 
 ## ERRORS
@@ -87,14 +147,32 @@ ERR_GUEST_EXISTS = 1
 ERR_GUEST_NOT_EXISTS = 2
 ERR_GUEST_NOT_STOPPED = 3
 ERR_GUEST_REPLICATION_IN_PROGRESS = 4
+ERR_BATCH_FAILED = 5
+ERR_JOURNAL = 6
+ERR_DISK_REASSIGN = 7
+ERR_REPLICATION_CREATE = 8
 ERR_REASSIGN_MSG = "Could not re-assign disk %s, please check manually"
 NORMAL_PROMPT_EXIT_MSG = "Exiting script."
 
+## JOURNAL STEPS
+# Keyed by None, the origin:target mapping of the whole run
+STEP_MAPPING = "mapping"
+STEP_PLAN = "plan"
+STEP_DELETE_REPLICATION = "delete_replication_jobs"
+STEP_BACKUP_JOBS = "backup_jobs"
+STEP_MOVE_CONFIG = "move_config"
+STEP_REASSIGN_DISKS = "reassign_disks"
+# One per disk renamed in its storage, followed by the volume ID
+STEP_DISK_PREFIX = "disk:"
+STEP_CREATE_REPLICATION = "create_replication_jobs"
+STEP_FINISHED = "finished"
+STEP_ROLLED_BACK = "rolled_back"
+
 
 def validate_vmid(vmid) -> bool:
 	try:
 		int(vmid)
-	except ValueError:
+	except (TypeError, ValueError):
 		return False
 	vmid = int(vmid)
 	return vmid >= 100 and vmid < 999999999
@@ -116,182 +194,253 @@ def vmid_prompt(target=False):
 def change_guest_id_on_backup_jobs(
 	old_id: int, new_id: int, dry_run=False
 ) -> None:
-	logger = logging.getLogger()
-	backup_jobs = get_all_backup_jobs()
-	backup_change_errors = []
-	for job in backup_jobs:
-		logger.debug("Looped through Backup Job: %s", json.dumps(job, indent=4))
-		if "vmid" in job:
-			job_id = job["id"]
-			job_vmids_data = job["vmid"]
-			job_description = job.get("comment", "")
-			job_vmids: list = [int(v) for v in job_vmids_data.split(",")]
-			if old_id not in job_vmids:
-				logger.debug(
-					"VM not in Backup Job %s%s, skipping.",
-					job_id,
-					f" ({job_description})" if job_description else "",
-				)
-				continue
+	change_guest_ids_on_backup_jobs(mapping={old_id: new_id}, dry_run=dry_run)
 
-			job_vmids.remove(old_id)
-			job_vmids.append(new_id)
-			job_vmids_data = ",".join([str(v) for v in job_vmids])
 
-			if not dry_run:
-				if set_backup_attrs(
-					job_id=job_id,
-					data={"vmid": job_vmids_data},
-					raise_exception=False,
-				):
-					backup_change_errors.append(job_id)
-				else:
-					logger.info(
-						"Modified backup job %s%s.",
-						job_id,
-						f" ({job_description})" if job_description else "",
-					)
-			else:
-				logger.info(
-					"Fake modified backup job %s%s.",
-					job_id,
-					f" ({job_description})" if job_description else "",
-				)
-	if len(backup_change_errors) > 0:
+def change_guest_ids_on_backup_jobs(
+	mapping: dict[int, int], dry_run=False
+) -> None:
+	"""Re-targets every backup job of the remapped guests at once."""
+	logger = logging.getLogger()
+	backup_jobs = BackupJobManager()
+	if backup_jobs.remap(mapping=mapping, dry_run=dry_run):
 		logger.error(
 			"Unable to re-target some backup jobs, please fix them manually."
 		)
 	return
 
 
-def main(argv_a: LocalParser, **kwargs):
-	signal.signal(signal.SIGINT, graceful_exit)
-	hostname = socket.gethostname()
-	running_in_background = True
+class GuestIdChangeError(Exception):
+	def __init__(self, code: int, *args):
+		self.code = code
+		super().__init__(*args)
 
-	try:
-		if os.getpgrp() == os.tcgetpgrp(sys.stdout.fileno()):
-			running_in_background = False
-		else:
-			running_in_background = True
-			# Ignore SIGHUP
-			signal.signal(signal.SIGHUP, signal.SIG_IGN)
-	except Exception:
-		print("Could not check if process executed in background.")
-		pass
 
-	# Logging
+# Backup jobs are shared between guests, their updates must not overlap.
+BACKUP_JOBS_LOCK = threading.Lock()
+
+
+def get_guest_disks(guest_config: GuestConfig) -> list[DiskDict]:
+	"""Returns current and snapshot vmstate disks of a guest."""
 	logger = logging.getLogger()
-	log_level = "INFO"
-	if argv_a.debug:
-		log_level = "DEBUG"
-	debug_verbose = argv_a.debug and argv_a.verbose
-	log_file = (
-		f"{os.path.dirname(script_path)}/{os.path.basename(script_path)}.log"
-	)
-	logger = set_logger(
-		logger,
-		log_console=(not running_in_background),
-		log_file=log_file,
-		level=log_level,
-		format="%(levelname)s %(message)s",
+	guest_disks: list[DiskDict] = []
+
+	# Add snapshot vmstate disks to configuration.
+	for disk in guest_config.vmstate_disks():
+		logger.debug("Parsed Snapshot VM State: %s", disk)
+		guest_disks.append(disk.to_disk_dict())
+
+	for disk in guest_config.disks():
+		logger.debug("Parsed Disk: %s", disk)
+		guest_disks.append(disk.to_disk_dict())
+	return guest_disks
+
+
+class GuestIdChangePlan(TypedDict):
+	"""Guest state collected before any change, journaled for resumes."""
+
+	host: str
+	old_cfg_path: str
+	new_cfg_path: str
+	disks: list[DiskDict]
+	replication_jobs: dict[str, ReplicationJobDict]
+	snapshots: list[str]
+
+
+def get_journal_key(id_origin: int, id_target: int) -> str:
+	return f"{id_origin}:{id_target}"
+
+
+def get_default_journal_path() -> str:
+	return get_state_path(
+		"journals",
+		f"change_id-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl",
 	)
 
-	id_origin = argv_a.origin_id
-	id_target = argv_a.target_id
-	remote_user = argv_a.remote_user
-	if not validate_vmid(vmid=id_origin):
-		id_origin = vmid_prompt()
-	if not validate_vmid(vmid=id_target):
-		id_target = vmid_prompt(target=True)
 
-	# Ensure ids are cast to int
-	id_origin = int(id_origin)
-	id_target = int(id_target)
+def get_replication_job_create_cmd(
+	job_name: str, job: ReplicationJobDict
+) -> list[str]:
+	cmd_args = f"pvesr create-local-job {job_name} {job['target']}".split()
+	for arg in ["rate", "schedule", "comment"]:
+		if arg not in job:
+			continue
+
+		if arg == "comment":
+			v = f'"{job[arg]}"'
+		else:
+			v = str(job[arg])
+		cmd_args = cmd_args + [f"--{arg}", v]
+	return cmd_args
+
+
+def get_new_replication_job_name(
+	job_name: str, id_origin: int, id_target: int
+) -> str:
+	return job_name.replace(str(id_origin), str(id_target))
+
+
+def run_guest_cmd(
+	cmd_args: list[str], args_ssh: list[str] | None, dry_run=False, check=False
+) -> bool:
+	"""
+	Runs a command on the guest's host.
+
+	:return: Whether the command succeeded.
+	"""
+	logger = logging.getLogger()
+	if args_ssh:
+		cmd_args = args_ssh + cmd_args
+	logger.debug(" ".join(cmd_args))
+	if dry_run:
+		logger.info(" ".join(cmd_args))
+		return True
+	result = run_command(cmd_args, check=check)
+	if not result.ok:
+		logger.error(
+			"Bad command return code (%s): %s",
+			result.returncode,
+			result.errors.strip(),
+		)
+	return result.ok
+
+
+def get_guest_id_change_plan(
+	id_origin: int, id_target: int, debug_verbose=False
+) -> GuestIdChangePlan:
+	logger = logging.getLogger()
+	guest_cfg_details = get_guest_cfg_path(guest_id=id_origin, get_as_dict=True)
+
+	# Current and snapshot configurations in a single pmxcfs read
+	logger.info("Collecting Config for Guest %s", id_origin)
+	guest_config = GuestConfig.from_file(guest_cfg_details["path"])
+	if debug_verbose:
+		logger.debug("Guest Configuration File:\n%s", guest_config.dumps())
+	logger.debug("Guest Configuration Keys: %s", guest_config.keys())
+	return {
+		"host": guest_cfg_details["host"],
+		"old_cfg_path": guest_cfg_details["path"],
+		# Generate new config file path
+		"new_cfg_path": guest_cfg_details["path"].replace(
+			f"{id_origin}.conf", f"{id_target}.conf"
+		),
+		"disks": get_guest_disks(guest_config),
+		"replication_jobs": get_guest_replication_jobs(old_id=id_origin),
+		"snapshots": guest_config.snapshots(),
+	}
 
-	if not get_guest_exists(id_origin):
-		logger.error("Guest with Origin ID (%s) does not exist.", id_origin)
-		sys.exit(ERR_GUEST_NOT_EXISTS)
-	if get_guest_exists(id_target):
-		logger.error("Guest with Target ID (%s) already exists.", id_target)
-		sys.exit(ERR_GUEST_EXISTS)
 
-	if not argv_a.yes:
-		logger.info("This might break Replication and Backup Configurations.")
+def get_disk_volume(storage: PVEStorage, disk: DiskDict) -> str:
+	return f"{storage.name}:{disk['name']}"
+
+
+def change_guest_id(
+	id_origin: int,
+	id_target: int,
+	remote_user="root",
+	dry_run=False,
+	confirm=True,
+	verbose=False,
+	debug_verbose=False,
+	check_target=True,
+	update_backup_jobs=True,
+	journal: Journal | None = None,
+) -> None:
+	"""
+	Changes a guest's ID, its disks, replication and backup jobs.
+
+	Every step is journaled before and after it runs, steps already done
+	in journal are skipped so interrupted changes can be resumed.
+
+	:param bool check_target: Whether to fail if the target ID exists.
+	:param bool update_backup_jobs: Whether to re-target backup jobs, batches
+	  re-target them once for every guest instead.
+	:param journal: Journal to record and resume steps from, in-memory if
+	  None.
+	:raises GuestIdChangeError: When pre-checks fail.
+	"""
+	logger = logging.getLogger()
+	hostname = socket.gethostname()
+	if journal is None:
+		journal = Journal()
+	key = get_journal_key(id_origin, id_target)
+
+	if journal.is_done(key, STEP_FINISHED):
 		logger.info(
-			"Please ensure such tasks are reconfigured after script completion."
+			"Guest ID change %s -> %s already finished.", id_origin, id_target
 		)
-		confirm = yes_no_input(
-			f"Are you sure you wish to change Guest {id_origin}'s ID to {id_target}?",
-			input_default="N",
+		return
+	plan: GuestIdChangePlan | None = journal.get_data(key, STEP_PLAN)
+	resumed = journal.is_done(key, STEP_PLAN)
+	if resumed:
+		logger.info(
+			"Resuming Guest ID change %s -> %s from journal.",
+			id_origin,
+			id_target,
 		)
-		if not confirm:
-			print_c(bcolors.L_BLUE, NORMAL_PROMPT_EXIT_MSG)
-			sys.exit(0)
+	else:
+		if not get_guest_exists(id_origin):
+			raise GuestIdChangeError(
+				ERR_GUEST_NOT_EXISTS,
+				f"Guest with Origin ID ({id_origin}) does not exist.",
+			)
+		if check_target and get_guest_exists(id_target):
+			raise GuestIdChangeError(
+				ERR_GUEST_EXISTS,
+				f"Guest with Target ID ({id_target}) already exists.",
+			)
 
-	if argv_a.dry_run:
+		if confirm:
+			logger.info(
+				"This might break Replication and Backup Configurations."
+			)
+			logger.info(
+				"Please ensure such tasks are reconfigured after script completion."
+			)
+			confirm_change = yes_no_input(
+				f"Are you sure you wish to change Guest {id_origin}'s ID to {id_target}?",
+				input_default="N",
+			)
+			if not confirm_change:
+				print_c(bcolors.L_BLUE, NORMAL_PROMPT_EXIT_MSG)
+				sys.exit(0)
+		plan = get_guest_id_change_plan(
+			id_origin, id_target, debug_verbose=debug_verbose
+		)
+
+	if dry_run:
 		logger.info("Executing in dry-run mode.")
-	guest_cfg_details = get_guest_cfg_path(guest_id=id_origin, get_as_dict=True)
-	guest_cfg_host = guest_cfg_details["host"]
+	guest_cfg_host = plan["host"]
 	guest_on_remote_host = hostname != guest_cfg_host
 
 	# Set SSH Args if necessary
 	args_ssh = None
 	if guest_on_remote_host:
-		args_ssh = ["/usr/bin/ssh", f"{remote_user}@{guest_cfg_host}"]
+		args_ssh = get_remote_args(guest_cfg_host, remote_user)
 
-	guest_cfg = parse_guest_cfg(
-		guest_id=id_origin,
-		remote_args=args_ssh,
-		debug=debug_verbose,
-	)
-	guest_disks: list[DiskDict] = []
-	guest_snapshots = get_guest_snapshots(
-		guest_id=id_origin, remote_args=args_ssh
-	)
-
-	if argv_a.verbose:
+	if verbose:
 		logger.info("Guest is on Host: %s", guest_cfg_host)
 		logger.info("Selected Origin ID: %s", id_origin)
 		logger.info("Selected Target ID: %s", id_target)
-	logger.debug("Guest Configuration: %s", guest_cfg)
 
-	# Get Guest State
-	guest_state = get_guest_status(guest_id=id_origin, remote_args=args_ssh)
+	# Get Guest State, from its current ID
+	current_id = (
+		id_target if journal.is_done(key, STEP_MOVE_CONFIG) else id_origin
+	)
+	guest_state = get_guest_status(guest_id=current_id, remote_args=args_ssh)
 	if guest_state != "stopped":
-		logger.error(
-			"Guest must be in stopped state (Currently %s)", guest_state
+		raise GuestIdChangeError(
+			ERR_GUEST_NOT_STOPPED,
+			f"Guest must be in stopped state (Currently {guest_state})",
 		)
-		sys.exit(ERR_GUEST_NOT_STOPPED)
 
-	# Generate new config file path
-	old_cfg_path = guest_cfg_details["path"]
-	new_cfg_path = guest_cfg_details["path"].replace(
-		f"{id_origin}.conf", f"{id_target}.conf"
-	)
-
-	# Add snapshot vmstate disks to configuration.
-	for snapshot in guest_snapshots:
-		snapshot_cfg = parse_guest_cfg(
-			guest_id=id_origin,
-			remote_args=args_ssh,
-			debug=debug_verbose,
-			snapshot_name=snapshot,
-			current=False,
-		)
-		logger.debug("Snapshot Keys: %s", snapshot_cfg.keys())
-		logger.debug("Snapshot Configuration: %s", snapshot_cfg)
-		for key, value in snapshot_cfg.items():
-			if key == "vmstate":
-				parsed_disk = parse_guest_disk(
-					disk_name=key, disk_values=value, vmstate=True
-				)
-				if parsed_disk:
-					logger.debug("Parsed Snapshot VM State: %s", parsed_disk)
-					guest_disks.append(parsed_disk)
+	old_cfg_path = plan["old_cfg_path"]
+	new_cfg_path = plan["new_cfg_path"]
+	guest_snapshots = plan["snapshots"]
+	replication_jobs = plan["replication_jobs"]
 
 	# Second prompt if snapshots present
-	if not argv_a.yes and guest_snapshots:
+	if confirm and guest_snapshots and not resumed:
 		print(
 			f"Guest {id_origin} has {len(guest_snapshots)} snapshots that could be "
 			+ "irreversibly affected if the process does not finish correctly."
@@ -304,141 +453,871 @@ def main(argv_a: LocalParser, **kwargs):
 		):
 			print_c(bcolors.L_BLUE, NORMAL_PROMPT_EXIT_MSG)
 			sys.exit(0)
+	if not resumed:
+		journal.record(key, STEP_PLAN, JOURNAL_DONE, dict(plan))
 
 	# Remove old Replication Jobs
-	replication_jobs = get_guest_replication_jobs(old_id=id_origin)
-	if len(replication_jobs) > 0:
-		logger.debug(
-			"Found replication targets: " + ", ".join(replication_jobs.keys())
-		)
-
-	for job_name, job in replication_jobs.items():
-		job_name: str
-		job: ReplicationJobDict
-		target = job["target"]
-		logger.info(f"Deleting job {job_name}")
-		job_delete_cmd = f"pvesr delete {job_name}".split()
-		if guest_on_remote_host:
-			if not args_ssh:
-				raise Exception("args_ssh cannot be None.")
-			job_delete_cmd = args_ssh + job_delete_cmd
-		logger.debug(" ".join(job_delete_cmd))
-		if not argv_a.dry_run:
-			subprocess.call(job_delete_cmd)
-
-	_TIMEOUT = 120
-	_timer = 0
-	logger.info(
-		"Waiting for replication jobs to finish deletion (Timeout per job: %s seconds).",
-		_TIMEOUT,
-	)
-	replication_statuses = get_guest_replication_statuses(
-		guest_id=id_origin, remote_args=args_ssh
-	)
-	if any([v != "OK" for v in replication_statuses.values()]):
-		logger.error(
-			"Guest with Origin ID (%s) has a replication job in progress.",
-			id_origin,
-		)
-		sys.exit(ERR_GUEST_REPLICATION_IN_PROGRESS)
-	_curr_repl_statuses_len = len(replication_statuses)
-	_prev_repl_statuses_len = len(replication_statuses)
-	while _curr_repl_statuses_len > 0:
-		_prev_repl_statuses_len = _curr_repl_statuses_len
-		replication_statuses = get_guest_replication_statuses(
-			guest_id=id_origin, remote_args=args_ssh
-		)
-		_curr_repl_statuses_len = len(replication_statuses)
-		if _timer != 0 and _timer % 10 == 0:
-			logger.info("Waiting for replication jobs...")
-		if (
-			_prev_repl_statuses_len != _curr_repl_statuses_len
-			and _curr_repl_statuses_len > 0
-		):
-			logger.info("A job finished, awaiting further.")
-			_timer = 0
+	if not journal.is_done(key, STEP_DELETE_REPLICATION):
+		with journal.step(key, STEP_DELETE_REPLICATION):
+			if len(replication_jobs) > 0:
+				logger.debug(
+					"Found replication targets: "
+					+ ", ".join(replication_jobs.keys())
+				)
+			for job_name in replication_jobs:
+				logger.info(f"Deleting job {job_name}")
+				run_guest_cmd(
+					f"pvesr delete {job_name}".split(), args_ssh, dry_run
+				)
 
-		sleep(1)
-		_timer += 1
-		if _timer >= _TIMEOUT:
-			if len(replication_statuses) > 0:
-				logger.info("Timeout reached, cannot wait any longer.")
-			break
+			logger.info(
+				"Waiting for replication jobs to finish deletion (Timeout per job: %s seconds).",
+				DEFAULT_WAIT_TIMEOUT,
+			)
+			statuses = get_replication_statuses(
+				guest_ids=[id_origin], remote_args=args_ssh
+			)
+			replication_statuses = (statuses or {}).get(id_origin, {})
+			if any([v != "OK" for v in replication_statuses.values()]):
+				raise GuestIdChangeError(
+					ERR_GUEST_REPLICATION_IN_PROGRESS,
+					f"Guest with Origin ID ({id_origin}) has a replication job in progress.",
+				)
+			# Unknown statuses are awaited as well
+			if (statuses is None or replication_statuses) and not dry_run:
+				remaining = wait_for_replication_jobs_removal(
+					guest_ids=[id_origin], remote_args=args_ssh
+				)
+				if remaining:
+					raise GuestIdChangeError(
+						ERR_GUEST_REPLICATION_IN_PROGRESS,
+						f"Replication jobs of Guest {id_origin} were not removed: "
+						+ ", ".join(remaining.get(id_origin, {})),
+					)
 
 	# Alter Backup Jobs
 	# see https://forum.proxmox.com/threads/create-backup-jobs-using-a-shell-command.110845/
 	# pvesh get /cluster/backup --output-format json-pretty
 	# pvesh usage /cluster/backup --verbose
-	change_guest_id_on_backup_jobs(
-		old_id=id_origin, new_id=id_target, dry_run=argv_a.dry_run
-	)
-
-	# Rename Guest Config File
-	args_mv = ["/usr/bin/mv", old_cfg_path, new_cfg_path]
-	if guest_on_remote_host:
-		if not args_ssh:
-			raise Exception("args_ssh cannot be None.")
-		args_mv = args_ssh + args_mv
+	if update_backup_jobs and not journal.is_done(key, STEP_BACKUP_JOBS):
+		with journal.step(key, STEP_BACKUP_JOBS), BACKUP_JOBS_LOCK:
+			change_guest_id_on_backup_jobs(
+				old_id=id_origin, new_id=id_target, dry_run=dry_run
+			)
 
 	# Rename Guest Configuration
-	if argv_a.dry_run:
-		logger.info(args_mv)
-	else:
-		subprocess.call(args_mv, stdout=subprocess.PIPE)
+	if not journal.is_done(key, STEP_MOVE_CONFIG):
+		move_started = journal.get(key, STEP_MOVE_CONFIG) is not None
+		with journal.step(key, STEP_MOVE_CONFIG):
+			# /etc/pve is shared by every node, an interrupted run may have
+			# moved the configuration before journaling it.
+			if (
+				move_started
+				and not os.path.exists(old_cfg_path)
+				and os.path.exists(new_cfg_path)
+			):
+				logger.info(
+					"Guest Configuration already moved to %s.", new_cfg_path
+				)
+			else:
+				run_guest_cmd(
+					["/usr/bin/mv", old_cfg_path, new_cfg_path],
+					args_ssh,
+					dry_run,
+					check=True,
+				)
+			# Chained changes must not wait for the watcher to see it
+			get_guest_index().invalidate()
+
+	# Re-assign disks
+	if not journal.is_done(key, STEP_REASSIGN_DISKS):
+		with journal.step(key, STEP_REASSIGN_DISKS) as step_data:
+			failed_disks = reassign_guest_disks(
+				plan=plan,
+				id_origin=id_origin,
+				id_target=id_target,
+				journal=journal,
+				key=key,
+				args_ssh=args_ssh,
+				dry_run=dry_run,
+				step_data=step_data,
+			)
+			if failed_disks:
+				raise GuestIdChangeError(
+					ERR_DISK_REASSIGN,
+					f"Could not re-assign disks: {', '.join(failed_disks)}",
+				)
+
+	# Add new Replication Jobs
+	if not journal.is_done(key, STEP_CREATE_REPLICATION):
+		# Jobs created by a previous attempt are not created again
+		previous_data = journal.get_data(key, STEP_CREATE_REPLICATION) or {}
+		created = list(previous_data.get("created", []))
+		with journal.step(
+			key, STEP_CREATE_REPLICATION, {"created": created}
+		) as step_data:
+			step_data["failed"] = []
+			for job_name, job in replication_jobs.items():
+				new_job_name = get_new_replication_job_name(
+					job_name, id_origin, id_target
+				)
+				if new_job_name in created:
+					continue
+				if run_guest_cmd(
+					get_replication_job_create_cmd(new_job_name, job),
+					args_ssh,
+					dry_run,
+				):
+					step_data["created"].append(new_job_name)
+				else:
+					step_data["failed"].append(new_job_name)
+					print_c(
+						bcolors.L_YELLOW,
+						f"Replication job creation for {job_name} failed.",
+					)
+			if step_data["failed"]:
+				raise GuestIdChangeError(
+					ERR_REPLICATION_CREATE,
+					"Could not create replication jobs: "
+					+ ", ".join(step_data["failed"]),
+				)
+
+	# TODO - Change High-Availability services with guest id
+	journal.record(key, STEP_FINISHED, JOURNAL_DONE)
 
-	# For each discovered disk, do pre-checks
+
+def reassign_guest_disks(
+	plan: GuestIdChangePlan,
+	id_origin: int,
+	id_target: int,
+	journal: Journal,
+	key: str,
+	args_ssh: list[str] | None = None,
+	dry_run=False,
+	step_data: dict | None = None,
+) -> list[str]:
+	"""
+	Re-assigns the planned disks, each disk renamed in its storage is
+	journaled right away. Disks renamed by an interrupted run are only
+	rewritten in the guest configuration.
+
+	:return: Names of the disks that could not be renamed.
+	"""
+	logger = logging.getLogger()
 	logger.info("The following disks will be renamed: ")
-	for key, value in guest_cfg.items():
-		if not is_valid_guest_disk_type(key, value):
+	storages: dict[str, PVEStorage] = {}
+	disks_to_reassign = []
+	renamed_volumes = {}
+	for disk in plan["disks"]:
+		disk: DiskDict
+		if disk["storage"] not in storages:
+			storages[disk["storage"]] = get_storage_cfg(disk["storage"])
+		storage = storages[disk["storage"]]
+		volume = get_disk_volume(storage, disk)
+		disk_step = journal.get_data(key, f"{STEP_DISK_PREFIX}{volume}")
+		if journal.is_done(key, f"{STEP_DISK_PREFIX}{volume}"):
+			logger.info(
+				"%s: %s (Already renamed)", disk["storage"], disk["name"]
+			)
+			renamed_volumes[volume] = disk_step["new_volume"]
 			continue
-		parsed_disk = parse_guest_disk(disk_name=key, disk_values=value)
-		if parsed_disk:
-			guest_disks.append(parsed_disk)
+		logger.info("%s: %s", disk["storage"], disk["name"])
+		disks_to_reassign.append((storage, disk["name"]))
 
-	# Re-assign disks
-	for disk in guest_disks:
-		disk: DiskDict
-		d_storage = get_storage_cfg(disk["storage"])
-		d_name: str = disk["name"]
-		try:
-			d_storage.reassign_disk(
-				disk_name=d_name,
-				new_guest_id=id_target,
-				new_guest_cfg=new_cfg_path,
-				remote_args=args_ssh,
-				dry_run=argv_a.dry_run,
+	if renamed_volumes:
+		logger.debug(
+			"Changing disks renamed by a previous run in Guest Configuration (%s): %s",
+			plan["new_cfg_path"],
+			renamed_volumes,
+		)
+		if dry_run:
+			logger.info(
+				"Rewrite %s volumes: %s", plan["new_cfg_path"], renamed_volumes
 			)
-		except DiskReassignException as e:
-			logger.error(ERR_REASSIGN_MSG, d_name)
-			logger.exception(e)
-			pass
+		else:
+			rewrite_guest_cfg_volumes(plan["new_cfg_path"], renamed_volumes)
 
-	# Add new Replication Jobs
-	for job_name, job in replication_jobs.items():
-		new_job_name = job_name.replace(str(id_origin), str(id_target))
-		new_job_cmd = f"pvesr create-local-job {new_job_name} {target}".split()
-		for arg in ["rate", "schedule", "comment"]:
-			if arg not in job:
+	def _on_renamed(rename: DiskRename):
+		if dry_run:
+			return
+		journal.record(
+			key,
+			f"{STEP_DISK_PREFIX}{rename.volume}",
+			JOURNAL_DONE,
+			{"new_volume": rename.new_volume},
+		)
+
+	try:
+		failed_disks = reassign_disks(
+			disks=disks_to_reassign,
+			new_guest_id=id_target,
+			new_guest_cfg=plan["new_cfg_path"],
+			remote_args=args_ssh,
+			dry_run=dry_run,
+			on_renamed=_on_renamed,
+			guest_id=id_origin,
+		)
+	except (DiskReassignException, DiskDirectoryException) as e:
+		logger.exception(e)
+		failed_disks = [name for _, name in disks_to_reassign]
+	for d_name in failed_disks:
+		logger.error(ERR_REASSIGN_MSG, d_name)
+	if step_data is not None:
+		step_data["failed"] = failed_disks
+	return failed_disks
+
+
+def rollback_guest_id_change(
+	journal: Journal,
+	key: str,
+	remote_user="root",
+	dry_run=False,
+) -> bool:
+	"""
+	Reverts every journaled step of a guest ID change, in reverse order.
+
+	:return: Whether every step could be reverted.
+	"""
+	logger = logging.getLogger()
+	if journal.is_done(key, STEP_ROLLED_BACK):
+		logger.info("Guest ID change %s already rolled back.", key)
+		return True
+	plan: GuestIdChangePlan | None = journal.get_data(key, STEP_PLAN)
+	if not journal.is_done(key, STEP_PLAN):
+		logger.info("Guest ID change %s made no changes.", key)
+		return True
+	id_origin, id_target = (int(v) for v in key.split(":"))
+	args_ssh = None
+	if plan["host"] != socket.gethostname():
+		args_ssh = get_remote_args(plan["host"], remote_user)
+	ok = True
+
+	def _started(step: str) -> bool:
+		return journal.get(key, step) is not None
+
+	# Get Guest State, from its current ID
+	config_moved = _started(STEP_MOVE_CONFIG)
+	current_id = id_target if config_moved else id_origin
+	guest_state = get_guest_status(guest_id=current_id, remote_args=args_ssh)
+	if guest_state != "stopped":
+		raise GuestIdChangeError(
+			ERR_GUEST_NOT_STOPPED,
+			f"Guest must be in stopped state (Currently {guest_state})",
+		)
+
+	if _started(STEP_CREATE_REPLICATION):
+		for job_name in plan["replication_jobs"]:
+			new_job_name = get_new_replication_job_name(
+				job_name, id_origin, id_target
+			)
+			logger.info("Deleting job %s", new_job_name)
+			run_guest_cmd(
+				f"pvesr delete {new_job_name}".split(), args_ssh, dry_run
+			)
+		if plan["replication_jobs"] and not dry_run:
+			remaining = wait_for_replication_jobs_removal(
+				guest_ids=[id_target], remote_args=args_ssh
+			)
+			if remaining:
+				logger.error(
+					"Replication jobs of Guest %s were not removed: %s",
+					id_target,
+					", ".join(remaining.get(id_target, {})),
+				)
+				ok = False
+
+	cfg_path = plan["new_cfg_path"] if config_moved else plan["old_cfg_path"]
+	if _started(STEP_REASSIGN_DISKS):
+		storages: dict[str, PVEStorage] = {}
+		disks = []
+		for disk in plan["disks"]:
+			if disk["storage"] not in storages:
+				storages[disk["storage"]] = get_storage_cfg(disk["storage"])
+			storage = storages[disk["storage"]]
+			disk_step = journal.get_data(
+				key, f"{STEP_DISK_PREFIX}{get_disk_volume(storage, disk)}"
+			)
+			if not disk_step:
 				continue
+			new_name = disk_step["new_volume"].split(":", 1)[1]
+			disks.append((storage, new_name))
+		failed_disks = reassign_disks(
+			disks=disks,
+			new_guest_id=id_origin,
+			new_guest_cfg=cfg_path,
+			remote_args=args_ssh,
+			dry_run=dry_run,
+		)
+		for d_name in failed_disks:
+			logger.error(ERR_REASSIGN_MSG, d_name)
+			ok = False
 
-			if arg == "comment":
-				v = f'"{job[arg]}"'
-			else:
-				v = str(job[arg])
-			new_job_cmd = new_job_cmd + [f"--{arg}", v]
-		if guest_on_remote_host:
-			if not args_ssh:
-				raise Exception("args_ssh cannot be None.")
-			new_job_cmd = args_ssh + new_job_cmd
-		logger.debug(" ".join(new_job_cmd))
-		if not argv_a.dry_run:
+	if config_moved:
+		if os.path.exists(plan["new_cfg_path"]) or dry_run:
+			ok &= run_guest_cmd(
+				["/usr/bin/mv", plan["new_cfg_path"], plan["old_cfg_path"]],
+				args_ssh,
+				dry_run,
+			)
+			get_guest_index().invalidate()
+		else:
+			logger.warning(
+				"%s does not exist, skipping configuration rename.",
+				plan["new_cfg_path"],
+			)
+
+	if _started(STEP_BACKUP_JOBS):
+		with BACKUP_JOBS_LOCK:
+			change_guest_ids_on_backup_jobs(
+				mapping={id_target: id_origin}, dry_run=dry_run
+			)
+
+	if _started(STEP_DELETE_REPLICATION):
+		for job_name, job in plan["replication_jobs"].items():
+			ok &= run_guest_cmd(
+				get_replication_job_create_cmd(job_name, job), args_ssh, dry_run
+			)
+
+	if ok and not dry_run:
+		journal.record(key, STEP_ROLLED_BACK, JOURNAL_DONE)
+	return ok
+
+
+def parse_id_mapping_file(path: str) -> dict[int, int]:
+	"""
+	Parses an origin:target ID mapping file.
+
+	Either a JSON object ({"100": 1100}) or one pair per line, separated by
+	whitespace, a comma or a colon. Lines starting with # are ignored.
+	"""
+	if not os.path.isfile(path):
+		raise ValueError(f"{path} mapping file does not exist.")
+	with open(path, "r") as mapping_file:
+		raw = mapping_file.read()
+
+	if raw.lstrip().startswith("{"):
+		return {int(k): int(v) for k, v in json.loads(raw).items()}
+
+	mapping = {}
+	for line_number, line in enumerate(raw.splitlines(), start=1):
+		line = line.split("#")[0].strip()
+		if not line:
+			continue
+		pair = line.replace(",", " ").replace(":", " ").split()
+		if len(pair) != 2:
+			raise ValueError(f"Invalid mapping on line {line_number}: {line}")
+		id_origin, id_target = (int(v) for v in pair)
+		if id_origin in mapping:
+			raise ValueError(
+				f"Origin ID {id_origin} is mapped more than once (line {line_number})."
+			)
+		mapping[id_origin] = id_target
+	return mapping
+
+
+def validate_id_mapping(
+	mapping: dict[int, int], started: set[int] | None = None
+) -> list[list[tuple[int, int]]]:
+	"""
+	Validates every pair against the guest index.
+
+	Targets may only exist if they are renamed themselves within the same
+	mapping, such pairs are chained and returned in execution order.
+
+	:param started: Origin IDs of journaled changes being resumed, their
+	  configuration may already be on the target ID.
+
+	:raises ValueError: With every collision, cycle or invalid pair found.
+	:return: Chains of (origin, target) pairs, each in execution order.
+	"""
+	guest_index = get_guest_index()
+	started = started or set()
+	errors = []
+	target_counts = Counter(mapping.values())
+	for id_origin, id_target in mapping.items():
+		if not validate_vmid(id_origin) or not validate_vmid(id_target):
+			errors.append(f"Invalid ID pair {id_origin} -> {id_target}.")
+			continue
+		if id_origin == id_target:
+			errors.append(f"Origin and Target ID are equal ({id_origin}).")
+		if id_origin in started:
+			continue
+		if not guest_index.exists(id_origin):
+			errors.append(f"Guest with Origin ID ({id_origin}) does not exist.")
+		if target_counts[id_target] > 1:
+			errors.append(
+				f"Target ID {id_target} is used by more than one guest."
+			)
+		if guest_index.exists(id_target) and id_target not in mapping:
+			errors.append(f"Guest with Target ID ({id_target}) already exists.")
+
+	# Each chain starts on an origin that is nobody else's target
+	chains = []
+	chained = set()
+	targets = set(mapping.values())
+	for id_origin in mapping:
+		if id_origin in targets:
+			continue
+		chain = []
+		current = id_origin
+		while current in mapping and current not in chained:
+			chain.append((current, mapping[current]))
+			chained.add(current)
+			current = mapping[current]
+		# A target that is renamed itself must be freed first
+		chains.append(list(reversed(chain)))
+
+	# Origins not reachable from a chain start are part of a cycle
+	cyclic = [str(v) for v in mapping if v not in chained]
+	if cyclic:
+		errors.append(f"ID mapping has cycles ({', '.join(cyclic)}).")
+
+	if errors:
+		raise ValueError(*errors)
+	return chains
+
+
+def get_guest_lock_keys(
+	guest_id: int, plan: GuestIdChangePlan | None = None
+) -> set[str]:
+	"""
+	Returns the storage locks a guest ID change must hold.
+	Node local storages are locked per node, shared storages cluster-wide.
+
+	:param plan: Journaled plan of a resumed change, used instead of the
+	  guest's current configuration.
+	"""
+	if plan:
+		host, disks = plan["host"], plan["disks"]
+	else:
+		guest_cfg_details = get_guest_cfg_path(
+			guest_id=guest_id, get_as_dict=True
+		)
+		host = guest_cfg_details["host"]
+		disks = get_guest_disks(
+			GuestConfig.from_file(guest_cfg_details["path"])
+		)
+	lock_keys = set()
+	for disk in disks:
+		storage = get_storage_cfg(disk["storage"])
+		if storage.type in SHARED_STORAGE_TYPES:
+			lock_keys.add(f"{storage.name}")
+		else:
+			lock_keys.add(f"{host}/{storage.name}")
+	return lock_keys
+
+
+def change_guest_ids(
+	mapping: dict[int, int],
+	remote_user="root",
+	dry_run=False,
+	workers=DEFAULT_WORKERS,
+	verbose=False,
+	debug_verbose=False,
+	journal: Journal | None = None,
+	chains: list[list[tuple[int, int]]] | None = None,
+) -> dict[tuple[int, int], BaseException | None]:
+	"""
+	Changes the IDs of many guests concurrently.
+
+	Independent guests run in a bounded worker pool, guests sharing a
+	storage lock (same ZFS pool, VG or Ceph pool) never run at the same
+	time.
+
+	:param journal: Journal to record and resume changes from, finished
+	  changes are skipped.
+	:param chains: Chains of mapping already returned by
+	  validate_id_mapping, mapping is validated otherwise.
+	:return: (origin, target):exception map, None on success.
+	"""
+	logger = logging.getLogger()
+	if journal is None:
+		journal = Journal()
+	results: dict[tuple[int, int], BaseException | None] = {}
+	pending = {}
+	for id_origin, id_target in mapping.items():
+		key = get_journal_key(id_origin, id_target)
+		if journal.is_done(key, STEP_ROLLED_BACK):
+			continue
+		if journal.is_done(key, STEP_FINISHED):
+			results[(id_origin, id_target)] = None
+		else:
+			pending[id_origin] = id_target
+	plans: dict[int, GuestIdChangePlan] = {
+		id_origin: journal.get_data(
+			get_journal_key(id_origin, id_target), STEP_PLAN
+		)
+		for id_origin, id_target in pending.items()
+		if journal.is_done(get_journal_key(id_origin, id_target), STEP_PLAN)
+	}
+	if chains is None:
+		chains = validate_id_mapping(pending, started=set(plans))
+	else:
+		chains = [
+			[pair for pair in chain if pair[0] in pending] for chain in chains
+		]
+
+	locked_chains = []
+	all_lock_keys = set()
+	for chain in chains:
+		lock_keys = set()
+		for idx, (id_origin, id_target) in enumerate(chain):
 			try:
-				subprocess.call(new_job_cmd)
-			except:
-				print_c(
-					bcolors.L_YELLOW,
-					f"Replication job creation for {job_name} failed.",
+				lock_keys |= get_guest_lock_keys(
+					id_origin, plans.get(id_origin)
 				)
-				pass
+			except Exception as e:
+				logger.error(
+					"Could not get the storage locks of Guest %s: %s",
+					id_origin,
+					e,
+				)
+				results[(id_origin, id_target)] = e
+				# The chain cannot be locked, none of its pairs run
+				for skipped in chain[:idx] + chain[idx + 1 :]:
+					results[skipped] = GuestIdChangeError(
+						ERR_GUEST_EXISTS,
+						f"Skipped, Guest ID change {id_origin} -> {id_target} failed.",
+					)
+				break
+		else:
+			if chain:
+				locked_chains.append((chain, sorted(lock_keys)))
+				all_lock_keys |= lock_keys
+	locks = {k: threading.Lock() for k in all_lock_keys}
 
-	# TODO - Change High-Availability services with guest id
+	def _run_chain(chain: list[tuple[int, int]], lock_keys: list[str]):
+		# Sorted acquisition prevents deadlocks between chains
+		for k in lock_keys:
+			locks[k].acquire()
+		try:
+			for idx, (id_origin, id_target) in enumerate(chain):
+				logger.info("Changing Guest ID %s to %s", id_origin, id_target)
+				try:
+					change_guest_id(
+						id_origin=id_origin,
+						id_target=id_target,
+						remote_user=remote_user,
+						dry_run=dry_run,
+						confirm=False,
+						verbose=verbose,
+						debug_verbose=debug_verbose,
+						# Dry-runs do not free the targets of a chain
+						check_target=not (dry_run and idx > 0),
+						update_backup_jobs=False,
+						journal=journal,
+					)
+					results[(id_origin, id_target)] = None
+				except Exception as e:
+					logger.error(
+						"Could not change Guest ID %s to %s: %s",
+						id_origin,
+						id_target,
+						e,
+					)
+					results[(id_origin, id_target)] = e
+					# Following pairs depend on this target being freed
+					for skipped in chain[idx + 1 :]:
+						results[skipped] = GuestIdChangeError(
+							ERR_GUEST_EXISTS,
+							f"Skipped, Guest ID change {id_origin} -> {id_target} failed.",
+						)
+					return
+		finally:
+			for k in reversed(lock_keys):
+				locks[k].release()
+
+	# Workers look guests and storages up on every step, pmxcfs changes
+	# invalidate the caches instead of each lookup re-checking mtimes.
+	with (
+		watch.watching_caches(),
+		futures.ThreadPoolExecutor(
+			max_workers=max(1, workers), thread_name_prefix="change_id"
+		) as executor,
+	):
+		submitted = {
+			executor.submit(_run_chain, chain, lock_keys): chain
+			for chain, lock_keys in locked_chains
+		}
+	for future, chain in submitted.items():
+		e = future.exception()
+		if e is None:
+			continue
+		logger.error("Guest ID change chain %s failed: %s", chain, e)
+		# Pairs without a result did not finish
+		for pair in chain:
+			if pair not in results:
+				results[pair] = e
+
+	# Alter Backup Jobs, once for every changed guest
+	changed = {
+		id_origin: id_target
+		for (id_origin, id_target), e in results.items()
+		if e is None
+		and not journal.is_done(
+			get_journal_key(id_origin, id_target), STEP_BACKUP_JOBS
+		)
+	}
+	if changed:
+		keys = [get_journal_key(*pair) for pair in changed.items()]
+		for key in keys:
+			journal.record(key, STEP_BACKUP_JOBS, JOURNAL_STARTED)
+		with BACKUP_JOBS_LOCK:
+			change_guest_ids_on_backup_jobs(mapping=changed, dry_run=dry_run)
+		for key in keys:
+			journal.record(key, STEP_BACKUP_JOBS, JOURNAL_DONE)
+	return results
+
+
+def rollback_guest_id_changes(
+	journal: Journal, remote_user="root", dry_run=False
+) -> list[str]:
+	"""
+	Rolls back every journaled guest ID change, latest first.
+
+	:return: Keys of the changes that could not be fully rolled back.
+	"""
+	logger = logging.getLogger()
+	failed = []
+	for key in reversed(journal.keys()):
+		logger.info("Rolling back Guest ID change %s", key.replace(":", " -> "))
+		try:
+			if not rollback_guest_id_change(
+				journal, key, remote_user=remote_user, dry_run=dry_run
+			):
+				failed.append(key)
+		except Exception as e:
+			logger.error("Could not roll back %s: %s", key, e)
+			failed.append(key)
+	return failed
+
+
+def read_journal(path: str) -> Journal:
+	if not os.path.isfile(path):
+		raise ValueError(f"{path} journal file does not exist.")
+	return Journal(path)
+
+
+def get_journal_mapping(journal: Journal) -> dict[int, int]:
+	"""Returns the origin:target mapping of a journaled run."""
+	data = journal.get_data(None, STEP_MAPPING)
+	if data:
+		return {int(k): int(v) for k, v in data["mapping"].items()}
+	return {
+		int(id_origin): int(id_target)
+		for id_origin, id_target in (key.split(":") for key in journal.keys())
+	}
+
+
+def get_sigint_handler(journal: Journal):
+	def _handler(sig, frame):
+		if journal.path:
+			print(
+				f"\nResume with --resume {journal.path} or revert the changes "
+				+ f"with --rollback {journal.path}"
+			)
+		graceful_exit(sig, frame)
+
+	return _handler
+
+
+def log_batch_results(
+	results: dict[tuple[int, int], BaseException | None],
+	mapping: dict[int, int],
+) -> bool:
+	"""
+	:return: Whether every guest ID change succeeded.
+	"""
+	logger = logging.getLogger()
+	failed = {k: v for k, v in results.items() if v is not None}
+	logger.info(
+		"Changed %s of %s Guest IDs.",
+		len(results) - len(failed),
+		len(mapping),
+	)
+	for (id_origin, id_target), e in failed.items():
+		logger.error("%s -> %s failed: %s", id_origin, id_target, e)
+	return len(failed) < 1
+
+
+def main(argv_a: LocalParser, **kwargs):
+	signal.signal(signal.SIGINT, graceful_exit)
+	running_in_background = True
+
+	try:
+		if os.getpgrp() == os.tcgetpgrp(sys.stdout.fileno()):
+			running_in_background = False
+		else:
+			running_in_background = True
+			# Ignore SIGHUP
+			signal.signal(signal.SIGHUP, signal.SIG_IGN)
+	except Exception:
+		print("Could not check if process executed in background.")
+		pass
+
+	# Logging
+	logger = logging.getLogger()
+	log_level = "INFO"
+	if argv_a.debug:
+		log_level = "DEBUG"
+	debug_verbose = argv_a.debug and argv_a.verbose
+	log_file = (
+		f"{os.path.dirname(script_path)}/{os.path.basename(script_path)}.log"
+	)
+	batch_mode = bool(argv_a.mapping_file or argv_a.resume or argv_a.rollback)
+	logger = set_logger(
+		logger,
+		log_console=(not running_in_background),
+		log_file=log_file,
+		level=log_level,
+		threaded_logging=batch_mode,
+		format=None if batch_mode else "%(levelname)s %(message)s",
+	)
+
+	if argv_a.rollback or argv_a.resume:
+		if argv_a.mapping_file or argv_a.origin_id or argv_a.target_id:
+			logger.error(
+				"Origin/Target ID and mapping file arguments cannot be used with a journal."
+			)
+			sys.exit(ERR_JOURNAL)
+		try:
+			journal = read_journal(argv_a.rollback or argv_a.resume)
+		except ValueError as e:
+			logger.error(*e.args)
+			sys.exit(ERR_JOURNAL)
+		if argv_a.dry_run:
+			# Do not journal dry-run steps
+			journal.path = None
+		signal.signal(signal.SIGINT, get_sigint_handler(journal))
+		mapping = get_journal_mapping(journal)
+
+		if argv_a.rollback:
+			if not argv_a.yes and not yes_no_input(
+				f"Are you sure you wish to revert the ID changes of {len(mapping)} guests?",
+				input_default="N",
+			):
+				print_c(bcolors.L_BLUE, NORMAL_PROMPT_EXIT_MSG)
+				sys.exit(0)
+			failed = rollback_guest_id_changes(
+				journal, remote_user=argv_a.remote_user, dry_run=argv_a.dry_run
+			)
+			for key in failed:
+				logger.error(
+					"Guest ID change %s could not be fully reverted, please check it manually.",
+					key.replace(":", " -> "),
+				)
+			if failed:
+				sys.exit(ERR_JOURNAL)
+			return
+
+		try:
+			results = change_guest_ids(
+				mapping=mapping,
+				remote_user=argv_a.remote_user,
+				dry_run=argv_a.dry_run,
+				workers=argv_a.workers,
+				verbose=argv_a.verbose,
+				debug_verbose=debug_verbose,
+				journal=journal,
+			)
+		except ValueError as e:
+			for error in e.args:
+				logger.error(error)
+			sys.exit(ERR_JOURNAL)
+		if not log_batch_results(results, mapping):
+			sys.exit(ERR_BATCH_FAILED)
+		return
+
+	# Single guest changes are only journaled when requested
+	journal_path = argv_a.journal
+	if not journal_path and batch_mode:
+		journal_path = get_default_journal_path()
+	journal = Journal(None if argv_a.dry_run else journal_path)
+	signal.signal(signal.SIGINT, get_sigint_handler(journal))
+
+	if batch_mode:
+		if argv_a.origin_id or argv_a.target_id:
+			logger.error(
+				"Origin and Target ID arguments cannot be used with a mapping file."
+			)
+			sys.exit(ERR_BATCH_FAILED)
+		try:
+			mapping = parse_id_mapping_file(argv_a.mapping_file)
+			chains = validate_id_mapping(mapping)
+		except ValueError as e:
+			for error in e.args:
+				logger.error(error)
+			sys.exit(ERR_BATCH_FAILED)
+
+		if not argv_a.yes:
+			logger.info(
+				"This might break Replication and Backup Configurations."
+			)
+			if not yes_no_input(
+				f"Are you sure you wish to change the ID of {len(mapping)} guests?",
+				input_default="N",
+			):
+				print_c(bcolors.L_BLUE, NORMAL_PROMPT_EXIT_MSG)
+				sys.exit(0)
+
+		journal.record(
+			None,
+			STEP_MAPPING,
+			JOURNAL_DONE,
+			{"mapping": {str(k): v for k, v in mapping.items()}},
+		)
+		if journal.path:
+			logger.info("Journaling changes to %s", journal.path)
+		results = change_guest_ids(
+			mapping=mapping,
+			remote_user=argv_a.remote_user,
+			dry_run=argv_a.dry_run,
+			workers=argv_a.workers,
+			verbose=argv_a.verbose,
+			debug_verbose=debug_verbose,
+			journal=journal,
+			chains=chains,
+		)
+		if not log_batch_results(results, mapping):
+			sys.exit(ERR_BATCH_FAILED)
+		return
+
+	id_origin = argv_a.origin_id
+	id_target = argv_a.target_id
+	if not validate_vmid(vmid=id_origin):
+		id_origin = vmid_prompt()
+	if not validate_vmid(vmid=id_target):
+		id_target = vmid_prompt(target=True)
+
+	# Ensure ids are cast to int
+	id_origin = int(id_origin)
+	id_target = int(id_target)
+
+	journal.record(
+		None,
+		STEP_MAPPING,
+		JOURNAL_DONE,
+		{"mapping": {str(id_origin): id_target}},
+	)
+	try:
+		change_guest_id(
+			id_origin=id_origin,
+			id_target=id_target,
+			remote_user=argv_a.remote_user,
+			dry_run=argv_a.dry_run,
+			confirm=not argv_a.yes,
+			verbose=argv_a.verbose,
+			debug_verbose=debug_verbose,
+			journal=journal,
+		)
+	except GuestIdChangeError as e:
+		logger.error(*e.args)
+		sys.exit(e.code)
+	except Exception:
+		if journal.path:
+			logger.error(
+				"Guest ID change interrupted, resume with --resume %s or revert it with --rollback %s",
+				journal.path,
+				journal.path,
+			)
+		raise
@@ -6,18 +6,25 @@ if __name__ == "__main__":
 
 # IMPORTS
 import signal
-import subprocess
-import json
-import socket
-import ipaddress
 from core.proxmox.guests import (
 	get_guest_exists,
 	get_guest_cfg_path,
 	get_guest_status,
 )
+from core.network.ipam import AddressPoolExhausted
+from core.proxmox.subnet_index import (
+	DEFAULT_SUBNET_INDEX_TTL,
+	get_guest_addresses,
+	get_subnet_index,
+)
 from core.signal_handlers.sigint import graceful_exit
+from core.utils.lazy import lazy_import
+from core.utils.ssh import get_remote_args
 from core.parser import make_parser, ArgumentParser
 
+socket = lazy_import("socket")
+subprocess = lazy_import("subprocess")
+
 argparser_descr = """
 This program is used for scripted network modifications, recommended for situations
 where you might want a Remote Access Server to auto-adjust it's network along with the
@@ -44,60 +51,54 @@ def argparser(**kwargs) -> ArgumentParser:
 		help="May also be a physical interface.",
 	)
 	parser.add_argument("-v", "--verbose", action="store_true", default=False)
+	parser.add_argument(
+		"--cache-ttl",
+		default=DEFAULT_SUBNET_INDEX_TTL,
+		type=float,
+		help=f"Seconds cluster network data is cached for, 0 disables the cache (Default: {DEFAULT_SUBNET_INDEX_TTL:g}).",
+	)
+	parser.add_argument(
+		"--refresh",
+		action="store_true",
+		default=False,
+		help="Fetch cluster network data even if it is cached.",
+	)
 	return parser
 
 
 def main(argv_a, **kwargs):
 	signal.signal(signal.SIGINT, graceful_exit)
 	hostname = socket.gethostname()
-	reserved_ip_addresses = []
-	network = None
-	gateway = None
-	cmd = None
 	if not argv_a.guest_id:
 		raise ValueError("Please input a Guest ID.")
 	if not get_guest_exists(argv_a.guest_id):
 		raise Exception(f"Guest ID {argv_a.guest_id} does not exist.")
 
-	PVE_NODE_LIST_CMD = "pvesh get /nodes --output-format json"
-	cmd = PVE_NODE_LIST_CMD.split()
-	PVE_NODE_DATA: list[dict] = json.loads(subprocess.check_output(cmd))
-	PVE_NODE_LIST = tuple([d["node"] for d in PVE_NODE_DATA])
-	print("Proxmox VE Cluster Node list fetched.")
-
-	PVE_NETWORK_CMD = "pvesh get /nodes/{0}/network --output-format json"
-	for node in PVE_NODE_LIST:
-		print(f"Fetching network data for {node}.")
-		cmd = PVE_NETWORK_CMD.format(node).split()
-		PVE_NETWORK_DATA: list[dict] = json.loads(subprocess.check_output(cmd))
-		for iface_dict in PVE_NETWORK_DATA:
-			if "iface" not in iface_dict:
-				raise ValueError(
-					f"Missing critical key in Interface Dictionary.\n{iface_dict}"
-				)
-			if not iface_dict["iface"].startswith(argv_a.bridge):
-				continue
-			if "cidr" not in iface_dict:
-				continue
-			if network is None:
-				network = ipaddress.ip_network(iface_dict["cidr"], False)
-				gateway = ipaddress.ip_address(iface_dict["gateway"])
-			_addr = ipaddress.ip_address(iface_dict["address"])
-			if _addr in network:
-				reserved_ip_addresses.append(_addr)
-
-	reserved_ip_addresses.sort()
-	cloudinit_guest_address = reserved_ip_addresses[-1] + 1
-	if cloudinit_guest_address not in network:
-		print(
-			"Cannot increment IP Address bits, attempting to use a lower address."
+	subnet_index = get_subnet_index(
+		ttl=argv_a.cache_ttl, refresh=argv_a.refresh
+	)
+	subnet = subnet_index.get(argv_a.bridge)
+	if subnet is None or not subnet.reserved:
+		raise ValueError(
+			f"Could not find a network for {argv_a.bridge} on any cluster node."
 		)
-		cloudinit_guest_address = reserved_ip_addresses[0] - 1
-
-	if cloudinit_guest_address not in network:
+	print("Proxmox VE Cluster Node network data fetched.")
+	network = subnet.network
+	gateway = subnet.gateway
+
+	# Addresses already set on other guests are never re-used
+	guest_addresses = get_guest_addresses()
+	guest_addresses.pop(argv_a.guest_id, None)
+	allocator = subnet_index.get_allocator(argv_a.bridge, guest_addresses)
+	try:
+		# Prefer the addresses right after the cluster nodes
+		cloudinit_guest_address = allocator.allocate(
+			start=subnet.reserved[-1] + 1
+		)[0]
+	except AddressPoolExhausted as e:
 		raise Exception(
-			"Could not find a valid contiguous IP within requested subnet."
-		)
+			"Could not find a valid IP within requested subnet."
+		) from e
 	print(f"Using {cloudinit_guest_address} for guest.")
 
 	guest_cfg_details = get_guest_cfg_path(
@@ -111,9 +112,14 @@ def main(argv_a, **kwargs):
 	guest_on_remote_host = hostname != guest_cfg_host
 	args_ssh = None
 	if guest_on_remote_host:
-		args_ssh = ["/usr/bin/ssh", f"root@{guest_cfg_host}"]
+		args_ssh = get_remote_args(guest_cfg_host)
 
-	args_qm = f"qm set {argv_a.guest_id} --ipconfig0 ip={cloudinit_guest_address}/{network.prefixlen},gw={gateway}".split()
+	ipconfig = f"ip={cloudinit_guest_address}/{network.prefixlen}"
+	if gateway:
+		ipconfig += f",gw={gateway}"
+	else:
+		print(f"No gateway found for {argv_a.bridge}, guest will have none.")
+	args_qm = f"qm set {argv_a.guest_id} --ipconfig0 {ipconfig}".split()
 	if guest_on_remote_host:
 		args_qm = args_ssh + args_qm
 
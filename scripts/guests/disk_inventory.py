@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+if __name__ == "__main__":
+	raise Exception(
+		"This python script cannot be executed individually, please use main.py"
+	)
+
+# IMPORTS
+import sys
+import json
+import signal
+import logging
+from dataclasses import asdict
+from core.signal_handlers.sigint import graceful_exit
+from core.proxmox.inventory import InventoryReport, StorageInventory
+from core.format.colors import bcolors, print_c
+from core.parser import make_parser, ArgumentParser
+
+logger = logging.getLogger()
+
+# Volume states shown by default, referenced volumes are only listed with --all
+REPORT_STATES = ("orphaned", "unreferenced", "misnamed", "missing")
+REPORT_STATE_COLORS = {
+	"orphaned": bcolors.RED,
+	"unreferenced": bcolors.YELLOW,
+	"misnamed": bcolors.YELLOW,
+	"missing": bcolors.RED,
+	"referenced": bcolors.GREEN,
+}
+
+
+def argparser(**kwargs) -> ArgumentParser:
+	parser = make_parser(
+		prog="Proxmox VE Disk Inventory",
+		description="Lists every guest volume on a node's storages and reports orphaned, unreferenced, misnamed and missing disks.",
+		**kwargs,
+	)
+	parser.add_argument(
+		"-n", "--node", help="Node to inventory (Default: local host)"
+	)
+	parser.add_argument(
+		"-s",
+		"--storage",
+		action="append",
+		help="Only inventory storage (May be used more than once)",
+	)
+	parser.add_argument(
+		"-a",
+		"--all",
+		action="store_true",
+		help="Also list referenced volumes",
+	)
+	parser.add_argument(
+		"-j", "--json", action="store_true", help="Output report as JSON"
+	)
+	parser.add_argument("--debug", action="store_true", default=False)
+	return parser
+
+
+def get_report_dict(report: InventoryReport, show_all=False) -> dict:
+	states = REPORT_STATES + (("referenced",) if show_all else ())
+	sizes = {
+		v.volume_id: v.size
+		for storage_volumes in report.volumes.values()
+		for v in storage_volumes
+	}
+	return {
+		"node": report.node,
+		"errors": report.errors,
+		"volumes": [
+			{
+				"volume": volume_id,
+				"state": state,
+				"size": sizes.get(volume_id),
+				"guests": report.references.get(volume_id, []),
+			}
+			for volume_id, state in sorted(report.states.items())
+			if state in states
+		],
+		"totals": {
+			s: len(report.by_state(s)) for s in REPORT_STATES + ("referenced",)
+		},
+	}
+
+
+def print_report(report: InventoryReport, show_all=False) -> None:
+	report_dict = get_report_dict(report, show_all)
+	for storage, error in report_dict["errors"].items():
+		print_c(bcolors.RED, f"{storage}: could not be listed ({error})")
+	for volume in report_dict["volumes"]:
+		guests = ",".join(str(g) for g in volume["guests"])
+		print_c(
+			REPORT_STATE_COLORS[volume["state"]],
+			f"{volume['state'].upper():<13} {volume['volume']}"
+			+ (f" (Guests: {guests})" if guests else ""),
+		)
+	print(
+		"Totals: "
+		+ ", ".join(f"{s} {n}" for s, n in report_dict["totals"].items())
+	)
+
+
+def main(argv_a, **kwargs):
+	signal.signal(signal.SIGINT, graceful_exit)
+	logger.setLevel(logging.DEBUG if argv_a.debug else logging.INFO)
+	logger.addHandler(logging.StreamHandler(sys.stderr))
+
+	inventory = StorageInventory(node=argv_a.node)
+	report = inventory.report(storage_names=argv_a.storage)
+	if argv_a.json:
+		report_dict = get_report_dict(report, argv_a.all)
+		if argv_a.all:
+			report_dict["storages"] = {
+				name: [asdict(v) for v in volumes]
+				for name, volumes in report.volumes.items()
+			}
+		print(json.dumps(report_dict, indent=2))
+	else:
+		print_report(report, argv_a.all)
+	if report.errors:
+		sys.exit(1)
@@ -0,0 +1,369 @@
+#!/usr/bin/python3
+# Documentation: https://pve.proxmox.com/pve-docs/api-viewer/#/cluster/resources
+if __name__ == "__main__":
+	raise Exception(
+		"This python script cannot be executed individually, please use main.py"
+	)
+
+# IMPORTS
+import re
+import sys
+import csv
+import json
+import signal
+import logging
+from dataclasses import dataclass, field, asdict
+from core.signal_handlers.sigint import graceful_exit
+from core.proxmox.constants import PVE_CFG_USER
+from core.proxmox.guests import (
+	CLUSTER_RESOURCE_TYPES,
+	PveGuestType,
+	get_all_guests,
+	get_cluster_resources,
+	get_guest_cfg_path,
+	get_local_guest_statuses,
+)
+from core.proxmox.guest_config import GuestConfig
+from core.utils.command import CommandError
+from core.utils.lazy import lazy_import
+from core.parser import make_parser, ArgumentParser
+
+api = lazy_import("core.proxmox.api")
+
+logger = logging.getLogger()
+
+GUEST_STATUS_UNKNOWN = "unknown"
+GUEST_LIST_OUTPUTS = ("table", "json", "csv")
+GUEST_LIST_COLUMNS = (
+	"vmid",
+	"name",
+	"type",
+	"node",
+	"status",
+	"pool",
+	"tags",
+	"storages",
+)
+GUEST_LIST_DEFAULT_COLUMNS = (
+	"vmid",
+	"name",
+	"type",
+	"node",
+	"status",
+	"pool",
+	"tags",
+)
+GUEST_TAGS_SPLIT_REGEX = re.compile(r"[;,\s]+")
+
+
+def vmid_range(value: str) -> tuple[int, int]:
+	"""Parses 100 or 100-199 into an inclusive (start, end) range."""
+	try:
+		start, sep, end = value.partition("-")
+		start = int(start)
+		end = int(end) if sep else start
+	except ValueError:
+		raise ValueError(f"Invalid Guest ID range: {value}")
+	if end < start:
+		raise ValueError(f"Invalid Guest ID range: {value}")
+	return start, end
+
+
+def argparser(**kwargs) -> ArgumentParser:
+	parser = make_parser(
+		prog="Proxmox VE Cluster Guest List",
+		description="Lists and filters guests across the whole cluster with a single API call.",
+		**kwargs,
+	)
+	parser.add_argument(
+		"-n",
+		"--node",
+		action="append",
+		help="Only list guests on node (May be used more than once)",
+	)
+	parser.add_argument(
+		"-t",
+		"--type",
+		choices=[t.value for t in PveGuestType],
+		help="Only list Virtual Machines (vm) or Linux Containers (ct)",
+	)
+	parser.add_argument(
+		"-s", "--status", help="Only list guests with status (e.g. running)"
+	)
+	parser.add_argument(
+		"--tag",
+		action="append",
+		help="Only list guests with tag (May be used more than once)",
+	)
+	parser.add_argument("-p", "--pool", help="Only list guests in pool")
+	parser.add_argument(
+		"--storage", help="Only list guests with volumes on storage"
+	)
+	parser.add_argument(
+		"-r",
+		"--range",
+		type=vmid_range,
+		action="append",
+		help="Only list Guest IDs within range, e.g. 100-199 (May be used more than once)",
+	)
+	parser.add_argument(
+		"-o",
+		"--output",
+		choices=GUEST_LIST_OUTPUTS,
+		default=GUEST_LIST_OUTPUTS[0],
+	)
+	parser.add_argument(
+		"-c",
+		"--columns",
+		help=f"Comma separated columns (Default: {','.join(GUEST_LIST_DEFAULT_COLUMNS)}, Available: {','.join(GUEST_LIST_COLUMNS)})",
+	)
+	parser.add_argument(
+		"--offline",
+		action="store_true",
+		help="Scan the pmxcfs configuration tree instead of using the API",
+	)
+	parser.add_argument("--debug", action="store_true", default=False)
+	return parser
+
+
+@dataclass
+class GuestResource:
+	vmid: int
+	name: str
+	type: str
+	node: str
+	status: str
+	pool: str | None = None
+	tags: list[str] = field(default_factory=list)
+	storages: list[str] | None = None
+
+
+def parse_guest_tags(tags: str | None) -> list[str]:
+	if not tags:
+		return []
+	return [t for t in GUEST_TAGS_SPLIT_REGEX.split(tags) if t]
+
+
+def get_guest_storages(guest_id: int) -> list[str]:
+	"""Storages with guest volumes, including snapshots and unused disks."""
+	guest_cfg_path = get_guest_cfg_path(guest_id=guest_id)
+	if not guest_cfg_path:
+		return []
+	guest_config = GuestConfig.from_file(guest_cfg_path)
+	storages = set()
+	for section in guest_config.sections():
+		for disk in guest_config.disks(section=section):
+			storages.add(disk.storage)
+	return sorted(storages)
+
+
+def get_pool_members(path: str = PVE_CFG_USER) -> dict[int, str]:
+	"""
+	Reads pool memberships from pmxcfs' user.cfg.
+	Pool lines are formatted as pool:<name>:<comment>:<vmids>:<storages>:
+
+	:return: guest_id:pool pairs.
+	"""
+	members = {}
+	try:
+		with open(path, "r") as user_cfg:
+			for line in user_cfg:
+				if not line.startswith("pool:"):
+					continue
+				fields = line.rstrip("\n").split(":")
+				if len(fields) < 4:
+					continue
+				for guest_id in fields[3].split(","):
+					if guest_id.strip().isdigit():
+						members[int(guest_id)] = fields[1]
+	except OSError as e:
+		logger.debug("Could not read pools from %s: %s", path, e)
+	return members
+
+
+def get_guest_resources_from_api() -> list[GuestResource]:
+	"""Every cluster guest, with a single /cluster/resources call."""
+	guests = []
+	for resource in get_cluster_resources():
+		guest_type = CLUSTER_RESOURCE_TYPES.get(resource.get("type"))
+		if not guest_type:
+			continue
+		guests.append(
+			GuestResource(
+				vmid=int(resource["vmid"]),
+				name=resource.get("name", ""),
+				type=guest_type,
+				node=resource.get("node", ""),
+				status=resource.get("status", GUEST_STATUS_UNKNOWN),
+				pool=resource.get("pool"),
+				tags=parse_guest_tags(resource.get("tags")),
+			)
+		)
+	return guests
+
+
+def get_guest_resources_from_cfgs() -> list[GuestResource]:
+	"""
+	Every cluster guest, from the pmxcfs configuration tree.
+	Only statuses of local guests are known.
+	"""
+	local_statuses = get_local_guest_statuses()
+	pools = get_pool_members()
+	guests = []
+	for guest_type, guest_ids in get_all_guests().items():
+		for guest_id in guest_ids:
+			guest_cfg = get_guest_cfg_path(guest_id=guest_id, get_as_dict=True)
+			if not guest_cfg:
+				continue
+			try:
+				guest_config = GuestConfig.from_file(guest_cfg["path"])
+			except OSError as e:
+				logger.warning("Could not read Guest %s: %s", guest_id, e)
+				continue
+			if guest_type == PveGuestType.LINUX_CONTAINER.value:
+				name = guest_config.get("hostname")
+			else:
+				name = guest_config.get("name")
+			guests.append(
+				GuestResource(
+					vmid=guest_id,
+					name=name or "",
+					type=guest_type,
+					node=guest_cfg["host"],
+					status=local_statuses.get(guest_id, GUEST_STATUS_UNKNOWN),
+					pool=pools.get(guest_id),
+					tags=parse_guest_tags(guest_config.get("tags")),
+				)
+			)
+	return guests
+
+
+def get_guest_resources(offline=False) -> list[GuestResource]:
+	if not offline:
+		try:
+			return get_guest_resources_from_api()
+		except (CommandError, api.PVEAPIError, OSError, ValueError) as e:
+			logger.warning(
+				"Could not fetch cluster resources (%s), scanning configurations.",
+				e.args[0] if e.args else e,
+			)
+	return get_guest_resources_from_cfgs()
+
+
+def filter_guest_resources(
+	guests: list[GuestResource],
+	nodes: list[str] | None = None,
+	guest_type: str | None = None,
+	status: str | None = None,
+	tags: list[str] | None = None,
+	pool: str | None = None,
+	storage: str | None = None,
+	vmid_ranges: list[tuple[int, int]] | None = None,
+) -> list[GuestResource]:
+	"""
+	Filters are combined, guests must match all of them.
+	Storages are only read from guest configurations when filtering by
+	storage.
+	"""
+	result = []
+	for guest in guests:
+		if nodes and guest.node not in nodes:
+			continue
+		if guest_type and guest.type != guest_type:
+			continue
+		if status and guest.status != status:
+			continue
+		if tags and not set(tags).issubset(guest.tags):
+			continue
+		if pool and guest.pool != pool:
+			continue
+		if vmid_ranges and not any(
+			start <= guest.vmid <= end for start, end in vmid_ranges
+		):
+			continue
+		if storage:
+			if guest.storages is None:
+				guest.storages = get_guest_storages(guest.vmid)
+			if storage not in guest.storages:
+				continue
+		result.append(guest)
+	return sorted(result, key=lambda g: g.vmid)
+
+
+def get_guest_rows(
+	guests: list[GuestResource], columns: list[str]
+) -> list[dict[str, str]]:
+	rows = []
+	for guest in guests:
+		values = asdict(guest)
+		row = {}
+		for column in columns:
+			value = values[column]
+			if isinstance(value, list):
+				value = ";".join(value)
+			row[column] = "" if value is None else str(value)
+		rows.append(row)
+	return rows
+
+
+def format_table(rows: list[dict[str, str]], columns: list[str]) -> str:
+	widths = {c: max([len(c)] + [len(row[c]) for row in rows]) for c in columns}
+	lines = [" ".join(c.upper().ljust(widths[c]) for c in columns).rstrip()]
+	for row in rows:
+		lines.append(
+			" ".join(row[c].ljust(widths[c]) for c in columns).rstrip()
+		)
+	return "\n".join(lines)
+
+
+def write_guest_list(
+	guests: list[GuestResource], columns: list[str], output: str, file=None
+) -> None:
+	if file is None:
+		file = sys.stdout
+	if output == "json":
+		json.dump(
+			[{c: asdict(g)[c] for c in columns} for g in guests], file, indent=2
+		)
+		file.write("\n")
+		return
+	rows = get_guest_rows(guests, columns)
+	if output == "csv":
+		writer = csv.DictWriter(file, fieldnames=columns)
+		writer.writeheader()
+		writer.writerows(rows)
+		return
+	file.write(format_table(rows, columns) + "\n")
+
+
+def main(argv_a, **kwargs):
+	signal.signal(signal.SIGINT, graceful_exit)
+	logger.setLevel(logging.DEBUG if argv_a.debug else logging.INFO)
+	logger.addHandler(logging.StreamHandler(sys.stderr))
+
+	if argv_a.columns:
+		columns = [c.strip() for c in argv_a.columns.split(",") if c.strip()]
+		invalid = [c for c in columns if c not in GUEST_LIST_COLUMNS]
+		if invalid:
+			raise ValueError(f"Invalid columns: {', '.join(invalid)}")
+	else:
+		columns = list(GUEST_LIST_DEFAULT_COLUMNS)
+
+	nodes = None
+	if argv_a.node:
+		nodes = [n for arg in argv_a.node for n in arg.split(",") if n]
+	guests = filter_guest_resources(
+		get_guest_resources(offline=argv_a.offline),
+		nodes=nodes,
+		guest_type=argv_a.type,
+		status=argv_a.status,
+		tags=argv_a.tag,
+		pool=argv_a.pool,
+		storage=argv_a.storage,
+		vmid_ranges=argv_a.range,
+	)
+	if "storages" in columns:
+		for guest in guests:
+			if guest.storages is None:
+				guest.storages = get_guest_storages(guest.vmid)
+	write_guest_list(guests, columns, argv_a.output)
@@ -5,24 +5,33 @@
 # Documentation (LXC): https://pve.proxmox.com/pve-docs/pct.1.html
 import sys
 import os
-import socket
-import subprocess
 import signal
 import time
+import json
 import logging
 from copy import deepcopy
+from dataclasses import dataclass, field
 from core.signal_handlers.sigint import graceful_exit
 from core.proxmox.constants import PVE_CFG_NODES_DIR
 from core.proxmox.guests import (
 	get_guest_cfg_path,
 	get_all_guests,
 	get_guest_is_ct,
-	parse_guest_net_cfg,
+	get_guest_net_cfgs,
 	parse_net_opts_to_string,
 )
+from core.utils.command import run_command
+from core.utils.file_edit import write_file_atomic
+from core.utils.lazy import lazy_import
+from core.utils.path import get_state_path
 from core.utils.prompt import yes_no_input
+from core.utils.ssh import get_remote_args
 from core.parser import make_parser, ArgumentParser
 
+datetime = lazy_import("datetime")
+futures = lazy_import("concurrent.futures")
+socket = lazy_import("socket")
+
 script_path = os.path.realpath(__file__)
 script_dir = os.path.dirname(script_path)
 script_name = os.path.basename(script_path)
@@ -31,6 +40,12 @@ if __name__ == "__main__":
 		"This python script cannot be executed individually, please use main.py"
 	)
 
+# Concurrent guest changes per node
+DEFAULT_NODE_WORKERS = 4
+# Within the toolkit's state directory, one manifest per run
+MANIFEST_DIRNAME = "staged_net_change"
+MANIFEST_FILENAME_PREFIX = "rollback-"
+
 
 def argparser(**kwargs) -> ArgumentParser:
 	parser = make_parser(
@@ -45,12 +60,35 @@ def argparser(**kwargs) -> ArgumentParser:
 	parser.add_argument(
 		"-rd", "--rollback-delay", type=int, help="Rollback Delay in Seconds"
 	)
+	parser.add_argument(
+		"-w",
+		"--workers",
+		type=int,
+		default=DEFAULT_NODE_WORKERS,
+		help=f"Concurrent guest changes per node (Default: {DEFAULT_NODE_WORKERS})",
+	)
 	parser.add_argument(
 		"-p",
 		"--print-original",
 		type=int,
 		help="Print Original Config Arguments",
 	)
+	parser.add_argument(
+		"-m",
+		"--manifest",
+		default=None,
+		help=f"Rollback Manifest Path, written before applying any changes (Default: {get_state_path(MANIFEST_DIRNAME)}/{MANIFEST_FILENAME_PREFIX}<date>.json).",
+	)
+	parser.add_argument(
+		"--restore",
+		action="store_true",
+		help="Only replay the Rollback Manifest, the latest one if --manifest is not set",
+	)  # Bool
+	parser.add_argument(
+		"--force",
+		action="store_true",
+		help="Overwrite an existing Rollback Manifest",
+	)  # Bool
 	parser.add_argument(
 		"--example", action="store_true", help="Shows example config file"
 	)  # Bool
@@ -82,6 +120,220 @@ def TimedInputYN(
 			return False
 
 
+@dataclass
+class GuestNetChange:
+	"""Every network interface change for a single guest."""
+
+	guest_id: int
+	host: str
+	is_ct: bool
+	nets: dict[int, dict] = field(default_factory=dict)
+
+	def cmd_args(self, remote=False) -> list[str]:
+		"""Single qm/pct set call for all of the guest's interfaces."""
+		cmd_args = [
+			"/usr/sbin/pct" if self.is_ct else "/usr/sbin/qm",
+			"set",
+			str(self.guest_id),
+		]
+		for net_id in sorted(self.nets):
+			cmd_args += [
+				f"--net{net_id}",
+				parse_net_opts_to_string(self.nets[net_id]),
+			]
+		if remote:
+			cmd_args = get_remote_args(self.host) + cmd_args
+		return cmd_args
+
+
+def get_guest_net_rollback(
+	guest_net_map: dict, guest_net_orig: dict
+) -> dict[int, dict[int, dict]]:
+	"""Returns the original options of every interface to be changed."""
+	return {
+		int(guest_id): {
+			net_id: deepcopy(net_opts)
+			for net_id, net_opts in guest_net_orig[int(guest_id)].items()
+			if net_id in guest_net_map[guest_id]
+		}
+		for guest_id in guest_net_map
+		if int(guest_id) in guest_net_orig
+	}
+
+
+def make_guest_net_changes(
+	net_cfgs: dict[int, dict[int, dict]],
+) -> list[GuestNetChange]:
+	changes = []
+	for guest_id, nets in net_cfgs.items():
+		if not nets:
+			continue
+		changes.append(
+			GuestNetChange(
+				guest_id=int(guest_id),
+				host=get_guest_cfg_path(guest_id=guest_id, get_host=True),
+				is_ct=get_guest_is_ct(guest_id),
+				nets=nets,
+			)
+		)
+	return changes
+
+
+def get_guest_net_changes(
+	guest_net_map: dict, guest_net_orig: dict, rollback=False
+) -> list[GuestNetChange]:
+	"""
+	:param rollback: Return the original options of the changed interfaces.
+	"""
+	net_cfgs = get_guest_net_rollback(guest_net_map, guest_net_orig)
+	if not rollback:
+		for guest_id, net_cfg in net_cfgs.items():
+			for net_id, net_opts in net_cfg.items():
+				for k, v in guest_net_map[guest_id][net_id].items():
+					if v is None:
+						net_opts.pop(k, None)
+					else:
+						net_opts[k] = v
+	return make_guest_net_changes(net_cfgs)
+
+
+def get_default_manifest_path() -> str:
+	return get_state_path(
+		MANIFEST_DIRNAME,
+		f"{MANIFEST_FILENAME_PREFIX}{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json",
+	)
+
+
+def get_latest_manifest_path() -> str | None:
+	""":return: Most recent default Rollback Manifest, None if there are none."""
+	manifest_dir = get_state_path(MANIFEST_DIRNAME)
+	try:
+		filenames = [
+			f
+			for f in os.listdir(manifest_dir)
+			if f.startswith(MANIFEST_FILENAME_PREFIX) and f.endswith(".json")
+		]
+	except FileNotFoundError:
+		return None
+	# Dates sort lexicographically
+	return os.path.join(manifest_dir, max(filenames)) if filenames else None
+
+
+def write_rollback_manifest(
+	path: str, net_cfgs: dict[int, dict[int, dict]], overwrite=False
+) -> None:
+	"""
+	Persists the original interface options for a later --restore.
+
+	:param overwrite: Replace an existing manifest, its original options
+	  are lost.
+	:raises FileExistsError: If path exists and overwrite is False.
+	"""
+	if not overwrite and os.path.exists(path):
+		raise FileExistsError(
+			f"Rollback Manifest {path} already exists, use --force to overwrite it."
+		)
+	manifest = {
+		"created": datetime.datetime.now().isoformat(timespec="seconds"),
+		"guests": net_cfgs,
+	}
+	manifest_dir = os.path.dirname(path)
+	if manifest_dir:
+		os.makedirs(manifest_dir, exist_ok=True)
+	write_file_atomic(path, json.dumps(manifest, indent=4))
+
+
+def read_rollback_manifest(path: str) -> dict[int, dict[int, dict]]:
+	with open(path, "r") as manifest_file:
+		manifest = json.load(manifest_file)
+	# JSON object keys are always strings
+	return {
+		int(guest_id): {int(net_id): opts for net_id, opts in nets.items()}
+		for guest_id, nets in manifest["guests"].items()
+	}
+
+
+def run_guest_net_changes(
+	changes: list[GuestNetChange],
+	workers=DEFAULT_NODE_WORKERS,
+	dry_run=False,
+) -> dict[int, str | None]:
+	"""
+	Applies guest network changes with one worker pool per node, every
+	node is processed at the same time.
+
+	:param workers: Concurrent changes per node.
+	:return: guest_id:error pairs, None on success.
+	"""
+	logger = logging.getLogger()
+	hostname = socket.gethostname()
+	report: dict[int, str | None] = {}
+
+	def _run(change: GuestNetChange):
+		guest_is_remote = change.host != hostname
+		cmd_args = change.cmd_args(remote=guest_is_remote)
+		logger.debug(cmd_args)
+		if dry_run:
+			logger.info(" ".join(cmd_args))
+			report[change.guest_id] = None
+			return
+		try:
+			result = run_command(cmd_args)
+		except OSError as e:
+			report[change.guest_id] = str(e)
+			return
+		if not result.ok:
+			report[change.guest_id] = (
+				f"Bad command return code ({result.returncode}): "
+				+ result.errors.strip()
+			)
+		else:
+			report[change.guest_id] = None
+
+	node_changes: dict[str, list[GuestNetChange]] = {}
+	for change in changes:
+		node_changes.setdefault(change.host, []).append(change)
+
+	executors = []
+	submitted = []
+	try:
+		for node, node_group in node_changes.items():
+			logger.info("Changing %s guests on node %s.", len(node_group), node)
+			executor = futures.ThreadPoolExecutor(
+				max_workers=max(1, workers), thread_name_prefix=node
+			)
+			executors.append(executor)
+			submitted += [executor.submit(_run, c) for c in node_group]
+		futures.wait(submitted)
+	finally:
+		for executor in executors:
+			executor.shutdown(wait=True)
+	return report
+
+
+def log_guest_net_report(report: dict[int, str | None], phase: str) -> bool:
+	"""
+	:return: Whether every guest change succeeded.
+	:rtype: bool
+	"""
+	logger = logging.getLogger()
+	failed = {k: v for k, v in report.items() if v is not None}
+	logger.info(
+		"%s: %s of %s guests succeeded.",
+		phase,
+		len(report) - len(failed),
+		len(report),
+	)
+	for guest_id in sorted(report):
+		if report[guest_id] is None:
+			logger.info("%s: %s OK", phase, guest_id)
+		else:
+			logger.error(
+				"%s: %s FAILED (%s)", phase, guest_id, report[guest_id]
+			)
+	return len(failed) < 1
+
+
 def main(argv_a, **kwargs):
 	signal.signal(signal.SIGINT, graceful_exit)
 	logger = logging.getLogger()
@@ -136,6 +388,18 @@ def main(argv_a, **kwargs):
 	if not os.path.isdir(PVE_CFG_NODES_DIR):
 		raise Exception("PVE Nodes directory does not exist.")
 
+	if argv_a.restore:
+		manifest_path = argv_a.manifest or get_latest_manifest_path()
+		if not manifest_path:
+			raise ValueError("No Rollback Manifest found, see --manifest arg.")
+		logger.info("Restoring changes from %s", manifest_path)
+		report = run_guest_net_changes(
+			make_guest_net_changes(read_rollback_manifest(manifest_path)),
+			workers=argv_a.workers,
+			dry_run=argv_a.dry_run,
+		)
+		sys.exit(0 if log_guest_net_report(report, "Rollback") else 1)
+
 	if argv_a.config:
 		if not os.path.isfile(argv_a.config):
 			raise ValueError(f"{argv_a.config} config file does not exist.")
@@ -154,21 +418,7 @@ def main(argv_a, **kwargs):
 		logger.info("Running in dry-run mode. Commands will only be printed.")
 
 	all_guests = get_all_guests(filter_ids=guest_net_map)
-	guest_net_orig = {}
-	for guest_type in all_guests:
-		for guest_id in all_guests[guest_type]:
-			guest_host = get_guest_cfg_path(guest_id=guest_id, get_host=True)
-			if guest_host != hostname:
-				guest_net_orig[int(guest_id)] = parse_guest_net_cfg(
-					guest_id,
-					remote=True,
-					remote_host=guest_host,
-					debug=argv_a.debug,
-				)
-			else:
-				guest_net_orig[int(guest_id)] = parse_guest_net_cfg(
-					guest_id, debug=argv_a.debug
-				)
+	guest_net_orig = get_guest_net_cfgs(filter_ids=guest_net_map)
 
 	if argv_a.print_original:
 		logger.info(
@@ -184,56 +434,30 @@ def main(argv_a, **kwargs):
 		logger.info(all_guests)
 		sys.exit(0)
 
-	cmd_args: list = []
-	for guest_id in guest_net_map:
-		logger.info("Making changes to %s", guest_id)
-		guest_is_ct = get_guest_is_ct(guest_id)
-		guest_host = get_guest_cfg_path(guest_id=guest_id, get_host=True)
-		guest_is_remote = guest_host != hostname
-		net_cfg = deepcopy(guest_net_orig[int(guest_id)])
+	rollback_net_cfgs = get_guest_net_rollback(guest_net_map, guest_net_orig)
+	manifest_path = argv_a.manifest or get_default_manifest_path()
+	if argv_a.dry_run:
+		logger.info(
+			"Rollback Manifest (%s): %s", manifest_path, rollback_net_cfgs
+		)
+	else:
+		write_rollback_manifest(
+			manifest_path, rollback_net_cfgs, overwrite=argv_a.force
+		)
+		logger.info("Rollback Manifest written to %s", manifest_path)
 
-		if guest_is_remote:
+	changes = get_guest_net_changes(guest_net_map, guest_net_orig)
+	for change in changes:
+		if change.host != hostname:
 			logger.info(
-				"%s is located in remote host (%s)", guest_id, guest_host
+				"%s is located in remote host (%s)",
+				change.guest_id,
+				change.host,
 			)
-		for net_id in guest_net_map[guest_id]:
-			new_net_opts = guest_net_map[guest_id][net_id]
-			if net_id in net_cfg:
-				for k, v in new_net_opts.items():
-					if v is None:
-						net_cfg[net_id].pop(k, None)
-					else:
-						net_cfg[net_id][k] = v
-
-		for net_id, net_opts in net_cfg.items():
-			# Skip network interfaces without changes
-			if net_id not in guest_net_map[guest_id]:
-				continue
-			if guest_is_ct:
-				cmd_args = [
-					"/usr/sbin/pct",
-					"set",
-					str(guest_id),
-					f"--net{net_id}",
-					parse_net_opts_to_string(net_opts),
-				]
-			else:
-				cmd_args = [
-					"/usr/sbin/qm",
-					"set",
-					str(guest_id),
-					f"--net{net_id}",
-					parse_net_opts_to_string(net_opts),
-				]
-			if guest_is_remote:
-				ssh_args = ["/usr/bin/ssh", f"root@{guest_host}"]
-				cmd_args = ssh_args + cmd_args
-			if argv_a.debug:
-				logger.debug(cmd_args)
-			if argv_a.dry_run:
-				logger.info(" ".join(cmd_args))
-			else:
-				subprocess.run(cmd_args)
+	report = run_guest_net_changes(
+		changes, workers=argv_a.workers, dry_run=argv_a.dry_run
+	)
+	log_guest_net_report(report, "Apply")
 
 	# If rollback is not enabled, exit
 	if not argv_a.rollback:
@@ -259,46 +483,10 @@ def main(argv_a, **kwargs):
 		sys.exit(0)
 
 	logger.debug("Guest Net Map: %s", guest_net_map)
-	for guest_id in guest_net_map:
-		logger.info("Rolling back changes for %s.", guest_id)
-		# guest_cfg = get_guest_cfg_path(guest_id)
-		guest_is_ct = get_guest_is_ct(guest_id)
-		guest_host = get_guest_cfg_path(guest_id=guest_id, get_host=True)
-		guest_is_remote = guest_host != hostname
-		net_cfg = deepcopy(guest_net_orig[int(guest_id)])
-
-		if guest_is_remote:
-			logger.info(
-				"%s is located in remote host (%s)", guest_id, guest_host
-			)
-		for net_id, net_opts in net_cfg.items():
-			# Skip network interfaces without changes
-			if net_id not in guest_net_map[guest_id]:
-				continue
-			if guest_is_ct:
-				cmd_args = [
-					"/usr/sbin/pct",
-					"set",
-					str(guest_id),
-					f"--net{net_id}",
-					parse_net_opts_to_string(net_opts),
-				]
-			else:
-				cmd_args = [
-					"/usr/sbin/qm",
-					"set",
-					str(guest_id),
-					f"--net{net_id}",
-					parse_net_opts_to_string(net_opts),
-				]
-			if guest_is_remote:
-				ssh_args = ["/usr/bin/ssh", f"root@{guest_host}"]
-				cmd_args = ssh_args + cmd_args
-			if argv_a.debug:
-				logger.debug(cmd_args)
-			if argv_a.dry_run:
-				logger.info(" ".join(cmd_args))
-			else:
-				subprocess.run(cmd_args)
-
+	rollback_changes = make_guest_net_changes(rollback_net_cfgs)
+	report = run_guest_net_changes(
+		rollback_changes, workers=argv_a.workers, dry_run=argv_a.dry_run
+	)
+	if not log_guest_net_report(report, "Rollback"):
+		sys.exit(1)
 	sys.exit(0)
@@ -10,6 +10,7 @@ import sys
 import subprocess
 from core.format.colors import print_c, bcolors
 from core.network.ping import ping
+from core.network.links import LinkWatcher, wait_for_link_down
 from core.automation.network.vpn.controller import VPNController
 from time import sleep
 from core.parser import make_parser, ArgumentParser
@@ -76,6 +77,12 @@ def argparser(**kwargs) -> ArgumentParser:
 		help="Args to pass to Extra Script",
 		nargs="+",
 	)
+	parser.add_argument(
+		"-I",
+		"--interface",
+		default=None,
+		help="VPN Tunnel Interface, the gateway is checked as soon as it goes down instead of waiting for the next interval.",
+	)
 	return parser
 
 
@@ -88,6 +95,7 @@ class LocalParser:
 	ping_args: list[str]
 	script: str
 	script_args: list[str]
+	interface: str | None
 
 def main(argv_a: LocalParser, **kwargs):
 	gateway = argv_a.gateway
@@ -112,6 +120,8 @@ def main(argv_a: LocalParser, **kwargs):
 		raise ValueError(gateway)
 	print_c(bcolors.L_GREEN, f"{SCRIPT_NAME} started.")
 
+	link_watcher = LinkWatcher() if argv_a.interface else None
+
 	while True:
 		ping_success = False
 		if ping(gateway, ping_count, ping_timeout, args=ping_args) == 0:
@@ -177,7 +187,13 @@ def main(argv_a: LocalParser, **kwargs):
 
 		msg = f"Checking again in {interval} seconds"
 		print_c(bcolors.BLUE, msg)
-		sleep(interval)
+		if not link_watcher:
+			sleep(interval)
+			continue
+		# Link changes caused by the restart above are not a new failure
+		link_watcher.poll(0)
+		if wait_for_link_down(link_watcher, argv_a.interface, interval):
+			print_c(bcolors.YELLOW, f"{argv_a.interface} went down")
 
 # Direct execution is deprecated.
 if __name__ == "__main__":
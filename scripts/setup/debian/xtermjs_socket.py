@@ -10,6 +10,7 @@ import shutil
 from core.format.colors import bcolors, print_c
 from core.parser import make_parser, ArgumentParser
 from core.debian.os_release import get_data
+from core.utils.file_edit import Substitution, edit_file
 
 SUPPORTED_RELEASES = (
 	# DEBIAN
@@ -41,6 +42,18 @@ exec /sbin/getty -L 115200 ttyS0 vt102
 sudo start ttyS0
 """.lstrip()
 
+# Only append console args missing from the CMDLINE
+GRUB_CONSOLE_SUBSTITUTIONS = [
+	Substitution(
+		pattern=r'^(GRUB_CMDLINE_LINUX="(?![^"]*console=tty0\b).*)"$',
+		replacement=r'\1 console=tty0"',
+	),
+	Substitution(
+		pattern=r'^(GRUB_CMDLINE_LINUX="(?![^"]*console=ttyS0,115200).*)"$',
+		replacement=r'\1 console=ttyS0,115200"',
+	),
+]
+
 
 def argparser(**kwargs) -> ArgumentParser:
 	parser = make_parser(
@@ -77,17 +90,7 @@ def main(argv_a, **kwargs):
 		shutil.copyfile(GRUB_FILE, f"{GRUB_FILE}.bkp")
 
 	print_c(bcolors.L_YELLOW, "Updating GRUB CMDLINE with TTY0/TTYS0 Usage.")
-	cmd_grep = 'grep -q "console=tty0"'.split()
-	cmd_grep.append(GRUB_FILE)
-	if subprocess.call(cmd_grep) > 0:
-		sed_regex = r's#^\(GRUB_CMDLINE_LINUX=".*\)"$#\1 console=tty0"#'
-		subprocess.call(["/usr/bin/sed", "-i", sed_regex, GRUB_FILE])
-
-	cmd_grep = 'grep -q "console=ttyS0,115200"'.split()
-	cmd_grep.append(GRUB_FILE)
-	if subprocess.call(cmd_grep) > 0:
-		sed_regex = r's#^\(GRUB_CMDLINE_LINUX=".*\)"$#\1 console=ttyS0,115200"#'
-		subprocess.call(["/usr/bin/sed", "-i", sed_regex, GRUB_FILE])
+	edit_file(GRUB_FILE, GRUB_CONSOLE_SUBSTITUTIONS)
 
 	print_c(bcolors.L_YELLOW, "Doing update-grub.")
 	subprocess.call(["update-grub"])
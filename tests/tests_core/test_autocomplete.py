@@ -0,0 +1,154 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+from core.autocomplete import (
+	CompletionCache,
+	PathCompleter,
+	SingleLevelPathCompleter,
+	get_parser_options,
+	make_completion_parser,
+)
+from core.parser import make_parser
+from core.registry import ScriptRegistry
+
+MODULE_PATH = "core.autocomplete"
+
+
+def example_argparser(**kwargs):
+	parser = make_parser(prog="Example", **kwargs)
+	parser.add_argument("guest_id", type=int)
+	parser.add_argument("-t", "--type", choices=("vm", "ct"))
+	parser.add_argument("-s", "--storage", action="append")
+	parser.add_argument("-v", "--verbose", action="count", default=0)
+	mode = parser.add_mutually_exclusive_group()
+	mode.add_argument("--resume", metavar="JOURNAL")
+	mode.add_argument("--rollback", metavar="JOURNAL")
+	return parser
+
+
+@pytest.fixture
+def f_toolkit(tmp_path):
+	for rel_path in (
+		"scripts/general/update.py",
+		"scripts/guests/example.py",
+		"scripts/setup/pve/backup.py",
+	):
+		script = tmp_path / rel_path
+		script.parent.mkdir(parents=True, exist_ok=True)
+		script.write_text(
+			"def argparser(**kwargs):\n\tpass\n\n\ndef main(argv_a):\n\tpass\n"
+		)
+	return tmp_path
+
+
+@pytest.fixture
+def f_registry(f_toolkit):
+	return ScriptRegistry(str(f_toolkit))
+
+
+@pytest.fixture
+def f_import(mocker: MockerFixture):
+	m_import = mocker.patch(f"{MODULE_PATH}.importlib.import_module")
+	m_import.return_value.argparser.side_effect = example_argparser
+	return m_import
+
+
+def test_path_completer(f_toolkit, mocker: MockerFixture):
+	m_glob = mocker.patch("glob.glob")
+	completer = PathCompleter(toolkit_path=str(f_toolkit))
+	assert sorted(completer()) == [
+		"scripts/general/update.py",
+		"scripts/guests/example.py",
+		"scripts/setup/pve/backup.py",
+	]
+	m_glob.assert_not_called()
+
+
+@pytest.mark.parametrize(
+	"prefix, expected",
+	(
+		("", ["scripts/general/", "scripts/guests/", "scripts/setup/"]),
+		(
+			"scripts/se",
+			["scripts/general/", "scripts/guests/", "scripts/setup/"],
+		),
+		("scripts/setup/", ["scripts/setup/pve/"]),
+		("scripts/setup/pve/b", ["scripts/setup/pve/backup.py"]),
+	),
+)
+def test_single_level_path_completer(f_toolkit, prefix, expected):
+	completer = SingleLevelPathCompleter(toolkit_path=str(f_toolkit))
+	assert completer(prefix=prefix) == expected
+
+
+def test_completion_parser_round_trip(tmp_path):
+	parser_args = {"use_argcomplete": False, "toolkit_path": str(tmp_path)}
+	options = get_parser_options(example_argparser(**parser_args))
+	assert [a["dest"] for a in options["actions"]] == [
+		"guest_id",
+		"type",
+		"storage",
+		"verbose",
+		"resume",
+		"rollback",
+	]
+	assert options["groups"] == [["resume", "rollback"]]
+
+	parser = make_completion_parser(options, **parser_args)
+	args = parser.parse_args(
+		"scripts/guests/example.py 100 -t ct -s a -s b -vv --resume j".split()
+	)
+	assert args.guest_id == "100"
+	assert args.type == "ct"
+	assert args.storage == ["a", "b"]
+	assert args.verbose == 2
+	assert args.resume == "j"
+	with pytest.raises(SystemExit):
+		parser.parse_args(
+			"scripts/guests/example.py 100 --resume j --rollback j".split()
+		)
+
+
+def test_parser_options_with_completer(tmp_path):
+	parser = example_argparser(
+		use_argcomplete=False, toolkit_path=str(tmp_path)
+	)
+	parser.add_argument("--node").completer = lambda **kwargs: []
+	assert get_parser_options(parser) is None
+
+
+class TestCompletionCache:
+	def test_imports_once(self, f_registry, f_import):
+		entry = f_registry.get("scripts/guests/example.py")
+		parser_args = {
+			"use_argcomplete": False,
+			"toolkit_path": f_registry.toolkit_path,
+		}
+		parser = CompletionCache(
+			f_registry.toolkit_path, f_registry
+		).get_parser(entry, **parser_args)
+		assert parser.parse_args(["example.py", "100"]).guest_id == "100"
+		f_import.assert_called_once_with("scripts.guests.example")
+
+		# A new process answers from the cache file
+		f_import.reset_mock()
+		cache = CompletionCache(f_registry.toolkit_path, f_registry)
+		assert cache.get_parser(entry, **parser_args) is not None
+		f_import.assert_not_called()
+
+		# Changed scripts are imported again
+		entry = {**entry, "mtime": entry["mtime"] + 1}
+		cache = CompletionCache(f_registry.toolkit_path, f_registry)
+		assert cache.get_options(entry, **parser_args) is not None
+		f_import.assert_called_once()
+
+	def test_import_error(self, f_registry, f_import):
+		f_import.side_effect = ImportError("missing dependency")
+		cache = CompletionCache(f_registry.toolkit_path, f_registry)
+		entry = f_registry.get("scripts/guests/example.py")
+		assert (
+			cache.get_parser(entry, toolkit_path=f_registry.toolkit_path)
+			is None
+		)
@@ -0,0 +1,106 @@
+########################### Standard Pytest Imports ############################
+import pytest
+
+################################################################################
+import os
+from core.registry import ScriptRegistry, parse_script
+
+MODULE_PATH = "core.registry"
+
+SCRIPT_SOURCE = """
+from core.parser import make_parser, ArgumentParser
+
+
+def argparser(**kwargs) -> ArgumentParser:
+	parser = make_parser(
+		prog="Example Script",
+		description="Does nothing at all.",
+		**kwargs,
+	)
+	return parser
+
+
+def main(argv_a, **kwargs):
+	pass
+"""
+
+
+@pytest.fixture
+def f_toolkit(tmp_path):
+	scripts_dir = tmp_path / "scripts" / "guests"
+	scripts_dir.mkdir(parents=True)
+	(tmp_path / "scripts" / "__init__.py").write_text("")
+	(scripts_dir / "example.py").write_text(SCRIPT_SOURCE)
+	(scripts_dir / "no_parser.py").write_text("def main(**kwargs):\n\tpass\n")
+	(scripts_dir / "broken.py").write_text("def main(:\n")
+	(scripts_dir / "template.py").write_text(SCRIPT_SOURCE)
+	return tmp_path
+
+
+def test_parse_script():
+	entry = parse_script(SCRIPT_SOURCE, "scripts/guests/example.py")
+	assert entry["module"] == "scripts.guests.example"
+	assert entry["argparser"] == "argparser"
+	assert entry["prog"] == "Example Script"
+	assert entry["description"] == "Does nothing at all."
+
+
+class TestScriptRegistry:
+	def test_build(self, f_toolkit):
+		registry = ScriptRegistry(str(f_toolkit))
+		scripts = registry.scripts()
+		assert sorted(scripts) == [
+			"scripts/guests/example.py",
+			"scripts/guests/no_parser.py",
+		]
+		assert scripts["scripts/guests/no_parser.py"]["argparser"] is None
+		assert os.path.isfile(registry.cache_path)
+
+	def test_get(self, f_toolkit):
+		registry = ScriptRegistry(str(f_toolkit))
+		entry = registry.get("./scripts/guests/example.py")
+		assert entry["path"] == "scripts/guests/example.py"
+		assert registry.get("scripts.guests.example") == entry
+		assert registry.get(str(f_toolkit / "scripts/guests/example.py")) == (
+			entry
+		)
+		assert registry.get("scripts/guests/missing.py") is None
+
+	def test_cache(self, f_toolkit, mocker):
+		ScriptRegistry(str(f_toolkit)).scripts()
+		m_parse = mocker.patch(f"{MODULE_PATH}.parse_script")
+		registry = ScriptRegistry(str(f_toolkit))
+		assert registry.load()
+		assert "scripts/guests/example.py" in registry.scripts()
+		m_parse.assert_not_called()
+
+	@pytest.mark.parametrize("change", ("edit", "add", "remove"))
+	def test_stale_cache(self, f_toolkit, change):
+		ScriptRegistry(str(f_toolkit)).scripts()
+		script = f_toolkit / "scripts" / "guests" / "example.py"
+		stat = os.stat(script)
+		if change == "edit":
+			script.write_text(SCRIPT_SOURCE.replace("Does nothing", "Nothing"))
+			os.utime(script, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+		elif change == "add":
+			(script.parent / "added.py").write_text("def main():\n\tpass\n")
+		else:
+			script.unlink()
+		registry = ScriptRegistry(str(f_toolkit))
+		assert not registry.load()
+		scripts = registry.scripts()
+		if change == "edit":
+			assert scripts[str(script.relative_to(f_toolkit))][
+				"description"
+			] == ("Nothing at all.")
+		elif change == "add":
+			assert "scripts/guests/added.py" in scripts
+		else:
+			assert "scripts/guests/example.py" not in scripts
+
+	def test_corrupt_cache(self, f_toolkit):
+		registry = ScriptRegistry(str(f_toolkit))
+		with open(registry.cache_path, "wb") as cache_file:
+			cache_file.write(b"\x00not marshal")
+		assert not registry.load()
+		assert "scripts/guests/example.py" in registry.scripts()
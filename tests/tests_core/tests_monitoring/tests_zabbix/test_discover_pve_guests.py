@@ -0,0 +1,133 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import json
+import os
+import socket
+from core.monitoring.zabbix.discover_pve_guests import (
+	GuestCache,
+	GUEST_CONFIG_MISSING,
+	GUEST_NOT_ON_HOST,
+	GUEST_RUNNING,
+	GUEST_STOPPED,
+	get_socket_is_served,
+	main,
+	query_daemon,
+	run_daemon,
+)
+
+MODULE_PATH = "core.monitoring.zabbix.discover_pve_guests"
+
+
+@pytest.fixture
+def f_cache():
+	cache = GuestCache(hostname="pve1")
+	cache.discovery = json.dumps(
+		{"data": [{"{#GUEST_ID}": "100", "{#GUEST_TYPE}": "VM"}]}
+	)
+	cache.guest_hosts = {
+		("100", "vm"): "pve1",
+		("101", "ct"): "pve1",
+		("200", "vm"): "pve2",
+	}
+	cache.statuses = {"100": GUEST_RUNNING, "101": GUEST_STOPPED}
+	return cache
+
+
+class TestGuestCache:
+	def test_query_discovery(self, f_cache):
+		assert f_cache.query("discovery") == f_cache.discovery
+
+	def test_query_all_statuses(self, f_cache):
+		assert json.loads(f_cache.query("all-statuses")) == {
+			"100": GUEST_RUNNING,
+			"101": GUEST_STOPPED,
+		}
+
+	@pytest.mark.parametrize(
+		"request_str, expected",
+		(
+			("status 100 vm", GUEST_RUNNING),
+			("status 100 VM", GUEST_RUNNING),
+			("status 101 ct", GUEST_STOPPED),
+			("status 200 vm", GUEST_NOT_ON_HOST),
+			("status 100 ct", GUEST_CONFIG_MISSING),
+			("status 999 vm", GUEST_CONFIG_MISSING),
+		),
+	)
+	def test_query_status(self, f_cache, request_str, expected):
+		assert f_cache.query(request_str) == str(expected)
+
+	@pytest.mark.parametrize(
+		"request_str", ("", "status", "status 100", "statuses 100 vm x")
+	)
+	def test_query_invalid(self, f_cache, request_str):
+		with pytest.raises(ValueError, match="Invalid request"):
+			f_cache.query(request_str)
+
+
+class TestDaemonSocket:
+	def test_query_daemon_missing_socket(self, tmp_path):
+		assert query_daemon(str(tmp_path / "missing.sock"), "discovery") is None
+
+	def test_main_falls_back_without_daemon(
+		self, tmp_path, mocker: MockerFixture, capsys
+	):
+		mocker.patch(
+			"sys.argv",
+			["discover_pve_guests.py", "-a", "--socket", str(tmp_path / "x")],
+		)
+		m_statuses = mocker.patch(
+			f"{MODULE_PATH}.get_all_statuses",
+			return_value={"100": GUEST_RUNNING},
+		)
+
+		with pytest.raises(SystemExit):
+			main()
+		m_statuses.assert_called_once()
+		assert json.loads(capsys.readouterr().out) == {"100": GUEST_RUNNING}
+
+	def test_stale_socket_is_replaced(self, tmp_path, mocker: MockerFixture):
+		socket_path = str(tmp_path / "daemon.sock")
+		# Bound but closed without unlinking, as after a crash
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+			stale.bind(socket_path)
+		assert not get_socket_is_served(socket_path)
+
+		m_cache = mocker.patch(f"{MODULE_PATH}.GuestCache")
+		mocker.patch(f"{MODULE_PATH}.get_pmxcfs_watcher", return_value=None)
+		mocker.patch(f"{MODULE_PATH}.threading.Thread")
+		mocker.patch(f"{MODULE_PATH}.os.chmod")
+		stale_removed = []
+
+		def _server(path, handler):
+			stale_removed.append(not os.path.exists(path))
+			# Creates the socket file as the real server does
+			with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+				server.bind(path)
+			return mocker.MagicMock()
+
+		mocker.patch(
+			f"{MODULE_PATH}.socketserver.ThreadingUnixStreamServer",
+			side_effect=_server,
+		)
+
+		run_daemon(socket_path, 10)
+		m_cache.return_value.refresh.assert_called_once()
+		assert stale_removed == [True]
+		assert not os.path.exists(socket_path)
+
+	def test_served_socket_is_kept(self, tmp_path, mocker: MockerFixture):
+		socket_path = str(tmp_path / "daemon.sock")
+		m_cache = mocker.patch(f"{MODULE_PATH}.GuestCache")
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+			server.bind(socket_path)
+			server.listen()
+			assert get_socket_is_served(socket_path)
+
+			with pytest.raises(RuntimeError, match="already serving"):
+				run_daemon(socket_path, 10)
+			m_cache.assert_not_called()
+			assert os.path.exists(socket_path)
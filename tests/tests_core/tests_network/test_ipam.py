@@ -0,0 +1,153 @@
+########################### Standard Pytest Imports ############################
+import pytest
+
+################################################################################
+import ipaddress
+from core.network.ipam import (
+	IPAM,
+	AddressPoolExhausted,
+	IntervalSet,
+	SubnetAllocator,
+)
+
+MODULE_PATH = "core.network.ipam"
+
+
+class TestIntervalSet:
+	def test_update_merges(self):
+		interval_set = IntervalSet([5, 1, 2, 3, 9, 10, 3])
+		assert interval_set.intervals() == [(1, 3), (5, 5), (9, 10)]
+		interval_set.update([4, 11, 20])
+		assert interval_set.intervals() == [(1, 5), (9, 11), (20, 20)]
+		assert len(interval_set) == 9
+
+	def test_add(self):
+		interval_set = IntervalSet([1, 5, 9])
+		interval_set.add(3)
+		assert interval_set.intervals() == [(1, 1), (3, 3), (5, 5), (9, 9)]
+		# Adjacent intervals are merged
+		interval_set.add(2)
+		interval_set.add(6, 8)
+		assert interval_set.intervals() == [(1, 3), (5, 9)]
+		interval_set.add(0, 20)
+		assert interval_set.intervals() == [(0, 20)]
+
+	def test_remove(self):
+		interval_set = IntervalSet(range(1, 11))
+		interval_set.remove(5)
+		interval_set.remove(8, 20)
+		interval_set.remove(30)
+		assert interval_set.intervals() == [(1, 4), (6, 7)]
+		assert 5 not in interval_set
+		assert 6 in interval_set
+
+	def test_next_missing(self):
+		interval_set = IntervalSet([1, 2, 3, 5])
+		assert interval_set.next_missing(0) == 0
+		assert interval_set.next_missing(1) == 4
+		assert interval_set.next_missing(5) == 6
+
+	def test_count(self):
+		interval_set = IntervalSet([*range(1, 11), *range(20, 31)])
+		assert interval_set.count(5, 25) == 12
+		assert interval_set.count(11, 19) == 0
+
+	def test_find_gap(self):
+		interval_set = IntervalSet([2, 3, 6, 10])
+		assert interval_set.find_gap(2, 1, 20) == 4
+		assert interval_set.find_gap(3, 1, 20) == 7
+		assert interval_set.find_gap(3, 1, 9) == 7
+		assert interval_set.find_gap(4, 1, 12) is None
+
+
+class TestSubnetAllocator:
+	def test_bounds(self):
+		allocator = SubnetAllocator("10.0.0.0/30")
+		assert allocator.free_count == 2
+		assert allocator.allocate(2) == [
+			ipaddress.ip_address("10.0.0.1"),
+			ipaddress.ip_address("10.0.0.2"),
+		]
+		assert allocator.next_free() is None
+		assert not allocator.is_free("10.0.0.3")
+
+	@pytest.mark.parametrize(
+		"network, free_count",
+		(("10.0.0.0/31", 2), ("10.0.0.1/32", 1), ("fd00::/126", 3)),
+	)
+	def test_small_subnets(self, network, free_count):
+		assert SubnetAllocator(network).free_count == free_count
+
+	def test_reserved(self):
+		allocator = SubnetAllocator(
+			"10.0.0.0/24", ["10.0.0.1", "10.0.0.2", "10.0.1.1", "fd00::1"]
+		)
+		assert allocator.free_count == 252
+		assert allocator.next_free() == ipaddress.ip_address("10.0.0.3")
+		assert not allocator.reserve("192.168.0.1")
+		allocator.release("10.0.0.1")
+		assert allocator.is_free("10.0.0.1")
+
+	def test_next_free_wraps(self):
+		allocator = SubnetAllocator("10.0.0.0/29", ["10.0.0.5", "10.0.0.6"])
+		assert allocator.next_free("10.0.0.5") == ipaddress.ip_address(
+			"10.0.0.1"
+		)
+		allocator.update(["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"])
+		assert allocator.next_free("10.0.0.5") is None
+
+	def test_allocate_block(self):
+		reserved = [f"10.0.{i // 256}.{i % 256}" for i in range(1, 4000, 2)]
+		allocator = SubnetAllocator("10.0.0.0/16", reserved)
+		addresses = allocator.allocate(3, start="10.0.0.10")
+		assert [str(a) for a in addresses] == [
+			"10.0.0.10",
+			"10.0.0.12",
+			"10.0.0.14",
+		]
+		block = allocator.allocate(3, start="10.0.0.10", contiguous=True)
+		assert [str(a) for a in block] == [
+			"10.0.15.160",
+			"10.0.15.161",
+			"10.0.15.162",
+		]
+		assert not any(allocator.is_free(a) for a in addresses + block)
+
+	def test_allocate_contiguous_wraps(self):
+		allocator = SubnetAllocator("10.0.0.0/28", ["10.0.0.4", "10.0.0.12"])
+		block = allocator.allocate(5, start="10.0.0.10", contiguous=True)
+		assert [str(a) for a in block] == [f"10.0.0.{i}" for i in range(5, 10)]
+
+	def test_exhausted(self):
+		allocator = SubnetAllocator("10.0.0.0/29", ["10.0.0.3"])
+		with pytest.raises(AddressPoolExhausted):
+			allocator.allocate(7)
+		with pytest.raises(AddressPoolExhausted):
+			allocator.allocate(4, contiguous=True)
+		# Nothing is reserved by a failed allocation
+		assert allocator.free_count == 5
+		with pytest.raises(ValueError):
+			allocator.allocate(0)
+
+	def test_ipv6(self):
+		allocator = SubnetAllocator("fd00::/64", ["fd00::1"])
+		assert allocator.allocate(2) == [
+			ipaddress.ip_address("fd00::2"),
+			ipaddress.ip_address("fd00::3"),
+		]
+
+
+def test_ipam():
+	ipam = IPAM(["10.0.0.0/24", "192.168.0.0/24"])
+	ipam.update(["10.0.0.1", "192.168.0.1", "172.16.0.1"])
+	assert ipam.get("10.0.0.0/24").next_free() == ipaddress.ip_address(
+		"10.0.0.2"
+	)
+	assert ipam.get("192.168.0.5/24").next_free() == ipaddress.ip_address(
+		"192.168.0.2"
+	)
+	assert ipam.add_subnet("10.0.0.0/24", ["10.0.0.2"]) is ipam.get(
+		"10.0.0.0/24"
+	)
+	assert ipam.get("10.0.0.0/24").free_count == 252
+	assert ipam.get("172.16.0.0/24") is None
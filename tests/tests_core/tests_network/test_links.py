@@ -0,0 +1,326 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import errno
+import socket
+import struct
+from core.network.interface_status import get_iface_status
+from core.network.links import (
+	IF_OPER_STATES,
+	IFINFOMSG_STRUCT,
+	IFLA_ADDRESS,
+	IFLA_CARRIER,
+	IFLA_IFNAME,
+	IFLA_MTU,
+	IFLA_OPERSTATE,
+	NLMSG_DONE,
+	NLMSG_ERROR,
+	NLMSG_HEADER_STRUCT,
+	RTM_DELLINK,
+	RTM_NEWLINK,
+	LinkEvent,
+	LinkStatus,
+	LinkWatcher,
+	diff_links,
+	dump_links,
+	get_sysfs_links,
+	open_netlink_socket,
+	parse_link_message,
+	read_sysfs_link,
+	wait_for_link_down,
+)
+from core.utils.command import CommandResult
+
+MODULE_PATH = "core.network.links"
+
+
+def make_rtattr(rta_type: int, data: bytes) -> bytes:
+	rta_len = 4 + len(data)
+	padding = b"\0" * (((rta_len + 3) & ~3) - rta_len)
+	return struct.pack("=HH", rta_len, rta_type) + data + padding
+
+
+def make_link_payload(
+	name: str, index=1, operstate="UP", carrier=True, flags=0x1
+) -> bytes:
+	return (
+		IFINFOMSG_STRUCT.pack(socket.AF_UNSPEC, 1, index, flags, 0)
+		+ make_rtattr(IFLA_IFNAME, name.encode() + b"\0")
+		+ make_rtattr(IFLA_MTU, struct.pack("=I", 1500))
+		+ make_rtattr(IFLA_OPERSTATE, bytes([IF_OPER_STATES.index(operstate)]))
+		+ make_rtattr(IFLA_CARRIER, bytes([int(carrier)]))
+		+ make_rtattr(IFLA_ADDRESS, bytes([0xBC, 0x24, 0x11, 0, 0, index]))
+	)
+
+
+def make_nlmsg(msg_type: int, payload: bytes = b"", seq=0) -> bytes:
+	msg_len = NLMSG_HEADER_STRUCT.size + len(payload)
+	padding = b"\0" * (((msg_len + 3) & ~3) - msg_len)
+	return (
+		NLMSG_HEADER_STRUCT.pack(msg_len, msg_type, 0, seq, 0)
+		+ payload
+		+ padding
+	)
+
+
+def write_sysfs_link(sys_class_net, name: str, **attrs):
+	link_dir = sys_class_net / name
+	link_dir.mkdir(exist_ok=True)
+	for attr, value in attrs.items():
+		(link_dir / attr).write_text(f"{value}\n")
+
+
+@pytest.fixture
+def f_sysfs(tmp_path):
+	write_sysfs_link(
+		tmp_path,
+		"eno1",
+		ifindex=2,
+		operstate="up",
+		carrier=1,
+		speed=1000,
+		mtu=1500,
+		address="bc:24:11:00:00:02",
+		flags="0x1003",
+	)
+	# carrier and speed cannot be read while down
+	write_sysfs_link(
+		tmp_path, "vmbr0", ifindex=3, operstate="down", mtu=1500, flags="0x1002"
+	)
+	write_sysfs_link(
+		tmp_path, "tun0", ifindex=4, operstate="unknown", carrier=1, speed=-1
+	)
+	(tmp_path / "bonding_masters").write_text("\n")
+	return tmp_path
+
+
+class TestSysfs:
+	def test_read_link(self, f_sysfs):
+		assert read_sysfs_link("eno1", str(f_sysfs)) == LinkStatus(
+			name="eno1",
+			index=2,
+			operstate="UP",
+			carrier=True,
+			mtu=1500,
+			address="bc:24:11:00:00:02",
+			flags=0x1003,
+			speed=1000,
+		)
+		vmbr0 = read_sysfs_link("vmbr0", str(f_sysfs))
+		assert vmbr0.operstate == "DOWN"
+		assert vmbr0.carrier is None
+		assert vmbr0.speed is None
+		assert not vmbr0.admin_up
+		tun0 = read_sysfs_link("tun0", str(f_sysfs))
+		assert tun0.speed is None
+		assert not tun0.is_up
+
+	def test_missing(self, f_sysfs):
+		with pytest.raises(ValueError, match="does not exist"):
+			read_sysfs_link("eno2", str(f_sysfs))
+
+	def test_get_links(self, f_sysfs):
+		assert list(get_sysfs_links(str(f_sysfs))) == ["eno1", "tun0", "vmbr0"]
+
+
+class TestGetIfaceStatus:
+	def test_sysfs(self, mocker: MockerFixture):
+		mocker.patch(
+			"core.network.interface_status.read_sysfs_link",
+			return_value=LinkStatus("eno1", 2, "LOWERLAYERDOWN"),
+		)
+		m_run = mocker.patch("core.network.interface_status.run_command")
+		assert get_iface_status("eno1") == "LOWERLAYERDOWN"
+		m_run.assert_not_called()
+
+	def test_ip_fallback(self, mocker: MockerFixture):
+		mocker.patch(
+			"core.network.interface_status.os.path.isdir", return_value=False
+		)
+		mocker.patch(
+			"core.network.interface_status.run_command",
+			return_value=CommandResult(
+				[],
+				0,
+				b"2: eno1: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc mq "
+				b"master vmbr0 state UP mode DEFAULT group default qlen 1000\n",
+				b"",
+				0,
+			),
+		)
+		assert get_iface_status("eno1") == "UP"
+
+
+class TestNetlink:
+	def test_parse_link_message(self):
+		link = parse_link_message(
+			make_link_payload("vmbr0", index=3, operstate="DOWN", carrier=False)
+		)
+		assert link == LinkStatus(
+			name="vmbr0",
+			index=3,
+			operstate="DOWN",
+			carrier=False,
+			mtu=1500,
+			address="bc:24:11:00:00:03",
+			flags=0x1,
+		)
+
+	def test_dump_links(self, mocker: MockerFixture):
+		mocker.patch(f"{MODULE_PATH}.os.urandom", return_value=b"\x07\0\0\0")
+		m_sock = mocker.Mock()
+		m_sock.recv.side_effect = [
+			make_nlmsg(RTM_NEWLINK, make_link_payload("lo", 1), seq=7)
+			# Notification interleaved with the dump
+			+ make_nlmsg(RTM_NEWLINK, make_link_payload("tap100i0", 9), seq=0),
+			make_nlmsg(RTM_NEWLINK, make_link_payload("eno1", 2), seq=7),
+			make_nlmsg(NLMSG_DONE, struct.pack("=i", 0), seq=7),
+		]
+		assert list(dump_links(m_sock)) == ["lo", "eno1"]
+		request = m_sock.send.call_args[0][0]
+		assert NLMSG_HEADER_STRUCT.unpack_from(request)[3] == 7
+		m_sock.close.assert_not_called()
+
+	def test_dump_links_error(self, mocker: MockerFixture):
+		mocker.patch(f"{MODULE_PATH}.os.urandom", return_value=b"\x07\0\0\0")
+		m_sock = mocker.Mock()
+		m_sock.recv.return_value = make_nlmsg(
+			NLMSG_ERROR, struct.pack("=i", -errno.EPERM), seq=7
+		)
+		with pytest.raises(PermissionError):
+			dump_links(m_sock)
+
+	def test_dump_links_kernel(self):
+		try:
+			open_netlink_socket().close()
+		except OSError:
+			pytest.skip("rtnetlink is not available")
+		assert "lo" in dump_links()
+
+
+def test_diff_links():
+	eno1 = LinkStatus("eno1", 2, "UP", carrier=True, flags=0x1)
+	vmbr0 = LinkStatus("vmbr0", 3, "UP", carrier=True, flags=0x1)
+	eno1_down = LinkStatus("eno1", 2, "DOWN", carrier=False, flags=0x1)
+	tap = LinkStatus("tap100i0", 9, "UNKNOWN")
+	vmbr0_mtu = LinkStatus("vmbr0", 3, "UP", carrier=True, mtu=9000, flags=0x1)
+	assert diff_links(
+		{"eno1": eno1, "vmbr0": vmbr0},
+		{"eno1": eno1_down, "tap100i0": tap, "vmbr0": vmbr0_mtu},
+	) == [
+		LinkEvent("changed", "eno1", eno1_down, eno1),
+		LinkEvent("added", "tap100i0", tap),
+	]
+	assert diff_links({"eno1": eno1}, {}) == [
+		LinkEvent("removed", "eno1", None, eno1)
+	]
+
+
+class TestLinkWatcher:
+	def test_sysfs_polling(self, f_sysfs):
+		watcher = LinkWatcher(use_netlink=False, sys_class_net=str(f_sysfs))
+		assert not watcher.uses_netlink
+		received = []
+		watcher.subscribe(received.append, names=["vmbr0"])
+		assert watcher.poll(0) == []
+		write_sysfs_link(
+			f_sysfs, "vmbr0", operstate="up", carrier=1, flags="0x1003"
+		)
+		write_sysfs_link(f_sysfs, "eno1", operstate="down")
+		events = watcher.poll(0)
+		assert [(e.kind, e.name) for e in events] == [
+			("changed", "eno1"),
+			("changed", "vmbr0"),
+		]
+		assert received == [events[1]]
+		assert received[0].link.is_up
+
+	def test_netlink_events(self, mocker: MockerFixture):
+		monitor, kernel = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+		mocker.patch(f"{MODULE_PATH}.open_netlink_socket", return_value=monitor)
+		mocker.patch(
+			f"{MODULE_PATH}.dump_links",
+			return_value={
+				"eno1": parse_link_message(make_link_payload("eno1", 2)),
+				"tap100i0": parse_link_message(
+					make_link_payload("tap100i0", 9)
+				),
+			},
+		)
+		watcher = LinkWatcher()
+		assert watcher.uses_netlink
+		assert watcher.poll(0) == []
+		kernel.send(
+			make_nlmsg(
+				RTM_NEWLINK,
+				make_link_payload("eno1", 2, operstate="DOWN", carrier=False),
+			)
+			+ make_nlmsg(RTM_DELLINK, make_link_payload("tap100i0", 9))
+		)
+		# Attribute only changes are not published
+		kernel.send(
+			make_nlmsg(RTM_NEWLINK, make_link_payload("eno1", 2, "DOWN", False))
+		)
+		events = watcher.poll(1)
+		assert [(e.kind, e.name) for e in events] == [
+			("changed", "eno1"),
+			("removed", "tap100i0"),
+		]
+		assert events[0].previous.is_up and not events[0].link.is_up
+		watcher.stop()
+		kernel.close()
+
+	def test_netlink_overrun(self, mocker: MockerFixture):
+		m_sock = mocker.Mock()
+		m_sock.recv.side_effect = [
+			OSError(errno.ENOBUFS, "No buffer space available"),
+			BlockingIOError(),
+		]
+		mocker.patch(f"{MODULE_PATH}.open_netlink_socket", return_value=m_sock)
+		mocker.patch(
+			f"{MODULE_PATH}.select.select", return_value=([m_sock], [], [])
+		)
+		eno1 = LinkStatus("eno1", 2, "UP", carrier=True)
+		eno1_down = LinkStatus("eno1", 2, "DOWN", carrier=False)
+		mocker.patch(
+			f"{MODULE_PATH}.dump_links",
+			side_effect=[{"eno1": eno1}, {"eno1": eno1_down}],
+		)
+		watcher = LinkWatcher()
+		assert watcher.poll(0) == [
+			LinkEvent("changed", "eno1", eno1_down, eno1)
+		]
+
+	def test_thread(self, f_sysfs):
+		watcher = LinkWatcher(
+			poll_interval=0.01, use_netlink=False, sys_class_net=str(f_sysfs)
+		)
+		received = []
+		watcher.subscribe(received.append)
+		watcher.start()
+		write_sysfs_link(f_sysfs, "eno1", operstate="down")
+		for _ in range(200):
+			if received:
+				break
+			watcher._stop.wait(0.01)
+		watcher.stop()
+		assert received[0].name == "eno1"
+
+
+def test_wait_for_link_down(f_sysfs, mocker: MockerFixture):
+	watcher = LinkWatcher(
+		poll_interval=0.01, use_netlink=False, sys_class_net=str(f_sysfs)
+	)
+	assert not wait_for_link_down(watcher, "eno1", 0.03)
+	mocker.patch.object(
+		watcher,
+		"poll",
+		side_effect=[
+			[LinkEvent("changed", "vmbr0", LinkStatus("vmbr0", 3, "DOWN"))],
+			[LinkEvent("removed", "eno1", None)],
+		],
+	)
+	assert wait_for_link_down(watcher, "eno1", 10)
+	watcher.poll.assert_called_with(0.01)
@@ -0,0 +1,337 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import os
+import json
+import time
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from core.proxmox import api
+from core.proxmox.api import PVEAPIClient, PVEAPIError, pvesh_get
+from core.utils.command import CommandResult
+
+MODULE_PATH = "core.proxmox.api"
+TOKEN = "root@pam!toolkit=00000000-0000-0000-0000-000000000000"
+BACKUP_JOBS = [{"id": "backup-a1", "vmid": "100,101"}]
+
+
+class MockPVEHandler(BaseHTTPRequestHandler):
+	"""Minimal pveproxy, state is kept on the server object."""
+
+	protocol_version = "HTTP/1.1"
+
+	def setup(self):
+		super().setup()
+		self.server.connections += 1
+
+	def log_message(self, format, *args):
+		pass
+
+	def _reply(self, status: int, data=None, errors=None):
+		body = json.dumps({"data": data, "errors": errors}).encode()
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+		if self.server.drop_connections:
+			# Closed without announcing it, like an idle pveproxy timeout
+			self.close_connection = True
+
+	def _authenticated(self) -> bool:
+		if self.headers.get("Authorization") == f"PVEAPIToken={TOKEN}":
+			return True
+		cookie = self.headers.get("Cookie", "")
+		ticket = unquote(cookie.removeprefix("PVEAuthCookie="))
+		return ticket == self.server.ticket and ticket is not None
+
+	def _handle(self, method: str):
+		url = urlsplit(self.path)
+		length = int(self.headers.get("Content-Length") or 0)
+		params = parse_qs(self.rfile.read(length).decode() or url.query)
+		self.server.requests.append((method, url.path, params, self.headers))
+		path = url.path.removeprefix("/api2/json")
+		if path == "/access/ticket" and method == "POST":
+			if params != {"username": ["root@pam"], "password": ["secret"]}:
+				return self._reply(401)
+			self.server.ticket = f"PVE:root@pam:{int(time.time()):X}::sig"
+			return self._reply(
+				200,
+				{
+					"ticket": self.server.ticket,
+					"CSRFPreventionToken": "csrf",
+					"username": "root@pam",
+				},
+			)
+		if not self._authenticated():
+			return self._reply(401)
+		if path == "/cluster/backup" and method == "GET":
+			return self._reply(200, BACKUP_JOBS)
+		if path.startswith("/cluster/backup/") and method == "PUT":
+			if self.headers.get("CSRFPreventionToken") != "csrf" and (
+				"Authorization" not in self.headers
+			):
+				return self._reply(401)
+			return self._reply(200)
+		return self._reply(500, errors={"path": "not found"})
+
+	def do_GET(self):
+		self._handle("GET")
+
+	def do_PUT(self):
+		self._handle("PUT")
+
+	def do_POST(self):
+		self._handle("POST")
+
+
+def _init_server_state(server):
+	server.connections = 0
+	server.requests = []
+	server.ticket = None
+	server.drop_connections = False
+	return server
+
+
+@pytest.fixture
+def f_server():
+	server = _init_server_state(
+		ThreadingHTTPServer(("127.0.0.1", 0), MockPVEHandler)
+	)
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	yield server
+	server.shutdown()
+	server.server_close()
+
+
+@pytest.fixture
+def f_client_kwargs(f_server, tmp_path):
+	return {
+		"host": "127.0.0.1",
+		"port": f_server.server_address[1],
+		"use_ssl": False,
+		"ticket_cache_dir": str(tmp_path / "tickets"),
+	}
+
+
+def test_token_keep_alive(f_server, f_client_kwargs):
+	client = PVEAPIClient(token=TOKEN, **f_client_kwargs)
+	for _ in range(3):
+		assert client.get("/cluster/backup") == BACKUP_JOBS
+	assert f_server.connections == 1
+	assert len(f_server.requests) == 3
+	client.close()
+
+
+def test_concurrent_connections(f_server, f_client_kwargs):
+	client = PVEAPIClient(token=TOKEN, **f_client_kwargs)
+	results = []
+	threads = [
+		threading.Thread(
+			target=lambda: results.append(client.get("/cluster/backup"))
+		)
+		for _ in range(4)
+	]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert results == [BACKUP_JOBS] * 4
+	# Connections are pooled, never shared between threads
+	assert len(client._idle) == f_server.connections
+	client.close()
+
+
+def test_ticket_cached_on_disk(f_server, f_client_kwargs):
+	client = PVEAPIClient(user="root@pam", password="secret", **f_client_kwargs)
+	assert client.get("/cluster/backup") == BACKUP_JOBS
+	cache_path = client._get_ticket_cache_path()
+	assert os.stat(cache_path).st_mode & 0o777 == 0o600
+
+	# A new process re-uses the cached ticket
+	client = PVEAPIClient(user="root@pam", password="secret", **f_client_kwargs)
+	client.put("/cluster/backup/backup-a1", {"vmid": "100"})
+	methods = [(m, p) for m, p, *_ in f_server.requests]
+	assert methods == [
+		("POST", "/api2/json/access/ticket"),
+		("GET", "/api2/json/cluster/backup"),
+		("PUT", "/api2/json/cluster/backup/backup-a1"),
+	]
+	assert f_server.requests[-1][2] == {"vmid": ["100"]}
+
+
+def test_expired_ticket(f_server, f_client_kwargs, mocker: MockerFixture):
+	client = PVEAPIClient(user="root@pam", password="secret", **f_client_kwargs)
+	client.get("/cluster/backup")
+	mocker.patch(f"{MODULE_PATH}.time.time", return_value=time.time() + 7200)
+	client = PVEAPIClient(user="root@pam", password="secret", **f_client_kwargs)
+	client.get("/cluster/backup")
+	assert [p for _, p, *_ in f_server.requests].count(
+		"/api2/json/access/ticket"
+	) == 2
+
+
+def test_revoked_ticket(f_server, f_client_kwargs):
+	client = PVEAPIClient(user="root@pam", password="secret", **f_client_kwargs)
+	client.get("/cluster/backup")
+	f_server.ticket = "PVE:root@pam:0::revoked"
+	assert client.get("/cluster/backup") == BACKUP_JOBS
+	assert [m for m, *_ in f_server.requests] == [
+		"POST",
+		"GET",
+		"GET",
+		"POST",
+		"GET",
+	]
+
+
+def test_get_cache_ttl(f_server, f_client_kwargs, mocker: MockerFixture):
+	client = PVEAPIClient(token=TOKEN, cache_ttl=10, **f_client_kwargs)
+	assert client.get("/cluster/backup") == BACKUP_JOBS
+	assert client.get("/cluster/backup") == BACKUP_JOBS
+	assert len(f_server.requests) == 1
+	# Writes clear the cache
+	client.put("/cluster/backup/backup-a1", {"vmid": "100"})
+	client.get("/cluster/backup")
+	assert len(f_server.requests) == 3
+	mocker.patch(
+		f"{MODULE_PATH}.time.monotonic", return_value=time.monotonic() + 11
+	)
+	client.get("/cluster/backup")
+	assert len(f_server.requests) == 4
+
+
+def test_reconnects_closed_connection(f_server, f_client_kwargs):
+	f_server.drop_connections = True
+	client = PVEAPIClient(token=TOKEN, **f_client_kwargs)
+	assert client.get("/cluster/backup") == BACKUP_JOBS
+	assert client.get("/cluster/backup") == BACKUP_JOBS
+	assert f_server.connections == 2
+
+
+def test_error(f_server, f_client_kwargs):
+	client = PVEAPIClient(token=TOKEN, **f_client_kwargs)
+	with pytest.raises(PVEAPIError) as e:
+		client.get("/nodes")
+	assert e.value.status == 500
+	assert e.value.errors == {"path": "not found"}
+
+
+def test_unix_socket(tmp_path):
+	class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+		daemon_threads = True
+
+	class UnixHandler(MockPVEHandler):
+		def address_string(self):
+			return "unix"
+
+	socket_path = str(tmp_path / "pveproxy.sock")
+	server = _init_server_state(UnixHTTPServer(socket_path, UnixHandler))
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	try:
+		client = PVEAPIClient(token=TOKEN, unix_socket=socket_path)
+		assert client.get("/cluster/backup") == BACKUP_JOBS
+		assert client.get("/cluster/backup") == BACKUP_JOBS
+		assert server.connections == 1
+		client.close()
+	finally:
+		server.shutdown()
+		server.server_close()
+
+
+def test_from_env():
+	assert PVEAPIClient.from_env({}) is None
+	client = PVEAPIClient.from_env(
+		{
+			"PVE_API_TOKEN": TOKEN,
+			"PVE_API_HOST": "pve1",
+			"PVE_API_CACHE_TTL": "5",
+		}
+	)
+	assert client.host == "pve1"
+	assert client.cache_ttl == 5
+
+
+class TestPveshGet:
+	def test_pvesh_fallback(self, mocker: MockerFixture):
+		mocker.patch(f"{MODULE_PATH}.get_api_client", return_value=None)
+		m_run = mocker.patch(
+			f"{MODULE_PATH}.run_command",
+			return_value=CommandResult([], 0, b'[{"node": "pve1"}]', b"", 0),
+		)
+		assert pvesh_get("/cluster/resources", {"type": "vm"}) == [
+			{"node": "pve1"}
+		]
+		m_run.assert_called_once_with(
+			"pvesh get /cluster/resources --output-format json --type vm".split(),
+			check=True,
+		)
+
+	def test_api_client(self, f_server, f_client_kwargs, mocker: MockerFixture):
+		mocker.patch.object(api, "_api_client_loaded", False)
+		mocker.patch.dict(
+			os.environ,
+			{
+				"PVE_API_TOKEN": TOKEN,
+				"PVE_API_HOST": "127.0.0.1",
+				"PVE_API_PORT": str(f_client_kwargs["port"]),
+			},
+		)
+		mocker.patch.object(PVEAPIClient, "_connect", autospec=True)
+		m_run = mocker.patch(f"{MODULE_PATH}.run_command")
+		client = api.get_api_client()
+		assert client.token == TOKEN
+		client.use_ssl = False
+		PVEAPIClient._connect.side_effect = lambda self: (
+			api.http_client.HTTPConnection(self.host, self.port)
+		)
+		assert pvesh_get("/cluster/backup") == BACKUP_JOBS
+		m_run.assert_not_called()
+		mocker.patch.object(api, "_api_client", None)
+
+
+class TestPveshGetMany:
+	def test_pvesh_fallback(self, mocker: MockerFixture):
+		mocker.patch(f"{MODULE_PATH}.get_api_client", return_value=None)
+		m_run = mocker.patch(
+			f"{MODULE_PATH}.run_commands",
+			return_value=[
+				CommandResult([], 0, b'["a"]', b"", 0),
+				CommandResult([], 0, b'["b"]', b"", 0),
+			],
+		)
+		assert api.pvesh_get_many(["/nodes/a/network", "/nodes/b/network"]) == [
+			["a"],
+			["b"],
+		]
+		m_run.assert_called_once_with(
+			[
+				[
+					"pvesh",
+					"get",
+					f"/nodes/{n}/network",
+					"--output-format",
+					"json",
+				]
+				for n in ("a", "b")
+			],
+			check=True,
+		)
+
+	def test_api_client(self, f_server, f_client_kwargs, mocker: MockerFixture):
+		client = PVEAPIClient(token=TOKEN, **f_client_kwargs)
+		mocker.patch(f"{MODULE_PATH}.get_api_client", return_value=client)
+		assert api.pvesh_get_many(["/cluster/backup"] * 4) == [BACKUP_JOBS] * 4
+		assert len(f_server.requests) == 4
+		client.close()
+
+	def test_empty(self, mocker: MockerFixture):
+		m_client = mocker.patch(f"{MODULE_PATH}.get_api_client")
+		assert api.pvesh_get_many([]) == []
+		m_client.assert_not_called()
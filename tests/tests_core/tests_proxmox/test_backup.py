@@ -0,0 +1,163 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+from core.proxmox.backup import (
+	BackupJobManager,
+	parse_vzdump_cron,
+	remap_vmid_list,
+	set_backup_attrs,
+)
+
+MODULE_PATH = "core.proxmox.backup"
+
+JOBS_CFG = """
+vzdump: backup-a1
+	schedule sun 01:00
+	comment weekly
+	enabled 1
+	storage local
+	vmid 100,101,102
+
+realm-sync: realmsync-ldap
+	schedule daily
+	realm ldap
+
+vzdump: backup-b2
+	schedule daily
+	all 1
+	exclude 101
+	storage local
+
+vzdump: backup-c3
+	schedule daily
+	storage local
+	vmid 200
+"""
+
+VZDUMP_CRON = """
+# cluster wide vzdump cron schedule
+PATH="/usr/sbin:/usr/bin:/sbin:/bin"
+
+0 1 * * 6           root vzdump 100 101 --id backup-old --mode snapshot --quiet 1
+"""
+
+
+@pytest.fixture
+def f_manager(tmp_path):
+	jobs_cfg = tmp_path / "jobs.cfg"
+	jobs_cfg.write_text(JOBS_CFG)
+	return BackupJobManager(
+		jobs_cfg_path=str(jobs_cfg),
+		vzdump_cron_path=str(tmp_path / "vzdump.cron"),
+	)
+
+
+def test_parse_vzdump_cron():
+	assert parse_vzdump_cron(VZDUMP_CRON) == [
+		{
+			"id": "backup-old",
+			"mode": "snapshot",
+			"quiet": "1",
+			"vmid": "100,101",
+		}
+	]
+
+
+@pytest.mark.parametrize(
+	"vmids, mapping, expected",
+	(
+		("100,101", {100: 1100}, "1100,101"),
+		# Swaps and chains are applied at once
+		("100,101", {100: 101, 101: 100}, "101,100"),
+		("100,101", {101: 102, 100: 101}, "101,102"),
+		("100", {200: 1200}, "100"),
+	),
+)
+def test_remap_vmid_list(vmids, mapping, expected):
+	assert remap_vmid_list(vmids, mapping) == expected
+
+
+def test_set_backup_attrs_single_call(mocker: MockerFixture):
+	m_call = mocker.patch(f"{MODULE_PATH}.subprocess.call", return_value=0)
+	assert (
+		set_backup_attrs("backup-a1", {"vmid": "1,2", "exclude": "3"}) is None
+	)
+	m_call.assert_called_once_with(
+		[
+			"pvesh",
+			"set",
+			"/cluster/backup/backup-a1",
+			"-vmid",
+			"1,2",
+			"-exclude",
+			"3",
+		]
+	)
+
+
+class TestBackupJobManager:
+	def test_load_skips_other_sections(self, f_manager: BackupJobManager):
+		assert list(f_manager.jobs()) == ["backup-a1", "backup-b2", "backup-c3"]
+
+	def test_legacy_cron_jobs(self, tmp_path, f_manager: BackupJobManager):
+		with open(f_manager.vzdump_cron_path, "w") as cron_file:
+			cron_file.write(VZDUMP_CRON)
+		assert [j["id"] for j in f_manager.jobs_containing(101)] == [
+			"backup-a1",
+			"backup-old",
+		]
+
+	def test_legacy_cron_without_id_uses_api(
+		self, f_manager: BackupJobManager, mocker: MockerFixture
+	):
+		with open(f_manager.vzdump_cron_path, "w") as cron_file:
+			cron_file.write("0 1 * * 6 root vzdump 100 --quiet 1\n")
+		m_api = mocker.patch(
+			f"{MODULE_PATH}.get_all_backup_jobs",
+			return_value=[{"id": "api-job", "vmid": "100"}],
+		)
+		assert list(f_manager.jobs()) == ["api-job"]
+		m_api.assert_called_once()
+
+	def test_jobs_containing(self, f_manager: BackupJobManager):
+		assert [j["id"] for j in f_manager.jobs_containing(100)] == [
+			"backup-a1"
+		]
+		assert f_manager.jobs_containing(999) == []
+
+	def test_plan_remap_minimal(self, f_manager: BackupJobManager):
+		assert f_manager.plan_remap({100: 1100, 101: 1101}) == {
+			"backup-a1": {"vmid": "1100,1101,102"},
+			"backup-b2": {"exclude": "1101"},
+		}
+
+	def test_remap_one_call_per_job(
+		self, f_manager: BackupJobManager, mocker: MockerFixture
+	):
+		m_set = mocker.patch(
+			f"{MODULE_PATH}.set_backup_attrs", return_value=None
+		)
+		assert f_manager.remap({100: 1100, 101: 1101, 200: 1200}) == []
+		assert m_set.call_count == 3
+		# Index follows applied changes
+		assert f_manager.jobs_containing(100) == []
+		assert [j["id"] for j in f_manager.jobs_containing(1200)] == [
+			"backup-c3"
+		]
+
+	def test_remap_dry_run(
+		self, f_manager: BackupJobManager, mocker: MockerFixture
+	):
+		m_set = mocker.patch(f"{MODULE_PATH}.set_backup_attrs")
+		assert f_manager.remap({100: 1100}, dry_run=True) == []
+		m_set.assert_not_called()
+		assert f_manager.jobs_containing(100)
+
+	def test_remap_failed(
+		self, f_manager: BackupJobManager, mocker: MockerFixture
+	):
+		mocker.patch(f"{MODULE_PATH}.set_backup_attrs", return_value=["vmid"])
+		assert f_manager.remap({200: 1200}) == ["backup-c3"]
+		assert f_manager.jobs_containing(200)
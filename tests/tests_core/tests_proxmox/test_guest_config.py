@@ -0,0 +1,162 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import hashlib
+from core.proxmox.guest_config import GuestConfig, GuestDisk, GuestOption
+
+MODULE_PATH = "core.proxmox.guest_config"
+guest_conf_vm = """#Web%20Server
+boot: order=scsi0;net0
+cores: 2
+hostpci0: 0000:01:00.0,pcie=1
+ide2: local:iso/debian.iso,media=cdrom,size=600M
+ide3: local-lvm:vm-100-cloudinit,media=cdrom
+memory: 4096
+net0: virtio=BC:24:11:00:00:01,bridge=vmbr0,tag=100
+net1: e1000=BC:24:11:00:00:02,bridge=vmbr1,firewall=1
+parent: snap1
+scsi0: local-lvm:vm-100-disk-0,iothread=1,size=32G
+scsi1: /dev/disk/by-id/ata-disk,size=100G
+unused0: zfs:vm-100-disk-1
+
+[PENDING]
+cores: 4
+
+[snap1]
+cores: 2
+net0: virtio=BC:24:11:00:00:01,bridge=vmbr9
+scsi0: local-lvm:vm-100-disk-0,iothread=1,size=32G
+snaptime: 1700000000
+vmstate: local-lvm:vm-100-state-snap1
+
+[special:cloudinit]
+ipconfig0: ip=dhcp
+"""
+
+
+@pytest.fixture
+def f_config():
+	return GuestConfig(guest_conf_vm)
+
+
+def test_round_trip(f_config: GuestConfig):
+	assert f_config.dumps() == guest_conf_vm
+	assert f_config.digest == hashlib.sha1(guest_conf_vm.encode()).hexdigest()
+	assert f_config.description == "Web Server"
+
+
+def test_get_description():
+	config = GuestConfig("#first\ncores: 1\n\n[snap1]\n#before%20upgrade\n")
+	assert config.get_description() == "first"
+	assert config.get_description("snap1") == "before upgrade"
+	assert config.get_description("missing") == ""
+
+
+def test_sections(f_config: GuestConfig):
+	assert f_config.sections() == [
+		None,
+		"PENDING",
+		"snap1",
+		"special:cloudinit",
+	]
+	assert f_config.snapshots() == ["snap1"]
+	assert f_config.get("cores") == "2"
+	assert f_config.get("cores", section="PENDING") == "4"
+	assert f_config.get("missing") is None
+
+
+def test_lazy_option(f_config: GuestConfig, mocker: MockerFixture):
+	m_parse = mocker.spy(GuestOption, "_parse")
+	option = f_config.option("scsi0")
+	m_parse.assert_not_called()
+	assert option.get("size") == "32G"
+	assert option.bare == ["local-lvm:vm-100-disk-0"]
+	assert m_parse.call_count == 1
+	assert f_config.option("scsi0") is option
+
+
+def test_disks(f_config: GuestConfig):
+	disks = f_config.disks()
+	assert [d.to_disk_dict() for d in disks] == [
+		{
+			"interface": "ide3",
+			"storage": "local-lvm",
+			"name": "vm-100-cloudinit",
+			"raw_values": "local-lvm:vm-100-cloudinit",
+		},
+		{
+			"interface": "scsi0",
+			"storage": "local-lvm",
+			"name": "vm-100-disk-0",
+			"raw_values": "local-lvm:vm-100-disk-0",
+		},
+		{
+			"interface": "unused0",
+			"storage": "zfs",
+			"name": "vm-100-disk-1",
+			"raw_values": "zfs:vm-100-disk-1",
+		},
+	]
+	assert "ide2" in [d.key for d in f_config.disks(exclude_media=False)]
+
+
+def test_vmstate_disks(f_config: GuestConfig):
+	assert [d.to_disk_dict() for d in f_config.vmstate_disks()] == [
+		{
+			"interface": "vmstate",
+			"storage": "local-lvm",
+			"name": "vm-100-state-snap1",
+		}
+	]
+
+
+def test_nets(f_config: GuestConfig):
+	nets = f_config.nets()
+	assert list(nets) == [0, 1]
+	assert nets[0].values == {
+		"virtio": "BC:24:11:00:00:01",
+		"bridge": "vmbr0",
+		"tag": "100",
+	}
+	assert nets[0].tag == 100
+	assert nets[1].tag is None
+	assert f_config.nets(section="snap1")[0].bridge == "vmbr9"
+
+
+def test_option_types_are_compact():
+	disk = GuestDisk("scsi0", "local-lvm:vm-100-disk-0")
+	with pytest.raises(AttributeError):
+		disk.extra = True
+
+
+class TestWrite:
+	def test_set_existing(self, f_config: GuestConfig):
+		f_config.set("cores", 8)
+		assert f_config.get("cores") == "8"
+		assert f_config.dumps() == guest_conf_vm.replace(
+			"cores: 2\nhostpci0", "cores: 8\nhostpci0"
+		)
+
+	def test_set_new_in_section(self, f_config: GuestConfig):
+		f_config.set("memory", 2048, section="PENDING")
+		assert f_config.dumps() == guest_conf_vm.replace(
+			"[PENDING]\ncores: 4\n", "[PENDING]\ncores: 4\nmemory: 2048\n"
+		)
+
+	def test_set_missing_trailing_newline(self):
+		config = GuestConfig("cores: 2")
+		config.set("memory", 512)
+		assert config.dumps() == "cores: 2\nmemory: 512\n"
+
+	def test_delete(self, f_config: GuestConfig):
+		assert f_config.delete("unused0")
+		assert not f_config.delete("unused0")
+		assert "unused0" not in f_config.keys()
+		assert "zfs" not in [d.storage for d in f_config.disks()]
+
+	def test_write(self, f_config: GuestConfig, tmp_path):
+		path = tmp_path / "100.conf"
+		f_config.write(str(path))
+		assert GuestConfig.from_file(str(path)).dumps() == guest_conf_vm
@@ -0,0 +1,375 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import os
+import json
+import hashlib
+import subprocess
+import time
+from core.proxmox.guests import (
+	GuestIndex,
+	parse_guest_conf,
+	parse_guest_cfg,
+	get_guest_snapshots,
+	get_cluster_guest_statuses,
+	get_local_guest_statuses,
+	get_running_ct_ids,
+	get_guest_status,
+	get_vm_is_running,
+	get_all_guests,
+	get_guest_cfg_path,
+	get_guest_exists,
+	get_guest_is_ct,
+	get_guest_net_cfgs,
+)
+
+MODULE_PATH = "core.proxmox.guests"
+guest_conf_vm = """
+#Web%20Server
+#second line
+boot: order=scsi0;net0
+cores: 2
+memory: 4096
+name: web01
+net0: virtio=BC:24:11:00:00:01,bridge=vmbr0,tag=100
+parent: snap2
+scsi0: local-lvm:vm-100-disk-0,iothread=1,size=32G
+scsihw: virtio-scsi-single
+
+[PENDING]
+cores: 4
+delete: name
+
+[snap1]
+cores: 1
+scsi0: local-lvm:vm-100-disk-0,iothread=1,size=32G
+snaptime: 1700000000
+
+[snap2]
+#before upgrade
+cores: 2
+parent: snap1
+snaptime: 1700000100
+vmstate: local-lvm:vm-100-state-snap2
+
+[special:cloudinit]
+ipconfig0: ip=dhcp
+""".lstrip()
+
+
+@pytest.fixture
+def f_nodes_dir(tmp_path):
+	nodes_dir = tmp_path / "nodes"
+	for host, subp, guest_id in (
+		("pve01", "qemu-server", 100),
+		("pve01", "lxc", 101),
+		("pve02", "qemu-server", 200),
+	):
+		(nodes_dir / host / subp).mkdir(parents=True, exist_ok=True)
+		(nodes_dir / host / subp / f"{guest_id}.conf").write_text("")
+	# Subpaths without guests
+	(nodes_dir / "pve02" / "lxc").mkdir()
+	return nodes_dir
+
+
+@pytest.fixture
+def f_index(f_nodes_dir, tmp_path, mocker: MockerFixture):
+	index = GuestIndex(
+		nodes_dir=str(f_nodes_dir),
+		vmlist_path=str(tmp_path / ".vmlist"),
+	)
+	mocker.patch(f"{MODULE_PATH}.get_guest_index", return_value=index)
+	return index
+
+
+class TestGuestIndex:
+	def test_scan(self, f_index: GuestIndex, f_nodes_dir):
+		entry = f_index.get(101)
+		assert entry.host == "pve01"
+		assert entry.type == "ct"
+		assert entry.path == f"{f_nodes_dir}/pve01/lxc/101.conf"
+		assert set(f_index.all().keys()) == {100, 101, 200}
+		assert f_index.get(300) is None
+
+	def test_vmlist(self, f_index: GuestIndex, tmp_path):
+		vmlist = {
+			"version": 3,
+			"ids": {
+				"100": {"node": "pve01", "type": "qemu", "version": 1},
+				"500": {"node": "pve02", "type": "lxc", "version": 2},
+			},
+		}
+		(tmp_path / ".vmlist").write_text(json.dumps(vmlist))
+		assert set(f_index.all().keys()) == {100, 500}
+		assert f_index.get(500).subpath == "lxc"
+
+	def test_bad_vmlist_falls_back_to_scan(self, f_index: GuestIndex, tmp_path):
+		(tmp_path / ".vmlist").write_text("{")
+		assert set(f_index.all().keys()) == {100, 101, 200}
+
+	def test_refresh_on_mtime_change(
+		self, f_index: GuestIndex, f_nodes_dir, mocker: MockerFixture
+	):
+		m_scan = mocker.spy(f_index, "_scan")
+		f_index.get(100)
+		f_index.get(200)
+		assert m_scan.call_count == 1
+
+		new_conf = f_nodes_dir / "pve02" / "lxc" / "201.conf"
+		new_conf.write_text("")
+		# Ensure mtime differs on coarse-grained filesystems
+		st = os.stat(new_conf.parent)
+		os.utime(new_conf.parent, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+		assert f_index.exists(201)
+		assert m_scan.call_count == 2
+
+	def test_refresh_on_version_change(
+		self, f_nodes_dir, tmp_path, mocker: MockerFixture
+	):
+		version_path = tmp_path / ".version"
+		version_path.write_text(json.dumps({"version": 5, "vmlist": 1}))
+		index = GuestIndex(
+			nodes_dir=str(f_nodes_dir),
+			vmlist_path=str(tmp_path / ".vmlist"),
+			version_path=str(version_path),
+		)
+		m_scan = mocker.spy(index, "_scan")
+		m_scandir = mocker.spy(os, "scandir")
+		index.get(100)
+		index.get(200)
+		assert m_scan.call_count == 1
+		# Lookups only read .version, node directories are not listed again
+		scandir_count = m_scandir.call_count
+		index.get(100)
+		assert m_scandir.call_count == scandir_count
+
+		(f_nodes_dir / "pve02" / "lxc" / "201.conf").write_text("")
+		assert not index.exists(201)
+		version_path.write_text(json.dumps({"version": 6, "vmlist": 2}))
+		assert index.exists(201)
+		assert m_scan.call_count == 2
+
+	def test_missing_nodes_dir(self, tmp_path):
+		index = GuestIndex(nodes_dir=str(tmp_path / "missing"))
+		assert index.all() == {}
+		assert not index.exists(100)
+
+
+def test_get_guest_exists(f_index):
+	assert get_guest_exists(100)
+	assert get_guest_exists("200")
+	assert not get_guest_exists(300)
+
+
+def test_get_guest_cfg_path(f_index, f_nodes_dir):
+	assert (
+		get_guest_cfg_path(200) == f"{f_nodes_dir}/pve02/qemu-server/200.conf"
+	)
+	assert get_guest_cfg_path(200, get_host=True) == "pve02"
+	assert get_guest_cfg_path(101, get_type=True) == "lxc"
+	assert get_guest_cfg_path(101, get_as_dict=True) == {
+		"path": f"{f_nodes_dir}/pve01/lxc/101.conf",
+		"host": "pve01",
+		"type": "ct",
+		"subpath": "lxc",
+	}
+	assert get_guest_cfg_path(300) is None
+
+
+def test_get_guest_is_ct(f_index):
+	assert get_guest_is_ct(101)
+	assert not get_guest_is_ct(100)
+
+
+@pytest.mark.parametrize(
+	"filter_ids, expected",
+	(
+		([], {"vm": [100, 200], "ct": [101]}),
+		([100, 101], {"vm": [100], "ct": [101]}),
+		({200: {}}, {"vm": [200], "ct": []}),
+	),
+)
+def test_get_all_guests(f_index, filter_ids, expected):
+	result = get_all_guests(filter_ids=filter_ids)
+	assert {k: sorted(v) for k, v in result.items()} == expected
+
+
+def test_get_guest_net_cfgs(f_index, f_nodes_dir, mocker: MockerFixture):
+	(f_nodes_dir / "pve01" / "qemu-server" / "100.conf").write_text(
+		guest_conf_vm
+	)
+	(f_nodes_dir / "pve01" / "lxc" / "101.conf").write_text(
+		"hostname: ct01\n"
+		"net0: name=eth0,bridge=vmbr0,ip=dhcp\n"
+		"net1: name=eth1,bridge=vmbr1,ip=10.0.0.2/24,gw=10.0.0.1\n"
+		"\n[snap1]\nnet0: name=eth0,bridge=vmbr9\n"
+	)
+	m_run_command = mocker.patch(f"{MODULE_PATH}.run_command")
+	assert get_guest_net_cfgs(filter_ids={100: {}, 101: {}}) == {
+		100: {
+			0: {"virtio": "BC:24:11:00:00:01", "bridge": "vmbr0", "tag": "100"}
+		},
+		101: {
+			0: {"name": "eth0", "bridge": "vmbr0", "ip": "dhcp"},
+			1: {
+				"name": "eth1",
+				"bridge": "vmbr1",
+				"ip": "10.0.0.2/24",
+				"gw": "10.0.0.1",
+			},
+		},
+	}
+	m_run_command.assert_not_called()
+
+
+class TestParseGuestConf:
+	def test_sections(self):
+		result = parse_guest_conf(guest_conf_vm)
+		assert result["current"]["description"] == "Web Server\nsecond line"
+		assert result["current"]["cores"] == 2
+		assert result["current"]["name"] == "web01"
+		assert result["current"]["net0"] == {
+			"virtio": "BC:24:11:00:00:01",
+			"bridge": "vmbr0",
+			"tag": 100,
+		}
+		assert result["current"]["scsi0"] == {
+			"raw_values": ["local-lvm:vm-100-disk-0"],
+			"iothread": 1,
+			"size": "32G",
+		}
+		assert result["pending"] == {"cores": 4, "delete": "name"}
+		assert list(result["snapshots"].keys()) == ["snap1", "snap2"]
+		assert result["snapshots"]["snap2"] == {
+			"description": "before upgrade",
+			"cores": 2,
+			"parent": "snap1",
+			"snaptime": 1700000100,
+			"vmstate": "local-lvm:vm-100-state-snap2",
+		}
+		assert "ipconfig0" not in result["current"]
+
+	def test_digest(self):
+		assert (
+			parse_guest_conf(guest_conf_vm.encode())["digest"]
+			== hashlib.sha1(guest_conf_vm.encode()).hexdigest()
+		)
+
+
+class TestParseGuestCfgFromConf:
+	@pytest.fixture(autouse=True)
+	def f_conf(self, f_index, f_nodes_dir):
+		(f_nodes_dir / "pve01" / "qemu-server" / "100.conf").write_text(
+			guest_conf_vm
+		)
+
+	def test_current(self, mocker: MockerFixture):
+		m_run_command = mocker.patch(f"{MODULE_PATH}.run_command")
+		result = parse_guest_cfg(100)
+		m_run_command.assert_not_called()
+		assert result["cores"] == 2
+		assert result["name"] == "web01"
+		assert "digest" in result
+
+	def test_pending_applied(self):
+		result = parse_guest_cfg(100, current=False)
+		assert result["cores"] == 4
+		assert "name" not in result
+
+	def test_snapshot(self):
+		result = parse_guest_cfg(100, current=False, snapshot_name="snap1")
+		assert result["cores"] == 1
+		assert result["snaptime"] == 1700000000
+
+	def test_raises_missing_snapshot(self):
+		with pytest.raises(ValueError, match="does not exist"):
+			parse_guest_cfg(100, current=False, snapshot_name="missing")
+
+	def test_raises_current_and_snapshot(self):
+		with pytest.raises(ValueError, match="cannot be used at the same"):
+			parse_guest_cfg(100, snapshot_name="snap1")
+
+	def test_get_guest_snapshots(self, mocker: MockerFixture):
+		m_check_output = mocker.patch("subprocess.check_output")
+		assert get_guest_snapshots(100) == ["snap1", "snap2"]
+		m_check_output.assert_not_called()
+
+
+def test_get_cluster_guest_statuses(mocker: MockerFixture):
+	resources = [
+		{"vmid": 100, "node": "pve01", "status": "running", "type": "qemu"},
+		{"vmid": 101, "node": "pve01", "status": "stopped", "type": "lxc"},
+		{"vmid": 200, "node": "pve02", "status": "running", "type": "qemu"},
+	]
+	m_run_command = mocker.patch(f"{MODULE_PATH}.run_command")
+	m_run_command.return_value.output = json.dumps(resources)
+	assert get_cluster_guest_statuses() == {
+		100: "running",
+		101: "stopped",
+		200: "running",
+	}
+	assert get_cluster_guest_statuses(node="pve02") == {200: "running"}
+	assert m_run_command.call_count == 2
+	m_run_command.assert_called_with(
+		"pvesh get /cluster/resources --output-format json --type vm".split(),
+		check=True,
+	)
+
+
+def test_get_running_ct_ids(tmp_path, mocker: MockerFixture):
+	for d in ("101", "102", "init.scope"):
+		(tmp_path / d).mkdir()
+	mocker.patch(
+		f"{MODULE_PATH}.PVE_LXC_CGROUP_DIRS",
+		(str(tmp_path), str(tmp_path / "missing")),
+	)
+	assert get_running_ct_ids() == {101, 102}
+
+
+def test_get_local_guest_statuses(f_index, mocker: MockerFixture):
+	mocker.patch("socket.gethostname", return_value="pve01")
+	mocker.patch(f"{MODULE_PATH}.get_running_vm_ids", return_value={100})
+	mocker.patch(f"{MODULE_PATH}.get_running_ct_ids", return_value=set())
+	m_run_command = mocker.patch(f"{MODULE_PATH}.run_command")
+	assert get_local_guest_statuses() == {100: "running", 101: "stopped"}
+	assert get_local_guest_statuses(filter_ids=[101]) == {101: "stopped"}
+	m_run_command.assert_not_called()
+
+
+def test_get_vm_is_running(tmp_path, mocker: MockerFixture):
+	mocker.patch(f"{MODULE_PATH}.PVE_QEMU_RUN_DIR", str(tmp_path))
+	# Command line holding "-id 100" like a QEMU process
+	proc = subprocess.Popen(["sh", "-c", "sleep 5; true", "-id", "100"])
+	try:
+		# Wait for the exec to replace the forked command line
+		for _ in range(100):
+			with open(f"/proc/{proc.pid}/cmdline", "rb") as f:
+				if b"-id" in f.read():
+					break
+			time.sleep(0.01)
+		(tmp_path / "100.pid").write_text(f"{proc.pid}\n")
+		(tmp_path / "101.pid").write_text(f"{proc.pid}\n")
+		assert get_vm_is_running(100)
+		# PID re-used by another guest's process
+		assert not get_vm_is_running(101)
+		assert not get_vm_is_running(102)
+	finally:
+		proc.kill()
+		proc.wait()
+
+
+def test_get_guest_status_local(f_index, mocker: MockerFixture):
+	mocker.patch("socket.gethostname", return_value="pve01")
+	m_vm = mocker.patch(f"{MODULE_PATH}.get_vm_is_running", return_value=True)
+	m_ct = mocker.patch(f"{MODULE_PATH}.get_ct_is_running", return_value=False)
+	m_running_vms = mocker.patch(f"{MODULE_PATH}.get_running_vm_ids")
+	m_run_command = mocker.patch(f"{MODULE_PATH}.run_command")
+	assert get_guest_status(100) == "running"
+	assert get_guest_status(101) == "stopped"
+	# Only the requested guest's runtime state is read
+	m_vm.assert_called_once_with(100)
+	m_ct.assert_called_once_with(101)
+	m_running_vms.assert_not_called()
+	m_run_command.assert_not_called()
@@ -0,0 +1,275 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import json
+from core.proxmox.guests import GuestIndex
+from core.proxmox.storage import PVEStorage, StorageConfig
+from core.proxmox.inventory import (
+	StorageInventory,
+	StorageVolume,
+	get_lv_storage,
+	get_volume_ref_names,
+	parse_rbd_ls,
+	parse_zfs_list,
+)
+from core.utils.command import CommandResult
+
+MODULE_PATH = "core.proxmox.inventory"
+
+LVS_REPORT = {
+	"report": [
+		{
+			"lv": [
+				{
+					"lv_name": "data",
+					"lv_size": "107374182400",
+					"lv_attr": "twi-aotz--",
+					"pool_lv": "",
+				},
+				{
+					"lv_name": "root",
+					"lv_size": "10737418240",
+					"lv_attr": "-wi-ao----",
+					"pool_lv": "",
+				},
+				{
+					"lv_name": "vm-100-disk-0",
+					"lv_size": "8589934592",
+					"lv_attr": "Vwi-a-tz--",
+					"pool_lv": "data",
+				},
+				{
+					"lv_name": "vm-200-disk-0",
+					"lv_size": "8589934592",
+					"lv_attr": "Vwi-a-tz--",
+					"pool_lv": "data",
+				},
+				{
+					"lv_name": "vm-300-disk-0",
+					"lv_size": "8589934592",
+					"lv_attr": "Vwi-a-tz--",
+					"pool_lv": "data",
+				},
+			]
+		}
+	]
+}
+ZFS_LIST = (
+	"rpool\t1000\t-\n"
+	"rpool/data\t900\t-\n"
+	"rpool/data/subvol-101-disk-0\t500\t-\n"
+	"rpool/data/vm-100-state-snap1\t300\t400\n"
+	"rpool/data/vm-101-disk-1\t200\t200\n"
+	"rpool/data/subvol-101-disk-0/nested\t1\t-\n"
+)
+
+
+@pytest.fixture
+def f_cluster(tmp_path):
+	nodes_dir = tmp_path / "nodes"
+	for node, subp in (("pve1", "qemu-server"), ("pve1", "lxc")):
+		(nodes_dir / node / subp).mkdir(parents=True, exist_ok=True)
+	(nodes_dir / "pve2" / "qemu-server").mkdir(parents=True)
+	(nodes_dir / "pve1" / "qemu-server" / "100.conf").write_text(
+		"scsi0: local-lvm:vm-100-disk-0,size=8G\n"
+		"scsi1: local-lvm:vm-100-disk-1,size=8G\n"
+		"scsi2: local:100/vm-200-disk-0.qcow2,size=1G\n"
+		"ide2: local:iso/debian.iso,media=cdrom\n"
+		"\n[snap1]\nvmstate: zfs:vm-100-state-snap1\n"
+	)
+	(nodes_dir / "pve1" / "lxc" / "101.conf").write_text(
+		"rootfs: zfs:subvol-101-disk-0,size=8G\n"
+	)
+	(nodes_dir / "pve2" / "qemu-server" / "200.conf").write_text(
+		"scsi0: local-lvm:vm-200-disk-0,size=8G\n"
+		"scsi1: ceph:vm-200-disk-0,size=8G\n"
+	)
+	vz_dir = tmp_path / "vz"
+	(vz_dir / "images" / "100").mkdir(parents=True)
+	(vz_dir / "images" / "102").mkdir(parents=True)
+	(vz_dir / "images" / "100" / "vm-200-disk-0.qcow2").write_bytes(b"0" * 16)
+	(vz_dir / "images" / "102" / "notes.txt").write_text("")
+	(tmp_path / "storage.cfg").write_text(
+		f"dir: local\n\tpath {vz_dir}\n\tcontent iso,images\n\n"
+		"lvmthin: local-lvm\n\tthinpool data\n\tvgname pve\n\n"
+		"zfspool: zfs\n\tpool rpool/data\n\n"
+		"rbd: ceph\n\tpool ceph-vm\n\n"
+		"zfspool: other-node\n\tpool tank\n\tnodes pve2\n"
+	)
+	return tmp_path
+
+
+@pytest.fixture
+def f_inventory(f_cluster, mocker: MockerFixture):
+	mocker.patch(f"{MODULE_PATH}.socket.gethostname", return_value="pve1")
+	return StorageInventory(
+		storage_config=StorageConfig(cfg_path=str(f_cluster / "storage.cfg")),
+		guest_index=GuestIndex(
+			nodes_dir=str(f_cluster / "nodes"),
+			vmlist_path=str(f_cluster / ".vmlist"),
+		),
+	)
+
+
+@pytest.fixture
+def f_runner(mocker: MockerFixture):
+	outputs = {
+		"/usr/sbin/lvs": json.dumps(LVS_REPORT),
+		"/usr/sbin/zfs": ZFS_LIST,
+	}
+	calls = []
+
+	async def run(cmd_args, remote_args=None, **kwargs):
+		calls.append(cmd_args)
+		if cmd_args[0] not in outputs:
+			raise FileNotFoundError(2, "No such file or directory", cmd_args[0])
+		return CommandResult(cmd_args, 0, outputs[cmd_args[0]].encode(), b"", 0)
+
+	m_runner = mocker.patch(f"{MODULE_PATH}.get_command_runner")
+	m_runner.return_value.run = run
+	return calls
+
+
+class TestStorageInventory:
+	def test_report(self, f_inventory, f_runner):
+		report = f_inventory.report()
+		assert report.node == "pve1"
+		assert report.states == {
+			"local-lvm:vm-100-disk-0": "referenced",
+			"local-lvm:vm-200-disk-0": "unreferenced",
+			"local-lvm:vm-300-disk-0": "orphaned",
+			"local-lvm:vm-100-disk-1": "missing",
+			"zfs:subvol-101-disk-0": "referenced",
+			"zfs:vm-100-state-snap1": "referenced",
+			"zfs:vm-101-disk-1": "unreferenced",
+			"local:100/vm-200-disk-0.qcow2": "misnamed",
+			"local:102/notes.txt": "misnamed",
+		}
+		assert report.references["local:100/vm-200-disk-0.qcow2"] == [100]
+		assert report.by_state("orphaned") == ["local-lvm:vm-300-disk-0"]
+		# Unavailable backends are reported, not guessed
+		assert list(report.errors) == ["ceph"]
+		assert "ceph" not in report.volumes
+
+	def test_one_call_per_backend(self, f_inventory, f_runner):
+		f_inventory.report()
+		assert sorted(cmd[0] for cmd in f_runner) == [
+			"/usr/bin/rbd",
+			"/usr/sbin/lvs",
+			"/usr/sbin/zfs",
+		]
+		# Storages not available on the node are skipped
+		assert "tank" not in [arg for cmd in f_runner for arg in cmd]
+
+	def test_storage_filter(self, f_inventory, f_runner):
+		report = f_inventory.report(storage_names=["zfs"])
+		assert list(report.volumes) == ["zfs"]
+		assert [cmd[0] for cmd in f_runner] == ["/usr/sbin/zfs"]
+
+	def test_remote_node(self, f_inventory, f_runner, mocker: MockerFixture):
+		mocker.patch(
+			f"{MODULE_PATH}.get_remote_args", return_value=["ssh", "pve2"]
+		)
+		f_inventory.node = "pve2"
+		report = f_inventory.report(storage_names=["local-lvm", "local"])
+		# Files are listed remotely
+		assert "/usr/bin/find" in [cmd[0] for cmd in f_runner]
+		assert report.states["local-lvm:vm-200-disk-0"] == "referenced"
+		assert report.states["local-lvm:vm-100-disk-0"] == "unreferenced"
+
+	def test_file_and_unlisted_storages(self, f_cluster, f_inventory, f_runner):
+		nfs_dir = f_cluster / "nfs"
+		(nfs_dir / "images" / "100").mkdir(parents=True)
+		(nfs_dir / "images" / "100" / "vm-100-disk-2.qcow2").write_bytes(b"")
+		with open(f_cluster / "storage.cfg", "a") as cfg_file:
+			cfg_file.write(
+				f"\nnfs: nas\n\tpath {nfs_dir}\n\tserver 10.0.0.1\n"
+				"\nbtrfs: fast\n\tpath /mnt/fast\n"
+			)
+		report = f_inventory.report(storage_names=["nas", "fast"])
+		assert report.states == {"nas:100/vm-100-disk-2.qcow2": "unreferenced"}
+		assert report.errors == {
+			"fast": "Listing btrfs storages is not supported."
+		}
+		assert f_runner == []
+
+	def test_ovmf_tpm_volumes(self, f_cluster, f_inventory, f_runner):
+		images_dir = f_cluster / "vz" / "images" / "103"
+		images_dir.mkdir()
+		for name in ("vm-103-disk-0.raw", "vm-103-disk-1.raw"):
+			(images_dir / name).write_bytes(b"")
+		(f_cluster / "nodes" / "pve1" / "qemu-server" / "103.conf").write_text(
+			"bios: ovmf\n"
+			"efidisk0: local:103/vm-103-disk-0.raw,efitype=4m,size=528K\n"
+			"tpmstate0: local:103/vm-103-disk-1.raw,size=4M,version=v2.0\n"
+		)
+		report = f_inventory.report(storage_names=["local"])
+		assert report.states["local:103/vm-103-disk-0.raw"] == "referenced"
+		assert report.states["local:103/vm-103-disk-1.raw"] == "referenced"
+
+
+def test_storage_volume():
+	volume = StorageVolume("local", "100/vm-100-disk-0.qcow2")
+	assert volume.guest_id == 100
+	assert volume.dir_guest_id == 100
+	assert StorageVolume("local-lvm", "root").guest_id is None
+
+
+@pytest.mark.parametrize(
+	"storage_type, name, expected",
+	(
+		("lvmthin", "vm-100-disk-0", ("vm-100-disk-0", None)),
+		(
+			"zfspool",
+			"base-100-disk-0/vm-101-disk-0",
+			("vm-101-disk-0", "base-100-disk-0"),
+		),
+		("dir", "101/vm-101-disk-0.qcow2", ("101/vm-101-disk-0.qcow2", None)),
+		(
+			"dir",
+			"100/base-100-disk-0.qcow2/101/vm-101-disk-0.qcow2",
+			("101/vm-101-disk-0.qcow2", "100/base-100-disk-0.qcow2"),
+		),
+	),
+)
+def test_get_volume_ref_names(storage_type, name, expected):
+	assert get_volume_ref_names(storage_type, name) == expected
+
+
+def test_get_lv_storage_shared_vg():
+	thin = PVEStorage(name="local-lvm", type="lvmthin", path="pve")
+	thin.thinpool = "data"
+	thick = PVEStorage(name="thick", type="lvm", path="pve")
+	storages = [thin, thick]
+	assert (
+		get_lv_storage({"lv_name": "vm-1-disk-0", "pool_lv": "data"}, storages)
+		is thin
+	)
+	assert (
+		get_lv_storage({"lv_name": "vm-2-disk-0", "pool_lv": ""}, storages)
+		is thick
+	)
+	assert (
+		get_lv_storage({"lv_name": "data", "lv_attr": "twi-aotz--"}, storages)
+		is None
+	)
+
+
+def test_parse_zfs_list():
+	assert parse_zfs_list(ZFS_LIST, "rpool/data") == [
+		("subvol-101-disk-0", 500),
+		("vm-100-state-snap1", 400),
+		("vm-101-disk-1", 200),
+	]
+
+
+def test_parse_rbd_ls():
+	raw = json.dumps(
+		[
+			{"image": "vm-100-disk-0", "size": 8, "format": 2},
+			{"image": "vm-100-disk-0", "snapshot": "snap1", "size": 8},
+		]
+	)
+	assert parse_rbd_ls(raw) == [("vm-100-disk-0", 8)]
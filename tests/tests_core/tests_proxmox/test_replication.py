@@ -0,0 +1,183 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+from core.proxmox.replication import (
+	ReplicationWatch,
+	get_replication_jobs,
+	get_replication_statuses,
+	wait_for_replication_jobs_removal,
+)
+from core.utils.command import CommandError, CommandResult
+
+MODULE_PATH = "core.proxmox.replication"
+
+REPLICATION_CFG = """
+local: 100-0
+	target pve2
+	schedule */15
+
+local: 101-0
+	target pve2
+	rate 10
+
+local: 100-1
+	target pve3
+	comment second target
+"""
+
+PVESR_STATUS = b"""JobID      Enabled    Target                           LastSync             NextSync   Duration  FailCount State
+100-0      Yes        local/pve2              2024-01-01_12:00:00  2024-01-01_12:15:00   3.10          0 OK
+100-1      Yes        local/pve3              -                    pending               0.00          0 SYNCING
+101-0      Yes        local/pve2              2024-01-01_12:00:00  2024-01-01_12:15:00   1.00          0 OK
+"""
+
+
+@pytest.fixture
+def replication_cfg(tmp_path):
+	cfg_path = tmp_path / "replication.cfg"
+	cfg_path.write_text(REPLICATION_CFG)
+	return cfg_path
+
+
+def test_get_replication_jobs(replication_cfg):
+	jobs = get_replication_jobs(guest_ids=[100], cfg_path=str(replication_cfg))
+	assert jobs == {
+		100: {
+			"100-0": {"target": "pve2", "schedule": "*/15"},
+			"100-1": {"target": "pve3", "comment": "second target"},
+		}
+	}
+	assert set(get_replication_jobs(cfg_path=str(replication_cfg))) == {
+		100,
+		101,
+	}
+
+
+def test_get_replication_jobs_missing_file(tmp_path):
+	assert get_replication_jobs(cfg_path=str(tmp_path / "missing.cfg")) == {}
+
+
+def test_get_replication_statuses(mocker: MockerFixture):
+	m_run_command = mocker.patch(
+		f"{MODULE_PATH}.run_command",
+		return_value=CommandResult(
+			args=[], returncode=0, stdout=PVESR_STATUS, stderr=b"", duration=0
+		),
+	)
+	assert get_replication_statuses(
+		guest_ids=[100], remote_args=["ssh", "root@pve1"]
+	) == {100: {"100-0": "OK", "100-1": "SYNCING"}}
+	m_run_command.assert_called_once_with(
+		["ssh", "root@pve1", "/usr/bin/pvesr", "status"], check=True
+	)
+
+
+def test_get_replication_statuses_failure(mocker: MockerFixture):
+	mocker.patch(
+		f"{MODULE_PATH}.run_command",
+		side_effect=CommandError(
+			CommandResult(["pvesr"], 255, b"", b"ssh: timeout", 0.1)
+		),
+	)
+	assert get_replication_statuses(guest_ids=[100]) is None
+	with pytest.raises(CommandError):
+		get_replication_statuses(guest_ids=[100], raise_exception=True)
+
+
+class TestWaitForReplicationJobsRemoval:
+	@pytest.fixture(autouse=True)
+	def mock_sleep(self, mocker: MockerFixture):
+		return mocker.patch(f"{MODULE_PATH}.time.sleep")
+
+	def test_returns_without_status_call_when_cfg_empty(
+		self, tmp_path, mocker: MockerFixture
+	):
+		cfg_path = tmp_path / "replication.cfg"
+		cfg_path.write_text("")
+		m_statuses = mocker.patch(f"{MODULE_PATH}.get_replication_statuses")
+		assert (
+			wait_for_replication_jobs_removal(
+				guest_ids=[100, 101], cfg_path=str(cfg_path)
+			)
+			== {}
+		)
+		m_statuses.assert_not_called()
+
+	def test_batches_guests_until_removed(
+		self, replication_cfg, mocker: MockerFixture
+	):
+		m_statuses = mocker.patch(
+			f"{MODULE_PATH}.get_replication_statuses",
+			side_effect=[
+				{100: {"100-0": "OK", "100-1": "OK"}, 101: {"101-0": "OK"}},
+				{100: {"100-1": "OK"}},
+				{},
+			],
+		)
+		assert (
+			wait_for_replication_jobs_removal(
+				guest_ids=[100, 101],
+				cfg_path=str(replication_cfg),
+				initial_interval=0,
+			)
+			== {}
+		)
+		assert m_statuses.call_count == 3
+		for call in m_statuses.call_args_list:
+			assert call.args[0] == {100, 101}
+
+	def test_timeout(self, replication_cfg, mocker: MockerFixture):
+		remaining = {100: {"100-0": "OK"}}
+		mocker.patch(
+			f"{MODULE_PATH}.get_replication_statuses", return_value=remaining
+		)
+		assert (
+			wait_for_replication_jobs_removal(
+				guest_ids=[100], cfg_path=str(replication_cfg), timeout=0
+			)
+			== remaining
+		)
+
+	def test_status_failure_keeps_waiting(
+		self, replication_cfg, mocker: MockerFixture
+	):
+		m_statuses = mocker.patch(
+			f"{MODULE_PATH}.get_replication_statuses",
+			side_effect=[None, {100: {"100-0": "OK"}}, {}],
+		)
+		assert (
+			wait_for_replication_jobs_removal(
+				guest_ids=[100],
+				cfg_path=str(replication_cfg),
+				initial_interval=0,
+			)
+			== {}
+		)
+		assert m_statuses.call_count == 3
+
+	def test_status_failure_timeout(
+		self, replication_cfg, mocker: MockerFixture
+	):
+		mocker.patch(
+			f"{MODULE_PATH}.get_replication_statuses", return_value=None
+		)
+		assert wait_for_replication_jobs_removal(
+			guest_ids=[100], cfg_path=str(replication_cfg), timeout=0
+		) == {100: {"100-0": "unknown", "100-1": "unknown"}}
+
+	def test_remote_ignores_local_state(
+		self, replication_cfg, tmp_path, mocker: MockerFixture
+	):
+		mocker.patch(f"{MODULE_PATH}.get_replication_statuses", return_value={})
+		m_watch = mocker.patch(
+			f"{MODULE_PATH}.ReplicationWatch", wraps=ReplicationWatch
+		)
+		wait_for_replication_jobs_removal(
+			guest_ids=[100],
+			remote_args=["ssh", "root@pve2"],
+			cfg_path=str(replication_cfg),
+			state_path=str(tmp_path / "pvesr.state"),
+		)
+		assert m_watch.call_args.kwargs["paths"] == [str(replication_cfg)]
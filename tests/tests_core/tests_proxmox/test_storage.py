@@ -0,0 +1,321 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+from core.proxmox.storage import (
+	PVEStorage,
+	StorageConfig,
+	parse_storage_cfg,
+	reassign_disks,
+	rewrite_guest_cfg_volumes,
+	UnsupportedStorageType,
+)
+
+MODULE_PATH = "core.proxmox.storage"
+
+
+class TestGetDiskRename:
+	@pytest.mark.parametrize(
+		"storage_type, path, expected_args",
+		(
+			(
+				"lvmthin",
+				"pve",
+				[
+					"/usr/sbin/lvrename",
+					"pve",
+					"vm-100-disk-0",
+					"vm-1100-disk-0",
+				],
+			),
+			(
+				"zfspool",
+				"rpool/data",
+				[
+					"/usr/sbin/zfs",
+					"rename",
+					"rpool/data/vm-100-disk-0",
+					"rpool/data/vm-1100-disk-0",
+				],
+			),
+			(
+				"rbd",
+				"ceph-vm",
+				[
+					"/usr/bin/rbd",
+					"mv",
+					"ceph-vm/vm-100-disk-0",
+					"ceph-vm/vm-1100-disk-0",
+				],
+			),
+		),
+	)
+	def test_block_storages(self, storage_type, path, expected_args):
+		storage = PVEStorage(name="stor", type=storage_type, path=path)
+		rename = storage.get_disk_rename("vm-100-disk-0", 1100)
+		assert rename.cmd_args == expected_args
+		assert rename.volume == "stor:vm-100-disk-0"
+		assert rename.new_volume == "stor:vm-1100-disk-0"
+
+	def test_dir_id_prefix(self):
+		storage = PVEStorage(name="local", type="dir", path="/var/lib/vz")
+		rename = storage.get_disk_rename("100/vm-100-disk-0.qcow2", 1100)
+		assert rename.cmd_args == [
+			"/usr/bin/mv",
+			"/var/lib/vz/images/100/vm-100-disk-0.qcow2",
+			"/var/lib/vz/images/1100/vm-1100-disk-0.qcow2",
+		]
+		assert rename.volume == "local:100/vm-100-disk-0.qcow2"
+		assert rename.new_volume == "local:1100/vm-1100-disk-0.qcow2"
+		assert rename.old_disk_dir == "/var/lib/vz/images/100"
+
+	def test_nfs(self):
+		storage = PVEStorage(name="nas", type="nfs", path="/mnt/pve/nas")
+		rename = storage.get_disk_rename("100/vm-100-disk-0.qcow2", 1100)
+		assert rename.cmd_args == [
+			"/usr/bin/mv",
+			"/mnt/pve/nas/images/100/vm-100-disk-0.qcow2",
+			"/mnt/pve/nas/images/1100/vm-1100-disk-0.qcow2",
+		]
+
+	def test_raises_unsupported(self):
+		storage = PVEStorage(name="fast", type="btrfs", path="/mnt/fast")
+		with pytest.raises(UnsupportedStorageType):
+			storage.get_disk_rename("vm-100-disk-0", 1100)
+
+
+def test_rewrite_guest_cfg_volumes(tmp_path):
+	guest_cfg = tmp_path / "1100.conf"
+	guest_cfg.write_text(
+		"scsi0: local-lvm:vm-100-disk-1,size=8G\n"
+		"scsi1: local-lvm:vm-100-disk-10,size=8G\n"
+		"vmstate: local-lvm:vm-100-state-snap1\n"
+	)
+	rewrite_guest_cfg_volumes(
+		str(guest_cfg),
+		{
+			"local-lvm:vm-100-disk-1": "local-lvm:vm-1100-disk-1",
+			"local-lvm:vm-100-state-snap1": "local-lvm:vm-1100-state-snap1",
+		},
+	)
+	assert guest_cfg.read_text() == (
+		"scsi0: local-lvm:vm-1100-disk-1,size=8G\n"
+		"scsi1: local-lvm:vm-100-disk-10,size=8G\n"
+		"vmstate: local-lvm:vm-1100-state-snap1\n"
+	)
+
+
+def test_rewrite_guest_cfg_volumes_storage_suffix(tmp_path):
+	guest_cfg = tmp_path / "200.conf"
+	guest_cfg.write_text(
+		"scsi0: lvm:vm-100-disk-0,size=8G\n"
+		"scsi1: local-lvm:vm-100-disk-0,size=8G\n"
+	)
+	rewrite_guest_cfg_volumes(
+		str(guest_cfg), {"lvm:vm-100-disk-0": "lvm:vm-200-disk-0"}
+	)
+	assert guest_cfg.read_text() == (
+		"scsi0: lvm:vm-200-disk-0,size=8G\n"
+		"scsi1: local-lvm:vm-100-disk-0,size=8G\n"
+	)
+
+
+class TestReassignDisks:
+	def test_batches_cfg_and_lv_tags(self, tmp_path, mocker: MockerFixture):
+		guest_cfg = tmp_path / "1100.conf"
+		guest_cfg.write_text(
+			"scsi0: lvm:vm-100-disk-0,size=8G\n"
+			"scsi1: lvm:vm-100-disk-1,size=8G\n"
+			"scsi2: zfs:vm-100-disk-0,size=8G\n"
+		)
+		m_run = mocker.patch(f"{MODULE_PATH}._run_disk_cmd", return_value=0)
+		lvm = PVEStorage(name="lvm", type="lvm", path="vg0", tagged_only=True)
+		zfs = PVEStorage(name="zfs", type="zfspool", path="rpool/data")
+
+		failed = reassign_disks(
+			disks=[
+				(lvm, "vm-100-disk-0"),
+				(lvm, "vm-100-disk-1"),
+				(zfs, "vm-100-disk-0"),
+			],
+			new_guest_id=1100,
+			new_guest_cfg=str(guest_cfg),
+		)
+		assert failed == []
+		assert guest_cfg.read_text() == (
+			"scsi0: lvm:vm-1100-disk-0,size=8G\n"
+			"scsi1: lvm:vm-1100-disk-1,size=8G\n"
+			"scsi2: zfs:vm-1100-disk-0,size=8G\n"
+		)
+		lvchange_calls = [
+			c.args[0]
+			for c in m_run.call_args_list
+			if c.args[0][0] == "/usr/sbin/lvchange"
+		]
+		assert lvchange_calls == [
+			[
+				"/usr/sbin/lvchange",
+				"--deltag",
+				"vm-100-disk-0",
+				"--deltag",
+				"vm-100-disk-1",
+				"--addtag",
+				"lvm-vm-1100",
+				"vg0/vm-1100-disk-0",
+				"vg0/vm-1100-disk-1",
+			]
+		]
+		assert m_run.call_count == 4
+
+	def test_failed_rename_keeps_cfg(self, tmp_path, mocker: MockerFixture):
+		guest_cfg = tmp_path / "1100.conf"
+		guest_cfg.write_text(
+			"scsi0: zfs:vm-100-disk-0,size=8G\nscsi1: zfs:vm-100-disk-1,size=8G\n"
+		)
+
+		def _run(cmd_args, remote_args=None):
+			return 1 if cmd_args[-1].endswith("disk-1") else 0
+
+		mocker.patch(f"{MODULE_PATH}._run_disk_cmd", side_effect=_run)
+		zfs = PVEStorage(name="zfs", type="zfspool", path="rpool/data")
+		failed = reassign_disks(
+			disks=[(zfs, "vm-100-disk-0"), (zfs, "vm-100-disk-1")],
+			new_guest_id=1100,
+			new_guest_cfg=str(guest_cfg),
+		)
+		assert failed == ["zfs:vm-100-disk-1"]
+		assert guest_cfg.read_text() == (
+			"scsi0: zfs:vm-1100-disk-0,size=8G\nscsi1: zfs:vm-100-disk-1,size=8G\n"
+		)
+
+	def test_foreign_disk_fails_alone(self, tmp_path, mocker: MockerFixture):
+		guest_cfg = tmp_path / "1100.conf"
+		guest_cfg.write_text(
+			"scsi0: zfs:base-9000-disk-0/vm-100-disk-0,size=8G\n"
+			"scsi1: zfs:vm-100-disk-1,size=8G\n"
+		)
+		m_run = mocker.patch(f"{MODULE_PATH}._run_disk_cmd", return_value=0)
+		zfs = PVEStorage(name="zfs", type="zfspool", path="rpool/data")
+		failed = reassign_disks(
+			disks=[
+				(zfs, "base-9000-disk-0/vm-100-disk-0"),
+				(zfs, "vm-100-disk-1"),
+			],
+			new_guest_id=1100,
+			new_guest_cfg=str(guest_cfg),
+			guest_id=100,
+		)
+		assert failed == ["zfs:base-9000-disk-0/vm-100-disk-0"]
+		m_run.assert_called_once_with(
+			[
+				"/usr/sbin/zfs",
+				"rename",
+				"rpool/data/vm-100-disk-1",
+				"rpool/data/vm-1100-disk-1",
+			],
+			None,
+		)
+		assert guest_cfg.read_text() == (
+			"scsi0: zfs:base-9000-disk-0/vm-100-disk-0,size=8G\n"
+			"scsi1: zfs:vm-1100-disk-1,size=8G\n"
+		)
+
+	def test_dry_run(self, tmp_path, mocker: MockerFixture):
+		guest_cfg = tmp_path / "1100.conf"
+		guest_cfg.write_text("scsi0: zfs:vm-100-disk-0,size=8G\n")
+		m_run = mocker.patch(f"{MODULE_PATH}._run_disk_cmd")
+		zfs = PVEStorage(name="zfs", type="zfspool", path="rpool/data")
+		reassign_disks(
+			disks=[(zfs, "vm-100-disk-0")],
+			new_guest_id=1100,
+			new_guest_cfg=str(guest_cfg),
+			dry_run=True,
+		)
+		m_run.assert_not_called()
+		assert guest_cfg.read_text() == "scsi0: zfs:vm-100-disk-0,size=8G\n"
+
+
+STORAGE_CFG = """
+dir: local
+	path /var/lib/vz
+	content iso,vztmpl,backup
+
+lvmthin: local-lvm
+	thinpool data
+	vgname pve
+	content rootdir,images
+
+lvm: san
+	vgname vg_san
+	shared 1
+	tagged_only 1
+
+nfs: nas
+	export /export/pve
+	path /mnt/pve/nas
+	server 10.0.0.5
+
+dir: local-fast
+	path /var/lib/vz/fast
+	content images
+"""
+
+
+def test_parse_storage_cfg():
+	sections = parse_storage_cfg(STORAGE_CFG)
+	assert list(sections) == ["local", "local-lvm", "san", "nas", "local-fast"]
+	assert sections["local-lvm"] == {
+		"type": "lvmthin",
+		"name": "local-lvm",
+		"thinpool": "data",
+		"vgname": "pve",
+		"content": "rootdir,images",
+	}
+
+
+class TestStorageConfig:
+	@pytest.fixture
+	def storage_cfg(self, tmp_path):
+		cfg_path = tmp_path / "storage.cfg"
+		cfg_path.write_text(STORAGE_CFG)
+		return StorageConfig(cfg_path=str(cfg_path))
+
+	def test_get(self, storage_cfg):
+		storage = storage_cfg.get("local-lvm")
+		assert storage.type == "lvmthin"
+		assert storage.path == "pve"
+		assert storage_cfg.get("san").uses_lv_tags
+		assert storage_cfg.get("nas").server == "10.0.0.5"
+
+	def test_by_type(self, storage_cfg):
+		assert [s.name for s in storage_cfg.by_type("lvm", "lvmthin")] == [
+			"local-lvm",
+			"san",
+		]
+
+	def test_by_path(self, storage_cfg):
+		assert [
+			s.name for s in storage_cfg.by_path("/var/lib/vz/fast/images")
+		] == [
+			"local-fast",
+			"local",
+		]
+		assert [s.name for s in storage_cfg.by_path("vg_san")] == ["san"]
+		assert storage_cfg.by_path("/srv") == []
+
+	def test_parses_once(self, storage_cfg, mocker: MockerFixture):
+		m_parse = mocker.patch(
+			f"{MODULE_PATH}.parse_storage_cfg", wraps=parse_storage_cfg
+		)
+		for _ in range(3):
+			storage_cfg.get("local")
+		m_parse.assert_called_once()
+
+	def test_invalidated_on_mtime(self, storage_cfg):
+		assert storage_cfg.get("local")
+		with open(storage_cfg.cfg_path, "w") as cfg_file:
+			cfg_file.write("zfspool: tank\n\tpool tank/data\n")
+		storage_cfg._mtime = -1
+		assert storage_cfg.get("local") is None
+		assert storage_cfg.get("tank").path == "tank/data"
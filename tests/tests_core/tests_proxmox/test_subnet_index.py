@@ -0,0 +1,187 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import time
+import ipaddress
+from core.proxmox.guests import GuestIndex
+from core.proxmox.subnet_index import (
+	SubnetIndex,
+	fetch_node_networks,
+	get_guest_addresses,
+	get_subnet_index,
+)
+
+MODULE_PATH = "core.proxmox.subnet_index"
+
+NODES = [
+	{"node": "pve1", "status": "online"},
+	{"node": "pve2", "status": "online"},
+	{"node": "pve3", "status": "offline"},
+]
+NODE_NETWORKS = {
+	"pve1": [
+		{"iface": "eno1", "type": "eth"},
+		{
+			"iface": "vmbr0",
+			"cidr": "10.0.0.11/24",
+			"address": "10.0.0.11",
+			"gateway": "10.0.0.1",
+		},
+		{
+			"iface": "vmbr1",
+			"cidr": "192.168.10.11/24",
+			"address": "192.168.10.11",
+		},
+	],
+	"pve2": [
+		{"iface": "vmbr0", "cidr": "10.0.0.12/24", "address": "10.0.0.12"},
+		{
+			"iface": "vmbr1",
+			"cidr": "192.168.10.2/24",
+			"gateway": "192.168.10.1",
+		},
+		# Node address held by another interface
+		{"iface": "vmbr0v10", "cidr": "10.0.0.5/24", "address": "10.0.0.5"},
+	],
+}
+
+
+class TestSubnetIndex:
+	def test_from_node_networks(self):
+		index = SubnetIndex.from_node_networks(NODE_NETWORKS)
+		vmbr0 = index.get("vmbr0")
+		assert vmbr0.network == ipaddress.ip_network("10.0.0.0/24")
+		assert vmbr0.gateway == ipaddress.ip_address("10.0.0.1")
+		assert vmbr0.reserved == [
+			ipaddress.ip_address(a)
+			for a in ("10.0.0.5", "10.0.0.11", "10.0.0.12")
+		]
+		vmbr1 = index.get("vmbr1")
+		# Gateway set by a later node
+		assert vmbr1.gateway == ipaddress.ip_address("192.168.10.1")
+		assert [str(a) for a in vmbr1.reserved] == [
+			"192.168.10.2",
+			"192.168.10.11",
+		]
+
+	def test_get_prefix(self):
+		index = SubnetIndex.from_node_networks(
+			{"pve1": NODE_NETWORKS["pve2"][2:]}
+		)
+		assert index.get("vmbr0").bridge == "vmbr0v10"
+		assert index.get("vmbr2") is None
+
+	def test_missing_iface(self):
+		with pytest.raises(ValueError, match="Missing critical key"):
+			SubnetIndex.from_node_networks({"pve1": [{"cidr": "10.0.0.1/24"}]})
+
+	def test_get_allocator(self):
+		index = SubnetIndex.from_node_networks(NODE_NETWORKS)
+		allocator = index.get_allocator(
+			"vmbr0",
+			{
+				100: [ipaddress.ip_address("10.0.0.13")],
+				101: [ipaddress.ip_address("192.168.10.13")],
+			},
+		)
+		reserved = [
+			"10.0.0.1",
+			"10.0.0.5",
+			"10.0.0.11",
+			"10.0.0.12",
+			"10.0.0.13",
+		]
+		assert not any(allocator.is_free(a) for a in reserved)
+		assert allocator.free_count == 254 - len(reserved)
+		assert str(allocator.next_free("10.0.0.11")) == "10.0.0.14"
+		assert index.get_allocator("vmbr2") is None
+
+	def test_dict_round_trip(self):
+		index = SubnetIndex.from_node_networks(NODE_NETWORKS)
+		loaded = SubnetIndex.from_dict(index.to_dict())
+		assert loaded.subnets == index.subnets
+		assert loaded.created == index.created
+
+
+def test_fetch_node_networks(mocker: MockerFixture):
+	mocker.patch(f"{MODULE_PATH}.api.pvesh_get", return_value=NODES)
+	m_get_many = mocker.patch(
+		f"{MODULE_PATH}.api.pvesh_get_many",
+		return_value=[NODE_NETWORKS["pve1"], NODE_NETWORKS["pve2"]],
+	)
+	assert fetch_node_networks() == NODE_NETWORKS
+	# Offline nodes are not queried
+	m_get_many.assert_called_once_with(
+		["/nodes/pve1/network", "/nodes/pve2/network"]
+	)
+
+
+class TestGetSubnetIndex:
+	@pytest.fixture
+	def f_fetch(self, mocker: MockerFixture):
+		return mocker.patch(
+			f"{MODULE_PATH}.fetch_node_networks", return_value=NODE_NETWORKS
+		)
+
+	def test_cached(self, f_fetch, tmp_path):
+		cache_path = str(tmp_path / "cache" / "subnet_index.json")
+		index = get_subnet_index(ttl=60, cache_path=cache_path)
+		cached = get_subnet_index(ttl=60, cache_path=cache_path)
+		f_fetch.assert_called_once()
+		assert cached.subnets == index.subnets
+
+	def test_refresh(self, f_fetch, tmp_path):
+		cache_path = str(tmp_path / "subnet_index.json")
+		get_subnet_index(ttl=60, cache_path=cache_path)
+		get_subnet_index(ttl=60, cache_path=cache_path, refresh=True)
+		assert f_fetch.call_count == 2
+
+	def test_stale(self, f_fetch, tmp_path, mocker: MockerFixture):
+		cache_path = str(tmp_path / "subnet_index.json")
+		get_subnet_index(ttl=60, cache_path=cache_path)
+		mocker.patch(f"{MODULE_PATH}.time.time", return_value=time.time() + 61)
+		get_subnet_index(ttl=60, cache_path=cache_path)
+		assert f_fetch.call_count == 2
+
+	def test_disabled(self, f_fetch, tmp_path):
+		cache_path = tmp_path / "subnet_index.json"
+		get_subnet_index(ttl=0, cache_path=str(cache_path))
+		get_subnet_index(ttl=0, cache_path=str(cache_path))
+		assert f_fetch.call_count == 2
+		assert not cache_path.exists()
+
+	def test_corrupt_cache(self, f_fetch, tmp_path):
+		cache_path = tmp_path / "subnet_index.json"
+		cache_path.write_text("{")
+		assert get_subnet_index(ttl=60, cache_path=str(cache_path)).get("vmbr0")
+		f_fetch.assert_called_once()
+
+
+def test_get_guest_addresses(tmp_path):
+	nodes_dir = tmp_path / "nodes"
+	for node, subp in (("pve1", "qemu-server"), ("pve2", "lxc")):
+		(nodes_dir / node / subp).mkdir(parents=True)
+	(nodes_dir / "pve1" / "qemu-server" / "100.conf").write_text(
+		"ipconfig0: ip=10.0.0.20/24,gw=10.0.0.1\n"
+		"ipconfig1: ip=dhcp,ip6=fd00::20/64\n"
+		"net0: virtio=BC:24:11:00:00:01,bridge=vmbr0\n"
+		"\n[snap1]\nipconfig0: ip=10.0.0.99/24\n"
+	)
+	(nodes_dir / "pve1" / "qemu-server" / "101.conf").write_text(
+		"ipconfig0: ip=dhcp\n"
+	)
+	(nodes_dir / "pve2" / "lxc" / "200.conf").write_text(
+		"net0: name=eth0,bridge=vmbr0,ip=10.0.0.30/24,ip6=auto\n"
+	)
+	guest_index = GuestIndex(
+		nodes_dir=str(nodes_dir), vmlist_path=str(tmp_path / ".vmlist")
+	)
+	assert get_guest_addresses(guest_index) == {
+		100: [
+			ipaddress.ip_address("10.0.0.20"),
+			ipaddress.ip_address("fd00::20"),
+		],
+		200: [ipaddress.ip_address("10.0.0.30")],
+	}
@@ -0,0 +1,169 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import os
+import json
+from core.proxmox.guests import GuestIndex
+from core.proxmox.storage import StorageConfig
+from core.proxmox.watch import (
+	Inotify,
+	PVEChangeEvent,
+	PVEWatcher,
+	watch_caches,
+	watching_caches,
+)
+
+MODULE_PATH = "core.proxmox.watch"
+
+
+def inotify_available() -> bool:
+	try:
+		Inotify().close()
+	except OSError:
+		return False
+	return True
+
+
+@pytest.fixture
+def f_pve_root(tmp_path):
+	(tmp_path / "nodes" / "pve1" / "qemu-server").mkdir(parents=True)
+	(tmp_path / "storage.cfg").write_text("dir: local\n\tpath /var/lib/vz\n")
+	(tmp_path / "replication.cfg").write_text("")
+	(tmp_path / ".members").write_text('{"nodename": "pve1"}')
+	return tmp_path
+
+
+def write_version(root, **versions):
+	(root / ".version").write_text(json.dumps({"version": 1, **versions}))
+
+
+class TestVersionPolling:
+	def test_file_counters(self, f_pve_root, mocker: MockerFixture):
+		write_version(f_pve_root, **{"storage.cfg": 1, "vmlist": 1})
+		watcher = PVEWatcher(root=str(f_pve_root), use_inotify=False)
+		m_callback = mocker.Mock()
+		watcher.subscribe(m_callback, kinds=("storage",))
+		assert watcher.poll(timeout=0) == []
+
+		write_version(f_pve_root, **{"storage.cfg": 2, "vmlist": 1})
+		event = PVEChangeEvent("storage", str(f_pve_root / "storage.cfg"))
+		assert watcher.poll(timeout=0) == [event]
+		m_callback.assert_called_once_with(event)
+
+	def test_guest_conf_change(self, f_pve_root):
+		write_version(f_pve_root, vmlist=1)
+		watcher = PVEWatcher(root=str(f_pve_root), use_inotify=False)
+		(f_pve_root / ".version").write_text(
+			json.dumps({"version": 2, "vmlist": 1})
+		)
+		assert watcher.poll(timeout=0) == [
+			PVEChangeEvent("guests", str(f_pve_root / "nodes"))
+		]
+
+	def test_members(self, f_pve_root):
+		write_version(f_pve_root)
+		watcher = PVEWatcher(root=str(f_pve_root), use_inotify=False)
+		(f_pve_root / ".members").write_text('{"nodename": "pve2"}')
+		assert watcher.poll(timeout=0) == [
+			PVEChangeEvent("nodes", str(f_pve_root / ".members"))
+		]
+
+
+def test_mtime_polling_without_version(f_pve_root):
+	watcher = PVEWatcher(root=str(f_pve_root), use_inotify=False)
+	replication_cfg = f_pve_root / "replication.cfg"
+	replication_cfg.write_text("local: 100-0\n")
+	os.utime(replication_cfg, ns=(1, 1))
+	assert watcher.poll(timeout=0) == [
+		PVEChangeEvent("replication", str(replication_cfg))
+	]
+	assert watcher.poll(timeout=0) == []
+
+
+@pytest.mark.skipif(not inotify_available(), reason="inotify not available")
+class TestInotify:
+	def test_guest_conf(self, f_pve_root):
+		watcher = PVEWatcher(root=str(f_pve_root))
+		assert watcher.uses_inotify
+		conf_path = f_pve_root / "nodes" / "pve1" / "qemu-server" / "100.conf"
+		conf_path.write_text("cores: 1\n")
+		assert PVEChangeEvent("guests", str(conf_path)) in watcher.poll(1)
+		watcher.stop()
+
+	def test_new_node(self, f_pve_root):
+		watcher = PVEWatcher(root=str(f_pve_root))
+		(f_pve_root / "nodes" / "pve2").mkdir()
+		assert watcher.poll(1) == [
+			PVEChangeEvent("nodes", str(f_pve_root / "nodes" / "pve2"))
+		]
+		(f_pve_root / "nodes" / "pve2" / "lrm_status").write_text("{}")
+		(f_pve_root / "nodes" / "pve2" / "lxc").mkdir()
+		assert watcher.poll(1) == [
+			PVEChangeEvent("nodes", str(f_pve_root / "nodes" / "pve2" / "lxc"))
+		]
+		conf_path = f_pve_root / "nodes" / "pve2" / "lxc" / "101.conf"
+		conf_path.write_text("cores: 1\n")
+		assert PVEChangeEvent("guests", str(conf_path)) in watcher.poll(1)
+		watcher.stop()
+
+	def test_root_files(self, f_pve_root):
+		watcher = PVEWatcher(root=str(f_pve_root))
+		(f_pve_root / "jobs.cfg").write_text("")
+		(f_pve_root / "unrelated.cfg").write_text("")
+		assert watcher.poll(1) == [
+			PVEChangeEvent("jobs", str(f_pve_root / "jobs.cfg"))
+		]
+		watcher.stop()
+
+
+def test_watch_caches(f_pve_root, mocker: MockerFixture):
+	guest_index = GuestIndex(
+		nodes_dir=str(f_pve_root / "nodes"),
+		vmlist_path=str(f_pve_root / ".vmlist"),
+	)
+	storage_config = StorageConfig(cfg_path=str(f_pve_root / "storage.cfg"))
+	mocker.patch(f"{MODULE_PATH}.get_guest_index", return_value=guest_index)
+	mocker.patch(
+		f"{MODULE_PATH}.get_storage_config", return_value=storage_config
+	)
+	write_version(f_pve_root, **{"storage.cfg": 1})
+	watcher = PVEWatcher(root=str(f_pve_root), use_inotify=False)
+	watch_caches(watcher)
+
+	assert storage_config.get("local")
+	m_get_signature = mocker.spy(guest_index, "_get_signature")
+	guest_index.all()
+	guest_index.all()
+	# Watched caches only re-check after an event
+	assert m_get_signature.call_count == 1
+
+	(f_pve_root / "storage.cfg").write_text("dir: other\n\tpath /srv\n")
+	assert storage_config.get("other") is None
+	write_version(f_pve_root, **{"storage.cfg": 2})
+	watcher.poll(timeout=0)
+	assert storage_config.get("other")
+
+
+def test_watching_caches(f_pve_root, mocker: MockerFixture):
+	guest_index = GuestIndex(nodes_dir=str(f_pve_root / "nodes"))
+	storage_config = StorageConfig(cfg_path=str(f_pve_root / "storage.cfg"))
+	mocker.patch(f"{MODULE_PATH}.get_guest_index", return_value=guest_index)
+	mocker.patch(
+		f"{MODULE_PATH}.get_storage_config", return_value=storage_config
+	)
+	mocker.patch(f"{MODULE_PATH}.PVE_CFG_ROOT", str(f_pve_root))
+	with watching_caches(poll_interval=0.01) as watcher:
+		assert watcher is not None
+		assert guest_index.watched and storage_config.watched
+	# Lookups re-check mtimes once the watcher is stopped
+	assert not guest_index.watched and not storage_config.watched
+
+
+def test_watching_caches_no_pmxcfs(tmp_path, mocker: MockerFixture):
+	mocker.patch(f"{MODULE_PATH}.PVE_CFG_ROOT", str(tmp_path / "missing"))
+	m_watch_caches = mocker.patch(f"{MODULE_PATH}.watch_caches")
+	with watching_caches() as watcher:
+		assert watcher is None
+	m_watch_caches.assert_not_called()
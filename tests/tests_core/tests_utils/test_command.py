@@ -0,0 +1,69 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import time
+import asyncio
+from core.utils.command import (
+	CommandError,
+	CommandRunner,
+	CommandTimeoutError,
+	run_command,
+	run_commands,
+)
+
+MODULE_PATH = "core.utils.command"
+
+
+class TestRunCommand:
+	def test_result(self):
+		result = run_command(["sh", "-c", "echo out; echo err >&2; exit 3"])
+		assert result.returncode == 3
+		assert result.output == "out\n"
+		assert result.errors == "err\n"
+		assert not result.ok
+		assert not result.timed_out
+
+	def test_check_raises(self):
+		with pytest.raises(CommandError) as e:
+			run_command(["sh", "-c", "echo nope >&2; exit 1"], check=True)
+		assert e.value.args == ("Bad command return code (1).", "", "nope\n")
+		assert e.value.result.returncode == 1
+
+	def test_input(self):
+		assert run_command(["cat"], input=b"data").stdout == b"data"
+
+	def test_timeout(self):
+		result = run_command(["sleep", "5"], timeout=0.1)
+		assert result.timed_out
+		assert result.duration < 5
+		with pytest.raises(CommandTimeoutError):
+			result.check()
+
+	def test_host_uses_ssh_pool(self, mocker: MockerFixture):
+		m_remote_args = mocker.patch(
+			f"{MODULE_PATH}.get_remote_args", return_value=["env"]
+		)
+		result = run_command(["echo", "remote"], host="pve2")
+		m_remote_args.assert_called_once_with("pve2", "root")
+		assert result.args == ["env", "echo", "remote"]
+		assert result.output == "remote\n"
+
+
+def test_run_commands_concurrently():
+	start = time.monotonic()
+	results = run_commands(
+		[["sh", "-c", f"sleep 0.3; echo {i}"] for i in range(4)]
+	)
+	assert time.monotonic() - start < 1.2
+	assert [r.output for r in results] == ["0\n", "1\n", "2\n", "3\n"]
+
+
+def test_runner_concurrency_limit():
+	runner = CommandRunner(concurrency=1)
+	start = time.monotonic()
+	asyncio.run(runner.run_many([["sleep", "0.2"]] * 3))
+	assert time.monotonic() - start >= 0.6
+	# A new event loop gets its own semaphore
+	asyncio.run(runner.run(["true"]))
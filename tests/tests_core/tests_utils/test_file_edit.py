@@ -0,0 +1,122 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import os
+from core.utils.file_edit import (
+	Substitution,
+	apply_substitutions,
+	edit_file,
+	write_file_atomic,
+)
+
+MODULE_PATH = "core.utils.file_edit"
+replication_cfg = """
+local: 100-0
+	target pve02
+	schedule */15
+
+local: 1000-0
+	target pve02
+""".lstrip()
+
+
+class TestSubstitution:
+	def test_regex_is_multiline(self):
+		substitution = Substitution(
+			pattern=r"^local: 100-(.*)$", replacement=r"local: 1100-\1"
+		)
+		assert substitution.apply(replication_cfg) == replication_cfg.replace(
+			"local: 100-0", "local: 1100-0"
+		)
+
+	def test_literal(self):
+		substitution = Substitution(
+			pattern="a.b", replacement="c", literal=True
+		)
+		assert substitution.apply("a.b axb a.b") == "c axb c"
+
+	def test_literal_count(self):
+		substitution = Substitution(
+			pattern="a", replacement="b", literal=True, count=1
+		)
+		assert substitution.apply("aaa") == "baa"
+
+	def test_literal_raises_callable(self):
+		substitution = Substitution(
+			pattern="a", replacement=lambda m: "b", literal=True
+		)
+		with pytest.raises(TypeError):
+			substitution.apply("a")
+
+
+def test_apply_substitutions_in_order():
+	assert (
+		apply_substitutions(
+			"abc",
+			[
+				Substitution(pattern="a", replacement="b", literal=True),
+				Substitution(pattern="b+", replacement="x"),
+			],
+		)
+		== "xc"
+	)
+
+
+class TestEditFile:
+	@pytest.fixture
+	def f_file(self, tmp_path):
+		path = tmp_path / "replication.cfg"
+		path.write_text(replication_cfg)
+		os.chmod(path, 0o640)
+		return path
+
+	def test_edit(self, f_file):
+		diff = edit_file(
+			str(f_file),
+			[
+				Substitution(
+					pattern=r"^local: 100-(.*)$", replacement=r"local: 1100-\1"
+				)
+			],
+		)
+		assert "-local: 100-0" in diff
+		assert "+local: 1100-0" in diff
+		assert f_file.read_text().startswith("local: 1100-0\n")
+		assert os.stat(f_file).st_mode & 0o777 == 0o640
+		assert os.listdir(f_file.parent) == ["replication.cfg"]
+
+	def test_dry_run(self, f_file):
+		diff = edit_file(
+			str(f_file),
+			[Substitution(pattern="pve02", replacement="pve03", literal=True)],
+			dry_run=True,
+		)
+		assert diff.count("+\ttarget pve03") == 2
+		assert f_file.read_text() == replication_cfg
+
+	def test_no_changes_skips_write(self, f_file, mocker: MockerFixture):
+		m_write = mocker.patch(f"{MODULE_PATH}.write_file_atomic")
+		assert (
+			edit_file(
+				str(f_file),
+				[
+					Substitution(
+						pattern="missing", replacement="x", literal=True
+					)
+				],
+			)
+			== ""
+		)
+		m_write.assert_not_called()
+
+
+def test_write_file_atomic_cleans_up(tmp_path, mocker: MockerFixture):
+	path = tmp_path / "file"
+	path.write_text("old")
+	mocker.patch("os.rename", side_effect=OSError)
+	with pytest.raises(OSError):
+		write_file_atomic(str(path), "new")
+	assert path.read_text() == "old"
+	assert os.listdir(tmp_path) == ["file"]
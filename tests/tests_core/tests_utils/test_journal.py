@@ -0,0 +1,71 @@
+########################### Standard Pytest Imports ############################
+import pytest
+
+################################################################################
+from core.utils.journal import (
+	Journal,
+	JOURNAL_DONE,
+	JOURNAL_FAILED,
+	JOURNAL_STARTED,
+)
+
+MODULE_PATH = "core.utils.journal"
+
+
+class TestJournal:
+	def test_round_trip(self, tmp_path):
+		path = str(tmp_path / "journals" / "run.jsonl")
+		journal = Journal(path)
+		journal.record(
+			None, "mapping", JOURNAL_DONE, {"mapping": {"100": 1100}}
+		)
+		journal.record("100:1100", "plan", JOURNAL_DONE, {"host": "pve1"})
+		journal.record("100:1100", "move_config", JOURNAL_STARTED)
+
+		loaded = Journal(path)
+		assert loaded.keys() == ["100:1100"]
+		assert loaded.get_data(None, "mapping") == {"mapping": {"100": 1100}}
+		assert loaded.is_done("100:1100", "plan")
+		assert not loaded.is_done("100:1100", "move_config")
+		assert not loaded.is_done("100:1100", "finished")
+		assert [e["step"] for e in loaded.steps("100:1100")] == [
+			"plan",
+			"move_config",
+		]
+
+	def test_skips_corrupt_line(self, tmp_path):
+		path = tmp_path / "run.jsonl"
+		journal = Journal(str(path))
+		journal.record("100:1100", "plan", JOURNAL_DONE)
+		# Crash in the middle of a write
+		with open(path, "a") as journal_file:
+			journal_file.write('{"time": 1, "key": "100:11')
+
+		loaded = Journal(str(path))
+		assert loaded.is_done("100:1100", "plan")
+		assert len(loaded.steps("100:1100")) == 1
+
+	def test_in_memory(self, tmp_path):
+		journal = Journal()
+		journal.record("100:1100", "plan", JOURNAL_DONE)
+		assert journal.is_done("100:1100", "plan")
+		assert list(tmp_path.iterdir()) == []
+
+	def test_step_done(self, tmp_path):
+		journal = Journal(str(tmp_path / "run.jsonl"))
+		with journal.step("100:1100", "reassign_disks") as step_data:
+			assert journal.get("100:1100", "reassign_disks")["state"] == (
+				JOURNAL_STARTED
+			)
+			step_data["failed"] = []
+		assert journal.is_done("100:1100", "reassign_disks")
+		assert journal.get_data("100:1100", "reassign_disks") == {"failed": []}
+
+	def test_step_failed(self, tmp_path):
+		journal = Journal(str(tmp_path / "run.jsonl"))
+		with pytest.raises(OSError):
+			with journal.step("100:1100", "move_config"):
+				raise OSError("mv failed")
+		entry = Journal(journal.path).get("100:1100", "move_config")
+		assert entry["state"] == JOURNAL_FAILED
+		assert entry["data"] == {"error": "mv failed"}
@@ -0,0 +1,50 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import os
+import sys
+from core.utils.lazy import LazyModule, lazy_import
+
+MODULE_PATH = "core.utils.lazy"
+
+
+@pytest.fixture
+def f_unimported():
+	"""A stdlib module that is not imported yet."""
+	name = "colorsys"
+	module = sys.modules.pop(name, None)
+	yield name
+	if module is not None:
+		sys.modules[name] = module
+
+
+def test_imported_on_first_access(f_unimported):
+	module = lazy_import(f_unimported)
+	assert isinstance(module, LazyModule)
+	assert not module.loaded
+	assert f_unimported not in sys.modules
+	assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+	assert module.loaded
+	assert f_unimported in sys.modules
+
+
+def test_already_imported():
+	assert lazy_import("os") is os
+
+
+def test_patch_forwarded(f_unimported, mocker: MockerFixture):
+	module = lazy_import(f_unimported)
+	m_rgb_to_hsv = mocker.patch.object(module, "rgb_to_hsv")
+	# Other importers of the module see the mock as well
+	assert sys.modules[f_unimported].rgb_to_hsv is m_rgb_to_hsv
+	mocker.stopall()
+	assert module.rgb_to_hsv is not m_rgb_to_hsv
+	assert sys.modules[f_unimported].rgb_to_hsv is module.rgb_to_hsv
+
+
+def test_missing_module():
+	module = lazy_import("core.utils.does_not_exist")
+	with pytest.raises(ModuleNotFoundError):
+		module.anything
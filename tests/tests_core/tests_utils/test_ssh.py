@@ -0,0 +1,58 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import os
+import subprocess
+from core.utils.ssh import SSH_BIN, SSHSessionPool
+
+MODULE_PATH = "core.utils.ssh"
+
+
+class TestSSHSessionPool:
+	def test_remote_args(self, tmp_path):
+		pool = SSHSessionPool(control_dir=str(tmp_path), control_persist=60)
+		args = pool.remote_args("pve02", "admin")
+		assert args[0] == SSH_BIN
+		assert args[-1] == "admin@pve02"
+		assert "ControlMaster=auto" in args
+		assert f"ControlPath={tmp_path}/%C" in args
+		assert "ControlPersist=60" in args
+
+	def test_remote_args_raises_no_host(self, tmp_path):
+		pool = SSHSessionPool(control_dir=str(tmp_path))
+		with pytest.raises(ValueError, match="host is required"):
+			pool.remote_args("")
+
+	def test_close(self, mocker: MockerFixture):
+		m_call = mocker.patch("subprocess.call", return_value=0)
+		pool = SSHSessionPool()
+		pool.remote_args("pve02")
+		pool.remote_args("pve02")
+		control_dir = pool.control_dir
+		assert os.path.isdir(control_dir)
+
+		pool.close()
+		m_call.assert_called_once_with(
+			[
+				SSH_BIN,
+				"-o",
+				f"ControlPath={control_dir}/%C",
+				"-O",
+				"exit",
+				"root@pve02",
+			],
+			stdout=subprocess.DEVNULL,
+			stderr=subprocess.DEVNULL,
+		)
+		assert not os.path.exists(control_dir)
+
+	def test_close_keeps_external_control_dir(
+		self, tmp_path, mocker: MockerFixture
+	):
+		mocker.patch("subprocess.call", return_value=0)
+		pool = SSHSessionPool(control_dir=str(tmp_path))
+		pool.remote_args("pve02")
+		pool.close()
+		assert os.path.isdir(tmp_path)
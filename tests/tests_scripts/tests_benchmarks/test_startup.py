@@ -0,0 +1,65 @@
+########################### Standard Pytest Imports ############################
+import pytest
+
+################################################################################
+import os
+from scripts.benchmarks.startup import (
+	DEFAULT_BUDGET_MS,
+	get_total_import_us,
+	measure_startup,
+	parse_importtime,
+)
+
+MODULE_PATH = "scripts.benchmarks.startup"
+# Wall-clock budgets are only checked on request, shared runners are too noisy
+BENCHMARK_ENV_VAR = "PVE_TOOLKIT_BENCHMARKS"
+BUDGET_MARGIN = 1.25
+GUEST_SCRIPTS = (
+	"scripts/guests/change_id.py",
+	"scripts/guests/cloudinit_ip_based_on_host.py",
+	"scripts/guests/disk_inventory.py",
+	"scripts/guests/list.py",
+	"scripts/guests/staged_net_change.py",
+)
+TOOLKIT_PATH = os.path.dirname(
+	os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+)
+IMPORTTIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |        420 | io
+import time:        50 |         50 |     _sre
+import time:       200 |        250 |   re
+import time:       100 |        350 | argparse
+"""
+
+
+def test_parse_importtime():
+	assert parse_importtime(IMPORTTIME_OUTPUT) == {
+		"_io": 120,
+		"io": 420,
+		"_sre": 50,
+		"re": 250,
+		"argparse": 350,
+	}
+
+
+def test_get_total_import_us():
+	# Only top-level imports, their cumulative time includes nested ones
+	assert get_total_import_us(IMPORTTIME_OUTPUT) == 770
+
+
+@pytest.mark.parametrize("script", GUEST_SCRIPTS)
+def test_startup_excluded_modules(script):
+	# Heavy modules are imported on first use, not on startup
+	result = measure_startup(TOOLKIT_PATH, script, runs=1)
+	assert result.excluded_modules == []
+
+
+@pytest.mark.skipif(
+	not os.environ.get(BENCHMARK_ENV_VAR),
+	reason=f"set {BENCHMARK_ENV_VAR}=1 to check startup budgets",
+)
+@pytest.mark.parametrize("script", GUEST_SCRIPTS)
+def test_startup_budget(script):
+	result = measure_startup(TOOLKIT_PATH, script, runs=3)
+	assert result.import_ms <= DEFAULT_BUDGET_MS * BUDGET_MARGIN
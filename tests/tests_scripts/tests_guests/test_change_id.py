@@ -0,0 +1,409 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+from core.proxmox.storage import PVEStorage
+from core.utils.journal import Journal, JOURNAL_DONE, JOURNAL_STARTED
+from scripts.guests.change_id import (
+	parse_id_mapping_file,
+	validate_id_mapping,
+	change_guest_id,
+	change_guest_ids,
+	get_journal_mapping,
+	rollback_guest_id_change,
+	rollback_guest_id_changes,
+	GuestIdChangeError,
+)
+
+MODULE_PATH = "scripts.guests.change_id"
+
+
+@pytest.fixture
+def f_existing_guests(mocker: MockerFixture):
+	existing = {100, 101, 102, 200}
+	m_index = mocker.Mock()
+	m_index.exists.side_effect = lambda guest_id: int(guest_id) in existing
+	mocker.patch(f"{MODULE_PATH}.get_guest_index", return_value=m_index)
+	return existing
+
+
+class TestParseIdMappingFile:
+	def test_lines(self, tmp_path):
+		mapping_file = tmp_path / "mapping.txt"
+		mapping_file.write_text(
+			"# origin target\n100 1100\n101,1101\n\n102:1102 # comment\n"
+		)
+		assert parse_id_mapping_file(str(mapping_file)) == {
+			100: 1100,
+			101: 1101,
+			102: 1102,
+		}
+
+	def test_json(self, tmp_path):
+		mapping_file = tmp_path / "mapping.json"
+		mapping_file.write_text('{"100": 1100, "101": "1101"}')
+		assert parse_id_mapping_file(str(mapping_file)) == {
+			100: 1100,
+			101: 1101,
+		}
+
+	def test_raises_duplicate_origin(self, tmp_path):
+		mapping_file = tmp_path / "mapping.txt"
+		mapping_file.write_text("100 1100\n100 1101\n")
+		with pytest.raises(ValueError, match="mapped more than once"):
+			parse_id_mapping_file(str(mapping_file))
+
+	def test_raises_bad_line(self, tmp_path):
+		mapping_file = tmp_path / "mapping.txt"
+		mapping_file.write_text("100 1100 1200\n")
+		with pytest.raises(ValueError, match="Invalid mapping on line 1"):
+			parse_id_mapping_file(str(mapping_file))
+
+
+class TestValidateIdMapping:
+	def test_independent(self, f_existing_guests):
+		chains = validate_id_mapping({100: 1100, 101: 1101})
+		assert sorted(chains) == [[(100, 1100)], [(101, 1101)]]
+
+	def test_chain_order(self, f_existing_guests):
+		# 101 must be freed before 100 can take its ID
+		assert validate_id_mapping({100: 101, 101: 1101}) == [
+			[(101, 1101), (100, 101)]
+		]
+
+	def test_raises_existing_target(self, f_existing_guests):
+		with pytest.raises(ValueError, match=r"Target ID \(200\) already"):
+			validate_id_mapping({100: 200})
+
+	def test_raises_target_collision(self, f_existing_guests):
+		with pytest.raises(ValueError) as e:
+			validate_id_mapping({100: 1100, 101: 1100})
+		assert "Target ID 1100 is used by more than one guest." in e.value.args
+
+	def test_raises_cycle(self, f_existing_guests):
+		with pytest.raises(ValueError) as e:
+			validate_id_mapping({100: 101, 101: 100, 102: 1102})
+		assert "ID mapping has cycles (100, 101)." in e.value.args
+
+	def test_raises_missing_origin(self, f_existing_guests):
+		with pytest.raises(ValueError, match=r"Origin ID \(300\) does not"):
+			validate_id_mapping({300: 1300})
+
+	def test_started_origin(self, f_existing_guests):
+		# A resumed change may already have its configuration on the target
+		assert validate_id_mapping({300: 200}, started={300}) == [[(300, 200)]]
+
+
+class TestChangeGuestIds:
+	def test_chain_failure_skips_dependents(
+		self, f_existing_guests, mocker: MockerFixture
+	):
+		mocker.patch(f"{MODULE_PATH}.get_guest_lock_keys", return_value=set())
+
+		def _change(id_origin, id_target, **kwargs):
+			if id_origin == 101:
+				raise GuestIdChangeError(3, "not stopped")
+
+		m_change = mocker.patch(
+			f"{MODULE_PATH}.change_guest_id", side_effect=_change
+		)
+		m_backup_jobs = mocker.patch(
+			f"{MODULE_PATH}.change_guest_ids_on_backup_jobs"
+		)
+		results = change_guest_ids({100: 101, 101: 1101, 102: 1102})
+		assert results[(102, 1102)] is None
+		assert isinstance(results[(101, 1101)], GuestIdChangeError)
+		assert isinstance(results[(100, 101)], GuestIdChangeError)
+		assert m_change.call_count == 2
+		# Backup jobs are only re-targeted once, for changed guests
+		m_backup_jobs.assert_called_once_with(
+			mapping={102: 1102}, dry_run=False
+		)
+
+	def test_lock_keys_failure_fails_chain(
+		self, f_existing_guests, mocker: MockerFixture
+	):
+		def _lock_keys(id_origin, plan=None):
+			if id_origin == 100:
+				raise Exception("Storage gone not found in storage.cfg")
+			return {f"pve1/local-{id_origin}"}
+
+		mocker.patch(
+			f"{MODULE_PATH}.get_guest_lock_keys", side_effect=_lock_keys
+		)
+		m_change = mocker.patch(f"{MODULE_PATH}.change_guest_id")
+		mocker.patch(f"{MODULE_PATH}.change_guest_ids_on_backup_jobs")
+		results = change_guest_ids({100: 101, 101: 1101, 102: 1102})
+		assert results[(102, 1102)] is None
+		assert "storage.cfg" in str(results[(100, 101)])
+		assert isinstance(results[(101, 1101)], GuestIdChangeError)
+		m_change.assert_called_once()
+		assert m_change.call_args.kwargs["id_origin"] == 102
+
+	def test_uncaught_chain_error_is_recorded(
+		self, f_existing_guests, mocker: MockerFixture
+	):
+		mocker.patch(f"{MODULE_PATH}.get_guest_lock_keys", return_value=set())
+
+		def _change(id_origin, id_target, **kwargs):
+			if id_origin == 101:
+				# Not an Exception, escapes the chain's error handling
+				raise SystemExit(1)
+
+		mocker.patch(f"{MODULE_PATH}.change_guest_id", side_effect=_change)
+		m_backup_jobs = mocker.patch(
+			f"{MODULE_PATH}.change_guest_ids_on_backup_jobs"
+		)
+		results = change_guest_ids({100: 101, 101: 1101, 102: 1102})
+		assert results[(102, 1102)] is None
+		assert isinstance(results[(101, 1101)], SystemExit)
+		assert isinstance(results[(100, 101)], SystemExit)
+		m_backup_jobs.assert_called_once_with(
+			mapping={102: 1102}, dry_run=False
+		)
+
+	def test_validated_chains_are_reused(self, mocker: MockerFixture):
+		m_validate = mocker.patch(f"{MODULE_PATH}.validate_id_mapping")
+		mocker.patch(f"{MODULE_PATH}.get_guest_lock_keys", return_value=set())
+		m_change = mocker.patch(f"{MODULE_PATH}.change_guest_id")
+		mocker.patch(f"{MODULE_PATH}.change_guest_ids_on_backup_jobs")
+		results = change_guest_ids(
+			{100: 1100}, chains=[[(100, 1100)]], journal=Journal(None)
+		)
+		assert results == {(100, 1100): None}
+		m_validate.assert_not_called()
+		m_change.assert_called_once()
+
+
+KEY = "100:1100"
+PLAN = {
+	"host": "pve1",
+	"old_cfg_path": "/etc/pve/nodes/pve1/qemu-server/100.conf",
+	"new_cfg_path": "/etc/pve/nodes/pve1/qemu-server/1100.conf",
+	"disks": [
+		{"interface": "scsi0", "storage": "local-lvm", "name": "vm-100-disk-0"},
+		{"interface": "scsi1", "storage": "local-lvm", "name": "vm-100-disk-1"},
+	],
+	"replication_jobs": {
+		"100-0": {
+			"comment": "",
+			"target": "pve2",
+			"schedule": "*/15",
+			"source": "pve1",
+		}
+	},
+	"snapshots": [],
+}
+
+
+@pytest.fixture
+def f_journal(tmp_path):
+	"""Journal of a change interrupted after renaming its first disk."""
+	journal = Journal(str(tmp_path / "change_id.jsonl"))
+	journal.record(None, "mapping", JOURNAL_DONE, {"mapping": {"100": 1100}})
+	journal.record(KEY, "plan", JOURNAL_DONE, PLAN)
+	for step in ("delete_replication_jobs", "backup_jobs", "move_config"):
+		journal.record(KEY, step, JOURNAL_STARTED)
+		journal.record(KEY, step, JOURNAL_DONE)
+	journal.record(KEY, "reassign_disks", JOURNAL_STARTED)
+	journal.record(
+		KEY,
+		"disk:local-lvm:vm-100-disk-0",
+		JOURNAL_DONE,
+		{"new_volume": "local-lvm:vm-1100-disk-0"},
+	)
+	return Journal(journal.path)
+
+
+@pytest.fixture
+def f_host(mocker: MockerFixture):
+	mocker.patch(f"{MODULE_PATH}.socket.gethostname", return_value="pve1")
+	mocker.patch(
+		f"{MODULE_PATH}.get_storage_cfg",
+		side_effect=lambda name: PVEStorage(
+			name=name, type="lvmthin", path="pve"
+		),
+	)
+	m_run_command = mocker.patch(f"{MODULE_PATH}.run_command")
+	m_run_command.return_value.ok = True
+	return m_run_command
+
+
+class TestChangeGuestIdJournal:
+	def test_resume_skips_done_steps(
+		self, f_journal, f_host, mocker: MockerFixture
+	):
+		m_status = mocker.patch(
+			f"{MODULE_PATH}.get_guest_status", return_value="stopped"
+		)
+		m_reassign = mocker.patch(
+			f"{MODULE_PATH}.reassign_disks", return_value=[]
+		)
+		m_rewrite = mocker.patch(f"{MODULE_PATH}.rewrite_guest_cfg_volumes")
+		m_backup_jobs = mocker.patch(
+			f"{MODULE_PATH}.change_guest_ids_on_backup_jobs"
+		)
+		m_plan = mocker.patch(f"{MODULE_PATH}.get_guest_id_change_plan")
+
+		change_guest_id(100, 1100, confirm=False, journal=f_journal)
+
+		m_plan.assert_not_called()
+		m_backup_jobs.assert_not_called()
+		# The configuration was already moved to the target ID
+		m_status.assert_called_once_with(guest_id=1100, remote_args=None)
+		m_rewrite.assert_called_once_with(
+			PLAN["new_cfg_path"],
+			{"local-lvm:vm-100-disk-0": "local-lvm:vm-1100-disk-0"},
+		)
+		disks = m_reassign.call_args.kwargs["disks"]
+		assert [name for _, name in disks] == ["vm-100-disk-1"]
+		# Only the replication jobs are re-created
+		assert [c.args[0][:2] for c in f_host.call_args_list] == [
+			["pvesr", "create-local-job"]
+		]
+		assert Journal(f_journal.path).is_done(KEY, "finished")
+
+	def test_failed_disks_not_done(
+		self, f_journal, f_host, mocker: MockerFixture
+	):
+		mocker.patch(f"{MODULE_PATH}.get_guest_status", return_value="stopped")
+		mocker.patch(
+			f"{MODULE_PATH}.reassign_disks", return_value=["vm-100-disk-1"]
+		)
+		mocker.patch(f"{MODULE_PATH}.rewrite_guest_cfg_volumes")
+
+		with pytest.raises(GuestIdChangeError) as e:
+			change_guest_id(100, 1100, confirm=False, journal=f_journal)
+		assert e.value.code == 7
+		journal = Journal(f_journal.path)
+		assert journal.get(KEY, "reassign_disks")["state"] == "failed"
+		assert journal.get_data(KEY, "reassign_disks")["failed"] == [
+			"vm-100-disk-1"
+		]
+		assert journal.get(KEY, "create_replication_jobs") is None
+		assert not journal.is_done(KEY, "finished")
+
+	def test_failed_replication_not_done(
+		self, f_journal, f_host, mocker: MockerFixture
+	):
+		mocker.patch(f"{MODULE_PATH}.get_guest_status", return_value="stopped")
+		mocker.patch(f"{MODULE_PATH}.reassign_disks", return_value=[])
+		mocker.patch(f"{MODULE_PATH}.rewrite_guest_cfg_volumes")
+		f_host.return_value.ok = False
+
+		with pytest.raises(GuestIdChangeError) as e:
+			change_guest_id(100, 1100, confirm=False, journal=f_journal)
+		assert e.value.code == 8
+		journal = Journal(f_journal.path)
+		assert journal.get(KEY, "create_replication_jobs")["state"] == "failed"
+		assert not journal.is_done(KEY, "finished")
+
+		# Resuming only creates the jobs that failed
+		f_host.return_value.ok = True
+		change_guest_id(100, 1100, confirm=False, journal=journal)
+		assert journal.is_done(KEY, "finished")
+		assert journal.get_data(KEY, "create_replication_jobs")["created"] == [
+			"1100-0"
+		]
+
+	def test_resume_moved_config(self, tmp_path, f_host, mocker: MockerFixture):
+		old_cfg_path = tmp_path / "100.conf"
+		new_cfg_path = tmp_path / "1100.conf"
+		new_cfg_path.write_text("")
+		plan = {
+			**PLAN,
+			"old_cfg_path": str(old_cfg_path),
+			"new_cfg_path": str(new_cfg_path),
+			"disks": [],
+			"replication_jobs": {},
+		}
+		journal = Journal(str(tmp_path / "change_id.jsonl"))
+		journal.record(KEY, "plan", JOURNAL_DONE, plan)
+		for step in ("delete_replication_jobs", "backup_jobs"):
+			journal.record(KEY, step, JOURNAL_DONE)
+		# Interrupted after the configuration was moved
+		journal.record(KEY, "move_config", JOURNAL_STARTED)
+		mocker.patch(f"{MODULE_PATH}.get_guest_status", return_value="stopped")
+		mocker.patch(f"{MODULE_PATH}.reassign_disks", return_value=[])
+
+		change_guest_id(100, 1100, confirm=False, journal=journal)
+		f_host.assert_not_called()
+		assert journal.is_done(KEY, "move_config")
+		assert journal.is_done(KEY, "finished")
+
+	def test_replication_removal_timeout(
+		self, tmp_path, f_host, mocker: MockerFixture
+	):
+		journal = Journal(str(tmp_path / "change_id.jsonl"))
+		journal.record(KEY, "plan", JOURNAL_DONE, PLAN)
+		mocker.patch(f"{MODULE_PATH}.get_guest_status", return_value="stopped")
+		mocker.patch(
+			f"{MODULE_PATH}.get_replication_statuses",
+			return_value={100: {"100-0": "OK"}},
+		)
+		mocker.patch(
+			f"{MODULE_PATH}.wait_for_replication_jobs_removal",
+			return_value={100: {"100-0": "OK"}},
+		)
+		m_backup_jobs = mocker.patch(
+			f"{MODULE_PATH}.change_guest_ids_on_backup_jobs"
+		)
+
+		with pytest.raises(GuestIdChangeError) as e:
+			change_guest_id(100, 1100, confirm=False, journal=journal)
+		assert e.value.code == 4
+		assert journal.get(KEY, "delete_replication_jobs")["state"] == "failed"
+		m_backup_jobs.assert_not_called()
+
+	def test_rollback(self, f_journal, f_host, mocker: MockerFixture):
+		m_status = mocker.patch(
+			f"{MODULE_PATH}.get_guest_status", return_value="stopped"
+		)
+		mocker.patch(f"{MODULE_PATH}.os.path.exists", return_value=True)
+		m_reassign = mocker.patch(
+			f"{MODULE_PATH}.reassign_disks", return_value=[]
+		)
+		m_backup_jobs = mocker.patch(
+			f"{MODULE_PATH}.change_guest_ids_on_backup_jobs"
+		)
+
+		assert rollback_guest_id_change(f_journal, KEY)
+		# Only the journaled disk is renamed back
+		m_reassign.assert_called_once()
+		assert [name for _, name in m_reassign.call_args.kwargs["disks"]] == [
+			"vm-1100-disk-0"
+		]
+		assert m_reassign.call_args.kwargs["new_guest_id"] == 100
+		# The guest is checked at its current ID
+		assert m_status.call_args.kwargs["guest_id"] == 1100
+		m_backup_jobs.assert_called_once_with(
+			mapping={1100: 100}, dry_run=False
+		)
+		assert [c.args[0] for c in f_host.call_args_list] == [
+			["/usr/bin/mv", PLAN["new_cfg_path"], PLAN["old_cfg_path"]],
+			"pvesr create-local-job 100-0 pve2 --schedule */15 --comment".split()
+			+ ['""'],
+		]
+		assert Journal(f_journal.path).is_done(KEY, "rolled_back")
+		# Rolled back changes are not resumed
+		m_change = mocker.patch(f"{MODULE_PATH}.change_guest_id")
+		assert (
+			change_guest_ids(get_journal_mapping(f_journal), journal=f_journal)
+			== {}
+		)
+		m_change.assert_not_called()
+
+	def test_rollback_guest_not_stopped(
+		self, f_journal, f_host, mocker: MockerFixture
+	):
+		mocker.patch(f"{MODULE_PATH}.get_guest_status", return_value="running")
+		m_reassign = mocker.patch(f"{MODULE_PATH}.reassign_disks")
+
+		with pytest.raises(GuestIdChangeError) as e:
+			rollback_guest_id_change(f_journal, KEY)
+		assert e.value.code == 3
+		m_reassign.assert_not_called()
+		f_host.assert_not_called()
+		assert not Journal(f_journal.path).is_done(KEY, "rolled_back")
+		assert rollback_guest_id_changes(f_journal) == [KEY]
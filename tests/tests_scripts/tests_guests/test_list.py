@@ -0,0 +1,203 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import io
+import json
+from core.proxmox.api import PVEAPIError
+from core.proxmox.guests import GuestIndex
+from core.utils.command import CommandError, CommandResult
+from scripts.guests.list import (
+	GuestResource,
+	filter_guest_resources,
+	format_table,
+	get_guest_resources,
+	get_pool_members,
+	vmid_range,
+	write_guest_list,
+)
+
+MODULE_PATH = "scripts.guests.list"
+
+CLUSTER_RESOURCES = [
+	{
+		"vmid": 100,
+		"name": "web",
+		"type": "qemu",
+		"node": "pve1",
+		"status": "running",
+		"pool": "prod",
+		"tags": "web;debian",
+	},
+	{
+		"vmid": 101,
+		"name": "db",
+		"type": "lxc",
+		"node": "pve2",
+		"status": "stopped",
+	},
+	{
+		"vmid": 250,
+		"name": "test",
+		"type": "qemu",
+		"node": "pve2",
+		"status": "running",
+		"tags": "debian",
+	},
+]
+
+
+@pytest.fixture
+def f_guests():
+	return [
+		GuestResource(100, "web", "vm", "pve1", "running", "prod", ["web"]),
+		GuestResource(101, "db", "ct", "pve2", "stopped"),
+		GuestResource(250, "test", "vm", "pve2", "running", None, ["web"]),
+	]
+
+
+@pytest.fixture
+def f_pve_nodes(tmp_path, mocker: MockerFixture):
+	nodes_dir = tmp_path / "nodes"
+	(nodes_dir / "pve1" / "qemu-server").mkdir(parents=True)
+	(nodes_dir / "pve2" / "lxc").mkdir(parents=True)
+	(nodes_dir / "pve1" / "qemu-server" / "100.conf").write_text(
+		"name: web\ntags: web;debian\nscsi0: local-lvm:vm-100-disk-0,size=8G\n"
+		"\n[snap1]\nscsi0: local-lvm:vm-100-disk-0,size=8G\n"
+		"vmstate: zfs:vm-100-state-snap1\n"
+	)
+	(nodes_dir / "pve2" / "lxc" / "101.conf").write_text(
+		"hostname: db\nrootfs: zfs:subvol-101-disk-0,size=8G\n"
+	)
+	(tmp_path / "user.cfg").write_text(
+		"user:root@pam:1:0:::::\npool:prod::100,102:local:\n"
+	)
+	guest_index = GuestIndex(
+		nodes_dir=str(nodes_dir), vmlist_path=str(tmp_path / ".vmlist")
+	)
+	mocker.patch(
+		"core.proxmox.guests.get_guest_index", return_value=guest_index
+	)
+	mocker.patch("core.proxmox.guests.socket.gethostname", return_value="pve1")
+	mocker.patch("core.proxmox.guests.get_running_vm_ids", return_value={100})
+	mocker.patch(
+		f"{MODULE_PATH}.get_pool_members",
+		return_value=get_pool_members(str(tmp_path / "user.cfg")),
+	)
+	return tmp_path
+
+
+def test_vmid_range():
+	assert vmid_range("100") == (100, 100)
+	assert vmid_range("100-199") == (100, 199)
+	with pytest.raises(ValueError):
+		vmid_range("199-100")
+	with pytest.raises(ValueError):
+		vmid_range("abc")
+
+
+class TestGetGuestResources:
+	def test_api(self, mocker: MockerFixture):
+		m_resources = mocker.patch(
+			f"{MODULE_PATH}.get_cluster_resources",
+			return_value=CLUSTER_RESOURCES,
+		)
+		guests = get_guest_resources()
+		m_resources.assert_called_once_with()
+		assert guests[0] == GuestResource(
+			100, "web", "vm", "pve1", "running", "prod", ["web", "debian"]
+		)
+		assert guests[1].type == "ct"
+		assert guests[1].tags == []
+
+	def test_offline(self, f_pve_nodes, mocker: MockerFixture):
+		m_resources = mocker.patch(f"{MODULE_PATH}.get_cluster_resources")
+		guests = get_guest_resources(offline=True)
+		m_resources.assert_not_called()
+		assert sorted(guests, key=lambda g: g.vmid) == [
+			GuestResource(
+				100, "web", "vm", "pve1", "running", "prod", ["web", "debian"]
+			),
+			GuestResource(101, "db", "ct", "pve2", "unknown"),
+		]
+
+	def test_api_failure_scans_cfgs(self, f_pve_nodes, mocker: MockerFixture):
+		mocker.patch(
+			f"{MODULE_PATH}.get_cluster_resources",
+			side_effect=CommandError(
+				CommandResult(["pvesh"], 1, b"", b"ipcc_send_rec failed", 0.1)
+			),
+		)
+		assert {g.vmid for g in get_guest_resources()} == {100, 101}
+
+	def test_api_error_scans_cfgs(self, f_pve_nodes, mocker: MockerFixture):
+		mocker.patch(
+			f"{MODULE_PATH}.get_cluster_resources",
+			side_effect=PVEAPIError(403, "Permission check failed", None),
+		)
+		assert {g.vmid for g in get_guest_resources()} == {100, 101}
+
+
+class TestFilterGuestResources:
+	@pytest.mark.parametrize(
+		"filters, expected",
+		(
+			({}, [100, 101, 250]),
+			({"nodes": ["pve2"]}, [101, 250]),
+			({"guest_type": "ct"}, [101]),
+			({"status": "running"}, [100, 250]),
+			({"tags": ["web"]}, [100, 250]),
+			({"tags": ["web", "other"]}, []),
+			({"pool": "prod"}, [100]),
+			({"vmid_ranges": [(100, 199)]}, [100, 101]),
+			({"vmid_ranges": [(101, 101), (200, 299)]}, [101, 250]),
+			({"nodes": ["pve2"], "status": "running"}, [250]),
+		),
+	)
+	def test_filters(self, f_guests, filters, expected):
+		guests = filter_guest_resources(f_guests, **filters)
+		assert [g.vmid for g in guests] == expected
+
+	def test_storage_reads_cfgs(self, f_pve_nodes):
+		guests = [
+			GuestResource(100, "web", "vm", "pve1", "running"),
+			GuestResource(101, "db", "ct", "pve2", "stopped"),
+		]
+		# Snapshot volumes count as well
+		assert [
+			g.vmid for g in filter_guest_resources(guests, storage="zfs")
+		] == [100, 101]
+		assert guests[0].storages == ["local-lvm", "zfs"]
+		assert [
+			g.vmid for g in filter_guest_resources(guests, storage="local-lvm")
+		] == [100]
+
+
+class TestWriteGuestList:
+	def test_table(self, f_guests):
+		output = io.StringIO()
+		write_guest_list(
+			f_guests[:2], ["vmid", "name", "tags"], "table", output
+		)
+		assert output.getvalue() == "VMID NAME TAGS\n100  web  web\n101  db\n"
+
+	def test_json(self, f_guests):
+		output = io.StringIO()
+		write_guest_list(f_guests[:1], ["vmid", "tags", "pool"], "json", output)
+		assert json.loads(output.getvalue()) == [
+			{"vmid": 100, "tags": ["web"], "pool": "prod"}
+		]
+
+	def test_csv(self, f_guests):
+		output = io.StringIO()
+		write_guest_list(f_guests[:2], ["vmid", "pool"], "csv", output)
+		assert output.getvalue().splitlines() == [
+			"vmid,pool",
+			"100,prod",
+			"101,",
+		]
+
+
+def test_format_table_without_rows():
+	assert format_table([], ["vmid", "name"]) == "VMID NAME"
@@ -0,0 +1,174 @@
+########################### Standard Pytest Imports ############################
+import pytest
+from pytest_mock import MockerFixture
+
+################################################################################
+import threading
+from core.utils.command import CommandResult
+from scripts.guests.staged_net_change import (
+	GuestNetChange,
+	get_guest_net_changes,
+	get_guest_net_rollback,
+	get_latest_manifest_path,
+	read_rollback_manifest,
+	run_guest_net_changes,
+	write_rollback_manifest,
+)
+
+MODULE_PATH = "scripts.guests.staged_net_change"
+
+GUEST_NET_ORIG = {
+	100: {
+		0: {"virtio": "AA:BB", "bridge": "vmbr0", "tag": "10"},
+		1: {"virtio": "AA:CC", "bridge": "vmbr1"},
+		2: {"virtio": "AA:DD", "bridge": "vmbr2"},
+	},
+	200: {0: {"name": "eth0", "bridge": "vmbr0", "tag": "10"}},
+}
+GUEST_NET_MAP = {
+	100: {0: {"tag": 20}, 1: {"tag": 30}},
+	200: {0: {"tag": None}},
+}
+
+
+@pytest.fixture
+def f_guests(mocker: MockerFixture):
+	hosts = {100: "pve1", 200: "pve2"}
+	mocker.patch(
+		f"{MODULE_PATH}.get_guest_cfg_path",
+		side_effect=lambda guest_id, get_host: hosts[int(guest_id)],
+	)
+	mocker.patch(
+		f"{MODULE_PATH}.get_guest_is_ct",
+		side_effect=lambda guest_id: int(guest_id) == 200,
+	)
+	mocker.patch(f"{MODULE_PATH}.socket.gethostname", return_value="pve1")
+	mocker.patch(
+		f"{MODULE_PATH}.get_remote_args",
+		side_effect=lambda host: ["ssh", f"root@{host}"],
+	)
+
+
+class TestGetGuestNetChanges:
+	def test_apply(self, f_guests):
+		changes = get_guest_net_changes(GUEST_NET_MAP, GUEST_NET_ORIG)
+		assert [c.guest_id for c in changes] == [100, 200]
+		# Interfaces without changes are left out
+		assert changes[0].nets == {
+			0: {"virtio": "AA:BB", "bridge": "vmbr0", "tag": 20},
+			1: {"virtio": "AA:CC", "bridge": "vmbr1", "tag": 30},
+		}
+		assert changes[1].nets == {0: {"name": "eth0", "bridge": "vmbr0"}}
+		# Originals are not modified
+		assert GUEST_NET_ORIG[200][0]["tag"] == "10"
+
+	def test_rollback(self, f_guests):
+		changes = get_guest_net_changes(
+			GUEST_NET_MAP, GUEST_NET_ORIG, rollback=True
+		)
+		assert changes[0].nets == {
+			0: GUEST_NET_ORIG[100][0],
+			1: GUEST_NET_ORIG[100][1],
+		}
+
+	def test_combined_cmd_args(self, f_guests):
+		changes = get_guest_net_changes(GUEST_NET_MAP, GUEST_NET_ORIG)
+		assert changes[0].cmd_args() == [
+			"/usr/sbin/qm",
+			"set",
+			"100",
+			"--net0",
+			"virtio=AA:BB,bridge=vmbr0,tag=20",
+			"--net1",
+			"virtio=AA:CC,bridge=vmbr1,tag=30",
+		]
+		assert changes[1].cmd_args(remote=True) == [
+			"ssh",
+			"root@pve2",
+			"/usr/sbin/pct",
+			"set",
+			"200",
+			"--net0",
+			"name=eth0,bridge=vmbr0",
+		]
+
+
+def test_rollback_manifest(tmp_path):
+	# The state directory is created on the first write
+	manifest_path = str(tmp_path / "state" / "rollback.json")
+	net_cfgs = get_guest_net_rollback(GUEST_NET_MAP, GUEST_NET_ORIG)
+	write_rollback_manifest(manifest_path, net_cfgs)
+	assert read_rollback_manifest(manifest_path) == {
+		100: {0: GUEST_NET_ORIG[100][0], 1: GUEST_NET_ORIG[100][1]},
+		200: GUEST_NET_ORIG[200],
+	}
+	# The originals of an earlier run are never replaced by accident
+	with pytest.raises(FileExistsError):
+		write_rollback_manifest(manifest_path, {100: {0: {"tag": "20"}}})
+	assert (
+		read_rollback_manifest(manifest_path)[100][0] == GUEST_NET_ORIG[100][0]
+	)
+	write_rollback_manifest(
+		manifest_path, {100: {0: {"tag": "20"}}}, overwrite=True
+	)
+	assert read_rollback_manifest(manifest_path) == {100: {0: {"tag": "20"}}}
+
+
+def test_get_latest_manifest_path(tmp_path, mocker: MockerFixture):
+	mocker.patch(
+		f"{MODULE_PATH}.get_state_path",
+		side_effect=lambda *parts: str(tmp_path.joinpath(*parts)),
+	)
+	assert get_latest_manifest_path() is None
+	manifest_dir = tmp_path / "staged_net_change"
+	manifest_dir.mkdir()
+	for name in (
+		"rollback-20260101-120000.json",
+		"rollback-20260102-090000.json",
+		"notes.txt",
+	):
+		(manifest_dir / name).write_text("")
+	assert get_latest_manifest_path() == str(
+		manifest_dir / "rollback-20260102-090000.json"
+	)
+
+
+class TestRunGuestNetChanges:
+	def test_report(self, f_guests, mocker: MockerFixture):
+		def _run(cmd_args, **kwargs):
+			returncode = 1 if "200" in cmd_args else 0
+			return CommandResult(cmd_args, returncode, b"", b"locked", 0.1)
+
+		m_run = mocker.patch(f"{MODULE_PATH}.run_command", side_effect=_run)
+		changes = get_guest_net_changes(GUEST_NET_MAP, GUEST_NET_ORIG)
+		report = run_guest_net_changes(changes)
+		assert m_run.call_count == 2
+		assert report[100] is None
+		assert "locked" in report[200]
+
+	def test_dry_run(self, f_guests, mocker: MockerFixture):
+		m_run = mocker.patch(f"{MODULE_PATH}.run_command")
+		changes = get_guest_net_changes(GUEST_NET_MAP, GUEST_NET_ORIG)
+		assert run_guest_net_changes(changes, dry_run=True) == {
+			100: None,
+			200: None,
+		}
+		m_run.assert_not_called()
+
+	def test_nodes_run_concurrently(self, f_guests, mocker: MockerFixture):
+		# Each node's only change waits for the other node's one
+		barrier = threading.Barrier(2, timeout=5)
+
+		def _run(cmd_args, **kwargs):
+			barrier.wait()
+			return CommandResult(cmd_args, 0, b"", b"", 0.1)
+
+		mocker.patch(f"{MODULE_PATH}.run_command", side_effect=_run)
+		changes = [
+			GuestNetChange(guest_id=100, host="pve1", is_ct=False),
+			GuestNetChange(guest_id=200, host="pve2", is_ct=True),
+		]
+		assert run_guest_net_changes(changes, workers=1) == {
+			100: None,
+			200: None,
+		}
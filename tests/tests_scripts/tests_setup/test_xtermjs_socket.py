@@ -0,0 +1,27 @@
+########################### Standard Pytest Imports ############################
+import pytest
+
+################################################################################
+from core.utils.file_edit import apply_substitutions
+from scripts.setup.debian.xtermjs_socket import GRUB_CONSOLE_SUBSTITUTIONS
+
+
+@pytest.mark.parametrize(
+	"cmdline, expected",
+	(
+		(
+			'GRUB_CMDLINE_LINUX=""',
+			'GRUB_CMDLINE_LINUX=" console=tty0 console=ttyS0,115200"',
+		),
+		(
+			'GRUB_CMDLINE_LINUX="console=ttyS0,115200"',
+			'GRUB_CMDLINE_LINUX="console=ttyS0,115200 console=tty0"',
+		),
+		(
+			'GRUB_CMDLINE_LINUX="console=tty0 console=ttyS0,115200"',
+			'GRUB_CMDLINE_LINUX="console=tty0 console=ttyS0,115200"',
+		),
+	),
+)
+def test_grub_cmdline_substitutions(cmdline, expected):
+	assert apply_substitutions(cmdline, GRUB_CONSOLE_SUBSTITUTIONS) == expected